@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
@@ -48,11 +50,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'store.db_routing.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.profiling.ProfilingMiddleware',
+    'store.slow_queries.SlowQueryMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,6 +75,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'store.user_context.context_processor',
             ],
         },
     },
@@ -88,8 +95,71 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # соединение проверяется перед повторным использованием (после CONN_MAX_AGE или сбоя БД)
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True').lower() in ('true', '1', 'yes'),
     }
 }
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    # тот же бэкенд PostgreSQL, плюс замер выдачи соединений и состояние пула в /metrics
+    DATABASES['default']['ENGINE'] = 'store.pg_backend'
+# Пул соединений psycopg 3 на процесс (нужен пакет psycopg[pool]): DB_POOL_MIN_SIZE открыто всегда,
+# под нагрузкой до DB_POOL_MAX_SIZE; сверх этого запрос ждёт DB_POOL_TIMEOUT секунд, а если ждущих
+# уже DB_POOL_MAX_WAITING (0 — без предела), сразу получает ошибку.
+# Без пула соединение живёт DB_CONN_MAX_AGE секунд и переиспользуется запросами потока (0 — на каждый запрос новое)
+DB_POOL = os.getenv('DB_POOL', 'False').lower() in ('true', '1', 'yes')
+if DB_POOL:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {'pool': {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'max_waiting': int(os.getenv('DB_POOL_MAX_WAITING', 0)),
+        'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 600)),
+        'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+    }}
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+# Реплики для чтения: DB_REPLICAS=host1,host2 (для SQLite — пути к файлам), остальное как у default.
+# Каталог, карточка товара, аналитика, выгрузки и GET к API читают с реплики (store.db_routing)
+REPLICA_DATABASES = []
+for _number, _replica in enumerate(filter(None, map(str.strip, os.getenv('DB_REPLICAS', '').split(','))), 1):
+    _key = 'NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3') else 'HOST'
+    DATABASES[f'replica{_number}'] = {**DATABASES['default'], _key: _replica, 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(f'replica{_number}')
+DATABASE_ROUTERS = ['store.db_routing.ReplicaRouter']
+# После записи пользователь читает с основной базы столько секунд (read-your-writes)
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+# Реплика, отставшая больше чем на столько секунд, пропускается; отставание проверяется раз в REPLICA_LAG_CHECK_SECONDS
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 10))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', 5))
+
+# Кэш. default — память процесса (аналитика, админка); store — общий второй уровень store.cache:
+# CACHE_BACKEND=file (каталог CACHE_LOCATION, по умолчанию во временном каталоге системы — не в репозитории), db (таблица CACHE_LOCATION, создать: python manage.py
+# createcachetable), redis (redis://host:6379/1, пакет redis), memcached (host:11211, пакет pymemcache), locmem.
+# manage.py test всегда берёт locmem: тесты не видят чужой кэш и не оставляют свой
+TESTING = sys.argv[1:2] == ['test']
+CACHE_BACKEND = 'locmem' if TESTING else os.getenv('CACHE_BACKEND', 'file')
+_CACHE_BACKENDS = {
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(Path(tempfile.gettempdir()) / 'tabletopstore-cache')),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'store_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'store'),
+}
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'store': {
+        'BACKEND': _CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.getenv('CACHE_LOCATION') or _CACHE_BACKENDS[CACHE_BACKEND][1],
+        'KEY_PREFIX': 'store',
+    },
+}
+# L1 — LRU в памяти процесса перед store: до CACHE_L1_MAX_ENTRIES записей по CACHE_L1_SECONDS секунд;
+# сброс тега другим процессом замечается не позже чем через CACHE_TAG_CHECK_SECONDS
+CACHE_L1_MAX_ENTRIES = int(os.getenv('CACHE_L1_MAX_ENTRIES', 2000))
+CACHE_L1_SECONDS = float(os.getenv('CACHE_L1_SECONDS', 30))
+CACHE_TAG_CHECK_SECONDS = float(os.getenv('CACHE_TAG_CHECK_SECONDS', 1))
 
 
 # Password validation
@@ -144,7 +214,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'store.user_context.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -158,6 +228,9 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # роль пользователя в claim role access-токена — permissions API обходятся без запросов
+    'TOKEN_OBTAIN_SERIALIZER': 'store.serializers.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'store.serializers.RoleTokenRefreshSerializer',
 }
 
 
@@ -178,4 +251,57 @@ if EMAIL_PORT == 587:
 if EMAIL_USE_SSL:
     EMAIL_USE_TLS = False
 
-SEED_DEMO = os.getenv("SEED_DEMO", "1")
\ No newline at end of file
+SEED_DEMO = os.getenv("SEED_DEMO", "1")
+
+# Админка больших таблиц: выше порога changelist берёт оценку планировщика вместо COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000))
+ADMIN_DATE_RANGE_CACHE_SECONDS = int(os.getenv('ADMIN_DATE_RANGE_CACHE_SECONDS', 3600))
+
+# Фоновый импорт каталога: куда складывать загруженные файлы и запускать ли обработчик сразу после загрузки
+CATALOG_IMPORT_DIR = os.getenv('CATALOG_IMPORT_DIR', str(BASE_DIR / 'imports'))
+CATALOG_IMPORT_SPAWN_WORKER = os.getenv('CATALOG_IMPORT_SPAWN_WORKER', 'True').lower() in ('true', '1', 'yes')
+# Задача, чей обработчик не отмечался столько секунд, считается брошенной: снова в очередь,
+# а после CATALOG_IMPORT_MAX_ATTEMPTS запусков — в ошибки
+CATALOG_IMPORT_STALE_SECONDS = int(os.getenv('CATALOG_IMPORT_STALE_SECONDS', 600))
+CATALOG_IMPORT_MAX_ATTEMPTS = int(os.getenv('CATALOG_IMPORT_MAX_ATTEMPTS', 3))
+# Запас водяного знака инкрементальной выгрузки каталога (секунды)
+CATALOG_WATERMARK_OVERLAP_SECONDS = int(os.getenv('CATALOG_WATERMARK_OVERLAP_SECONDS', 5))
+# Внутренний location nginx (internal, alias на backups/) для отдачи бэкапов через X-Accel-Redirect;
+# пусто — файлы отдаёт Django
+BACKUP_DOWNLOAD_ACCEL_REDIRECT = os.getenv('BACKUP_DOWNLOAD_ACCEL_REDIRECT', '')
+# Профилирование запросов: Server-Timing на каждый ответ, строка JSON в лог store.profiling для запросов
+# дольше PROFILING_LOG_MIN_MS, cProfile для персонала (?_profile=1) и для доли PROFILING_SAMPLE_RATE запросов
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True').lower() in ('true', '1', 'yes')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_LOG_MIN_MS = float(os.getenv('PROFILING_LOG_MIN_MS', 500))
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', 500))
+
+# Медленные запросы: всё дольше SLOW_QUERY_MS сохраняется (фоновым потоком) с планом EXPLAIN, см. админку
+SLOW_QUERY_ENABLED = os.getenv('SLOW_QUERY_ENABLED', 'True').lower() in ('true', '1', 'yes')
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+SLOW_QUERY_BACKGROUND = os.getenv('SLOW_QUERY_BACKGROUND', 'True').lower() in ('true', '1', 'yes')
+SLOW_QUERY_KEEP = int(os.getenv('SLOW_QUERY_KEEP', 5000))
+
+# Метрики Prometheus на /metrics. METRICS_DIR — общий каталог файлов метрик воркеров gunicorn
+# (очищать перед запуском); пусто — метрики одного процесса в памяти. Доступ: METRICS_TOKEN — Bearer-токен
+# опроса, METRICS_ALLOWED_IPS — адреса/сети через запятую (за nginx на том же хосте loopback сюда не вносить),
+# плюс вошедшие сотрудники; остальным — 403
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() in ('true', '1', 'yes')
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'store.profiling': {
+            'handlers': ['console'],
+            'level': os.getenv('PROFILING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
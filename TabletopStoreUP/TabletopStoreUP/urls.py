@@ -11,7 +11,7 @@ from store.api import (
     MeUserSettingsViewSet, ReviewViewSet, PaymentMethodViewSet, RegisterView,
 )
 from store.api_views import MeUserSettingsViewSet
-from store import admin_reports
+from store import admin_reports, metrics, views as store_views
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -41,13 +41,18 @@ router.register(r'payment-methods', PaymentMethodViewSet)
 
 urlpatterns = [
     path('api/', include(router.urls)),
+    # старый адрес скачивания бэкапа: раньше admin/, иначе его перехватит catch-all админки
+    path('admin/backups/<str:filename>/', store_views.download_backup, name='download_backup_legacy'),
     path('admin/', admin.site.urls),
     path('admin/analytics/', admin_reports.analytics_dashboard, name='admin_analytics'),
     path('admin/analytics/export/', admin_reports.export_analytics_csv, name='export_analytics_csv'),
+    path('admin/analytics/series/', admin_reports.analytics_series, name='admin_analytics_series'),
+    path('admin/analytics/customers/', admin_reports.customer_analytics, name='admin_customer_analytics'),
     path('api/auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/auth/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
     path('api/auth/register/', RegisterView.as_view(), name='auth_register'),
+    path('metrics', metrics.metrics_view, name='metrics'),
     path('', include('store.urls')),
 ]
 
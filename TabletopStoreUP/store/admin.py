@@ -1,19 +1,26 @@
 from django.contrib import admin, messages
-from django.db.models import Count, F
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Min
 from django.db import transaction
 from django.http import HttpResponse
-from django.urls import re_path
-from django.utils.html import format_html
+from django.shortcuts import get_object_or_404
+from django.urls import path, re_path, reverse
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
 from decimal import Decimal
+import datetime
 
-from . import admin_reports
+from . import admin_reports, metrics
+from .paginators import EstimatedCountPaginator
 from .models import (
     UserRole, UserProfile, UserSettings,
     Genre, PlayerRange, Product, Review,
     OrderStatus, Order, OrderItem,
     PaymentMethod, PaymentStatus, Payment,
-    DeliveryMethod, DeliveryStatus, Delivery
+    DeliveryMethod, DeliveryStatus, Delivery,
+    CatalogImportJob, RequestProfile, SlowQuery, SlowQueryFingerprint,
 )
 
 @admin.register(UserRole)
@@ -56,6 +63,81 @@ class StockLevelFilter(admin.SimpleListFilter):
             return queryset.filter(stock__gte=5)
         return queryset
 
+class CachedDateHierarchyFilter(admin.SimpleListFilter):
+    """
+    Облегчённая замена date_hierarchy: годы/месяцы строятся по закэшированным
+    min/max датам, без DISTINCT-сканирования всей таблицы на каждый запрос.
+    """
+    title = "Период"
+    date_field = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = f"{self.date_field.replace('__', '_')}_period"
+        super().__init__(request, params, model, model_admin)
+
+    def _date_range(self, model):
+        key = f"admin:daterange:{model._meta.label_lower}:{self.date_field}"
+        bounds = cache.get(key)
+        metrics.cache_lookup("admin_date_range", int(bounds is not None), int(bounds is None))
+        if bounds is None:
+            agg = model._default_manager.aggregate(first=Min(self.date_field), last=Max(self.date_field))
+            bounds = (agg["first"], agg["last"])
+            cache.set(key, bounds, getattr(settings, "ADMIN_DATE_RANGE_CACHE_SECONDS", 3600))
+        return bounds
+
+    def lookups(self, request, model_admin):
+        first, last = self._date_range(model_admin.model)
+        if not first or not last:
+            return []
+        choices = []
+        selected_year = (self.value() or "")[:4]
+        for year in range(last.year, first.year - 1, -1):
+            choices.append((str(year), str(year)))
+            if str(year) == selected_year:
+                months = range(1, 13)
+                if year == first.year:
+                    months = [m for m in months if m >= first.month]
+                if year == last.year:
+                    months = [m for m in months if m <= last.month]
+                choices += [(f"{year}-{m:02d}", f"— {m:02d}.{year}") for m in months]
+        return choices
+
+    def queryset(self, request, queryset):
+        v = self.value()
+        if not v:
+            return queryset
+        try:
+            if len(v) == 4:
+                start = datetime.date(int(v), 1, 1)
+                end = datetime.date(start.year + 1, 1, 1)
+            else:
+                start = datetime.date(int(v[:4]), int(v[5:7]), 1)
+                end = (start + datetime.timedelta(days=32)).replace(day=1)
+        except ValueError:
+            return queryset
+        # диапазон вместо __year/__month — так используется индекс по полю даты
+        tz = timezone.get_current_timezone()
+        start = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min), tz)
+        end = timezone.make_aware(datetime.datetime.combine(end, datetime.time.min), tz)
+        return queryset.filter(**{f"{self.date_field}__gte": start, f"{self.date_field}__lt": end})
+
+class OrderDateFilter(CachedDateHierarchyFilter):
+    date_field = "order_date"
+
+class RelatedOrderDateFilter(CachedDateHierarchyFilter):
+    date_field = "order__order_date"
+
+class PaymentDateFilter(CachedDateHierarchyFilter):
+    date_field = "payment_date"
+
+class ReviewDateFilter(CachedDateHierarchyFilter):
+    date_field = "created_at"
+
+class LargeTableAdminMixin:
+    """Changelist больших таблиц: оценочный COUNT и без второго COUNT(*) по всей таблице."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 class ReviewInline(admin.TabularInline):
     model = Review
     extra = 0
@@ -112,6 +194,132 @@ class PlayerRangeAdmin(admin.ModelAdmin):
     list_editable = ("min_players", "max_players")
     search_fields = ("id", "min_players", "max_players")
 
+@admin.register(CatalogImportJob)
+class CatalogImportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "original_name", "status", "dry_run", "rows_done", "created_count",
+                    "updated_count", "error_count", "rows_per_sec", "created_by", "created_at", "finished_at")
+    list_filter = ("status", "dry_run")
+    readonly_fields = [f.name for f in CatalogImportJob._meta.fields]
+    exclude = ("diff",)
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "method", "path", "status_code", "total_ms", "sql_count", "sql_ms",
+                    "template_ms", "trigger", "user")
+    list_filter = ("trigger", "method", "status_code")
+    search_fields = ("path",)
+    exclude = ("dump", "stats")
+    readonly_fields = [f.name for f in RequestProfile._meta.fields if f.name not in ("dump", "stats")] + [
+        "download_link", "stats_pre",
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path("<int:pk>/download/", self.admin_site.admin_view(self.download_view),
+                 name="store_requestprofile_download"),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(bytes(profile.dump), content_type="application/octet-stream")
+        response["Content-Disposition"] = f'attachment; filename="request_{profile.pk}.prof"'
+        return response
+
+    @admin.display(description="Дамп cProfile")
+    def download_link(self, obj):
+        url = reverse("admin:store_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">request_{}.prof</a> (snakeviz, python -m pstats)', url, obj.pk)
+
+    @admin.display(description="Топ по cumulative")
+    def stats_pre(self, obj):
+        return format_html('<pre style="font-size:12px;white-space:pre;overflow-x:auto">{}</pre>', obj.stats)
+
+class SlowQueryInline(admin.TabularInline):
+    model = SlowQuery
+    fields = ("captured_at", "duration_ms", "origin", "params")
+    readonly_fields = fields
+    extra = 0
+    max_num = 0
+    can_delete = False
+    ordering = ("-captured_at",)
+
+    def get_queryset(self, request):
+        # последние 20 замеров: inline не допускает срез queryset, поэтому отбор по id
+        qs = super().get_queryset(request)
+        parent_id = request.resolver_match.kwargs.get("object_id")
+        ids = qs.filter(fingerprint_id=parent_id).order_by("-captured_at").values_list("id", flat=True)[:20]
+        return qs.filter(id__in=list(ids))
+
+@admin.register(SlowQueryFingerprint)
+class SlowQueryFingerprintAdmin(admin.ModelAdmin):
+    list_display = ("short_sql", "count", "total_ms", "avg_display", "p50_ms", "p95_ms", "p99_ms", "max_ms",
+                    "top_origin", "plan_status", "last_seen")
+    list_filter = ("plan_status",)
+    search_fields = ("normalized_sql",)
+    exclude = ("recent_ms", "normalized_sql", "plan", "origins")
+    readonly_fields = [f.name for f in SlowQueryFingerprint._meta.fields
+                       if f.name not in ("recent_ms", "normalized_sql", "plan", "origins")] + [
+        "sql_pre", "plan_pre", "origins_display",
+    ]
+    inlines = [SlowQueryInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Запрос")
+    def short_sql(self, obj):
+        return obj.normalized_sql[:120]
+
+    @admin.display(description="Среднее, мс")
+    def avg_display(self, obj):
+        return round(obj.avg_ms, 1)
+
+    @admin.display(description="Источник")
+    def top_origin(self, obj):
+        return max(obj.origins, key=obj.origins.get) if obj.origins else "—"
+
+    @admin.display(description="SQL")
+    def sql_pre(self, obj):
+        return format_html('<pre style="white-space:pre-wrap">{}</pre>', obj.normalized_sql)
+
+    @admin.display(description="План (EXPLAIN)")
+    def plan_pre(self, obj):
+        return format_html('<pre style="white-space:pre;overflow-x:auto">{}</pre>', obj.plan or "—")
+
+    @admin.display(description="Источники")
+    def origins_display(self, obj):
+        rows = sorted(obj.origins.items(), key=lambda kv: -kv[1])
+        return format_html_join(mark_safe("<br>"), "{}: {}", rows) if rows else "—"
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ("captured_at", "duration_ms", "origin", "fingerprint_id")
+    search_fields = ("origin",)
+    readonly_fields = [f.name for f in SlowQuery._meta.fields if f.name != "stack"] + ["stack_pre"]
+    exclude = ("stack",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Стек")
+    def stack_pre(self, obj):
+        return format_html("<pre>{}</pre>", obj.stack or "—")
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ("user", "role", "full_name", "phone")
@@ -120,9 +328,9 @@ class UserProfileAdmin(admin.ModelAdmin):
     autocomplete_fields = ("user", "role")
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ("product", "user", "rating", "created_at")
-    list_filter = ("rating", "created_at")
+    list_filter = ("rating", ReviewDateFilter)
     search_fields = ("product__name", "user__username", "comment")
     readonly_fields = ("created_at",)
     autocomplete_fields = ("product", "user")
@@ -209,10 +417,9 @@ def export_orders_csv(modeladmin, request, queryset):
     return resp
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ("id", "order_date", "user", "status", "items_count", "total_fmt")
-    list_filter = ("status", "order_date")
-    date_hierarchy = "order_date"
+    list_filter = ("status", OrderDateFilter)
     search_fields = ("id", "user__username", "user__email")
     autocomplete_fields = ("user", "status")
     inlines = [OrderItemInline, PaymentInline, DeliveryInline]
@@ -234,8 +441,9 @@ class OrderAdmin(admin.ModelAdmin):
     total_fmt.short_description = "Сумма"
 
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ("order", "product", "quantity", "price", "line_total")
+    list_filter = (RelatedOrderDateFilter,)
     list_select_related = ("order", "product")
     search_fields = ("order__id", "product__name")
     autocomplete_fields = ("order", "product")
@@ -248,17 +456,16 @@ class OrderItemAdmin(admin.ModelAdmin):
     line_total.short_description = "Сумма"
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ("order", "amount", "status", "method", "payment_date")
-    list_filter  = ("status", "method", "payment_date")
-    date_hierarchy = "payment_date"
+    list_filter  = ("status", "method", PaymentDateFilter)
     search_fields = ("order__id",)
     autocomplete_fields = ("order", "status", "method")
 
 @admin.register(Delivery)
-class DeliveryAdmin(admin.ModelAdmin):
+class DeliveryAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ("order", "address", "method", "status")
-    list_filter = ("status", "method")
+    list_filter = ("status", "method", RelatedOrderDateFilter)
     search_fields = ("order__id", "address")
     autocomplete_fields = ("order", "method", "status")
 
@@ -288,6 +495,8 @@ def get_custom_admin_urls(original_get_urls):
         my_urls = [
             re_path(r"^analytics/$", admin_reports.analytics_dashboard, name="admin_analytics"),
             re_path(r"^analytics/export/$", admin_reports.export_analytics_csv, name="export_analytics_csv"),
+            re_path(r"^analytics/series/$", admin_reports.analytics_series, name="admin_analytics_series"),
+            re_path(r"^analytics/customers/$", admin_reports.customer_analytics, name="admin_customer_analytics"),
         ]
         return my_urls + urls
     return custom_urls
@@ -296,6 +505,7 @@ admin.site.get_urls = get_custom_admin_urls(admin.site.get_urls)
 
 admin.site.index_title = format_html(
     'Панель управления магазином | <a href="/admin/analytics/" style="color:#6E56CF;text-decoration:none;">📊 Аналитика</a>'
+    ' | <a href="/admin/store/slowqueryfingerprint/" style="color:#6E56CF;text-decoration:none;">🐢 Медленные запросы</a>'
 )
 admin.site.site_header = "Админ-панель магазина игр"
 admin.site.site_title = "Магазин игр — админка"
\ No newline at end of file
@@ -1,53 +1,48 @@
+from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
-from django.shortcuts import render
-from django.db.models import Sum, Count, Avg
-from django.http import HttpResponse
+from django.shortcuts import render, redirect
+from django.db.models import Count, Max, Sum
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.dateparse import parse_date
-from .models import Order, OrderItem
+from . import analytics_cache, rollup, timeseries
+from .db_routing import replica_reads
+from .models import Product, CustomerRFM, CohortRetention
 import csv
 import datetime
+import hashlib
+import json
 
-@staff_member_required
-def analytics_dashboard(request):
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-
-    if start_date:
-        start_date = parse_date(start_date)
-    if end_date:
-        end_date = parse_date(end_date)
+def _period(request):
+    start_date = parse_date(request.GET.get('start_date') or '')
+    end_date = parse_date(request.GET.get('end_date') or '')
     if not start_date:
         start_date = datetime.date.today() - datetime.timedelta(days=30)
     if not end_date:
         end_date = datetime.date.today()
+    return start_date, end_date
 
-    orders = Order.objects.filter(order_date__date__range=(start_date, end_date))
 
-    total_orders = orders.count()
-    total_revenue = orders.aggregate(total=Sum('total'))['total'] or 0
-    avg_check = orders.aggregate(avg=Avg('total'))['avg'] or 0
-    unique_customers = orders.values('user').distinct().count()
+@replica_reads
+@staff_member_required
+def analytics_dashboard(request):
+    start_date, end_date = _period(request)
 
-    daily_revenue = (
-        orders.values('order_date__date')
-        .annotate(total=Sum('total'))
-        .order_by('order_date__date')
-    )
+    daily = analytics_cache.get_daily(start_date, end_date)
+    summary = analytics_cache.summarize(daily)
+    total_orders = summary['orders']
+    total_revenue = summary['revenue']
+    avg_check = (total_revenue / total_orders) if total_orders else 0
+    # число уникальных покупателей не суммируется по дням, поэтому считается
+    # по индексу order_date только в пределах выбранного периода
+    unique_customers = rollup.counted_orders(start_date, end_date).values('user').distinct().count()
 
-    popular_products = (
-        OrderItem.objects
-        .filter(order__in=orders)
-        .values('product__name')
-        .annotate(total_sold=Sum('quantity'))
-        .order_by('-total_sold')[:10]
-    )
-
-    user_activity = (
-        orders
-        .values('order_date__date')
-        .annotate(total_orders=Count('id'))
-        .order_by('order_date__date')
-    )
+    names = dict(Product.objects.filter(id__in=[pid for pid, _ in summary['top_products']]).values_list('id', 'name'))
+    popular_products = [
+        {'product__name': names.get(pid, f'#{pid}'), 'total_sold': units}
+        for pid, units in summary['top_products']
+    ]
 
     context = {
         'start_date': start_date,
@@ -56,37 +51,111 @@ def analytics_dashboard(request):
         'total_revenue': total_revenue,
         'avg_check': avg_check,
         'unique_customers': unique_customers,
-        'daily_revenue': daily_revenue,
         'popular_products': popular_products,
-        'user_activity': user_activity,
     }
 
     return render(request, 'admin/analytics_dashboard.html', context)
 
 
+@replica_reads
+@staff_member_required
+def analytics_series(request):
+    """
+    Ряды выручки и числа заказов для графиков дашборда.
+    Гранулярность выбирается по длине периода (или ?bucket=day|week|month),
+    ряд прореживается LTTB до ?points= точек.
+    """
+    start_date, end_date = _period(request)
+    if start_date > end_date:
+        return JsonResponse({'error': 'start_date позже end_date'}, status=400)
+    bucket = request.GET.get('bucket')
+    if bucket not in timeseries.BUCKETS:
+        bucket = timeseries.choose_bucket(start_date, end_date)
+    try:
+        points = max(10, min(5000, int(request.GET.get('points', 400))))
+    except ValueError:
+        points = 400
+
+    daily = analytics_cache.get_daily(start_date, end_date)
+    revenue = timeseries.rebucket([(d['day'], d['revenue']) for d in daily], bucket)
+    orders = timeseries.rebucket([(d['day'], d['orders']) for d in daily], bucket)
+    payload = {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'bucket': bucket,
+        'revenue': [[d.isoformat(), round(v, 2)] for d, v in timeseries.downsample(revenue, points)],
+        'orders': [[d.isoformat(), int(v)] for d, v in timeseries.downsample(orders, points)],
+    }
+
+    body = json.dumps(payload, ensure_ascii=False)
+    etag = '"%s"' % hashlib.md5(body.encode('utf-8')).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json; charset=utf-8')
+    response['ETag'] = etag
+    # прошлые дни неизменны — такой ответ можно держать долго, с сегодняшним днём — коротко
+    max_age = 60 if end_date >= timezone.localdate() else 3600
+    patch_cache_control(response, private=True, max_age=max_age)
+    return response
+
+
+@replica_reads
 @staff_member_required
 def export_analytics_csv(request):
     """Экспорт данных аналитики в CSV"""
     response = HttpResponse(content_type='text/csv; charset=utf-8')
     response['Content-Disposition'] = 'attachment; filename="analytics_report.csv"'
     response.write('\ufeff'.encode('utf8'))
-    start_date = parse_date(request.GET.get('start_date'))
-    end_date = parse_date(request.GET.get('end_date'))
-
-    if not start_date or not end_date:
-        start_date = datetime.date.today() - datetime.timedelta(days=30)
-        end_date = datetime.date.today()
-
-    daily_revenue = (
-        Order.objects.filter(order_date__date__range=(start_date, end_date))
-        .values('order_date__date')
-        .annotate(total=Sum('total'))
-        .order_by('order_date__date')
-    )
+    start_date, end_date = _period(request)
 
     writer = csv.writer(response)
     writer.writerow(['Дата', 'Заказы', 'Выручка (₽)'])
-    for day in daily_revenue:
-        writer.writerow([day['order_date__date'], day['total']])
+    for day in analytics_cache.get_daily(start_date, end_date):
+        writer.writerow([day['day'], day['orders'], day['revenue']])
 
     return response
+
+
+@replica_reads
+@staff_member_required
+def customer_analytics(request):
+    """RFM-сегменты и удержание когорт из предрасчитанных таблиц; POST — пересчёт в фоне."""
+    if request.method == 'POST':
+        from . import customer_analytics as engine  # NumPy нужен только для пересчёта
+        if engine.start_background():
+            messages.success(request, "Пересчёт запущен в фоне — обновите страницу через несколько минут.")
+        else:
+            messages.warning(request, "Пересчёт уже выполняется.")
+        return redirect('admin_customer_analytics')
+
+    segments = (
+        CustomerRFM.objects.values('segment')
+        .annotate(customers=Count('id'), revenue=Sum('monetary'))
+        .order_by('-customers')
+    )
+    computed_at = CustomerRFM.objects.aggregate(at=Max('computed_at'))['at']
+
+    # Последние 12 когорт, удержание в % от размера когорты (смещение 0)
+    cells = CohortRetention.objects.filter(
+        cohort__in=CohortRetention.objects.filter(month_offset=0).order_by('-cohort').values('cohort')[:12]
+    )
+    by_cohort = {}
+    for c in cells:
+        by_cohort.setdefault(c.cohort, {})[c.month_offset] = c.customers
+    width = max((max(row) for row in by_cohort.values()), default=-1) + 1
+    retention = []
+    for cohort in sorted(by_cohort):
+        row = by_cohort[cohort]
+        size = row.get(0) or 0
+        retention.append({
+            'cohort': cohort,
+            'size': size,
+            'cells': [round(100 * row.get(i, 0) / size, 1) if size else 0 for i in range(width)],
+        })
+
+    return render(request, 'admin/customer_analytics.html', {
+        'segments': segments,
+        'computed_at': computed_at,
+        'retention': retention,
+        'offsets': range(width),
+    })
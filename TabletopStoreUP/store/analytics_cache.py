@@ -0,0 +1,136 @@
+"""
+Кэш дневных итогов аналитики.
+
+Закрытые дни (раньше сегодняшнего) почти не меняются, поэтому их итоги лежат в общем для
+процессов кэше store (см. store.cache) до DAY_TIMEOUT; текущий день всегда считается заново.
+У каждого дня свой тег analytics:day:{дата}, версия тега входит в ключ: пересчёт среза
+продаж за день (отмена или правка старого заказа) сбрасывает тег, и все процессы перестают
+видеть старые итоги. Итоги для кэша считаются по основной базе — отставшая реплика не
+попадает в кэш, даже если отчёт открыт через @replica_reads.
+"""
+import datetime
+import logging
+from collections import Counter
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import cache as store_cache
+from . import metrics
+from .models import SalesDailyRollup
+
+logger = logging.getLogger("store.analytics_cache")
+
+CACHE_PREFIX = "analytics:day:v2:"
+DAY_TIMEOUT = 30 * 24 * 3600  # ключи сброшенных версий сами уходят из кэша
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def _tag(day):
+    return f"analytics:day:{day.isoformat()}"
+
+
+def _key(day, version):
+    return f"{CACHE_PREFIX}{day.isoformat()}:{version}"
+
+
+def _days(start, end):
+    return [start + ONE_DAY * i for i in range((end - start).days + 1)]
+
+
+def _empty(day):
+    return {"day": day, "orders": 0, "revenue": Decimal("0"), "products": {}}
+
+
+def compute_days(start, end, using=None):
+    """Итоги по дням start..end из дневного среза: два запроса на весь отрезок."""
+    summaries = {day: _empty(day) for day in _days(start, end)}
+    rows = SalesDailyRollup.objects.using(using).filter(day__range=(start, end))
+    totals = (
+        rows.filter(product__isnull=True)
+        .values("day")
+        .annotate(orders=Sum("orders_count"), revenue=Sum("revenue"))
+        .order_by()
+    )
+    for r in totals:
+        summaries[r["day"]]["orders"] = r["orders"] or 0
+        summaries[r["day"]]["revenue"] = r["revenue"] or Decimal("0")
+    products = (
+        rows.filter(product__isnull=False)
+        .values("day", "product_id")
+        .annotate(units=Sum("units"))
+        .order_by()
+    )
+    for r in products:
+        summaries[r["day"]]["products"][r["product_id"]] = r["units"] or 0
+    return summaries
+
+
+def _runs(days):
+    """Разбивает отсортированный список дней на непрерывные отрезки."""
+    runs = []
+    for day in days:
+        if runs and runs[-1][1] + ONE_DAY == day:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def _cache_call(method, *args, default=None):
+    if store_cache.is_bypassed():
+        return default
+    try:
+        return getattr(store_cache.backend(), method)(*args)
+    except Exception as e:  # кэш недоступен — считаем без него
+        logger.warning("Кэш итогов по дням недоступен (%s): %s", method, e)
+        return default
+
+
+def get_daily(start, end):
+    """Список дневных итогов за start..end: закрытые дни из кэша, сегодняшний — вживую."""
+    today = timezone.localdate()
+    result = {}
+
+    sealed_end = min(end, today - ONE_DAY)
+    if start <= sealed_end:
+        days = _days(start, sealed_end)
+        # версии тегов берутся до расчёта: сброс во время расчёта сделает его ключ устаревшим
+        versions = store_cache.tag_versions([_tag(day) for day in days])
+        keys = {_key(day, versions[_tag(day)]): day for day in days}
+        cached = _cache_call("get_many", list(keys), default={})
+        for key, summary in cached.items():
+            result[keys[key]] = summary
+        missing = [day for key, day in keys.items() if key not in cached]
+        metrics.cache_lookup("analytics_day", len(cached), len(missing))
+        fresh = {}
+        for a, b in _runs(missing):
+            fresh.update(compute_days(a, b, using=DEFAULT_DB_ALIAS))
+        if fresh:
+            _cache_call("set_many", {_key(day, versions[_tag(day)]): summary for day, summary in fresh.items()},
+                        DAY_TIMEOUT)
+            result.update(fresh)
+
+    if start <= today <= end:
+        result.update(compute_days(today, today))
+
+    return [result[day] for day in sorted(result)]
+
+
+def invalidate(start, end=None):
+    """Сбрасывает кэш закрытых дней из отрезка start..end (сегодняшний день не кэшируется)."""
+    end = min(end or start, timezone.localdate() - ONE_DAY)
+    if start <= end:
+        store_cache.invalidate_on_commit(*[_tag(day) for day in _days(start, end)])
+
+
+def summarize(daily, top=10):
+    """Сводка периода по дневным итогам: заказы, выручка и топ товаров (product_id, штук)."""
+    orders = sum(d["orders"] for d in daily)
+    revenue = sum((d["revenue"] for d in daily), Decimal("0"))
+    units = Counter()
+    for d in daily:
+        units.update(d["products"])
+    return {"orders": orders, "revenue": revenue, "top_products": units.most_common(top)}
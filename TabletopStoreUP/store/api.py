@@ -3,6 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
 from django.db.models import Avg
+from . import catalog_sync
 from .models import (
     UserRole, UserProfile, UserSettings,
     Genre, PlayerRange, Product, Review,
@@ -62,6 +63,17 @@ class ProductViewSet(viewsets.ModelViewSet):
         top = Product.objects.annotate(avg=Avg("reviews__rating")).order_by("-avg")[:5]
         return Response([{"id": p.id, "name": p.name, "avg": round(p.average_rating() or 0, 2)} for p in top])
 
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        """Дельта каталога для синхронизации: ?since=<watermark> из предыдущего ответа."""
+        since = request.query_params.get("since")
+        if since:
+            try:
+                since = catalog_sync.parse_watermark(since)
+            except ValueError as e:
+                return Response({"detail": str(e)}, status=400)
+        return Response(catalog_sync.changes_since(since or None))
+
     @action(detail=False, methods=["get"])
     def stats(self, request):
         return Response({
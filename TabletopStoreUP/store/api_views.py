@@ -1,15 +1,14 @@
 from rest_framework import permissions, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import UserSettings
+from . import user_context
 from .serializers import UserSettingsSerializer
 
 class MeUserSettingsViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def _get(self, request):
-        us, _ = UserSettings.objects.get_or_create(user=request.user)
-        return us
+        return user_context.user_settings(request, 'saved_filters', 'updated_at')
 
     def list(self, request):
         us = self._get(request)
@@ -20,7 +19,10 @@ class MeUserSettingsViewSet(viewsets.ViewSet):
         us = self._get(request)
         ser = UserSettingsSerializer(us, data=request.data, partial=True)
         ser.is_valid(raise_exception=True)
-        ser.save()
+        # поля контекста взяты из кэша — пишем только присланные
+        for field, value in ser.validated_data.items():
+            setattr(us, field, value)
+        us.save(update_fields=[*ser.validated_data, 'updated_at'])
         return Response(ser.data)
 
     @action(detail=False, methods=['post'], url_path=r'filters/(?P<key>[^/]+)')
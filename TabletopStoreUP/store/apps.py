@@ -6,4 +6,8 @@ class StoreConfig(AppConfig):
     name = 'store'
 
     def ready(self):
-        import store.signals
\ No newline at end of file
+        import store.signals
+        from django.db.backends.signals import connection_created
+        from store import backup_changes, slow_queries
+        connection_created.connect(slow_queries.install, dispatch_uid="store_slow_queries")
+        backup_changes.connect_signals()
\ No newline at end of file
@@ -0,0 +1,226 @@
+"""
+Журнал изменений строк для инкрементальных бэкапов (BackupChangeLog).
+
+На PostgreSQL журнал пишут строковые триггеры (вместе с txid транзакции), поэтому в него
+попадают и массовые операции — bulk_create, update(), сырой SQL. Изменения «после бэкапа»
+определяются по снимку транзакций бэкапа: строка журнала нужна, если её транзакция не была
+видна снимку родительского бэкапа. Так не теряются транзакции, которые начались до бэкапа,
+а закоммитились после. На остальных СУБД журнал ведут сигналы post_save/post_delete
+(массовые операции там не отслеживаются), граница — id последней записи журнала. Сигналы
+подключаются в connect_signals() только к моделям бэкапа и только не на PostgreSQL:
+обработчик post_delete отключает быстрое удаление (QuerySet.delete() без загрузки строк).
+
+TRUNCATE (flush на PostgreSQL) триггерами не отслеживается, а на время массовой загрузки
+(восстановление, генерация набора данных) триггеры отключаются — paused(): после
+восстановления нужен новый полный бэкап.
+"""
+import contextlib
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models.signals import post_delete, post_save
+
+_changelog_exists = False  # таблица журнала появляется при migrate; один раз найдена — есть и дальше
+
+TRIGGER_NAME = "store_backup_changes"
+FUNCTION_NAME = "store_backup_log_change"
+
+FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION {FUNCTION_NAME}() RETURNS trigger AS $$
+DECLARE
+    rec jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := to_jsonb(OLD);
+    ELSE
+        rec := to_jsonb(NEW);
+    END IF;
+    INSERT INTO store_backupchangelog (table_name, row_pk, op, txid, changed_at)
+    VALUES (TG_TABLE_NAME, rec ->> TG_ARGV[0], left(TG_OP, 1), txid_current(), now());
+    IF TG_OP = 'UPDATE' AND (to_jsonb(OLD) ->> TG_ARGV[0]) IS DISTINCT FROM (rec ->> TG_ARGV[0]) THEN
+        INSERT INTO store_backupchangelog (table_name, row_pk, op, txid, changed_at)
+        VALUES (TG_TABLE_NAME, to_jsonb(OLD) ->> TG_ARGV[0], 'D', txid_current(), now());
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+def is_tracked(model):
+    """Модели, изменения которых пишутся в журнал. Through-таблицы M2M бэкапятся целиком."""
+    from .backup_engine import EXCLUDED_MODELS
+    opts = model._meta
+    return not (
+        opts.proxy or not opts.managed or opts.auto_created
+        or opts.label_lower in EXCLUDED_MODELS
+        or opts.label_lower == "store.backupchangelog"
+    )
+
+
+def install_triggers(models, conn=None):
+    """Создаёт недостающие триггеры журнала (только PostgreSQL). Возвращает число созданных."""
+    conn = conn or connection
+    if conn.vendor != "postgresql":
+        return 0
+    tables = {m._meta.db_table: m._meta.pk.column for m in models if is_tracked(m)}
+    qn = conn.ops.quote_name
+    created = 0
+    with conn.cursor() as cursor:
+        cursor.execute(FUNCTION_SQL)
+        existing = _triggered_tables(cursor)
+        for table, pk_column in tables.items():
+            if table in existing:
+                continue
+            cursor.execute(
+                f"CREATE TRIGGER {TRIGGER_NAME} AFTER INSERT OR UPDATE OR DELETE ON {qn(table)} "
+                f"FOR EACH ROW EXECUTE FUNCTION {FUNCTION_NAME}(%s)",
+                [pk_column],
+            )
+            created += 1
+    return created
+
+
+def _triggered_tables(cursor):
+    cursor.execute(
+        "SELECT c.relname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid WHERE t.tgname = %s",
+        [TRIGGER_NAME],
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _replica_role(conn):
+    try:
+        with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+            cursor.execute("SET LOCAL session_replication_role = replica")
+        return True
+    except DatabaseError:  # нет прав
+        return False
+
+
+@contextlib.contextmanager
+def paused(models, conn=None, replication_role=False):
+    """
+    Транзакция, изменения которой не пишутся в журнал: для массовой загрузки строк.
+
+    По умолчанию — ALTER TABLE ... DISABLE TRIGGER на таблицах models до конца транзакции:
+    проверки внешних ключей остаются, но таблицы блокируются целиком. replication_role —
+    SET LOCAL session_replication_role = replica: без блокировок (куски одной таблицы
+    грузятся параллельно), но вместе с журналом отключаются и внешние ключи; нужны права
+    суперпользователя, без них — как по умолчанию.
+    """
+    conn = conn or connection
+    with transaction.atomic(using=conn.alias):
+        if conn.vendor != "postgresql" or (replication_role and _replica_role(conn)):
+            yield
+            return
+        qn = conn.ops.quote_name
+        with conn.cursor() as cursor:
+            tables = sorted({m._meta.db_table for m in models} & _triggered_tables(cursor))
+            for table in tables:
+                cursor.execute(f"ALTER TABLE {qn(table)} DISABLE TRIGGER {TRIGGER_NAME}")
+        yield
+        with conn.cursor() as cursor:
+            for table in tables:
+                cursor.execute(f"ALTER TABLE {qn(table)} ENABLE TRIGGER {TRIGGER_NAME}")
+
+
+def drop_triggers(models, conn=None):
+    conn = conn or connection
+    if conn.vendor != "postgresql":
+        return
+    qn = conn.ops.quote_name
+    with conn.cursor() as cursor:
+        for model in models:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON {qn(model._meta.db_table)}")
+        cursor.execute(f"DROP FUNCTION IF EXISTS {FUNCTION_NAME}()")
+
+
+def _changelog_ready():
+    global _changelog_exists
+    if not _changelog_exists:
+        from .models import BackupChangeLog
+        _changelog_exists = BackupChangeLog._meta.db_table in connection.introspection.table_names()
+    return _changelog_exists
+
+
+def record(model, instance, op):
+    """
+    Запись в журнал из сигнала — только там, где нет триггеров, и только для моделей из
+    бэкапа. Пока таблицы журнала нет (migrate до 0015), ничего не пишется.
+    """
+    if connection.vendor == "postgresql" or instance.pk is None:
+        return
+    from .backup_engine import backup_models
+    model = model._meta.concrete_model
+    if not is_tracked(model) or model not in backup_models() or not _changelog_ready():
+        return
+    from .models import BackupChangeLog
+    BackupChangeLog.objects.create(table_name=model._meta.db_table, row_pk=str(instance.pk), op=op)
+
+
+def _saved(sender, instance, created, **kwargs):
+    record(sender, instance, "I" if created else "U")
+
+
+def _deleted(sender, instance, **kwargs):
+    record(sender, instance, "D")
+
+
+def connect_signals():
+    """Журнал через сигналы для СУБД без триггеров; вызывается из StoreConfig.ready()."""
+    if connection.vendor == "postgresql":
+        return
+    from .backup_engine import backup_models
+    for model in backup_models():
+        if is_tracked(model):
+            label = model._meta.label_lower
+            post_save.connect(_saved, sender=model, dispatch_uid=f"store_backup_changes_save:{label}")
+            post_delete.connect(_deleted, sender=model, dispatch_uid=f"store_backup_changes_delete:{label}")
+
+
+def current_watermark():
+    """Граница журнала для бэкапа. Вызывать внутри транзакции снимка бэкапа."""
+    from .models import BackupChangeLog
+    watermark = {"changelog_id": BackupChangeLog.objects.order_by("-id").values_list("id", flat=True).first() or 0}
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT txid_current_snapshot()::text")
+            watermark["txid_snapshot"] = cursor.fetchone()[0]
+    return watermark
+
+
+def changed_rows(since):
+    """{db_table: {pk-строка, ...}} — строки, изменённые после бэкапа с водяным знаком since."""
+    from .models import BackupChangeLog
+    changes = {}
+    if connection.vendor == "postgresql" and since.get("txid_snapshot"):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT DISTINCT table_name, row_pk FROM {BackupChangeLog._meta.db_table} "
+                "WHERE txid >= txid_snapshot_xmin(%s::txid_snapshot) "
+                "AND NOT txid_visible_in_snapshot(txid, %s::txid_snapshot)",
+                [since["txid_snapshot"], since["txid_snapshot"]],
+            )
+            rows = cursor.fetchall()
+    else:
+        rows = (
+            BackupChangeLog.objects.filter(id__gt=since.get("changelog_id", 0))
+            .values_list("table_name", "row_pk").distinct().iterator()
+        )
+    for table, pk in rows:
+        changes.setdefault(table, set()).add(pk)
+    return changes
+
+
+def prune(watermark):
+    """Удаляет записи журнала, уже покрытые полным бэкапом с водяным знаком watermark."""
+    from .models import BackupChangeLog
+    table = connection.ops.quote_name(BackupChangeLog._meta.db_table)
+    # сырой DELETE: журнал может быть большим, строки в Python не нужны
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql" and watermark.get("txid_snapshot"):
+            cursor.execute(f"DELETE FROM {table} WHERE txid < txid_snapshot_xmin(%s::txid_snapshot)",
+                           [watermark["txid_snapshot"]])
+        else:
+            cursor.execute(f"DELETE FROM {table} WHERE id <= %s", [watermark.get("changelog_id", 0)])
+        return cursor.rowcount
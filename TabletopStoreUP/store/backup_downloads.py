@@ -0,0 +1,233 @@
+"""
+Выдача файлов из backups/ персоналу: докачка (Range / If-Range) и список бэкапов.
+
+ETag — sha256 файла, если он уже известен: запись манифеста бэкапа ndjson, имя блоба
+в хранилище медиа или <файл>.sha256 рядом с файлом (его пишет команда backup — ни
+выдача, ни список бэкапов файлы не читают). Иначе ETag строится из размера и mtime. Если задан BACKUP_DOWNLOAD_ACCEL_REDIRECT, файл
+отдаёт фронтовой nginx (X-Accel-Redirect) — и Range он обрабатывает сам. Без него полный
+файл идёт через FileResponse, то есть через wsgi.file_wrapper (sendfile в gunicorn/uwsgi).
+"""
+import datetime
+import hashlib
+import json
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.urls import reverse
+from django.utils.http import http_date
+
+from . import backup_engine, media_backup
+
+CHECKSUM_SUFFIX = ".sha256"
+LISTED = re.compile(r"^(backup_[\d_-]+(\.json)?|media_[\d_-]+\.(tar\.gz|json))$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def backup_root():
+    return Path(settings.BASE_DIR) / "backups"
+
+
+def resolve(filename):
+    """Путь к файлу внутри backups/; всё, что выходит за его пределы или не является файлом, — 404."""
+    root = backup_root().resolve()
+    path = (root / filename).resolve()
+    if root not in path.parents or not path.is_file() or path.name.endswith(CHECKSUM_SUFFIX):
+        raise Http404("Файл бэкапа не найден")
+    return path
+
+
+def _sha256(path, block=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def known_checksum(path, st=None):
+    """sha256 без чтения файла: из манифеста, имени блоба или свежего <файл>.sha256. None, если неизвестен."""
+    st = st or path.stat()
+    if path.parent.parent.name == "objects" and path.parents[2].name == media_backup.STORE_NAME:
+        return path.name
+    manifest_path = path.parent / backup_engine.MANIFEST_NAME
+    if path.name != backup_engine.MANIFEST_NAME and manifest_path.exists():
+        try:
+            manifest = backup_engine.read_manifest(path.parent)
+        except ValueError:
+            manifest = {"models": []}
+        for entry in manifest["models"]:
+            if entry["file"] == path.name:
+                return entry["sha256"]
+    try:
+        cached = json.loads(path.with_name(path.name + CHECKSUM_SUFFIX).read_text())
+    except (OSError, ValueError):
+        return None
+    if (cached.get("size"), cached.get("mtime_ns")) == (st.st_size, st.st_mtime_ns):
+        return cached.get("sha256")
+    return None
+
+
+def write_checksum(path):
+    """Считает sha256 готового файла бэкапа и пишет его в <файл>.sha256 рядом. Возвращает sha256."""
+    path = Path(path)
+    st = path.stat()
+    sha = _sha256(path)
+    path.with_name(path.name + CHECKSUM_SUFFIX).write_text(
+        json.dumps({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha})
+    )
+    return sha
+
+
+def etag(st, sha=None):
+    return f'"{sha}"' if sha else f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Один диапазон из заголовка Range → (start, end) включительно.
+    None — заголовок игнорируется (не bytes, несколько диапазонов, синтаксическая ошибка).
+    """
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0 or size == 0:
+                raise RangeNotSatisfiable
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class _FileRange:
+    """Отрезок открытого файла для FileResponse. fileno() оставлен, чтобы работал sendfile."""
+
+    def __init__(self, fh, start, length):
+        fh.seek(start)
+        self.fh, self.remaining, self.name = fh, length, fh.name
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.fh.fileno()
+
+    def close(self):
+        self.fh.close()
+
+
+def serve(request, path):
+    root = backup_root().resolve()
+    st = path.stat()
+    tag = etag(st, known_checksum(path, st))
+    last_modified = http_date(st.st_mtime)
+    common = {"ETag": tag, "Last-Modified": last_modified, "Accept-Ranges": "bytes"}
+
+    if tag in [t.strip() for t in request.headers.get("If-None-Match", "").split(",")]:
+        response = HttpResponseNotModified()
+        response["ETag"] = tag
+        return response
+
+    accel = getattr(settings, "BACKUP_DOWNLOAD_ACCEL_REDIRECT", "")
+    if accel:
+        response = HttpResponse(content_type="application/octet-stream")
+        response["X-Accel-Redirect"] = accel.rstrip("/") + "/" + quote(path.relative_to(root).as_posix())
+        response["Content-Disposition"] = f'attachment; filename="{path.name}"'
+        for header, value in common.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (not if_range or if_range.strip() in (tag, last_modified)):
+        try:
+            byte_range = parse_range(range_header, st.st_size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{st.st_size}"
+            for header, value in common.items():
+                response[header] = value
+            return response
+
+    fh = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(fh, as_attachment=True, filename=path.name)
+    else:
+        start, end = byte_range
+        response = FileResponse(_FileRange(fh, start, end - start + 1), as_attachment=True, filename=path.name)
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+        response["Content-Length"] = str(end - start + 1)
+    for header, value in common.items():
+        response[header] = value
+    return response
+
+
+def _file_info(path, root):
+    st = path.stat()
+    sha = known_checksum(path, st)  # без чтения файла; None — ETag из размера и mtime
+    rel = path.relative_to(root).as_posix()
+    return {
+        "name": rel,
+        "size": st.st_size,
+        "modified": datetime.datetime.fromtimestamp(st.st_mtime, datetime.timezone.utc).isoformat(),
+        "sha256": sha,
+        "etag": etag(st, sha),
+        "url": reverse("store:download_backup", args=[rel]),
+    }
+
+
+def list_backups():
+    """Бэкапы в backups/: дампы json, каталоги ndjson (по файлам), архивы и манифесты медиа."""
+    root = backup_root()
+    if not root.exists():
+        return []
+    items = []
+    for path in sorted(root.iterdir()):
+        if not LISTED.match(path.name):
+            continue
+        if path.is_dir():
+            try:
+                manifest = backup_engine.read_manifest(path)
+            except (OSError, ValueError):
+                continue  # незавершённый бэкап
+            files = [_file_info(path / entry["file"], root) for entry in manifest["models"]]
+            files.append(_file_info(path / backup_engine.MANIFEST_NAME, root))
+            items.append({
+                "name": path.name,
+                "type": "ndjson",
+                "kind": manifest.get("kind", "full"),
+                "parent": manifest.get("parent"),
+                "created_at": manifest["created_at"],
+                "size": sum(f["size"] for f in files),
+                "files": files,
+            })
+        else:
+            info = _file_info(path, root)
+            info["type"] = "json" if path.name.startswith("backup_") else (
+                "media-cas" if path.suffix == ".json" else "media"
+            )
+            items.append(info)
+    return items
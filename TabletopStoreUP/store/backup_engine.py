@@ -0,0 +1,651 @@
+"""
+Формат бэкапа «по таблицам»: каталог backups/backup_<ts>/ с файлом NDJSON на модель
+(gzip или zstd, если установлен zstandard) и manifest.json с числом строк, размером
+и sha256 каждого файла.
+
+Строка файла — JSON-массив значений колонок в порядке manifest["models"][i]["columns"]
+(attname полей, без натуральных ключей). Модели выгружаются параллельно отдельными
+процессами, каждая — потоковым iterator() кусками. На PostgreSQL все процессы читают
+один экспортированный снимок (pg_export_snapshot), как pg_dump -j, поэтому бэкап
+согласован, хотя таблицы читаются разными соединениями.
+
+Восстановление (restore_backup) грузит таблицы сырыми пакетными INSERT (на PostgreSQL —
+COPY), минуя модели: ни save(), ни сигналы не вызываются. Таблицы разбиваются на уровни
+по внешним ключам; таблицы одного уровня друг от друга не зависят и грузятся параллельно
+в отдельных потоках, каждая в своей транзакции с отложенной проверкой ограничений.
+
+Кроме полного (kind=full) бывают инкрементальный (родитель — последний бэкап любого вида)
+и дифференциальный (родитель — последний полный) бэкапы: в них попадают только строки из
+журнала изменений (backup_changes) после водяного знака родителя, id удалённых строк
+и целиком — through-таблицы M2M и таблицы, которых не было в родителе. Восстановление
+инкремента проигрывает цепочку от полного бэкапа.
+"""
+import base64
+import contextlib
+import datetime
+import decimal
+import gzip
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, connections, models, transaction
+from django.utils.duration import duration_iso_string
+
+try:
+    import zstandard
+except ImportError:  # сжатие zstd — опционально
+    zstandard = None
+
+FORMAT_NAME = "ndjson"
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+# служебные и диагностические таблицы: сессии, журналы, профили запросов
+EXCLUDED_MODELS = {
+    "sessions.session", "admin.logentry", "store.backupchangelog",
+    "store.requestprofile", "store.slowquery", "store.slowqueryfingerprint",
+    "store.salesrollupdirty",
+}
+COMPRESSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+
+def resolve_compression(name="auto"):
+    if name == "auto":
+        return "zstd" if zstandard is not None else "gzip"
+    if name == "zstd" and zstandard is None:
+        raise ValueError("Для zstd нужен пакет zstandard (pip install zstandard)")
+    if name not in COMPRESSIONS:
+        raise ValueError(f"Неизвестное сжатие: {name}")
+    return name
+
+
+def backup_models():
+    """Модели для бэкапа, включая through-таблицы M2M. Прокси и unmanaged пропускаются."""
+    for model in apps.get_models(include_auto_created=True):
+        opts = model._meta
+        if opts.proxy or not opts.managed or opts.label_lower in EXCLUDED_MODELS:
+            continue
+        yield model
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return duration_iso_string(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        # BinaryField.to_python принимает base64-строку
+        return base64.b64encode(bytes(value)).decode("ascii")
+    raise TypeError(f"Не сериализуется в JSON: {type(value).__name__}")
+
+
+class _HashingWriter(io.RawIOBase):
+    """Файл, который по ходу записи считает sha256 и размер сжатых данных."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.digest.update(b)
+        self.size += len(b)
+        return self.raw.write(b)
+
+
+@contextlib.contextmanager
+def open_compressed_writer(path, compression):
+    """Открывает файл на запись со сжатием. Отдаёт (поток, _HashingWriter)."""
+    with open(path, "wb") as raw:
+        hashing = _HashingWriter(raw)
+        if compression == "zstd":
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(hashing, closefd=False)
+        else:
+            stream = gzip.GzipFile(fileobj=hashing, mode="wb", compresslevel=5)
+        try:
+            yield stream, hashing
+        finally:
+            stream.close()
+
+
+def open_compressed_reader(path, compression):
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("Для чтения zstd-бэкапа нужен пакет zstandard")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return gzip.open(path, "rb")
+
+
+@contextlib.contextmanager
+def snapshot_transaction(snapshot_id=None):
+    """
+    Транзакция только на чтение с согласованным снимком. На PostgreSQL без snapshot_id
+    экспортирует снимок и отдаёт его id, с snapshot_id — подключается к чужому снимку.
+    Должна быть внешней: уровень изоляции задаётся до первого запроса транзакции.
+    """
+    if connection.vendor == "postgresql" and connection.in_atomic_block:
+        raise ValueError("Бэкап ndjson нельзя запускать внутри транзакции: снимку нужна своя (REPEATABLE READ)")
+    with transaction.atomic(durable=True):
+        if connection.vendor != "postgresql":
+            yield None
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            if snapshot_id:
+                cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot_id])
+            else:
+                cursor.execute("SELECT pg_export_snapshot()")
+                snapshot_id = cursor.fetchone()[0]
+        yield snapshot_id
+
+
+def _delta_rows(qs, pk_name, pks, chunk_size):
+    """Строки с первичными ключами из pks (кусками по chunk_size), по возрастанию ключа."""
+    pks = sorted(pks)
+    for i in range(0, len(pks), chunk_size):
+        yield from qs.filter(**{f"{pk_name}__in": pks[i:i + chunk_size]})
+
+
+def dump_model(label, directory, compression, chunk_size=5000, pks=None):
+    """
+    Выгружает одну модель в NDJSON-файл. Возвращает запись для манифеста.
+    С pks (строки первичных ключей из журнала) выгружаются только эти строки, а ключи,
+    которых в таблице уже нет, попадают в список удалённых.
+    """
+    model = apps.get_model(label)
+    fields = list(model._meta.concrete_fields)
+    attnames = [f.attname for f in fields]
+    pk = model._meta.pk
+    path = Path(directory) / f"{label}{COMPRESSIONS[compression]}"
+    t0 = time.perf_counter()
+    rows = 0
+    qs = model._base_manager.order_by(pk.attname).values_list(*attnames)
+    pk_pos = attnames.index(pk.attname)
+    if pks is not None:
+        wanted = {pk.to_python(value) for value in pks}
+        source = _delta_rows(qs, pk.attname, wanted, chunk_size)
+    else:
+        source = qs.iterator(chunk_size=chunk_size)
+    with open_compressed_writer(path, compression) as (stream, hashing):
+        buf = []
+        for row in source:
+            if pks is not None:
+                wanted.discard(row[pk_pos])
+            buf.append(json.dumps(row, default=_json_default, ensure_ascii=False, separators=(",", ":")))
+            if len(buf) >= chunk_size:
+                stream.write(("\n".join(buf) + "\n").encode("utf-8"))
+                rows += len(buf)
+                buf.clear()
+        if buf:
+            stream.write(("\n".join(buf) + "\n").encode("utf-8"))
+            rows += len(buf)
+    return {
+        "label": label,
+        "table": model._meta.db_table,
+        "file": path.name,
+        "rows": rows,
+        "bytes": hashing.size,
+        "sha256": hashing.digest.hexdigest(),
+        "columns": attnames,
+        "db_columns": [f.column for f in fields],
+        "mode": "full" if pks is None else "delta",
+        "deleted": sorted(wanted) if pks is not None else [],
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _dump_in_worker(label, directory, compression, chunk_size, snapshot_id, pks=None):
+    try:
+        with snapshot_transaction(snapshot_id):
+            return dump_model(label, directory, compression, chunk_size, pks)
+    finally:
+        connections.close_all()
+
+
+def file_sha256(path, block=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_manifest(directory, manifest):
+    tmp = Path(directory) / (MANIFEST_NAME + ".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, Path(directory) / MANIFEST_NAME)
+
+
+def read_manifest(directory):
+    path = Path(directory) / MANIFEST_NAME
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    if manifest.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path}: неизвестный формат бэкапа")
+    return manifest
+
+
+def list_backups(backup_dir):
+    """Завершённые бэкапы формата ndjson в каталоге: [(путь, манифест)] по времени создания."""
+    found = []
+    for path in Path(backup_dir).glob("backup_*"):
+        if (path / MANIFEST_NAME).exists():
+            try:
+                found.append((path, read_manifest(path)))
+            except ValueError:
+                continue
+    return sorted(found, key=lambda item: item[1]["created_at"])
+
+
+def find_parent(backup_dir, kind):
+    """Родитель для инкремента (последний бэкап) или дифференциального бэкапа (последний полный)."""
+    candidates = list_backups(backup_dir)
+    if kind == "differential":
+        candidates = [c for c in candidates if c[1]["kind"] == "full"]
+    if not candidates:
+        raise ValueError("Нет полного бэкапа ndjson, от которого можно строить цепочку")
+    return candidates[-1]
+
+
+def create_backup(directory, workers=4, compression="auto", chunk_size=5000, on_model_done=None, kind="full"):
+    """
+    Создаёт бэкап в каталоге directory. Манифест пишется последним, поэтому каталог
+    без manifest.json — незавершённый бэкап. Для kind=incremental/differential родитель
+    ищется рядом с directory.
+    """
+    from . import backup_changes
+
+    directory = Path(directory)
+    parent_path = parent = None
+    if kind != "full":
+        parent_path, parent = find_parent(directory.parent, kind)
+    directory.mkdir(parents=True, exist_ok=True)
+    compression = resolve_compression(compression)
+    models_to_dump = list(backup_models())
+    labels = [m._meta.label_lower for m in models_to_dump]
+    backup_changes.install_triggers(models_to_dump)
+    # SQLite — один писатель, а тестовая БД живёт в памяти процесса: выгружаем в этом же процессе
+    if connection.vendor == "sqlite":
+        workers = 1
+
+    t0 = time.perf_counter()
+    entries = []
+    with snapshot_transaction() as snapshot_id:
+        watermark = backup_changes.current_watermark()
+        if parent is None:
+            tasks = [(label, None) for label in labels]
+        else:
+            if not parent.get("watermark"):
+                raise ValueError(f"{parent_path.name} создан без журнала изменений — сначала нужен новый полный бэкап")
+            changes = backup_changes.changed_rows(parent["watermark"])
+            tasks = []
+            for model in models_to_dump:
+                label = model._meta.label_lower
+                if not backup_changes.is_tracked(model) or label not in parent["tracked"]:
+                    tasks.append((label, None))
+                elif model._meta.db_table in changes:
+                    tasks.append((label, sorted(changes[model._meta.db_table])))
+
+        if workers <= 1:
+            for label, pks in tasks:
+                entry = dump_model(label, directory, compression, chunk_size, pks)
+                entries.append(entry)
+                if on_model_done:
+                    on_model_done(entry)
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+                futures = [
+                    pool.submit(_dump_in_worker, label, str(directory), compression, chunk_size, snapshot_id, pks)
+                    for label, pks in tasks
+                ]
+                for future in as_completed(futures):
+                    entry = future.result()
+                    entries.append(entry)
+                    if on_model_done:
+                        on_model_done(entry)
+
+    entries.sort(key=lambda e: labels.index(e["label"]))
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "kind": kind,
+        "parent": parent_path.name if parent_path else None,
+        "base": (parent.get("base") or parent_path.name) if parent else None,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "vendor": connection.vendor,
+        "compression": compression,
+        "watermark": watermark,
+        "tracked": sorted(set(labels) | set(parent["tracked"] if parent else [])),
+        "seconds": round(time.perf_counter() - t0, 3),
+        "models": entries,
+    }
+    write_manifest(directory, manifest)
+    if kind == "full":
+        # записи журнала, покрытые полным бэкапом, больше не нужны ни одной будущей цепочке
+        backup_changes.prune(watermark)
+    return manifest
+
+
+# --- восстановление ---
+
+def verify_backup(directory, manifest, workers=4):
+    """Сверяет sha256 файлов с манифестом. Возвращает список проблем (пустой — всё цело)."""
+    directory = Path(directory)
+
+    def check(entry):
+        path = directory / entry["file"]
+        if not path.exists():
+            return f"{entry['file']}: файл отсутствует"
+        if file_sha256(path) != entry["sha256"]:
+            return f"{entry['file']}: не совпадает sha256"
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return [problem for problem in pool.map(check, manifest["models"]) if problem]
+
+
+def dependency_levels(labels):
+    """
+    Разбивает модели на уровни: модель попадает на уровень после всех моделей, на которые
+    ссылается. Ссылки на себя не учитываются; модели из циклов идут последним уровнем
+    одной группой (грузятся последовательно, в одной транзакции).
+    """
+    labels = list(labels)
+    known = set(labels)
+    deps = {}
+    for label in labels:
+        model = apps.get_model(label)
+        deps[label] = {
+            f.related_model._meta.label_lower
+            for f in model._meta.concrete_fields
+            if f.is_relation and f.related_model is not None
+        } & known - {label}
+    levels, done = [], set()
+    while len(done) < len(labels):
+        level = [label for label in labels if label not in done and deps[label] <= done]
+        if not level:
+            levels.append([[label for label in labels if label not in done]])
+            break
+        levels.append([[label] for label in level])
+        done.update(level)
+    return levels
+
+
+def _prepare_value(field, value, conn):
+    if value is None:
+        return None
+    if isinstance(field, models.JSONField):
+        return field.get_db_prep_save(value, conn)
+    return field.get_db_prep_save(field.to_python(value), conn)
+
+
+def _copy_text(field, value, conn):
+    """Значение в текстовом формате COPY."""
+    if value is None:
+        return "\\N"
+    if isinstance(field, models.JSONField):
+        text = json.dumps(value, ensure_ascii=False)
+    else:
+        value = field.get_db_prep_save(field.to_python(value), conn)
+        if value is None:
+            return "\\N"
+        if isinstance(value, bool):
+            text = "t" if value else "f"
+        elif isinstance(value, (bytes, memoryview)):
+            text = "\\x" + bytes(value).hex()
+        elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            text = value.isoformat()
+        else:
+            text = str(value)
+    return (
+        text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    )
+
+
+def _copy_rows(cursor, table, columns, payload):
+    """COPY ... FROM STDIN для psycopg2 (copy_expert) и psycopg 3 (cursor.copy)."""
+    qn = connection.ops.quote_name
+    sql = f"COPY {qn(table)} ({', '.join(qn(c) for c in columns)}) FROM STDIN"
+    raw = cursor.cursor
+    if hasattr(raw, "copy_expert"):
+        raw.copy_expert(sql, io.StringIO(payload))
+    else:
+        with raw.copy(sql) as copy:
+            copy.write(payload)
+
+
+def insert_rows(cursor, model, fields, rows, use_copy, conn=None):
+    """Пакетная вставка строк (значения по порядку fields) в таблицу модели: COPY или executemany."""
+    # сам объект соединения, а не прокси django.db.connection: преобразование идёт по каждому значению
+    conn = conn or connections["default"]
+    columns = [f.column for f in fields]
+    if use_copy:
+        lines = ("\t".join(_copy_text(f, value, conn) for f, value in zip(fields, row)) for row in rows)
+        _copy_rows(cursor, model._meta.db_table, columns, "\n".join(lines) + "\n")
+    else:
+        qn = conn.ops.quote_name
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            qn(model._meta.db_table), ", ".join(qn(c) for c in columns), ", ".join(["%s"] * len(columns)),
+        )
+        cursor.executemany(sql, [[_prepare_value(f, value, conn) for f, value in zip(fields, row)] for row in rows])
+
+
+def load_model(directory, entry, compression, chunk_size=10000, use_copy=None):
+    """Грузит одну таблицу из файла бэкапа в текущем соединении. Возвращает отчёт по таблице."""
+    model = apps.get_model(entry["label"])
+    conn = connections["default"]
+    use_copy = conn.vendor == "postgresql" if use_copy is None else use_copy
+    by_attname = {f.attname: f for f in model._meta.concrete_fields}
+    positions = [i for i, name in enumerate(entry["columns"]) if name in by_attname]
+    fields = [by_attname[entry["columns"][i]] for i in positions]
+
+    t0 = time.perf_counter()
+    rows = 0
+    with open_compressed_reader(Path(directory) / entry["file"], compression) as fh, conn.cursor() as cursor:
+        batch = []
+
+        def flush():
+            if not batch:
+                return
+            insert_rows(cursor, model, fields, [[row[i] for i in positions] for row in batch], use_copy, conn)
+            batch.clear()
+
+        for line in fh:
+            batch.append(json.loads(line))
+            rows += 1
+            if len(batch) >= chunk_size:
+                flush()
+        flush()
+
+    return {
+        "label": entry["label"],
+        "rows": rows,
+        "expected": entry["rows"],
+        "seconds": round(time.perf_counter() - t0, 3),
+        "method": "copy" if use_copy else "insert",
+        "dropped_columns": [c for c in entry["columns"] if c not in by_attname],
+    }
+
+
+@contextlib.contextmanager
+def _deferred_constraints(conn):
+    """Транзакция с проверкой внешних ключей при коммите (PostgreSQL) или после загрузки (прочие БД)."""
+    if conn.vendor == "postgresql":
+        with transaction.atomic(using=conn.alias):
+            with conn.cursor() as cursor:
+                cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+            yield
+    else:
+        # проверки отключаются до начала транзакции: внутри неё PRAGMA foreign_keys не действует
+        with conn.constraint_checks_disabled(), transaction.atomic(using=conn.alias):
+            yield
+
+
+def _load_group(directory, entries, compression, chunk_size, close_connection):
+    """Грузит группу таблиц последовательно в одной транзакции."""
+    from . import backup_changes
+    conn = connections["default"]
+    models = [apps.get_model(e["label"]) for e in entries]
+    try:
+        with _deferred_constraints(conn), backup_changes.paused(models, conn):
+            reports = [load_model(directory, entry, compression, chunk_size) for entry in entries]
+            if conn.vendor != "postgresql":
+                conn.check_constraints(table_names=[apps.get_model(e["label"])._meta.db_table for e in entries])
+        return reports
+    finally:
+        if close_connection:
+            conn.close()
+
+
+def reset_sequences(labels):
+    """Сдвигает последовательности автоинкремента за максимальные загруженные id."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [apps.get_model(label) for label in labels])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def backup_chain(directory):
+    """[(каталог, манифест)] от полного бэкапа до directory включительно."""
+    directory = Path(directory)
+    chain = [(directory, read_manifest(directory))]
+    while chain[-1][1]["kind"] != "full":
+        parent = directory.parent / chain[-1][1]["parent"]
+        if not (parent / MANIFEST_NAME).exists():
+            raise ValueError(f"Цепочка бэкапов разорвана: нет {parent.name}")
+        chain.append((parent, read_manifest(parent)))
+    chain.reverse()
+    return chain
+
+
+def _existing_entries(manifest):
+    entries = {}
+    for entry in manifest["models"]:
+        try:
+            apps.get_model(entry["label"])
+        except LookupError:
+            continue  # модель удалена из проекта после бэкапа
+        entries[entry["label"]] = entry
+    return entries
+
+
+def _file_pks(directory, entry, compression):
+    model = apps.get_model(entry["label"])
+    pos = entry["columns"].index(model._meta.pk.attname)
+    with open_compressed_reader(Path(directory) / entry["file"], compression) as fh:
+        return [json.loads(line)[pos] for line in fh]
+
+
+def _delete_rows(model, pks=None, chunk_size=1000):
+    """DELETE без ORM: без сигналов и каскадов (связанные строки приходят из того же инкремента)."""
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    pk = model._meta.pk
+    with connection.cursor() as cursor:
+        if pks is None:
+            cursor.execute(f"DELETE FROM {table}")
+            return
+        values = [pk.get_db_prep_value(pk.to_python(v), connection) for v in pks]
+        for i in range(0, len(values), chunk_size):
+            chunk = values[i:i + chunk_size]
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {qn(pk.column)} IN ({', '.join(['%s'] * len(chunk))})", chunk,
+            )
+
+
+def apply_increment(directory, manifest, chunk_size=10000):
+    """
+    Накатывает инкрементальный/дифференциальный бэкап одной транзакцией: строки из него
+    удаляются (от зависимых таблиц к родительским) и вставляются заново (в обратном порядке).
+    """
+    from . import backup_changes
+    entries = _existing_entries(manifest)
+    order = [label for level in dependency_levels(entries) for group in level for label in group]
+    compression = manifest["compression"]
+    models = [apps.get_model(label) for label in order]
+    with _deferred_constraints(connection), backup_changes.paused(models):
+        for label in reversed(order):
+            entry = entries[label]
+            model = apps.get_model(label)
+            if entry["mode"] == "full":
+                _delete_rows(model)
+            else:
+                _delete_rows(model, entry["deleted"] + _file_pks(directory, entry, compression))
+        reports = [load_model(directory, entries[label], compression, chunk_size) for label in order]
+        if connection.vendor != "postgresql":
+            connection.check_constraints(table_names=[apps.get_model(label)._meta.db_table for label in order])
+    return reports
+
+
+def restore_backup(directory, workers=4, flush=True, verify=True, chunk_size=10000, on_table_done=None):
+    """
+    Восстанавливает БД из бэкапа формата ndjson. Возвращает список отчётов по таблицам.
+    flush очищает БД без post_migrate: справочники, contenttypes и права берутся из бэкапа.
+    Загруженные строки в журнал изменений не попадают — после восстановления нужен новый
+    полный бэкап. Для инкремента сначала грузится полный бэкап цепочки, затем по порядку все инкременты.
+    """
+    chain = backup_chain(directory)
+    if verify:
+        for path, manifest in chain:
+            problems = verify_backup(path, manifest, workers)
+            if problems:
+                raise ValueError(f"Бэкап {path.name} повреждён: " + "; ".join(problems))
+
+    base_path, base = chain[0]
+    entries = _existing_entries(base)
+
+    if flush:
+        call_command("flush", interactive=False, verbosity=0, inhibit_post_migrate=True)
+
+    # SQLite — один писатель: грузим в этом же потоке
+    if connection.vendor == "sqlite":
+        workers = 1
+
+    reports = []
+
+    def collect(path, group_reports):
+        for report in group_reports:
+            report["backup"] = path.name
+            reports.append(report)
+            if on_table_done:
+                on_table_done(report)
+
+    for level in dependency_levels(entries):
+        groups = [[entries[label] for label in group] for group in level]
+        if workers <= 1:
+            results = [_load_group(base_path, g, base["compression"], chunk_size, False) for g in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(
+                    lambda g: _load_group(base_path, g, base["compression"], chunk_size, True), groups
+                ))
+        for group_reports in results:
+            collect(base_path, group_reports)
+
+    touched = set(entries)
+    for path, manifest in chain[1:]:
+        collect(path, apply_increment(path, manifest, chunk_size))
+        touched.update(_existing_entries(manifest))
+
+    reset_sequences(touched)
+    return reports
@@ -0,0 +1,303 @@
+"""
+Микробенчмарки основных сценариев: время ответа, число SQL-запросов и время в БД.
+
+Сценарий — запрос к приложению через django.test.Client в этом же процессе (без сети)
+или прямой вызов функции (импорт каталога). Запросы к БД считает обёртка
+connection.execute_wrapper. Весь прогон идёт в одной транзакции, которая в конце
+откатывается: служебные пользователи, корзины и заказы в базе не остаются. Изменяющие
+сценарии к тому же откатываются после каждого повтора (точка сохранения — её запросы
+тоже попадают в счёт), поэтому все повторы видят одни и те же данные. on_commit-колбэки
+при этом не выполняются, поэтому кэш store.cache на время прогона выключен (bypassed):
+страницы, посчитанные по откатываемым данным, не попадают в общий кэш, а замер
+показывает работу view, а не попадание в кэш.
+
+Результаты сохраняются в JSON и сравниваются с базовой линией: рост числа запросов —
+всегда регрессия, рост медианного времени — если он больше допуска и заметен в миллисекундах.
+"""
+import datetime
+import io
+import json
+import statistics
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from . import cache as store_cache
+from . import catalog_import, catalog_sync
+from .models import Cart, CartItem, Payment, PaymentMethod, PlayerRange, Product
+
+User = get_user_model()
+
+CATALOG_SORTS = ["new", "price_asc", "price_desc", "rating_desc", "rating_asc", "popular"]
+CATALOG_FILTERS = {
+    "all": lambda ctx: {},
+    "genre": lambda ctx: {"genre": ctx["genre_id"]},
+    "in_stock_price": lambda ctx: {"in_stock": "1", "price_min": "1000", "price_max": "5000"},
+    "players": lambda ctx: {"players": ctx["range_id"]},
+    "search": lambda ctx: {"q": ctx["search"]},
+    "rating": lambda ctx: {"rating_min": "4"},
+}
+IMPORT_ROWS = 500
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+@dataclass
+class Scenario:
+    name: str
+    path: object = None  # строка или callable(ctx) -> str
+    method: str = "get"
+    data: object = None  # dict или callable(ctx) -> dict
+    user: str = "anon"  # anon | customer | staff
+    mutates: bool = False
+    prepare: Optional[Callable] = None  # (ctx) -> None, до замера, внутри точки сохранения
+    func: Optional[Callable] = None  # вместо HTTP-запроса: (ctx) -> None
+    expect: tuple = (200,)
+
+
+@dataclass
+class Result:
+    name: str
+    wall_ms: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    db_ms: list = field(default_factory=list)
+
+    def summary(self):
+        wall = sorted(self.wall_ms)
+        return {
+            "wall_ms": round(statistics.median(wall), 2),
+            "wall_p95_ms": round(wall[min(len(wall) - 1, int(len(wall) * 0.95))], 2),
+            "queries": int(statistics.median(self.queries)),
+            "db_ms": round(statistics.median(self.db_ms), 2),
+            "runs": len(wall),
+        }
+
+
+class QueryMeter:
+    """Обёртка execute_wrapper: число запросов и суммарное время в БД."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - t0
+
+
+def _value(value, ctx):
+    return value(ctx) if callable(value) else value
+
+
+def _catalog_url(params):
+    query = urlencode(params, doseq=True)
+    return reverse("store:product_list") + (f"?{query}" if query else "")
+
+
+def _fill_cart(ctx, products=("popular_id", "regular_id")):
+    cart, _ = Cart.objects.get_or_create(user=ctx["customer"])
+    for key in products:
+        item, _ = CartItem.objects.update_or_create(cart=cart, product_id=ctx[key], defaults={"quantity": 2})
+        ctx["cart_item_id"] = item.id
+
+
+def _pending_card_payment(ctx):
+    _fill_cart(ctx)
+    ctx["clients"]["customer"].post(reverse("store:create_order"), {
+        "address": "ул. Бенчмарка, 1", "payment_method": ctx["card_method_id"],
+    })
+    ctx["payment_id"] = Payment.objects.filter(order__user=ctx["customer"]).latest("id").id
+
+
+def _import_catalog(ctx):
+    report = catalog_import.import_catalog(io.BytesIO(ctx["import_payload"]), "bench.ndjson")
+    if report.errors:
+        raise BenchmarkError(f"импорт: {report.errors[0]}")
+
+
+def default_scenarios():
+    scenarios = [
+        Scenario(f"catalog.{sort}.{flt}", path=lambda ctx, s=sort, f=make: _catalog_url({"sort": s, **f(ctx)}))
+        for sort in CATALOG_SORTS for flt, make in CATALOG_FILTERS.items()
+    ]
+    scenarios += [
+        Scenario("product_detail.popular", path=lambda ctx: reverse("store:product_detail", args=[ctx["popular_id"]])),
+        Scenario("product_detail.regular", path=lambda ctx: reverse("store:product_detail", args=[ctx["regular_id"]])),
+        Scenario("cart.detail", path=lambda ctx: reverse("store:cart_detail"), user="customer",
+                 mutates=True, prepare=_fill_cart),
+        Scenario("cart.add", path=lambda ctx: reverse("store:cart_add", args=[ctx["popular_id"]]),
+                 user="customer", mutates=True, expect=(302,)),
+        Scenario("cart.add_gate", path=lambda ctx: reverse("store:cart_add_gate", args=[ctx["popular_id"]]) + "?qty=2",
+                 user="customer", mutates=True, expect=(302,)),
+        Scenario("cart.remove", path=lambda ctx: reverse("store:cart_remove", args=[ctx["cart_item_id"]]),
+                 user="customer", mutates=True, prepare=_fill_cart, expect=(302,)),
+        Scenario("checkout.form", path=lambda ctx: reverse("store:create_order"), user="customer",
+                 mutates=True, prepare=_fill_cart),
+        Scenario("checkout.cod", path=lambda ctx: reverse("store:create_order"), method="post",
+                 data=lambda ctx: {"address": "ул. Бенчмарка, 1", "payment_method": ctx["cod_method_id"]},
+                 user="customer", mutates=True, prepare=_fill_cart, expect=(302,)),
+        Scenario("checkout.payment_callback", method="post",
+                 path=lambda ctx: reverse("store:payment_mock_callback", args=[ctx["payment_id"]]),
+                 data={"outcome": "success"}, user="customer", mutates=True,
+                 prepare=_pending_card_payment, expect=(302,)),
+        Scenario("api.products", path=lambda ctx: reverse("product-list")),
+        Scenario("api.products.top", path=lambda ctx: reverse("product-top")),
+        Scenario("api.products.stats", path=lambda ctx: reverse("product-stats")),
+        Scenario("analytics.dashboard", path=lambda ctx: reverse("admin_analytics"), user="staff"),
+        Scenario("catalog.export_csv", path=lambda ctx: reverse("store:catalog_export_csv"), user="staff"),
+        Scenario("catalog.export_json", path=lambda ctx: reverse("store:catalog_export_json"), user="staff"),
+        Scenario(f"catalog.import_{IMPORT_ROWS}", func=_import_catalog, mutates=True),
+    ]
+    return scenarios
+
+
+def _client_host():
+    hosts = [h for h in settings.ALLOWED_HOSTS if h and not h.startswith(".")]
+    if not hosts or "*" in hosts:
+        return "testserver"
+    return hosts[0]
+
+
+def build_context():
+    """Служебные пользователи и параметры сценариев. Вызывать внутри транзакции прогона."""
+    popular = (
+        Product.objects.annotate(n=Count("orderitem")).order_by("-n", "id").values_list("id", flat=True).first()
+    )
+    if popular is None:
+        raise BenchmarkError("Каталог пуст — сначала выполните generate_dataset")
+    regular = Product.objects.exclude(id=popular).order_by("?").values_list("id", flat=True).first() or popular
+    # остаток, которого хватит на все повторы оформления заказа
+    Product.objects.filter(id__in=[popular, regular]).update(stock=10 ** 6)
+    product = Product.objects.select_related("genre").get(id=popular)
+    methods = dict(PaymentMethod.objects.filter(is_active=True).values_list("code", "id"))
+    if not {"cod", "card"} <= set(methods):
+        raise BenchmarkError("Нет способов оплаты cod/card — выполните migrate")
+
+    suffix = uuid.uuid4().hex[:8]
+    customer = User.objects.create_user(f"bench_customer_{suffix}", password=None)
+    staff = User.objects.create_user(f"bench_staff_{suffix}", password=None, is_staff=True)
+    host = _client_host()
+    clients = {"anon": Client(HTTP_HOST=host), "customer": Client(HTTP_HOST=host), "staff": Client(HTTP_HOST=host)}
+    clients["customer"].force_login(customer)
+    clients["staff"].force_login(staff)
+
+    rows = [catalog_sync.product_row(p) for p in catalog_sync.catalog_queryset()[:IMPORT_ROWS]]
+    for row in rows:
+        row["stock"] += 1  # чтобы импорт обновлял товары, а не пропускал неизменённые
+    return {
+        "customer": customer,
+        "staff": staff,
+        "clients": clients,
+        "popular_id": popular,
+        "regular_id": regular,
+        "genre_id": product.genre_id,
+        "range_id": PlayerRange.objects.order_by("id").values_list("id", flat=True).first(),
+        "search": product.name.split()[0],
+        "cod_method_id": methods["cod"],
+        "card_method_id": methods["card"],
+        "import_payload": "\n".join(json.dumps(r, ensure_ascii=False) for r in rows).encode(),
+    }
+
+
+def _measure_once(scenario, ctx):
+    meter = QueryMeter()
+    client = ctx["clients"][scenario.user]
+    with connection.execute_wrapper(meter):
+        t0 = time.perf_counter()
+        if scenario.func:
+            scenario.func(ctx)
+        else:
+            response = getattr(client, scenario.method)(_value(scenario.path, ctx), _value(scenario.data, ctx))
+            if getattr(response, "streaming", False):
+                for _ in response.streaming_content:
+                    pass
+            if response.status_code not in scenario.expect:
+                raise BenchmarkError(f"{scenario.name}: ответ {response.status_code}, ожидался {scenario.expect}")
+        wall = time.perf_counter() - t0
+    return wall, meter
+
+
+def run_scenario(scenario, ctx, repeat=5, warmup=1):
+    result = Result(scenario.name)
+    for i in range(warmup + repeat):
+        if scenario.mutates:
+            with transaction.atomic():
+                if scenario.prepare:
+                    scenario.prepare(ctx)
+                wall, meter = _measure_once(scenario, ctx)
+                transaction.set_rollback(True)
+        else:
+            if scenario.prepare:
+                scenario.prepare(ctx)
+            wall, meter = _measure_once(scenario, ctx)
+        if i >= warmup:
+            result.wall_ms.append(wall * 1000)
+            result.queries.append(meter.count)
+            result.db_ms.append(meter.seconds * 1000)
+    return result
+
+
+def run(scenarios=None, repeat=5, warmup=1, only=None, on_result=None):
+    """Прогоняет сценарии в откатываемой транзакции. Возвращает {имя: сводка}."""
+    scenarios = scenarios or default_scenarios()
+    if only:
+        scenarios = [s for s in scenarios if any(pattern in s.name for pattern in only)]
+    results = {}
+    with store_cache.bypassed(), transaction.atomic():
+        ctx = build_context()
+        for scenario in scenarios:
+            summary = run_scenario(scenario, ctx, repeat=repeat, warmup=warmup).summary()
+            results[scenario.name] = summary
+            if on_result:
+                on_result(scenario.name, summary)
+        transaction.set_rollback(True)
+    return results
+
+
+def dataset_stats():
+    from .models import Order, Review
+    return {
+        "products": Product.objects.count(),
+        "orders": Order.objects.count(),
+        "reviews": Review.objects.count(),
+        "users": User.objects.count(),
+    }
+
+
+def make_report(results):
+    return {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "database": connection.vendor,
+        "dataset": dataset_stats(),
+        "scenarios": results,
+    }
+
+
+def compare(results, baseline, tolerance=0.25, min_delta_ms=2.0):
+    """Регрессии относительно базовой линии: [(сценарий, описание)]."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if current["queries"] > base["queries"]:
+            regressions.append((name, f"запросов {base['queries']} → {current['queries']}"))
+        delta = current["wall_ms"] - base["wall_ms"]
+        if delta > min_delta_ms and current["wall_ms"] > base["wall_ms"] * (1 + tolerance):
+            regressions.append((name, f"время {base['wall_ms']} → {current['wall_ms']} мс"))
+    return regressions
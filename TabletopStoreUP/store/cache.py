@@ -0,0 +1,442 @@
+"""
+Двухуровневый кэш с тегами.
+
+L1 — LRU в памяти процесса: не больше CACHE_L1_MAX_ENTRIES записей, каждая живёт в нём
+не дольше CACHE_L1_SECONDS. L2 — общий для процессов бэкенд CACHES["store"]: файлы или
+таблица локально, Redis / memcached в продакшене (см. CACHE_BACKEND в settings).
+Недоступный L2 не ломает запросы: кэш работает как L1 плюс пересчёт.
+
+Записи помечаются тегами: product:{id}, catalog, lookups, user:{id}. invalidate("product:7")
+сбрасывает сразу все записи тега — ключи перебирать не нужно. У тега в L2 хранится версия
+(время последнего сброса в нс), запись помнит версии своих тегов на момент расчёта и при
+чтении с другой версией считается промахом. Вытесненный из L2 тег получает новую версию,
+так что старые записи не «оживают». Свой сброс процесс видит сразу, сброс другого
+процесса — не позже чем через CACHE_TAG_CHECK_SECONDS.
+
+Защита от лавины пересчётов (stampede):
+- single-flight: при промахе значение считает один поток процесса и один процесс
+  (блокировка add в L2), остальные ждут готового значения до LOCK_TIMEOUT секунд;
+- раннее обновление (XFetch): незадолго до истечения записи — тем раньше, чем дольше
+  она считалась, — один читатель пересчитывает её заранее, остальные получают текущую.
+
+Значение для кэша считается с основной базы, даже внутри view с @replica_reads
+(db_routing.primary_reads).
+Значения из L1 отдаются без копирования, менять их на месте нельзя.
+Внутри bypassed() кэш не читается и не пополняется (бенчмарки в откатываемой транзакции).
+Счётчики — stats() и store_cache_requests_total{cache="tiered_l1"|"tiered_l2"} в /metrics.
+"""
+import contextlib
+import contextvars
+import functools
+import hashlib
+import inspect
+import logging
+import math
+import random
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.db import transaction
+from django.http import HttpResponse
+
+from . import db_routing, metrics
+
+logger = logging.getLogger("store.cache")
+
+ALIAS = "store"
+DEFAULT_TIMEOUT = 300
+LOCK_TIMEOUT = 10  # сколько живёт блокировка пересчёта и сколько её ждут другие процессы
+LOCK_POLL = 0.05
+BETA = 1.0  # XFetch: больше 1 — обновлять раньше
+KEY_VERSION = 1
+MAX_KEY_LENGTH = 200
+
+# запись: значение, версии тегов ((тег, версия), ...), срок (time.time()), время расчёта в секундах
+Entry = namedtuple("Entry", "value tags expires delta")
+
+_guard = threading.Lock()
+_stripes = [threading.RLock() for _ in range(64)]  # single-flight внутри процесса, по хэшу ключа
+_l1 = OrderedDict()  # ключ -> (Entry, до какого monotonic держать в L1)
+_tags = {}  # тег -> (версия, когда сверена с L2 по monotonic)
+_stats = Counter()
+_bypass = contextvars.ContextVar("store_cache_bypass", default=False)
+
+
+class _Uncacheable(Exception):
+    """compute вернул значение, которое не кладётся в кэш (см. cached_view)."""
+
+    def __init__(self, value):
+        self.value = value
+
+
+def backend():
+    """Кэш второго уровня; без CACHES["store"] — кэш по умолчанию."""
+    try:
+        return caches[ALIAS]
+    except InvalidCacheBackendError:
+        return caches["default"]
+
+
+def _l2(method, *args, default=None):
+    try:
+        return getattr(backend(), method)(*args)
+    except Exception as e:  # Redis лежит, нет таблицы кэша — работаем без L2
+        _count("l2_errors")
+        logger.warning("Кэш L2 недоступен (%s): %s", method, e)
+        return default
+
+
+def _count(name, n=1):
+    with _guard:
+        _stats[name] += n
+
+
+def _full_key(key):
+    key = f"v{KEY_VERSION}:{key}"
+    if len(key) > MAX_KEY_LENGTH or not key.isprintable() or " " in key:
+        return f"v{KEY_VERSION}:md5:{hashlib.md5(key.encode()).hexdigest()}"  # ограничения memcached
+    return key
+
+
+def _tag_key(tag):
+    return _full_key(f"tag:{tag}")
+
+
+def _lock_key(key):
+    return _full_key(f"lock:{key}")
+
+
+# --- теги ---
+
+def tag_versions(tags):
+    """{тег: версия}: из памяти процесса, если сверялись с L2 не раньше CACHE_TAG_CHECK_SECONDS назад."""
+    if not tags:
+        return {}
+    now = time.monotonic()
+    ttl = getattr(settings, "CACHE_TAG_CHECK_SECONDS", 1)
+    versions, stale = {}, []
+    with _guard:
+        for tag in tags:
+            known = _tags.get(tag)
+            if known is not None and now - known[1] < ttl:
+                versions[tag] = known[0]
+            else:
+                stale.append(tag)
+    if stale:
+        found = _l2("get_many", [_tag_key(t) for t in stale], default={})
+        for tag in stale:
+            version = found.get(_tag_key(tag))
+            if version is None:
+                # тега ещё нет или L2 его вытеснил: новая версия; add — вдруг другой процесс успел раньше
+                version = time.time_ns()
+                if not _l2("add", _tag_key(tag), version, None, default=True):
+                    version = _l2("get", _tag_key(tag)) or version
+            versions[tag] = version
+        with _guard:
+            for tag in stale:
+                _tags[tag] = (versions[tag], now)
+    return versions
+
+
+def invalidate(*tags):
+    """Сбрасывает все записи с любым из тегов."""
+    if not tags:
+        return
+    version = time.time_ns()
+    _l2("set_many", {_tag_key(t): version for t in tags}, None)
+    now = time.monotonic()
+    with _guard:
+        for tag in tags:
+            _tags[tag] = (version, now)
+        _stats["invalidations"] += len(tags)
+
+
+def invalidate_on_commit(*tags):
+    """
+    Сброс из обработчика сигнала: сразу и ещё раз после коммита — иначе параллельный
+    запрос успел бы закэшировать данные, которые транзакция вот-вот заменит.
+    """
+    invalidate(*tags)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: invalidate(*tags))
+
+
+# --- чтение и запись ---
+
+def _fresh(entry):
+    if entry.expires <= time.time():
+        return False
+    if not entry.tags:
+        return True
+    current = tag_versions([tag for tag, _ in entry.tags])
+    return all(current[tag] == version for tag, version in entry.tags)
+
+
+def _remember(key, entry):
+    limit = getattr(settings, "CACHE_L1_MAX_ENTRIES", 2000)
+    if limit <= 0:
+        return
+    seconds = min(getattr(settings, "CACHE_L1_SECONDS", 30), entry.expires - time.time())
+    with _guard:
+        _l1[key] = (entry, time.monotonic() + seconds)
+        _l1.move_to_end(key)
+        while len(_l1) > limit:
+            _l1.popitem(last=False)
+            _stats["l1_evictions"] += 1
+
+
+def _lookup(key):
+    """(запись, "l1" | "l2") или (None, None); истёкшие и сброшенные тегом записи — промах."""
+    with _guard:
+        held = _l1.get(key)
+        if held is not None:
+            if held[1] > time.monotonic():
+                _l1.move_to_end(key)
+            else:
+                del _l1[key]
+                held = None
+    if held is not None and _fresh(held[0]):
+        return held[0], "l1"
+    entry = _l2("get", _full_key(key))
+    if isinstance(entry, Entry) and _fresh(entry):
+        _remember(key, entry)
+        return entry, "l2"
+    return None, None
+
+
+def _record(level):
+    if level == "l1":
+        _count("l1_hits")
+        metrics.cache_lookup("tiered_l1", 1)
+    elif level == "l2":
+        _count("l2_hits")
+        metrics.cache_lookup("tiered_l1", 0, 1)
+        metrics.cache_lookup("tiered_l2", 1)
+    else:
+        _count("misses")
+        metrics.cache_lookup("tiered_l1", 0, 1)
+        metrics.cache_lookup("tiered_l2", 0, 1)
+
+
+def _store(key, value, timeout, versions, delta):
+    expires = math.inf if timeout is None else time.time() + timeout
+    entry = Entry(value, tuple(sorted(versions.items())), expires, delta)
+    _l2("set", _full_key(key), entry, timeout)
+    _remember(key, entry)
+
+
+def _compute(key, compute, timeout, tags):
+    # версии тегов — до расчёта: сброс во время расчёта сделает результат устаревшим
+    versions = tag_versions(tags)
+    t0 = time.perf_counter()
+    try:
+        with db_routing.primary_reads():  # отставшая реплика не должна попасть в кэш
+            value = compute()
+    except _Uncacheable as e:
+        return e.value
+    _count("computes")
+    _store(key, value, timeout, versions, time.perf_counter() - t0)
+    return value
+
+
+def _stripe(key):
+    return _stripes[zlib.crc32(key.encode()) % len(_stripes)]
+
+
+def _fill(key, compute, timeout, tags):
+    with _stripe(key):
+        entry, _ = _lookup(key)
+        if entry is not None:  # посчитал другой поток, пока ждали
+            _count("waits")
+            return entry.value
+        owner = _l2("add", _lock_key(key), 1, LOCK_TIMEOUT, default=True)
+        if not owner:
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL)
+                entry, _ = _lookup(key)
+                if entry is not None:
+                    _count("waits")
+                    return entry.value
+                if _l2("get", _lock_key(key)) is None:
+                    break  # другой процесс не досчитал (ошибка) — считаем сами
+        try:
+            return _compute(key, compute, timeout, tags)
+        finally:
+            if owner:
+                _l2("delete", _lock_key(key))
+
+
+def _refresh_early(entry):
+    # XFetch (Vattani и др., 2015): -ln(U) ~ Exp(1), запас пропорционален цене пересчёта
+    return time.time() - entry.delta * BETA * math.log(random.random() or 1e-12) >= entry.expires
+
+
+def _refresh(key, compute, timeout, tags, entry):
+    stripe = _stripe(key)
+    if not stripe.acquire(blocking=False):
+        return entry.value
+    try:
+        if not _l2("add", _lock_key(key), 1, LOCK_TIMEOUT, default=True):
+            return entry.value  # обновляет другой процесс
+        try:
+            _count("early_refreshes")
+            return _compute(key, compute, timeout, tags)
+        finally:
+            _l2("delete", _lock_key(key))
+    finally:
+        stripe.release()
+
+
+@contextlib.contextmanager
+def bypassed():
+    """
+    Кэш выключен: get_or_set каждый раз вызывает compute(), get ничего не находит, set
+    ничего не пишет. Для прогонов в транзакции, которая откатывается: посчитанное по
+    её данным не должно попасть в общий L2, а откат не сбросит теги (invalidate_on_commit).
+    """
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def is_bypassed():
+    return _bypass.get()
+
+
+def get_or_set(key, compute, timeout=DEFAULT_TIMEOUT, tags=()):
+    """Значение из L1/L2 или результат compute(), посчитанный одним вызывающим."""
+    if _bypass.get():
+        try:
+            return compute()
+        except _Uncacheable as e:
+            return e.value
+    entry, level = _lookup(key)
+    _record(level)
+    if entry is None:
+        return _fill(key, compute, timeout, tags)
+    if _refresh_early(entry):
+        return _refresh(key, compute, timeout, tags, entry)
+    return entry.value
+
+
+def get(key, default=None):
+    if _bypass.get():
+        return default
+    entry, level = _lookup(key)
+    _record(level)
+    return default if entry is None else entry.value
+
+
+def set(key, value, timeout=DEFAULT_TIMEOUT, tags=()):
+    if _bypass.get():
+        return
+    _store(key, value, timeout, tag_versions(tags), 0)
+
+
+def delete(key):
+    with _guard:
+        _l1.pop(key, None)
+    _l2("delete", _full_key(key))
+
+
+def stats():
+    """Счётчики этого процесса: попадания по уровням, промахи, пересчёты, ожидания, сбросы."""
+    with _guard:
+        data = dict(_stats)
+        data["l1_entries"] = len(_l1)
+    hits = data.get("l1_hits", 0) + data.get("l2_hits", 0)
+    lookups = hits + data.get("misses", 0)
+    data["hit_ratio"] = round(hits / lookups, 3) if lookups else None
+    return data
+
+
+def reset():
+    """Очищает L1, версии тегов и счётчики процесса (L2 не трогает)."""
+    with _guard:
+        _l1.clear()
+        _tags.clear()
+        _stats.clear()
+
+
+# --- декораторы ---
+
+def _resolver(func):
+    signature = inspect.signature(func)
+
+    def resolve(template, args, kwargs):
+        if callable(template):
+            return template(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return template.format(**bound.arguments)
+
+    return resolve
+
+
+def cached(key, timeout=DEFAULT_TIMEOUT, tags=()):
+    """
+    Кэширует результат функции. key и каждый тег — шаблон str.format по её аргументам
+    ("product:{obj.pk}:rating") или функция от тех же аргументов.
+    """
+    def decorator(func):
+        resolve = _resolver(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return get_or_set(
+                resolve(key, args, kwargs), lambda: func(*args, **kwargs), timeout,
+                [resolve(tag, args, kwargs) for tag in tags],
+            )
+
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
+
+
+def cached_view(timeout=DEFAULT_TIMEOUT, tags=(), anonymous_only=True):
+    """
+    Кэширует ответ GET/HEAD функции-view целиком; ключ — путь с параметрами, теги — шаблоны
+    по именованным аргументам URL ("product:{pk}"). По умолчанию только для анонимов: у
+    вошедшего страница зависит от его настроек и корзины. В кэш попадают только ответы 200
+    без cookie и без нового CSRF-токена; при непоказанных сообщениях кэш не используется.
+    Для класса — method_decorator(cached_view(...), name="dispatch").
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            from django.contrib.messages import get_messages
+
+            if (request.method not in ("GET", "HEAD")
+                    or (anonymous_only and request.user.is_authenticated)
+                    or len(get_messages(request))):
+                return view(request, *args, **kwargs)
+
+            def render():
+                response = view(request, *args, **kwargs)
+                if hasattr(response, "render") and callable(response.render):
+                    response.render()
+                if (response.status_code != 200 or response.streaming or response.cookies
+                        or request.META.get("CSRF_COOKIE_NEEDS_UPDATE")):
+                    raise _Uncacheable(response)
+                return response.status_code, response["Content-Type"], response.content
+
+            page = get_or_set(
+                f"view:{request.get_full_path()}", render, timeout,
+                [tag.format(**kwargs) for tag in tags],
+            )
+            if isinstance(page, HttpResponse):
+                return page
+            status, content_type, content = page
+            return HttpResponse(content, status=status, content_type=content_type)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,369 @@
+"""
+Пакетный импорт каталога.
+
+Файл читается потоково (CSV/TSV и NDJSON — построчно, JSON-массив — целиком, т.к. в stdlib
+нет потокового JSON-парсера), строки обрабатываются кусками. Перед стартом в память
+загружаются словари жанров, диапазонов игроков и товаров (id, имя без регистра → id),
+поэтому на кусок приходится фиксированное число запросов: bulk_create / bulk_update
+товаров и массовая запись связей в through-таблицу, каждый кусок — в своей транзакции.
+Счётчики и ошибки куска попадают в отчёт только после его коммита; если кусок откатился,
+из словарей убираются добавленные им id, а строки куска повторяются по одной — чтобы
+записать всё, что можно, и назвать в ошибке настоящую строку файла.
+В режиме dry_run ничего не пишется, а в отчёт попадает построчный diff.
+"""
+import csv
+import io
+import itertools
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache as store_cache
+from .models import Genre, PlayerRange, Product
+
+RANGE_RE = re.compile(r"^(\d+)\s*[-–]\s*(\d+)$")
+PRODUCT_FIELDS = ("name", "description", "price", "stock", "genre_id")
+MAX_DIFF_ENTRIES = 500
+MAX_ERRORS = 1000
+
+ProductRanges = Product.player_ranges.through
+
+
+@dataclass
+class ImportReport:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    rows: int = 0
+    errors: list = field(default_factory=list)
+    diff: list = field(default_factory=list)
+    dry_run: bool = False
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return round(self.rows / self.elapsed, 1) if self.elapsed else 0.0
+
+    def add_error(self, message):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+    def merge(self, other):
+        """Добавляет итоги куска (кроме rows — их считает run)."""
+        self.created += other.created
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        for message in other.errors:
+            self.add_error(message)
+        self.diff.extend(other.diff[:MAX_DIFF_ENTRIES - len(self.diff)])
+
+
+def detect_format(name, head: bytes):
+    """Формат по расширению, а если его нет — по первым байтам файла."""
+    ext = (name.rsplit(".", 1)[-1] if name and "." in name else "").lower()
+    if ext in ("csv", "tsv", "json", "ndjson", "jsonl"):
+        return "ndjson" if ext == "jsonl" else ext
+    stripped = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if stripped.startswith(b"["):
+        return "json"
+    if stripped.startswith(b"{"):
+        return "ndjson"
+    return "csv"
+
+
+def iter_rows(fileobj, name=""):
+    """Генератор (номер строки, dict) из бинарного файла."""
+    head = fileobj.read(2048)
+    fileobj.seek(0)
+    fmt = detect_format(name, head)
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="" if fmt in ("csv", "tsv") else None)
+    try:
+        if fmt in ("csv", "tsv"):
+            reader = csv.DictReader(text, delimiter="\t" if fmt == "tsv" else ",")
+            yield from enumerate(reader, start=1)
+        elif fmt == "ndjson":
+            idx = 0
+            for line in text:
+                if line.strip():
+                    idx += 1
+                    yield idx, json.loads(line)
+        else:
+            data = json.load(text)
+            if not isinstance(data, list):
+                raise ValueError("JSON должен быть списком объектов")
+            yield from enumerate(data, start=1)
+    finally:
+        # не даём TextIOWrapper закрыть исходный файл
+        text.detach()
+
+
+def _parse_ranges(raw):
+    items = raw.split(";") if isinstance(raw, str) else list(raw or [])
+    ranges = []
+    for s in items:
+        m = RANGE_RE.match(str(s).strip())
+        if m:
+            ranges.append((int(m.group(1)), int(m.group(2))))
+    return ranges
+
+
+def parse_row(row):
+    """Нормализует строку файла. Бросает ValueError с текстом ошибки."""
+    if not isinstance(row, dict):
+        raise ValueError("ожидался объект")
+    name = (row.get("name") or "").strip()
+    if not name:
+        raise ValueError("отсутствует name")
+    genre = (row.get("genre") or "").strip()
+    if not genre:
+        raise ValueError("отсутствует genre")
+    try:
+        price = Decimal(str(row.get("price") or "0")).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ValueError(f"некорректная цена: {row.get('price')!r}")
+    try:
+        stock = int(row.get("stock") or 0)
+    except (TypeError, ValueError):
+        raise ValueError(f"некорректный остаток: {row.get('stock')!r}")
+    pid = row.get("id")
+    try:
+        pid = int(pid) if pid not in (None, "") else None
+    except (TypeError, ValueError):
+        raise ValueError(f"некорректный id: {pid!r}")
+    return {
+        "id": pid,
+        "name": name,
+        "description": row.get("description") or "",
+        "price": price,
+        "stock": stock,
+        "genre": genre,
+        "ranges": _parse_ranges(row.get("player_ranges") or ""),
+    }
+
+
+class CatalogImporter:
+    def __init__(self, chunk_size=1000, dry_run=False, on_progress=None):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.on_progress = on_progress
+        self.report = ImportReport(dry_run=dry_run)
+        self._added = []  # (словарь или множество, ключ), добавленные текущим куском
+        self._planned = {}  # dry-run: фиктивный отрицательный id → строка товара, который был бы создан
+
+    # --- предзагрузка справочников ---
+
+    def _preload(self):
+        self.genres = dict(Genre.objects.values_list("name", "id"))
+        self.ranges = {}
+        for rid, mn, mx in PlayerRange.objects.order_by("id").values_list("id", "min_players", "max_players"):
+            self.ranges.setdefault((mn, mx), rid)
+        self.product_ids = set()
+        self.names = {}
+        for pid, name in Product.objects.order_by("id").values_list("id", "name").iterator(chunk_size=10_000):
+            self.product_ids.add(pid)
+            self.names.setdefault(name.lower(), pid)
+
+    def _add(self, store, key, value=None):
+        if key in store:
+            return
+        if isinstance(store, set):
+            store.add(key)
+        else:
+            store[key] = value
+        self._added.append((store, key))
+
+    def _forget_added(self):
+        """Откат куска: его жанры, диапазоны и товары в базе не остались."""
+        for store, key in reversed(self._added):
+            if isinstance(store, set):
+                store.discard(key)
+            else:
+                store.pop(key, None)
+        self._added.clear()
+
+    def _ensure_lookups(self, specs):
+        """Создаёт недостающие жанры и диапазоны игроков одним bulk_create на кусок."""
+        new_genres = {s["genre"] for s in specs} - self.genres.keys()
+        new_ranges = {r for s in specs for r in s["ranges"]} - self.ranges.keys()
+        if self.dry_run:
+            # в dry-run новым справочникам выдаются фиктивные отрицательные id
+            for name in new_genres:
+                self._add(self.genres, name, -len(self.genres) - 1)
+            for key in new_ranges:
+                self._add(self.ranges, key, -len(self.ranges) - 1)
+            return
+        if new_genres:
+            Genre.objects.bulk_create([Genre(name=n) for n in new_genres], ignore_conflicts=True)
+            for name, gid in Genre.objects.filter(name__in=new_genres).values_list("name", "id"):
+                self._add(self.genres, name, gid)
+        if new_ranges:
+            PlayerRange.objects.bulk_create([PlayerRange(min_players=a, max_players=b) for a, b in new_ranges])
+            for rid, mn, mx in PlayerRange.objects.order_by("id").values_list("id", "min_players", "max_players"):
+                self._add(self.ranges, (mn, mx), rid)
+
+    # --- обработка куска ---
+
+    def _process_chunk(self, chunk):
+        """Импортирует кусок одной транзакцией. Возвращает его итоги (ImportReport)."""
+        tally = ImportReport(dry_run=self.dry_run)
+        specs = []
+        for idx, row in chunk:
+            try:
+                spec = parse_row(row)
+            except ValueError as e:
+                tally.add_error(f"Строка {idx}: {e}")
+                continue
+            spec["row"] = idx
+            specs.append(spec)
+        if not specs:
+            return tally
+
+        with transaction.atomic():
+            self._ensure_lookups(specs)
+
+            # сопоставление с существующими: сначала по id, затем по имени без регистра;
+            # повторы одного нового товара внутри куска сливаются (побеждает последняя строка)
+            targets, new_specs = {}, {}
+            for s in specs:
+                s["genre_id"] = self.genres[s["genre"]]
+                s["range_ids"] = {self.ranges[r] for r in s["ranges"]}
+                pid = s["id"] if s["id"] in self.product_ids else self.names.get(s["name"].lower())
+                if pid is None:
+                    new_specs[s["name"].lower()] = s
+                else:
+                    targets[pid] = s
+
+            existing = Product.objects.only(*PRODUCT_FIELDS).in_bulk(list(targets))
+            current_ranges = {}
+            for pid, rid in ProductRanges.objects.filter(product_id__in=list(targets)).values_list("product_id", "playerrange_id"):
+                current_ranges.setdefault(pid, set()).add(rid)
+            for pid in targets.keys() & self._planned.keys():
+                # в dry-run товар из прошлого куска не записан — сравниваем с его строкой
+                planned = self._planned[pid]
+                existing[pid] = Product(**{f: planned[f] for f in PRODUCT_FIELDS})
+                current_ranges[pid] = planned["range_ids"]
+
+            to_update, ranges_changed = [], {}
+            now = timezone.now()
+            for pid, s in targets.items():
+                obj = existing.get(pid)
+                if obj is None:
+                    new_specs[s["name"].lower()] = s
+                    continue
+                changes = {
+                    f: (getattr(obj, f), s[f]) for f in PRODUCT_FIELDS if getattr(obj, f) != s[f]
+                }
+                old_ranges = current_ranges.get(pid, set())
+                if s["range_ids"] != old_ranges:
+                    changes["player_ranges"] = (sorted(old_ranges), sorted(s["range_ids"]))
+                    ranges_changed[pid] = s["range_ids"]
+                if not changes:
+                    tally.unchanged += 1
+                    continue
+                tally.updated += 1
+                self._add_diff(tally, s, "update", None if pid in self._planned else pid, changes)
+                for f in PRODUCT_FIELDS:
+                    setattr(obj, f, s[f])
+                obj.updated_at = now
+                to_update.append(obj)
+
+            tally.created += len(new_specs)
+            for s in new_specs.values():
+                self._add_diff(tally, s, "create", None, {f: (None, s[f]) for f in PRODUCT_FIELDS})
+
+            if self.dry_run:
+                # как и в записи, созданные товары попадают в справочник имён — повтор в следующем куске не создаст их снова
+                for s in new_specs.values():
+                    pid = -len(self._planned) - 1
+                    self._add(self._planned, pid, s)
+                    self._add(self.names, s["name"].lower(), pid)
+                for pid in targets.keys() & self._planned.keys():
+                    self._planned[pid] = targets[pid]
+                transaction.set_rollback(True)
+                return tally
+
+            if to_update:
+                Product.objects.bulk_update(
+                    to_update, ["name", "description", "price", "stock", "genre", "updated_at"]
+                )
+            if new_specs:
+                created = Product.objects.bulk_create([
+                    Product(name=s["name"], description=s["description"], price=s["price"],
+                            stock=s["stock"], genre_id=s["genre_id"])
+                    for s in new_specs.values()
+                ])
+                for obj, s in zip(created, new_specs.values()):
+                    self._add(self.product_ids, obj.pk)
+                    self._add(self.names, obj.name.lower(), obj.pk)
+                    if s["range_ids"]:
+                        ranges_changed[obj.pk] = s["range_ids"]
+
+            stale = [pid for pid in ranges_changed if pid in existing]
+            if stale:
+                ProductRanges.objects.filter(product_id__in=stale).delete()
+            if ranges_changed:
+                ProductRanges.objects.bulk_create([
+                    ProductRanges(product_id=pid, playerrange_id=rid)
+                    for pid, rids in ranges_changed.items() for rid in rids
+                ])
+            # bulk-операции не шлют сигналов — кэш сбрасывается здесь
+            store_cache.invalidate_on_commit(
+                "catalog", "lookups", *(f"product:{pid}" for pid in {*(o.pk for o in to_update), *stale})
+            )
+        return tally
+
+    def _add_diff(self, tally, spec, action, pid, changes):
+        if not self.dry_run or len(self.report.diff) + len(tally.diff) >= MAX_DIFF_ENTRIES:
+            return
+        tally.diff.append({
+            "row": spec["row"],
+            "action": action,
+            "id": pid,
+            "name": spec["name"],
+            "changes": {k: [str(a) if a is not None else None, str(b)] for k, (a, b) in changes.items()},
+        })
+
+    def _import_chunk(self, chunk):
+        try:
+            self.report.merge(self._process_chunk(chunk))
+            self._added.clear()
+            return
+        except Exception as e:
+            self._forget_added()
+            if len(chunk) == 1:
+                self.report.add_error(f"Строка {chunk[0][0]}: {e}")
+                return
+        for row in chunk:  # ищем строку, из-за которой откатился кусок
+            self._import_chunk([row])
+
+    def run(self, rows):
+        """Импортирует итерируемое (номер строки, dict). Возвращает ImportReport."""
+        t0 = time.perf_counter()
+        self._preload()
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.report.rows += len(chunk)
+            self._import_chunk(chunk)
+            self.report.elapsed = time.perf_counter() - t0
+            if self.on_progress:
+                self.on_progress(self.report)
+        self.report.elapsed = time.perf_counter() - t0
+        return self.report
+
+
+def import_catalog(fileobj, name="", dry_run=False, chunk_size=1000, on_progress=None):
+    """Импорт каталога из бинарного файла (CSV/TSV/JSON/NDJSON)."""
+    importer = CatalogImporter(chunk_size=chunk_size, dry_run=dry_run, on_progress=on_progress)
+    try:
+        return importer.run(iter_rows(fileobj, name))
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        importer.report.add_error(str(e))
+        return importer.report
@@ -0,0 +1,78 @@
+"""
+Инкрементальная выгрузка каталога.
+
+Каждый ответ несёт водяной знак (watermark) — момент, начиная с которого клиент запросит
+изменения в следующий раз. Изменённые товары находятся по индексу Product.updated_at,
+удалённые — по таблице ProductTombstone. Водяной знак берётся с небольшим запасом в прошлое,
+чтобы не потерять товары из транзакций, закоммиченных уже после чтения: такие товары
+просто придут ещё раз (клиент применяет изменения идемпотентно, по id).
+"""
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Product, ProductTombstone
+
+
+def watermark_overlap():
+    return datetime.timedelta(seconds=getattr(settings, "CATALOG_WATERMARK_OVERLAP_SECONDS", 5))
+
+
+def current_watermark():
+    return timezone.now() - watermark_overlap()
+
+
+def format_watermark(dt):
+    return dt.astimezone(datetime.timezone.utc).isoformat()
+
+
+def parse_watermark(value):
+    """Разбирает водяной знак из запроса. Бросает ValueError, если он некорректен."""
+    dt = parse_datetime((value or "").strip().replace(" ", "+"))
+    if dt is None:
+        raise ValueError(f"некорректный since: {value!r}")
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, datetime.timezone.utc)
+    return dt
+
+
+def catalog_queryset():
+    return Product.objects.select_related("genre").prefetch_related("player_ranges").order_by("id")
+
+
+def product_row(p):
+    """Товар в формате выгрузки каталога (как в catalog/export.json)."""
+    return {
+        "id": p.id,
+        "name": p.name,
+        "description": p.description,
+        "price": float(p.price),
+        "stock": p.stock,
+        "genre": p.genre.name if p.genre_id else None,
+        "player_ranges": [f"{r.min_players}-{r.max_players}" for r in p.player_ranges.all()],
+        "updated_at": format_watermark(p.updated_at),
+    }
+
+
+def changes_since(since=None):
+    """
+    Изменения каталога с момента since: изменённые/созданные товары и id удалённых.
+    Без since — полный снимок в том же формате.
+    """
+    watermark = current_watermark()
+    changed = catalog_queryset()
+    deleted = []
+    if since is not None:
+        changed = changed.filter(updated_at__gte=since)
+        deleted = list(
+            ProductTombstone.objects.filter(deleted_at__gte=since)
+            .order_by("product_id").values_list("product_id", flat=True).distinct()
+        )
+    return {
+        "watermark": format_watermark(watermark),
+        "since": format_watermark(since) if since is not None else None,
+        "changed": [product_row(p) for p in changed],
+        "deleted": deleted,
+    }
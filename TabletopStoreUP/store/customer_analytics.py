@@ -0,0 +1,239 @@
+"""
+Пакетная клиентская аналитика: RFM-оценки, когорты по месяцу первой покупки и матрица удержания.
+
+История заказов читается одним потоковым запросом (server-side cursor на PostgreSQL) кусками
+в колонки NumPy: на заказ уходит ~24 байта, без промежуточных Python-объектов на всю выборку.
+Все метрики считаются векторно после сортировки по (покупатель, дата).
+
+Пересчёт из админки идёт в отдельном процессе (start_background → build_customer_analytics);
+одновременно выполняется не больше одного пересчёта — блокировка в общем кэше store.
+"""
+import contextlib
+import datetime
+import itertools
+import os
+import subprocess
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache as store_cache
+from .models import Order, CustomerRFM, CohortRetention
+from .rollup import EXCLUDED_ORDER_STATUSES
+
+SECONDS_PER_DAY = 86400
+
+RUN_LOCK = "customer_analytics:running"
+RUN_LOCK_TIMEOUT = 3600  # упавший пересчёт не держит блокировку дольше
+
+SEGMENTS = ("champions", "loyal", "new", "promising", "at_risk", "hibernating", "lost")
+
+
+def load_order_history(chunk_size=100_000):
+    """Колонки (user_id int64, order_ts int64 секунд UTC, total float64) всех учитываемых заказов."""
+    rows = (
+        Order.objects
+        .exclude(status__name__in=EXCLUDED_ORDER_STATUSES)
+        .order_by()
+        .values_list("user_id", "order_date", "total")
+        .iterator(chunk_size=chunk_size)
+    )
+    users, stamps, totals = [], [], []
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        n = len(chunk)
+        users.append(np.fromiter((r[0] for r in chunk), dtype=np.int64, count=n))
+        stamps.append(np.fromiter((int(r[1].timestamp()) for r in chunk), dtype=np.int64, count=n))
+        totals.append(np.fromiter((r[2] for r in chunk), dtype=np.float64, count=n))
+    if not users:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.copy(), np.empty(0, dtype=np.float64)
+    return np.concatenate(users), np.concatenate(stamps), np.concatenate(totals)
+
+
+def quintile_scores(values, higher_is_better=True):
+    """Оценка 1..5 по квинтилям распределения."""
+    if values.size == 0:
+        return np.empty(0, dtype=np.int8)
+    edges = np.quantile(values, [0.2, 0.4, 0.6, 0.8])
+    # при совпадающих значениях (например, вся выборка за один день) сторона поиска
+    # выбирается так, чтобы одинаковые значения получали лучшую оценку
+    if higher_is_better:
+        return (np.searchsorted(edges, values, side="right") + 1).astype(np.int8)
+    return (5 - np.searchsorted(edges, values, side="left")).astype(np.int8)
+
+
+def segment_labels(r, f):
+    """Классическая сетка сегментов по R и F."""
+    conditions = [
+        (r >= 4) & (f >= 4),
+        (f >= 4),
+        (r >= 4) & (f <= 1),
+        (r >= 3) & (f <= 3),
+        (r <= 2) & (f >= 3),
+        (r == 2),
+    ]
+    return np.select(conditions, SEGMENTS[:6], default=SEGMENTS[6])
+
+
+def compute(users, stamps, totals, now_ts=None):
+    """
+    Векторный расчёт по колонкам заказов.
+    Возвращает словарь колонок по покупателям и разреженную матрицу удержания.
+    """
+    now_ts = int(now_ts if now_ts is not None else time.time())
+    order = np.lexsort((stamps, users))
+    users, stamps, totals = users[order], stamps[order], totals[order]
+
+    customer_ids, starts, counts = np.unique(users, return_index=True, return_counts=True)
+    if customer_ids.size == 0:
+        return {"customers": {}, "retention": []}
+    last_ts = stamps[starts + counts - 1]
+    monetary = np.add.reduceat(totals, starts)
+    recency_days = np.maximum(now_ts - last_ts, 0) // SECONDS_PER_DAY
+
+    r = quintile_scores(recency_days, higher_is_better=False)
+    f = quintile_scores(counts)
+    m = quintile_scores(monetary)
+
+    # Когорты: номер месяца с 1970-01 для каждого заказа и смещение от месяца первой покупки
+    months = stamps.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+    first_month = months[starts]
+    customer_idx = np.repeat(np.arange(customer_ids.size), counts)
+    offsets = months - first_month[customer_idx]
+
+    # Данные отсортированы по (покупатель, дата) — уникальные пары (покупатель, смещение) идут подряд
+    distinct = np.ones(offsets.size, dtype=bool)
+    distinct[1:] = (customer_idx[1:] != customer_idx[:-1]) | (offsets[1:] != offsets[:-1])
+    cohort_of_pair = first_month[customer_idx[distinct]]
+    offset_of_pair = offsets[distinct]
+
+    base_month = int(first_month.min())
+    width = int(offsets.max()) + 1
+    flat = (cohort_of_pair - base_month) * width + offset_of_pair
+    matrix = np.bincount(flat, minlength=(int(first_month.max()) - base_month + 1) * width)
+    matrix = matrix.reshape(-1, width)
+
+    cohort_rows, offset_cols = np.nonzero(matrix)
+    retention = [
+        (_month_to_date(base_month + int(c)), int(o), int(matrix[c, o]))
+        for c, o in zip(cohort_rows, offset_cols)
+    ]
+
+    return {
+        "customers": {
+            "user_id": customer_ids,
+            "recency_days": recency_days,
+            "frequency": counts,
+            "monetary": monetary,
+            "r": r, "f": f, "m": m,
+            "segment": segment_labels(r, f),
+            "cohort": first_month,
+        },
+        "retention": retention,
+    }
+
+
+def _month_to_date(month_index):
+    return datetime.date(1970 + month_index // 12, month_index % 12 + 1, 1)
+
+
+def persist(result, batch_size=5000):
+    """Заменяет содержимое CustomerRFM и CohortRetention результатом расчёта."""
+    now = timezone.now()
+    c = result["customers"]
+
+    def rfm_rows():
+        if not c:
+            return
+        columns = zip(
+            c["user_id"].tolist(), c["recency_days"].tolist(), c["frequency"].tolist(),
+            c["monetary"].tolist(), c["r"].tolist(), c["f"].tolist(), c["m"].tolist(),
+            c["segment"].tolist(), c["cohort"].tolist(),
+        )
+        for user_id, recency, frequency, monetary, r, f, m, segment, cohort in columns:
+            yield CustomerRFM(
+                user_id=user_id,
+                recency_days=recency,
+                frequency=frequency,
+                monetary=Decimal(f"{monetary:.2f}"),
+                r_score=r,
+                f_score=f,
+                m_score=m,
+                segment=segment,
+                cohort=_month_to_date(cohort),
+                computed_at=now,
+            )
+
+    with transaction.atomic():
+        CustomerRFM.objects.all().delete()
+        CohortRetention.objects.all().delete()
+        rows = rfm_rows()
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            CustomerRFM.objects.bulk_create(batch)
+        CohortRetention.objects.bulk_create(
+            [CohortRetention(cohort=co, month_offset=o, customers=n) for co, o, n in result["retention"]],
+            batch_size=batch_size,
+        )
+
+
+def run(chunk_size=100_000):
+    """Полный цикл: загрузка, расчёт, сохранение. Возвращает статистику с таймингами."""
+    t0 = time.perf_counter()
+    users, stamps, totals = load_order_history(chunk_size=chunk_size)
+    t1 = time.perf_counter()
+    result = compute(users, stamps, totals)
+    t2 = time.perf_counter()
+    persist(result)
+    t3 = time.perf_counter()
+    customers = result["customers"]
+    return {
+        "orders": int(users.size),
+        "customers": int(customers["user_id"].size) if customers else 0,
+        "cohort_cells": len(result["retention"]),
+        "load_s": t1 - t0,
+        "compute_s": t2 - t1,
+        "persist_s": t3 - t2,
+    }
+
+
+@contextlib.contextmanager
+def run_lock():
+    """True, если блокировка пересчёта взята этим процессом; False — пересчёт уже идёт."""
+    lock = store_cache.backend()
+    acquired = lock.add(RUN_LOCK, os.getpid(), RUN_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            lock.delete(RUN_LOCK)
+
+
+def is_running():
+    return store_cache.backend().get(RUN_LOCK) is not None
+
+
+def start_background():
+    """Запускает build_customer_analytics отдельным процессом. False — пересчёт уже идёт."""
+    if is_running():
+        return False
+    manage_py = Path(settings.BASE_DIR) / "manage.py"
+    subprocess.Popen(
+        [sys.executable, str(manage_py), "build_customer_analytics"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    return True
@@ -0,0 +1,362 @@
+"""
+Детерминированный синтетический набор данных для нагрузочного тестирования.
+
+Объёмы задаются параметрами (вплоть до сотен тысяч товаров и миллионов заказов).
+Все случайные величины берутся из numpy.random.default_rng([seed, таблица, номер куска]),
+поэтому при тех же seed, объёмах, размере куска и end_date получаются те же данные —
+независимо от числа процессов. Распределения:
+
+* популярность товаров — закон Ципфа (несколько хитов и длинный хвост), она же
+  определяет товары в заказах и число отзывов;
+* активность покупателей — тоже Ципф, только пологий;
+* даты заказов — рост продаж, выходные и сезонность с пиком перед Новым годом;
+* цены — логнормальные, состав и статусы заказов — согласованы между собой.
+
+Пользователи создаются через store.provisioning (профили и настройки — как у сигналов),
+остальные таблицы пишутся без ORM: COPY на PostgreSQL, executemany на прочих БД
+(backup_engine.insert_rows). У товаров и заказов id назначаются заранее — диапазоном
+после текущего максимума, поэтому куски генерируются в отдельных процессах без
+обращений друг к другу. Сигналы не срабатывают: дневной срез продаж после генерации
+нужно перестроить (команда generate_dataset делает это сама).
+"""
+import datetime
+import functools
+import math
+import uuid
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections
+from django.db.models import Max
+
+from . import backup_changes, backup_engine, provisioning
+from .models import (
+    Delivery, DeliveryMethod, DeliveryStatus, Genre, Order, OrderItem, OrderStatus, Payment,
+    PaymentMethod, PaymentStatus, PlayerRange, Product, Review,
+)
+
+User = get_user_model()
+ProductRanges = Product.player_ranges.through
+
+# номера потоков случайных чисел: [seed, таблица, кусок]
+STREAM_POPULARITY, STREAM_PRICES, STREAM_USERS, STREAM_PRODUCTS, STREAM_ORDERS, STREAM_REVIEWS, STREAM_ACTIVITY = range(7)
+
+MAX_ITEMS_PER_ORDER = 6
+PRODUCT_ZIPF = 1.1
+USER_ZIPF = 0.6
+
+# статус заказа → доля, статус оплаты, статус доставки
+ORDER_STATUS_MIX = [
+    ("Completed", 0.70, "Paid", "Delivered"),
+    ("Shipped", 0.07, "Paid", "Shipped"),
+    ("Awaiting Shipment", 0.04, "Paid", "Pending"),
+    ("Paid", 0.04, "Paid", "Pending"),
+    ("New", 0.06, "Pending", "Pending"),
+    ("Cancelled", 0.07, "Refunded", "Pending"),
+    ("Payment Failed", 0.02, "Failed", "Pending"),
+]
+RATING_P = [0.04, 0.06, 0.15, 0.33, 0.42]
+ADJECTIVES = ["Древние", "Тайные", "Звёздные", "Затерянные", "Великие", "Северные", "Механические", "Морские"]
+NOUNS = ["империи", "руины", "караваны", "драконы", "колонии", "замки", "острова", "шахты", "пираты"]
+COMMENTS = ["Отличная игра!", "Играем всей семьёй.", "Хорошие компоненты.", "Правила сложноваты.", "Не зашло."]
+STREETS = ["Ленина", "Мира", "Садовая", "Лесная", "Школьная", "Набережная"]
+
+
+def _rng(seed, stream, chunk=0):
+    return np.random.default_rng([seed, stream, chunk])
+
+
+def zipf_weights(n, s, rng):
+    """Вероятности Ципфа для n элементов в случайном порядке (чтобы хиты не шли подряд по id)."""
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+@functools.lru_cache(maxsize=4)
+def product_popularity(seed, n_products):
+    return zipf_weights(n_products, PRODUCT_ZIPF, _rng(seed, STREAM_POPULARITY))
+
+
+@functools.lru_cache(maxsize=4)
+def product_prices_cents(seed, n_products):
+    prices = _rng(seed, STREAM_PRICES).lognormal(mean=math.log(2500), sigma=0.55, size=n_products)
+    return (np.clip(np.round(prices, -1), 290, 40000) * 100).astype(np.int64)
+
+
+@functools.lru_cache(maxsize=4)
+def user_activity(seed, n_users):
+    return zipf_weights(n_users, USER_ZIPF, _rng(seed, STREAM_ACTIVITY))
+
+
+@functools.lru_cache(maxsize=4)
+def user_ids(prefix, n_users, run):
+    """
+    id сгенерированных пользователей по порядку номеров (username = prefix + номер).
+    Читаются один раз на процесс и запуск (run — метка запуска из плана).
+    """
+    rows = User.objects.filter(username__startswith=prefix).values_list("username", "id")
+    ids = np.zeros(n_users, dtype=np.int64)
+    for username, pk in rows.iterator(chunk_size=20000):
+        suffix = username[len(prefix):]
+        if suffix.isdigit() and int(suffix) < n_users:
+            ids[int(suffix)] = pk
+    if not ids.all():
+        raise ValueError("Не все пользователи набора созданы — запустите генерацию заново")
+    return ids
+
+
+def day_weights(start, days, growth=0.6):
+    """Вес каждого дня: рост продаж, выходные, зимний сезон и пик в декабре."""
+    dates = [start + datetime.timedelta(days=i) for i in range(days)]
+    doy = np.array([d.timetuple().tm_yday for d in dates], dtype=float)
+    weekday = np.array([d.weekday() for d in dates])
+    trend = 1 + growth * np.arange(days) / max(days - 1, 1)
+    season = 1 + 0.2 * np.cos(2 * np.pi * (doy - 15) / 365.25) + 0.9 * np.exp(-((doy - 352) / 12) ** 2)
+    weekend = np.where(weekday >= 5, 1.25, 1.0)
+    weights = trend * season * weekend
+    return weights / weights.sum()
+
+
+# вечерний пик покупок
+HOUR_WEIGHTS = np.array([1, 0.5, 0.3, 0.2, 0.2, 0.3, 0.6, 1, 1.5, 2, 2.5, 2.8,
+                         3, 3, 2.8, 2.8, 3, 3.4, 4, 4.6, 5, 4.4, 3.2, 2], dtype=float)
+HOUR_WEIGHTS /= HOUR_WEIGHTS.sum()
+
+
+def _cents(value):
+    return f"{value // 100}.{value % 100:02d}"
+
+
+def _write(model, field_names, rows):
+    if not rows:
+        return 0
+    fields = [model._meta.get_field(name) for name in field_names]
+    with connection.cursor() as cursor:
+        backup_engine.insert_rows(cursor, model, fields, rows, use_copy=connection.vendor == "postgresql")
+    return len(rows)
+
+
+def reference_ids():
+    """id справочников, созданных миграцией (seed_reference_and_demo)."""
+    def by_name(model):
+        return dict(model.objects.values_list("name", "id"))
+
+    refs = {
+        "genres": sorted(Genre.objects.values_list("id", flat=True)),
+        "ranges": sorted(PlayerRange.objects.values_list("id", flat=True)),
+        "order_status": by_name(OrderStatus),
+        "payment_status": by_name(PaymentStatus),
+        "delivery_status": by_name(DeliveryStatus),
+        "payment_methods": sorted(PaymentMethod.objects.filter(is_active=True).values_list("id", flat=True)),
+        "delivery_methods": sorted(DeliveryMethod.objects.values_list("id", flat=True)),
+    }
+    needed = {s for s, *_ in ORDER_STATUS_MIX}
+    missing = (needed - set(refs["order_status"])) \
+        | ({p for _, _, p, _ in ORDER_STATUS_MIX} - set(refs["payment_status"])) \
+        | ({d for *_, d in ORDER_STATUS_MIX} - set(refs["delivery_status"]))
+    if missing or not all(refs[k] for k in ("genres", "ranges", "payment_methods", "delivery_methods")):
+        raise ValueError(f"Нет справочников ({', '.join(sorted(missing)) or 'жанры/методы'}) — выполните migrate")
+    return refs
+
+
+def create_users(plan, chunk_size=5000, on_progress=None):
+    """Пользователи набора через provisioning: одинаковый пароль хэшируется один раз."""
+    password_hash = make_password(plan["password"])
+    rng = _rng(plan["seed"], STREAM_USERS)
+    joined = plan["start_ts"] + rng.random(plan["users"]) * plan["days"] * 86400 * 0.8
+    prefix = plan["user_prefix"]
+
+    def rows():
+        for i in range(plan["users"]):
+            yield {
+                "username": f"{prefix}{i:07d}",
+                "email": f"{prefix}{i:07d}@example.com",
+                "password_hash": password_hash,
+                "full_name": f"Покупатель {i}",
+                "date_joined": datetime.datetime.fromtimestamp(joined[i], datetime.timezone.utc).isoformat(),
+            }
+
+    return provisioning.provision_users(rows(), chunk_size=chunk_size, on_progress=on_progress)
+
+
+def generate_products(plan, chunk, start, stop):
+    rng = _rng(plan["seed"], STREAM_PRODUCTS, chunk)
+    n = stop - start
+    prices = product_prices_cents(plan["seed"], plan["products"])[start:stop]
+    genres = np.array(plan["refs"]["genres"])[rng.integers(0, len(plan["refs"]["genres"]), n)]
+    stock = rng.integers(0, 250, n)
+    adjectives = rng.integers(0, len(ADJECTIVES), n)
+    nouns = rng.integers(0, len(NOUNS), n)
+    now = plan["now"]
+    ids = plan["product_base"] + np.arange(start, stop)
+
+    products = [
+        (int(pk), f"{ADJECTIVES[a]} {NOUNS[b]} #{pk}", f"Синтетический товар набора {plan['seed']}.",
+         _cents(int(price)), int(s), int(g), now)
+        for pk, a, b, price, s, g in zip(ids, adjectives, nouns, prices, stock, genres)
+    ]
+    ranges = np.array(plan["refs"]["ranges"])
+    first = rng.integers(0, len(ranges), n)
+    second = rng.integers(0, len(ranges), n)
+    has_second = rng.random(n) < 0.35
+    links = [(int(pk), int(ranges[a])) for pk, a in zip(ids, first)]
+    links += [(int(pk), int(ranges[b])) for pk, a, b, extra in zip(ids, first, second, has_second) if extra and a != b]
+
+    _write(Product, ["id", "name", "description", "price", "stock", "genre", "updated_at"], products)
+    _write(ProductRanges, ["product", "playerrange"], links)
+    return {"products": len(products), "product_ranges": len(links)}
+
+
+def generate_orders(plan, chunk, start, stop):
+    """Заказы [start, stop) с позициями, оплатами и доставками."""
+    seed, refs = plan["seed"], plan["refs"]
+    rng = _rng(seed, STREAM_ORDERS, chunk)
+    n = stop - start
+    n_products = plan["products"]
+    order_ids = plan["order_base"] + np.arange(start, stop)
+
+    days = rng.choice(plan["days"], size=n, p=day_weights(plan["start_date"], plan["days"]))
+    seconds = rng.choice(24, size=n, p=HOUR_WEIGHTS) * 3600 + rng.integers(0, 3600, n)
+    order_ts = plan["start_ts"] + days * 86400 + seconds
+    buyers = user_ids(plan["user_prefix"], plan["users"], plan["run"])[rng.choice(plan["users"], size=n, p=user_activity(seed, plan["users"]))]
+
+    status_p = np.array([p for _, p, _, _ in ORDER_STATUS_MIX])
+    status_idx = rng.choice(len(ORDER_STATUS_MIX), size=n, p=status_p / status_p.sum())
+
+    # позиции: товары по популярности, повторы внутри заказа схлопываются (unique order+product)
+    counts = 1 + np.minimum(rng.poisson(0.8, n), MAX_ITEMS_PER_ORDER - 1)
+    item_order = np.repeat(np.arange(n), counts)
+    item_product = rng.choice(n_products, size=item_order.size, p=product_popularity(seed, n_products))
+    _, first = np.unique(item_order * n_products + item_product, return_index=True)
+    item_order, item_product = item_order[first], item_product[first]
+    quantity = np.minimum(rng.geometric(0.7, item_order.size), 5)
+    price = product_prices_cents(seed, n_products)[item_product]
+    totals = np.bincount(item_order, weights=quantity * price, minlength=n).astype(np.int64)
+
+    def ts(value):
+        return datetime.datetime.fromtimestamp(float(value), datetime.timezone.utc)
+
+    order_status = [refs["order_status"][s] for s, *_ in ORDER_STATUS_MIX]
+    payment_status = [refs["payment_status"][p] for _, _, p, _ in ORDER_STATUS_MIX]
+    delivery_status = [refs["delivery_status"][d] for *_, d in ORDER_STATUS_MIX]
+    pay_methods = np.array(refs["payment_methods"])[rng.integers(0, len(refs["payment_methods"]), n)]
+    del_methods = np.array(refs["delivery_methods"])[rng.integers(0, len(refs["delivery_methods"]), n)]
+    pay_delay = rng.integers(30, 3600, n)
+    houses = rng.integers(1, 200, n)
+    streets = rng.integers(0, len(STREETS), n)
+
+    written = {
+        "orders": _write(Order, ["id", "user", "order_date", "status", "total"], [
+            (int(pk), int(u), ts(t), order_status[s], _cents(int(total)))
+            for pk, u, t, s, total in zip(order_ids, buyers, order_ts, status_idx, totals)
+        ]),
+        "order_items": _write(OrderItem, ["order", "product", "quantity", "price"], [
+            (int(order_ids[o]), int(plan["product_base"] + p), int(q), _cents(int(c)))
+            for o, p, q, c in zip(item_order, item_product, quantity, price)
+        ]),
+        "payments": _write(Payment, ["order", "amount", "payment_date", "status", "method"], [
+            (int(pk), _cents(int(total)), ts(t + d), payment_status[s], int(m))
+            for pk, total, t, d, s, m in zip(order_ids, totals, order_ts, pay_delay, status_idx, pay_methods)
+        ]),
+        "deliveries": _write(Delivery, ["order", "address", "method", "status"], [
+            (int(pk), f"ул. {STREETS[st]}, д. {h}", int(m), delivery_status[s])
+            for pk, st, h, m, s in zip(order_ids, streets, houses, del_methods, status_idx)
+        ]),
+    }
+    return written
+
+
+def review_counts(plan):
+    """Сколько отзывов у каждого товара: по популярности, не больше числа пользователей."""
+    counts = _rng(plan["seed"], STREAM_REVIEWS).multinomial(plan["reviews"], product_popularity(plan["seed"], plan["products"]))
+    return np.minimum(counts, plan["users"])
+
+
+def generate_reviews(plan, chunk, start, stop):
+    """Отзывы на товары [start, stop): пара (товар, пользователь) уникальна внутри куска, а значит и везде."""
+    rng = _rng(plan["seed"], STREAM_REVIEWS, chunk + 1)
+    counts = review_counts(plan)[start:stop]
+    review_product = np.repeat(np.arange(start, stop), counts)
+    review_user = rng.integers(0, plan["users"], review_product.size)
+    _, first = np.unique(review_product * plan["users"] + review_user, return_index=True)
+    review_product, review_user = review_product[first], review_user[first]
+    m = review_product.size
+    ratings = rng.choice(5, size=m, p=RATING_P) + 1
+    comments = rng.integers(-len(COMMENTS), len(COMMENTS), m)  # отрицательные — без текста
+    created = plan["start_ts"] + rng.random(m) * plan["days"] * 86400
+    ids = user_ids(plan["user_prefix"], plan["users"], plan["run"])
+
+    rows = [
+        (int(plan["product_base"] + p), int(ids[u]), int(r), COMMENTS[c] if c >= 0 else None,
+         datetime.datetime.fromtimestamp(float(t), datetime.timezone.utc))
+        for p, u, r, c, t in zip(review_product, review_user, ratings, comments, created)
+    ]
+    return {"reviews": _write(Review, ["product", "user", "rating", "comment", "created_at"], rows)}
+
+
+GENERATORS = {"products": generate_products, "orders": generate_orders, "reviews": generate_reviews}
+
+
+# таблицы, которые пишет генератор, — для отключения журнала изменений бэкапов
+GENERATED_MODELS = {
+    "products": [Product, ProductRanges],
+    "orders": [Order, OrderItem, Payment, Delivery],
+    "reviews": [Review],
+}
+
+
+def run_task(plan, kind, chunk, start, stop):
+    """
+    Один кусок одной таблицы в своей транзакции. Возвращает {таблица: строк}.
+    Строки набора не пишутся в журнал изменений бэкапов (после генерации — полный бэкап).
+    """
+    with backup_changes.paused(GENERATED_MODELS[kind], replication_role=True):
+        return GENERATORS[kind](plan, chunk, start, stop)
+
+
+def run_task_in_worker(plan, kind, chunk, start, stop):
+    try:
+        return run_task(plan, kind, chunk, start, stop)
+    finally:
+        connections.close_all()
+
+
+def build_plan(seed=42, users=1000, products=500, orders=5000, reviews=5000, days=730,
+               end_date=None, password="demo12345"):
+    """Параметры генерации: объёмы, справочники, стартовые id товаров и заказов."""
+    if min(users, products) < 1 or min(orders, reviews, days) < 0:
+        raise ValueError("Нужен хотя бы один пользователь и один товар")
+    end_date = end_date or datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=days)
+    start_ts = datetime.datetime.combine(start_date, datetime.time(), datetime.timezone.utc).timestamp()
+    return {
+        "seed": seed,
+        "users": users,
+        "products": products,
+        "orders": orders,
+        "reviews": reviews,
+        "days": max(days, 1),
+        "start_date": start_date,
+        "start_ts": start_ts,
+        "now": datetime.datetime.combine(end_date, datetime.time(), datetime.timezone.utc),
+        "password": password,
+        "user_prefix": f"ds{seed}_",
+        "run": uuid.uuid4().hex,
+        "refs": reference_ids(),
+        "product_base": (Product.objects.aggregate(m=Max("id"))["m"] or 0) + 1,
+        "order_base": (Order.objects.aggregate(m=Max("id"))["m"] or 0) + 1,
+    }
+
+
+def tasks(plan, chunk_size):
+    """Куски по фазам: товары, затем заказы и отзывы (они ссылаются на товары)."""
+    def split(kind, total):
+        return [(kind, i, start, min(start + chunk_size, total))
+                for i, start in enumerate(range(0, total, chunk_size))]
+
+    review_chunk = max(1, chunk_size * plan["products"] // max(plan["reviews"], 1))
+    reviews = [("reviews", i, start, min(start + review_chunk, plan["products"]))
+               for i, start in enumerate(range(0, plan["products"], review_chunk))] if plan["reviews"] else []
+    return [split("products", plan["products"]), split("orders", plan["orders"]) + reviews]
@@ -0,0 +1,185 @@
+"""
+Соединения с БД: метрики выдачи соединений и пула, бенчмарк режимов.
+
+Режимы задаются в settings (DB_POOL, DB_CONN_MAX_AGE):
+- new — соединение на каждый запрос (CONN_MAX_AGE=0, как было);
+- persistent — соединение живёт CONN_MAX_AGE секунд и переиспользуется запросами
+  этого потока; перед повторным использованием проверяется (CONN_HEALTH_CHECKS);
+- pool — пул psycopg 3 на процесс (OPTIONS["pool"]): min_size соединений открыто
+  всегда, при нагрузке пул растёт до max_size, сверх этого запрос ждёт соединение
+  не дольше timeout секунд, а если ждущих уже max_waiting — сразу получает ошибку.
+
+Бэкенд store.pg_backend замеряет выдачу соединения (подключение или ожидание в пуле)
+и после каждого возврата соединения записывает состояние пула в /metrics.
+"""
+import random
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.utils import load_backend
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+MODES = ("new", "persistent", "pool")
+PERSISTENT_MAX_AGE = 600
+
+ACQUIRE = metrics.Histogram(
+    "store_db_connection_acquire_seconds",
+    "Выдача соединения: подключение к БД (direct) или ожидание свободного соединения пула (pool).",
+    ["alias", "mode"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+ACQUIRE_ERRORS = metrics.Counter(
+    "store_db_connection_errors", "Не удалось получить соединение (PoolTimeout, TooManyRequests, отказ БД).",
+    ["alias", "error"],
+)
+POOL = metrics.Gauge(
+    "store_db_pool_connections",
+    "Пул соединений: size — открыто, in_use — выдано, available — свободно, max — предел, waiting — ждут.",
+    ["alias", "state"],
+)
+
+
+def record_acquire(wrapper, seconds):
+    ACQUIRE.observe(seconds, alias=wrapper.alias, mode="pool" if wrapper.pool else "direct")
+    if wrapper.pool:
+        record_pool(wrapper)
+
+
+def record_error(wrapper, error):
+    ACQUIRE_ERRORS.inc(alias=wrapper.alias, error=type(error).__name__)
+
+
+def record_pool(wrapper):
+    stats = wrapper.pool.get_stats()
+    size, available = stats.get("pool_size", 0), stats.get("pool_available", 0)
+    for state, value in (("size", size), ("available", available), ("in_use", size - available),
+                         ("max", stats.get("pool_max", 0)), ("waiting", stats.get("requests_waiting", 0))):
+        POOL.set(value, alias=wrapper.alias, state=state)
+
+
+def pool_unavailable_reason():
+    """None, если режим pool возможен; иначе причина."""
+    if connections[DEFAULT_DB_ALIAS].vendor != "postgresql":
+        return "пул есть только у PostgreSQL"
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return 'нужен пакет psycopg[pool] (psycopg 3)'
+    return None
+
+
+def _config(mode, pool_options):
+    base = connections[DEFAULT_DB_ALIAS].settings_dict
+    options = {k: v for k, v in base["OPTIONS"].items() if k != "pool"}
+    config = {**base, "OPTIONS": options, "CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False}
+    if mode == "persistent":
+        config.update(CONN_MAX_AGE=PERSISTENT_MAX_AGE, CONN_HEALTH_CHECKS=True)
+    elif mode == "pool":
+        options["pool"] = dict(pool_options)
+        config["CONN_HEALTH_CHECKS"] = True
+    return config
+
+
+def _queries():
+    """Лёгкий запрос страницы: товар и справочник жанров — здесь заметна цена соединения."""
+    from .models import Genre, Product
+
+    product = Product.objects.filter(pk=0).values("id", "name", "price", "stock").query.sql_with_params()[0]
+    genres = Genre.objects.values_list("id", "name").query.sql_with_params()
+    return product, genres
+
+
+def _client(config, alias, mode, requests, product_ids, queries, stats, rng):
+    # своё соединение на поток, как у воркера; в connections оно не регистрируется
+    connection = load_backend(config["ENGINE"]).DatabaseWrapper(config, alias)
+    product_sql, (genres_sql, genres_params) = queries
+    try:
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            error = None
+            # как request_started / request_finished: устаревшее соединение закрывается или уходит в пул
+            connection.close_if_unusable_or_obsolete()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(product_sql, [rng.choice(product_ids)])
+                    cursor.fetchall()
+                    cursor.execute(genres_sql, genres_params)
+                    cursor.fetchall()
+            except DatabaseError as e:
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                connection.close_if_unusable_or_obsolete()
+            stats.record(mode, time.perf_counter() - t0, error)
+    finally:
+        connection.close()
+        if mode == "pool" and connection.pool:
+            stats.pool = connection.pool.get_stats()
+
+
+def run(modes=MODES, concurrency=20, requests=200, pool_options=None, seed=None):
+    """
+    Для каждого режима concurrency потоков выполняют по requests «запросов».
+    Возвращает {режим: сводка} с rps, p50/p95/p99, числом подключений и статистикой пула.
+    """
+    # модели и Stats — не при импорте: модуль грузит бэкенд БД, возможно, до готовности приложений
+    from .loadtest import Stats
+    from .models import Product
+
+    product_ids = list(Product.objects.values_list("id", flat=True)[:1000])
+    if not product_ids:
+        raise ValueError("Нет товаров — выполните generate_dataset")
+    queries = _queries()
+    pool_options = pool_options or {"min_size": 2, "max_size": concurrency, "timeout": 10}
+    master = random.Random(seed)
+    report = {}
+    for mode in modes:
+        if mode == "pool" and pool_unavailable_reason():
+            report[mode] = {"skipped": pool_unavailable_reason()}
+            continue
+        alias = f"benchmark_{mode}"
+        config = _config(mode, pool_options)
+        connects = []
+        lock = threading.Lock()
+
+        def on_connect(sender, connection, **kwargs):
+            if connection.alias == alias:
+                with lock:
+                    connects.append(1)
+
+        connection_created.connect(on_connect, weak=False)
+        stats = Stats()
+        stats.pool = None
+        threads = [
+            threading.Thread(target=_client, args=(config, alias, mode, requests, product_ids, queries, stats,
+                                                   random.Random(master.random())))
+            for _ in range(concurrency)
+        ]
+        try:
+            t0 = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - t0
+        finally:
+            connection_created.disconnect(on_connect)
+            if mode == "pool":
+                load_backend(config["ENGINE"]).DatabaseWrapper(config, alias).close_pool()
+        summary = stats.summary(elapsed)
+        step = summary["endpoints"].get(mode, {})
+        report[mode] = {
+            "requests": summary["requests"],
+            "errors": summary["errors"],
+            "rps": summary["rps"],
+            "p50_ms": step.get("p50_ms"),
+            "p95_ms": step.get("p95_ms"),
+            "p99_ms": step.get("p99_ms"),
+            "max_ms": step.get("max_ms"),
+            "error_samples": step.get("error_samples", []),
+            # в режиме pool Django «подключается» при каждой выдаче из пула; реальные соединения — в pool
+            "connects": len(connects),
+            "pool": stats.pool,
+        }
+    return report
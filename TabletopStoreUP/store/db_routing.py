@@ -0,0 +1,212 @@
+"""
+Чтение с реплик: ReplicaRouter и ReplicaRoutingMiddleware.
+
+Реплики перечислены в REPLICA_DATABASES (алиасы DATABASES, см. DB_REPLICAS в settings).
+На реплику уходят только SELECT-ы запросов, которые:
+- пришли безопасным методом (GET, HEAD, OPTIONS);
+- обслуживаются view, помеченным @replica_reads (каталог, карточка товара, аналитика,
+  выгрузки), или API DRF;
+- не выполняются внутри транзакции на основной базе.
+Всё остальное — записи, команды manage.py, фоновые задачи — работает с default.
+
+Read-your-writes: как только view что-то записал (router спросили db_for_write), дальнейшие
+чтения запроса идут на основную базу, а в ответ ставится cookie, которая
+REPLICA_PIN_SECONDS секунд держит этого пользователя на основной базе — пока реплика
+не догонит его корзину, заказ или отзыв. API-клиенту для этого нужно хранить cookie.
+Считаются только записи самого view (счёт начинается в process_view) и не считаются
+служебные — INCIDENTAL_WRITES (сессия, диагностика) и last_login при входе: иначе
+на основную базу уходил бы почти каждый посетитель.
+
+Значения для общего кэша (store.cache) считаются с основной базы — primary_reads(): иначе
+данные отставшей реплики легли бы в кэш под новой версией тега и пережили её догон.
+
+Отставание реплики проверяется не чаще раза в REPLICA_LAG_CHECK_SECONDS на процесс
+(на PostgreSQL — по pg_last_xact_replay_timestamp). Реплика, отставшая больше чем на
+REPLICA_MAX_LAG_SECONDS или недоступная, пропускается; если подходящих нет — чтение
+идёт на default.
+"""
+import contextlib
+import contextvars
+import logging
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger("store.db_routing")
+
+PIN_COOKIE = "db_pin"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_state = contextvars.ContextVar("store_db_routing_state", default=None)
+_health = {}  # алиас -> (время проверки по monotonic, годна ли)
+
+INCIDENTAL_WRITES = {"sessions.session", "store.requestprofile", "store.slowquery", "store.slowqueryfingerprint"}
+
+
+@dataclass
+class RoutingState:
+    """Что известно о текущем HTTP-запросе."""
+    pinned: bool = False
+    use_replica: bool = False
+    replica: str = None
+    writes: Counter = field(default_factory=Counter)  # label модели -> сколько раз писали
+
+    @property
+    def wrote(self):
+        return any(n > 0 for label, n in self.writes.items() if label not in INCIDENTAL_WRITES)
+
+
+def forget_write(model):
+    """Не считать одну запись model (служебную, например last_login при входе)."""
+    state = _state.get()
+    label = model._meta.label_lower
+    if state is not None and state.writes[label] > 0:
+        state.writes[label] -= 1
+
+
+def replicas():
+    return list(getattr(settings, "REPLICA_DATABASES", []))
+
+
+def replica_reads(view):
+    """Помечает view (функцию или класс), чьи GET-запросы можно читать с реплики."""
+    view.replica_reads = True
+    return view
+
+
+def _replica_view(view_func):
+    if getattr(view_func, "replica_reads", False):
+        return True
+    view_class = getattr(view_func, "view_class", None) or getattr(view_func, "cls", None)
+    if view_class is None:
+        return False
+    if getattr(view_class, "replica_reads", False):
+        return True
+    from rest_framework.views import APIView
+
+    return issubclass(view_class, APIView)
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Чтения внутри блока идут на основную базу, даже если view читает с реплики."""
+    state = _state.get()
+    if state is None or not state.use_replica:
+        yield
+        return
+    state.use_replica = False
+    try:
+        yield
+    finally:
+        state.use_replica = True
+
+
+def replica_lag(alias):
+    """Отставание реплики в секундах; None — СУБД его не сообщает (SQLite, копия базы)."""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+            "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        lag = cursor.fetchone()[0]
+    return float(lag) if lag is not None else None
+
+
+def replica_healthy(alias):
+    checked = _health.get(alias)
+    now = time.monotonic()
+    if checked and now - checked[0] < getattr(settings, "REPLICA_LAG_CHECK_SECONDS", 5):
+        return checked[1]
+    try:
+        lag = replica_lag(alias)
+        healthy = lag is None or lag <= getattr(settings, "REPLICA_MAX_LAG_SECONDS", 10)
+        if not healthy:
+            logger.warning("Реплика %s отстаёт на %.1f с — чтение с основной базы", alias, lag)
+    except DatabaseError as e:
+        healthy = False
+        logger.warning("Реплика %s недоступна: %s", alias, e)
+    _health[alias] = (now, healthy)
+    return healthy
+
+
+def reset_health():
+    _health.clear()
+
+
+def choose_replica():
+    """Случайная реплика из тех, что не отстают; None — читать с основной базы."""
+    candidates = [alias for alias in replicas() if replica_healthy(alias)]
+    return random.choice(candidates) if candidates else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or state.pinned or state.wrote:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None  # в транзакции читаем то, что она видит
+        if state.replica is None:
+            # одна реплика на весь запрос: страница не собирается из двух разных снимков
+            state.replica = choose_replica() or DEFAULT_DB_ALIAS
+        return state.replica if state.replica != DEFAULT_DB_ALIAS else None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.writes[model._meta.label_lower] += 1
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False  # схему реплики приносит репликация
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Разрешает чтение с реплики помеченным view и закрепляет за основной базой тех, кто писал."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(pinned=self._pinned(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and replicas():
+            seconds = getattr(settings, "REPLICA_PIN_SECONDS", 5)
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time() + seconds)), max_age=seconds, httponly=True, samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if state is None:
+            return
+        state.writes.clear()  # записи middleware до view не закрепляют за основной базой
+        if request.method in SAFE_METHODS and replicas() and _replica_view(view_func):
+            state.use_replica = True
+
+    @staticmethod
+    def _pinned(request):
+        try:
+            return int(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
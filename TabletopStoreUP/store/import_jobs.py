@@ -0,0 +1,223 @@
+"""
+Очередь фонового импорта каталога.
+
+Загруженный файл сохраняется в CATALOG_IMPORT_DIR, в таблицу CatalogImportJob ставится задача,
+и запрос сразу возвращает её id. Задачи обрабатывает команда process_import_jobs — отдельный
+процесс, который при CATALOG_IMPORT_SPAWN_WORKER запускается после загрузки, если другой
+обработчик ещё не работает (или работает постоянно как демон). Работающий обработчик держит
+блокировку WORKER_LOCK в общем кэше store; отпустив её, он ещё раз проверяет очередь, так что
+задача, поставленная, пока он работал, не остаётся без обработчика.
+
+Прогресс пишется в строку задачи после каждого куска, вместе с heartbeat_at. Задачу, чей
+обработчик не отмечался CATALOG_IMPORT_STALE_SECONDS (процесс упал или убит), следующий
+обработчик возвращает в очередь, а после CATALOG_IMPORT_MAX_ATTEMPTS запусков — в ошибки.
+"""
+import datetime
+import os
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import cache as store_cache
+from .catalog_import import import_catalog
+from .models import CatalogImportJob
+
+# не чаще одного обновления прогресса в эту паузу (секунды)
+PROGRESS_INTERVAL = 0.5
+WORKER_LOCK = "import_jobs:worker"
+WORKER_LOCK_TIMEOUT = 60  # обработчик продлевает блокировку при каждом обновлении прогресса
+
+
+def spool_upload(uploaded, user=None, dry_run=False):
+    """Сохраняет загруженный файл на диск по частям и ставит задачу в очередь."""
+    directory = Path(settings.CATALOG_IMPORT_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    original = os.path.basename(uploaded.name or "")
+    path = directory / f"{uuid.uuid4().hex}_{original or 'upload'}"
+    size = 0
+    with open(path, "wb") as out:
+        for chunk in uploaded.chunks():
+            out.write(chunk)
+            size += len(chunk)
+    job = CatalogImportJob.objects.create(
+        file_path=str(path),
+        original_name=original,
+        file_size=size,
+        dry_run=dry_run,
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+    if settings.CATALOG_IMPORT_SPAWN_WORKER:
+        transaction.on_commit(spawn_worker)
+    return job
+
+
+def acquire_worker_lock():
+    return store_cache.backend().add(WORKER_LOCK, os.getpid(), WORKER_LOCK_TIMEOUT)
+
+
+def refresh_worker_lock():
+    store_cache.backend().set(WORKER_LOCK, os.getpid(), WORKER_LOCK_TIMEOUT)
+
+
+def release_worker_lock():
+    store_cache.backend().delete(WORKER_LOCK)
+
+
+def worker_running():
+    return store_cache.backend().get(WORKER_LOCK) is not None
+
+
+def has_queued():
+    return CatalogImportJob.objects.filter(status=CatalogImportJob.STATUS_QUEUED).exists()
+
+
+def spawn_worker():
+    """
+    Запускает отдельный процесс-обработчик, который разберёт очередь и завершится.
+    Если обработчик уже работает, новый не нужен: задача разобрана будет им.
+    """
+    if worker_running():
+        return False
+    manage_py = Path(settings.BASE_DIR) / "manage.py"
+    subprocess.Popen(
+        [sys.executable, str(manage_py), "process_import_jobs", "--once"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    return True
+
+
+def reclaim_stale():
+    """
+    Брошенные задачи (обработчик не отмечался CATALOG_IMPORT_STALE_SECONDS) — снова в очередь
+    или, после CATALOG_IMPORT_MAX_ATTEMPTS запусков, в ошибки (их файлы удаляются).
+    Возвращает (в очередь, в ошибки).
+    """
+    now = timezone.now()
+    deadline = now - datetime.timedelta(seconds=settings.CATALOG_IMPORT_STALE_SECONDS)
+    stale = CatalogImportJob.objects.filter(
+        Q(heartbeat_at__lt=deadline) | Q(heartbeat_at__isnull=True, started_at__lt=deadline),
+        status=CatalogImportJob.STATUS_RUNNING,
+    )
+    failed = 0
+    exhausted = stale.filter(attempts__gte=settings.CATALOG_IMPORT_MAX_ATTEMPTS).values_list("pk", "file_path")
+    for pk, file_path in list(exhausted):
+        # по одной: файл удаляется, только если задачу действительно перевели в ошибки
+        if stale.filter(pk=pk).update(
+            status=CatalogImportJob.STATUS_FAILED, finished_at=now, error_count=1,
+            errors=["Обработчик импорта остановился, попытки исчерпаны"],
+        ):
+            failed += 1
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+    requeued = stale.update(status=CatalogImportJob.STATUS_QUEUED)
+    return requeued, failed
+
+
+def claim_next():
+    """
+    Забирает самую старую задачу из очереди. Захват — условный UPDATE по статусу,
+    поэтому несколько обработчиков не возьмут одну задачу дважды.
+    """
+    reclaim_stale()
+    while True:
+        job = CatalogImportJob.objects.filter(status=CatalogImportJob.STATUS_QUEUED).order_by("created_at", "id").first()
+        if job is None:
+            return None
+        now = timezone.now()
+        claimed = CatalogImportJob.objects.filter(pk=job.pk, status=CatalogImportJob.STATUS_QUEUED).update(
+            status=CatalogImportJob.STATUS_RUNNING, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1,
+        )
+        if claimed:
+            job.status, job.started_at, job.heartbeat_at = CatalogImportJob.STATUS_RUNNING, now, now
+            job.attempts += 1
+            return job
+
+
+RESULT_FIELDS = (
+    "status", "finished_at", "errors", "diff", "rows_done", "created_count", "updated_count",
+    "unchanged_count", "error_count", "rows_per_sec",
+)
+
+
+def _progress_fields(report):
+    return {
+        "rows_done": report.rows,
+        "created_count": report.created,
+        "updated_count": report.updated,
+        "unchanged_count": report.unchanged,
+        "error_count": len(report.errors),
+        "rows_per_sec": report.rows_per_sec,
+    }
+
+
+def process_job(job, chunk_size=1000):
+    """Выполняет импорт по задаче и записывает итог. Файл после обработки удаляется."""
+    last = [0.0]
+
+    def on_progress(report):
+        now = time.monotonic()
+        if now - last[0] >= PROGRESS_INTERVAL:
+            last[0] = now
+            CatalogImportJob.objects.filter(pk=job.pk).update(**_progress_fields(report), heartbeat_at=timezone.now())
+            refresh_worker_lock()
+
+    try:
+        with open(job.file_path, "rb") as fh:
+            report = import_catalog(
+                fh, name=job.original_name, dry_run=job.dry_run,
+                chunk_size=chunk_size, on_progress=on_progress,
+            )
+    except Exception as e:
+        job.status = CatalogImportJob.STATUS_FAILED
+        job.errors = [str(e)]
+        job.error_count = 1
+    else:
+        for name, value in _progress_fields(report).items():
+            setattr(job, name, value)
+        job.errors = report.errors
+        job.diff = report.diff
+        job.status = CatalogImportJob.STATUS_DONE
+    job.finished_at = timezone.now()
+    # итог пишется, только если задачу не вернули в очередь как брошенную — тогда и файл ещё нужен
+    written = CatalogImportJob.objects.filter(
+        pk=job.pk, status=CatalogImportJob.STATUS_RUNNING, attempts=job.attempts,
+    ).update(**{name: getattr(job, name) for name in RESULT_FIELDS})
+    if not written:
+        return job
+    try:
+        os.remove(job.file_path)
+    except OSError:
+        pass
+    return job
+
+
+def job_status(job):
+    """Состояние задачи для JSON-опроса."""
+    return {
+        "id": job.pk,
+        "status": job.status,
+        "status_display": job.get_status_display(),
+        "finished": job.is_finished,
+        "dry_run": job.dry_run,
+        "file": job.original_name,
+        "rows_done": job.rows_done,
+        "created": job.created_count,
+        "updated": job.updated_count,
+        "unchanged": job.unchanged_count,
+        "errors": job.error_count,
+        "rows_per_sec": job.rows_per_sec,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,612 @@
+"""
+Советник по индексам на основе реальной нагрузки (команда advise_indexes).
+
+Нагрузка собирается из трёх источников:
+- прогон сценариев бенчмарка (каталог со всеми сортировками и фильтрами, карточка,
+  корзина, оформление, API, аналитика) и списков заказов — в откатываемой транзакции,
+  SELECT-ы записываются вместе с параметрами;
+- медленные запросы из SlowQueryFingerprint (вес — число повторов);
+- pg_stat_statements, если расширение установлено (вес — calls; параметров нет,
+  поэтому такие запросы только подсказывают кандидатов, но не замеряются).
+
+SQL, который строит Django, однообразен ("таблица"."колонка" оператор %s), поэтому
+кандидаты выводятся из текста: равенства → ведущие колонки, затем диапазон или ORDER BY.
+Условие с одним и тем же значением во всей нагрузке (stock > 0, булево поле = true)
+становится условием частичного индекса. Кандидат, уже покрытый префиксом существующего
+индекса, отбрасывается.
+
+Каждый кандидат создаётся внутри транзакции, которая потом откатывается, и самые
+тяжёлые из давших его запросов замеряются до и после (на PostgreSQL ещё и сравнивается
+стоимость EXPLAIN). В миграцию попадают кандидаты, ускорившие нагрузку больше чем
+на 5%, и выбранные планировщиком, если с ними нагрузка не замедлилась больше чем на 5%.
+На больших таблицах PostgreSQL на время построения индекса блокирует запись —
+запускайте на копии базы или с --no-measure.
+
+Неиспользуемые индексы — те, что не встретились ни в одном плане нагрузки, а на
+PostgreSQL ещё и имеют idx_scan = 0 в pg_stat_user_indexes.
+"""
+import hashlib
+import json
+import re
+import time
+from dataclasses import dataclass, field
+
+from django.apps import apps
+from django.db import DatabaseError, connection, models, transaction
+from django.urls import reverse
+
+from . import benchmarks, slow_queries
+from .models import Genre, Order, OrderStatus, Product, Review
+
+APP_LABEL = "store"
+SETUP = "__setup__"
+DIAGNOSTIC_MODELS = {"RequestProfile", "SlowQuery", "SlowQueryFingerprint", "BackupChangeLog"}
+
+# ссылка на колонку: "таблица"."колонка" или псевдоним подзапроса Django U0."колонка"
+_REF = r'(?:"(?P<table>\w+)"|(?P<alias>\b[A-Z]\d+))\."(?P<col>\w+)"'
+_PREDICATE = re.compile(
+    _REF + r"\s*(?P<op>=|<>|<=|>=|<|>|\bIN\b|\bBETWEEN\b|\bIS NOT NULL\b|\bIS NULL\b)"
+    r"\s*(?P<value>%s|-?\d+(?:\.\d+)?\b|\btrue\b|\bfalse\b|\(?\s*(?:\"\w+\"|\b[A-Z]\d+)\.\"\w+\")?",
+    re.IGNORECASE,
+)
+_ORDER_ITEM = re.compile(_REF + r"\s*(?P<dir>ASC|DESC)?", re.IGNORECASE)
+_AGGREGATE = re.compile(r"\b(?:AVG|SUM|MIN|MAX|COUNT)\(\s*(?:DISTINCT\s+)?" + _REF + r"\s*\)", re.IGNORECASE)
+_SOURCE = re.compile(r'\b(?:FROM|JOIN)\s+"(\w+)"(?:\s+(?!ON\b|WHERE\b|INNER\b|LEFT\b|GROUP\b|ORDER\b|LIMIT\b)([A-Z]\d+))?')
+_TABLE = re.compile(r'"(\w+)"\.')
+_TAIL_END = re.compile(r"\b(LIMIT|OFFSET|FOR UPDATE)\b", re.IGNORECASE)
+_COST = re.compile(r"cost=[\d.]+\.\.([\d.]+)")
+_PLAN_INDEX = re.compile(r"(?:USING (?:COVERING )?INDEX|Index (?:Only )?Scan(?: Backward)? using|Bitmap Index Scan on)\s+\"?(\w+)")
+
+QUERIES_PER_CANDIDATE = 5
+SLOW_RUN_MS = 1000
+MIN_GAIN = 0.05
+
+RANGE_OPS = {"<", ">", "<=", ">=", "BETWEEN"}
+PARTIAL_OPS = {">": "gt", ">=": "gte", "<": "lt", "<=": "lte", "<>": "exact", "=": "exact"}
+
+
+@dataclass
+class WorkloadQuery:
+    sql: str
+    params: list = None
+    executable: bool = True
+    weight: float = 1.0
+    total_ms: float = 0.0
+    sources: set = field(default_factory=set)
+
+
+@dataclass
+class Candidate:
+    table: str
+    columns: tuple  # ((колонка, desc), ...)
+    condition: tuple = None  # (колонка, оператор, значение)
+    queries: list = field(default_factory=list)
+    weight: float = 0.0
+    workload_ms: float = 0.0
+    before_ms: float = 0.0
+    after_ms: float = 0.0
+    before_cost: float = None
+    after_cost: float = None
+    used: bool = False
+    measured: bool = False
+
+    @property
+    def benefit_ms(self):
+        return self.before_ms - self.after_ms
+
+    @property
+    def key(self):
+        return self.table, self.columns, self.condition
+
+
+@dataclass
+class UnusedIndex:
+    table: str
+    name: str
+    columns: list
+    definition: str
+    scans: int = None
+    kind: str = "sql"  # sql / meta / field
+    field_name: str = ""
+
+
+class _Recorder:
+    """execute_wrapper: SELECT-ы с параметрами, разложенные по текущему источнику."""
+
+    def __init__(self):
+        self.pending = []
+        self.captured = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if many or slow_queries.writing() or not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            return execute(sql, params, many, context)
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            self.pending.append((sql, list(params) if params is not None else None, ms))
+
+    def assign(self, source):
+        self.captured += [(sql, params, source, 1, ms) for sql, params, ms in self.pending]
+        self.pending = []
+
+
+def extra_scenarios():
+    """Списки заказов — в сценариях бенчмарка их нет."""
+    return [
+        benchmarks.Scenario("orders.list", path=lambda ctx: reverse("store:order_list"), user="customer"),
+        benchmarks.Scenario("orders.list.staff", path=lambda ctx: reverse("store:order_list"), user="staff"),
+    ]
+
+
+def representative_querysets():
+    """Типовые выборки, которых пока нет в представлениях, но есть в API и отчётах."""
+    user_id = Order.objects.values_list("user_id", flat=True).first()
+    status_id = OrderStatus.objects.values_list("id", flat=True).first()
+    product_id = Review.objects.values_list("product_id", flat=True).first()
+    genre_id = Genre.objects.values_list("id", flat=True).first()
+    querysets = {
+        "orders.history": Order.objects.filter(user_id=user_id).order_by("-order_date")[:20],
+        "orders.by_status": Order.objects.filter(status_id=status_id).order_by("-order_date")[:50],
+        "reviews.product": Review.objects.filter(product_id=product_id).order_by("-created_at")[:20],
+        "catalog.in_stock_genre": Product.objects.filter(stock__gt=0, genre_id=genre_id).order_by("price")[:24],
+        "catalog.in_stock_new": Product.objects.filter(stock__gt=0).order_by("-id")[:24],
+    }
+    return querysets
+
+
+def _selected(name, only):
+    return not only or any(pattern in name for pattern in only)
+
+
+def collect_replay(only=None, repeat=1):
+    """Прогон сценариев и типовых выборок. Возвращает [(sql, params, источник)]."""
+    scenarios = [s for s in benchmarks.default_scenarios() + extra_scenarios()
+                 if s.func is None and _selected(s.name, only)]
+    recorder = _Recorder()
+
+    def on_result(name, summary):
+        if name == SETUP:
+            recorder.pending = []  # запросы build_context — не нагрузка
+        else:
+            recorder.assign(f"replay:{name}")
+
+    with connection.execute_wrapper(recorder):
+        if scenarios:
+            setup = benchmarks.Scenario(SETUP, func=lambda ctx: None)
+            benchmarks.run(scenarios=[setup] + scenarios, repeat=repeat, warmup=0, on_result=on_result)
+        for name, qs in representative_querysets().items():
+            if _selected(name, only):
+                recorder.pending = []
+                list(qs)
+                recorder.assign(f"replay:{name}")
+    return recorder.captured
+
+
+def collect_slow_queries(limit=200):
+    from .models import SlowQueryFingerprint
+
+    rows = []
+    for fp in SlowQueryFingerprint.objects.order_by("-total_ms")[:limit]:
+        try:
+            params = json.loads(fp.example_params) if fp.example_params else None
+        except ValueError:
+            params = None
+        rows.append((fp.example_sql, params, "slow_query", fp.count, fp.total_ms))
+    return rows
+
+
+def collect_pg_stat_statements(limit=200):
+    if connection.vendor != "postgresql":
+        return []
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+            if cursor.fetchone() is None:
+                return []
+            cursor.execute(
+                "SELECT query, calls, total_exec_time FROM pg_stat_statements "
+                "WHERE query ILIKE %s AND query ILIKE %s ORDER BY total_exec_time DESC LIMIT %s",
+                ["select%", '%"store\\_%', limit],
+            )
+            return [(re.sub(r"\$\d+", "%s", query), None, "pg_stat_statements", calls, total_ms)
+                    for query, calls, total_ms in cursor.fetchall()]
+    except DatabaseError:
+        return []
+
+
+def build_workload(replayed=(), extra=()):
+    """Склеивает запросы по отпечатку: вес и время суммируются, исполняемый пример сохраняется."""
+    workload = {}
+    for sql, params, source, weight, ms in list(replayed) + list(extra):
+        if not sql:
+            continue
+        digest, _ = slow_queries.fingerprint(sql)
+        executable = params is not None or "%s" not in sql
+        query = workload.get(digest)
+        if query is None:
+            query = workload[digest] = WorkloadQuery(sql, params, executable, 0.0)
+        elif executable and not query.executable:
+            query.sql, query.params, query.executable = sql, params, True
+        query.weight += weight
+        query.total_ms += ms
+        query.sources.add(source)
+    return list(workload.values())
+
+
+def _order_clause(sql):
+    position = sql.upper().rfind(" ORDER BY ")
+    if position < 0:
+        return "", 0
+    start = position + len(" ORDER BY ")
+    end = _TAIL_END.search(sql, start)
+    return sql[start:end.start() if end else len(sql)], start
+
+
+def _constant(query, match):
+    """Значение параметра или литерала справа от оператора; None — не константа."""
+    value = match.group("value")
+    if value is None or "." in value and '"' in value:
+        return None
+    if value == "%s":
+        if not isinstance(query.params, list):
+            return None
+        index = query.sql[:match.start("value")].count("%s")
+        return query.params[index] if index < len(query.params) else None
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    return float(value) if "." in value else int(value)
+
+
+@dataclass
+class Access:
+    """Как запрос обращается к одной таблице."""
+    eq: list = field(default_factory=list)
+    ranges: list = field(default_factory=list)
+    order: list = field(default_factory=list)
+    aggregates: list = field(default_factory=list)
+    constants: list = field(default_factory=list)
+
+
+def analyze(query):
+    """{таблица: Access} — равенства, диапазоны, сортировка, агрегаты, условия-константы."""
+    sql = query.sql
+    aliases = {alias: table for table, alias in _SOURCE.findall(sql) if alias}
+
+    def table_of(match):
+        return match.group("table") or aliases.get(match.group("alias"))
+
+    access = {}
+    for match in _PREDICATE.finditer(sql):
+        table = table_of(match)
+        if table is None:
+            continue
+        a = access.setdefault(table, Access())
+        col, op = match.group("col"), match.group("op").upper()
+        if op in ("=", "IN") and col not in a.eq:
+            a.eq.append(col)
+        elif op in RANGE_OPS and col not in a.ranges:
+            a.ranges.append(col)
+        if op in PARTIAL_OPS:
+            a.constants.append((col, op, _constant(query, match)))
+    for match in _AGGREGATE.finditer(sql):
+        table = table_of(match)
+        if table in access and match.group("col") not in access[table].aggregates:
+            access[table].aggregates.append(match.group("col"))
+
+    clause, _ = _order_clause(sql)
+    order = [(table_of(m), m.group("col"), (m.group("dir") or "").upper() == "DESC")
+             for m in _ORDER_ITEM.finditer(clause)]
+    if order and len({t for t, _, _ in order}) == 1 and order[0][0]:
+        # сортировка по одной таблице без выражений — её может отдать индекс
+        access.setdefault(order[0][0], Access()).order = [(c, desc) for _, c, desc in order]
+    return access
+
+
+def _partial_conditions(analyzed):
+    """Условия, у которых во всей нагрузке одно значение: stock > 0, флаг = true."""
+    values = {}
+    for _, access in analyzed:
+        for table, a in access.items():
+            for col, op, value in a.constants:
+                values.setdefault((table, col, op), []).append(value)
+    partial = {}
+    for (table, col, op), seen in values.items():
+        if len(seen) < 2 or None in seen or len(set(map(repr, seen))) != 1:
+            continue
+        value = seen[0]
+        if not isinstance(value, (bool, int, float)):
+            continue  # даты и строки в условии частичного индекса быстро устаревают
+        if op == "=" and not isinstance(value, bool):
+            continue  # равенство с числом — это фильтр (жанр, пользователь), а не условие индекса
+        partial[(table, col)] = (col, op, value)
+    return partial
+
+
+def _existing_indexes(table):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return {
+        name: info for name, info in constraints.items()
+        if info.get("index") and not info.get("primary_key")
+    }
+
+
+def _covered(candidate, indexes):
+    cols = [c for c, _ in candidate.columns]
+    for info in indexes.values():
+        existing = info.get("columns") or []
+        if existing[:len(cols)] == cols and candidate.condition is None:
+            return True
+    return False
+
+
+def table_models():
+    """Таблицы моделей магазина, кроме служебных таблиц диагностики."""
+    return {
+        m._meta.db_table: m for m in apps.get_app_config(APP_LABEL).get_models()
+        if m.__name__ not in DIAGNOSTIC_MODELS
+    }
+
+
+def _columns(access, condition, max_columns, pk):
+    # по первичному ключу уже есть индекс; чаще всего это ссылка коррелированного подзапроса
+    skip = {pk, condition[0]} if condition else {pk}
+    columns = [(c, False) for c in access.eq if c not in skip]
+    order = [(c, desc) for c, desc in access.order if c not in skip and c not in access.eq]
+    if order:
+        columns += order
+    elif access.ranges:
+        columns += [(c, False) for c in access.ranges if c not in skip][:1]
+    elif columns:
+        # только равенства: агрегируемые колонки делают индекс покрывающим (AVG(rating) по product_id)
+        columns += [(c, False) for c in access.aggregates if c not in skip and (c, False) not in columns]
+    return tuple(columns[:max_columns])
+
+
+def find_candidates(workload, max_columns=3):
+    """Кандидаты, не покрытые существующими индексами, — сначала те, где нагрузка тратит больше времени."""
+    models_by_table = table_models()
+    analyzed = [(q, {t: a for t, a in analyze(q).items() if t in models_by_table}) for q in workload]
+    partial = _partial_conditions(analyzed)
+    found = {}
+    for query, access in analyzed:
+        for table, a in access.items():
+            condition = next((partial[(table, col)] for col in a.eq + a.ranges if (table, col) in partial), None)
+            columns = _columns(a, condition, max_columns, models_by_table[table]._meta.pk.column)
+            if not columns:
+                continue
+            candidate = found.setdefault((table, columns, condition), Candidate(table, columns, condition))
+            candidate.queries.append(query)
+            candidate.weight += query.weight
+            candidate.workload_ms += query.total_ms
+
+    indexes = {table: _existing_indexes(table) for table in {c.table for c in found.values()}}
+    return sorted(
+        (c for c in found.values() if not _covered(c, indexes[c.table])),
+        key=lambda c: (-c.workload_ms, -c.weight),
+    )
+
+
+def _field_name(model, column):
+    return next((f.name for f in model._meta.concrete_fields if f.column == column), column)
+
+
+def make_index(candidate, model=None):
+    model = model or table_models()[candidate.table]
+    fields = [("-" if desc else "") + _field_name(model, col) for col, desc in candidate.columns]
+    condition = None
+    if candidate.condition:
+        col, op, value = candidate.condition
+        lookup = {f"{_field_name(model, col)}__{PARTIAL_OPS[op]}": value}
+        condition = ~models.Q(**lookup) if op == "<>" else models.Q(**lookup)
+    digest = hashlib.sha1(repr(candidate.key).encode()).hexdigest()[:4]
+    base = f"{model._meta.model_name[:8]}_" + "_".join(f.lstrip("-")[:6] for f in fields)
+    name = f"{base[:21]}_{digest}_idx"
+    return models.Index(fields=fields, name=name, condition=condition)
+
+
+def _timed(sql, params, repeat):
+    """Лучшее время из repeat прогонов; запрос дольше секунды выполняется один раз."""
+    best = None
+    with connection.cursor() as cursor:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            elapsed = (time.perf_counter() - t0) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+            if best > SLOW_RUN_MS:
+                break
+    return best
+
+
+def _plan(query):
+    try:
+        return slow_queries.explain(connection.alias, query.sql, query.params)
+    except DatabaseError:
+        return ""
+
+
+def _cost(plan):
+    match = _COST.search(plan)
+    return float(match.group(1)) if match else None
+
+
+def plan_indexes(plan):
+    return set(_PLAN_INDEX.findall(plan))
+
+
+def measure(candidates, repeat=5):
+    """Замер до/после для каждого кандидата; индекс создаётся в транзакции и откатывается."""
+    models_by_table = table_models()
+    baseline = {}
+    for candidate in candidates:
+        # самые тяжёлые запросы кандидата — остальные лишь удлинили бы замер
+        queries = sorted((q for q in candidate.queries if q.executable), key=lambda q: -q.total_ms)
+        queries = queries[:QUERIES_PER_CANDIDATE]
+        if not queries:
+            continue
+        for q in queries:
+            if id(q) not in baseline:
+                plan = _plan(q)
+                baseline[id(q)] = (_timed(q.sql, q.params, repeat), _cost(plan))
+        model = models_by_table[candidate.table]
+        index = make_index(candidate, model)
+        if connection.vendor == "postgresql" and connection.in_atomic_block:
+            # отложенные проверки FK из внешней транзакции мешают DDL ("pending trigger events")
+            connection.check_constraints()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(str(index.create_sql(model, connection.schema_editor())))
+            after_costs, before_costs = [], []
+            for q in queries:
+                before_ms, before_cost = baseline[id(q)]
+                after_ms = _timed(q.sql, q.params, repeat)
+                plan = _plan(q)
+                candidate.before_ms += q.weight * before_ms
+                candidate.after_ms += q.weight * after_ms
+                candidate.used = candidate.used or index.name in plan_indexes(plan)
+                if before_cost is not None and _cost(plan) is not None:
+                    before_costs.append(q.weight * before_cost)
+                    after_costs.append(q.weight * _cost(plan))
+            transaction.set_rollback(True)
+        if before_costs:
+            candidate.before_cost, candidate.after_cost = sum(before_costs), sum(after_costs)
+        candidate.measured = True
+    return candidates
+
+
+def _index_definition(name):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", [name])
+        elif connection.vendor == "sqlite":
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = %s", [name])
+        else:
+            return ""
+        row = cursor.fetchone()
+    return (row[0] or "") if row else ""
+
+
+def _index_scans():
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT indexrelname, idx_scan FROM pg_stat_user_indexes")
+        return dict(cursor.fetchall())
+
+
+def find_unused(workload):
+    """Индексы таблиц магазина, которых нет ни в одном плане нагрузки (и с idx_scan = 0 на PostgreSQL)."""
+    used = set()
+    for query in workload:
+        if query.executable:
+            used |= plan_indexes(_plan(query))
+    touched = {t for q in workload for t in _TABLE.findall(q.sql)}
+    scans = _index_scans()
+    editor = connection.schema_editor()  # только для имён индексов, без входа в контекст
+    unused = []
+    for table, model in sorted(table_models().items()):
+        if table not in touched:
+            continue  # о таблицах вне нагрузки судить не по чему
+        meta_names = {index.name for index in model._meta.indexes}
+        field_indexes = {
+            editor._create_index_name(table, [f.column], suffix=""): f.name
+            for f in model._meta.concrete_fields if f.db_index and not f.unique
+        }
+        for name, info in sorted(_existing_indexes(table).items()):
+            if info.get("unique") or name in used or (scans is not None and scans.get(name, 0) > 0):
+                continue
+            item = UnusedIndex(table, name, info.get("columns") or [], _index_definition(name),
+                               scans.get(name) if scans is not None else None)
+            if name in meta_names:
+                item.kind = "meta"
+            elif name in field_indexes:
+                item.kind, item.field_name = "field", field_indexes[name]
+            unused.append(item)
+    return unused
+
+
+def _deconstruct_index(index):
+    parts = [f"fields={index.fields!r}", f"name={index.name!r}"]
+    if index.condition is not None:
+        parts.append(f"condition={_q_repr(index.condition)}")
+    return f"models.Index({', '.join(parts)})"
+
+
+def _q_repr(q):
+    inner = ", ".join(f"{k}={v!r}" for k, v in q.children)
+    return f"~Q({inner})" if q.negated else f"Q({inner})"
+
+
+def _worth_it(candidate, min_benefit_ms):
+    noise = MIN_GAIN * candidate.before_ms
+    if candidate.used:
+        # планировщик выбрал индекс — берём, если нагрузка не стала заметно медленнее
+        return candidate.benefit_ms > -noise
+    return candidate.benefit_ms > max(min_benefit_ms, noise)
+
+
+def migration_operations(candidates, unused, min_benefit_ms=0.0):
+    """Строки операций миграции: новые индексы с оценкой выигрыша, удаление неиспользуемых."""
+    models_by_table = table_models()
+    concurrent = connection.vendor == "postgresql"
+    op_name = "AddIndexConcurrently" if concurrent else "migrations.AddIndex"
+    lines = []
+    for candidate in candidates:
+        if candidate.measured and not _worth_it(candidate, min_benefit_ms):
+            continue
+        model = models_by_table[candidate.table]
+        index = make_index(candidate, model)
+        sources = sorted({s for q in candidate.queries for s in q.sources})
+        note = f"вес {candidate.weight:g}; {', '.join(sources[:4])}{' …' if len(sources) > 4 else ''}"
+        if candidate.measured:
+            note = (f"{candidate.before_ms:.1f} → {candidate.after_ms:.1f} мс на прогон нагрузки"
+                    + (f", стоимость {candidate.before_cost:.0f} → {candidate.after_cost:.0f}"
+                       if candidate.before_cost is not None else "")
+                    + (", используется планировщиком" if candidate.used else "") + f"; {note}")
+        lines.append(f"    # {note}")
+        lines.append(f"    {op_name}(model_name={model._meta.model_name!r}, index={_deconstruct_index(index)}),")
+    for item in unused:
+        model = models_by_table[item.table]
+        scans = f", idx_scan={item.scans}" if item.scans is not None else ""
+        lines.append(f"    # не используется: {item.table}({', '.join(item.columns)}){scans}")
+        if item.kind == "meta":
+            lines.append(f"    migrations.RemoveIndex(model_name={model._meta.model_name!r}, name={item.name!r}),")
+        elif item.kind == "field":
+            fk = " (внешний ключ: индекс нужен для каскадного удаления)" if model._meta.get_field(
+                item.field_name).is_relation else ""
+            lines.append(f"    # → {model.__name__}.{item.field_name}: db_index=False{fk}")
+        elif item.definition:
+            lines.append(
+                f"    migrations.RunSQL({f'DROP INDEX IF EXISTS {item.name};'!r}, reverse_sql={item.definition + ';'!r}),"
+            )
+    return lines
+
+
+def render_migration(lines):
+    concurrent = connection.vendor == "postgresql"
+    header = [
+        "from django.db import migrations, models",
+        "from django.db.models import Q",
+    ]
+    if concurrent:
+        header.append("from django.contrib.postgres.operations import AddIndexConcurrently")
+    body = header + ["", "", "class Migration(migrations.Migration):"]
+    if concurrent:
+        body.append("    atomic = False  # CREATE INDEX CONCURRENTLY нельзя выполнять в транзакции")
+    body += [
+        "",
+        "    dependencies = [",
+        "        # ('store', '<последняя миграция>'),",
+        "    ]",
+        "",
+        "    operations = [",
+        *["    " + line for line in lines],
+        "    ]",
+        "",
+        "# Новые индексы добавьте и в Meta.indexes моделей, иначе makemigrations предложит их удалить.",
+    ]
+    return "\n".join(body) + "\n"
@@ -0,0 +1,305 @@
+"""
+Нагрузочный генератор: N виртуальных покупателей параллельно проходят сценарий покупки.
+
+Сценарий: каталог → каталог с фильтром и сортировкой → карточка товара →
+cart_add_gate → order_create (оплата картой) → payment_mock_callback. Запросы идут либо
+в этом же процессе через WSGI-обработчик тестового клиента, либо по HTTP на запущенный
+сервер (runserver, gunicorn, uvicorn — без разницы). Редиректы не выполняются: каждый
+шаг — ровно один замеряемый запрос.
+
+Часть покупок нацелена на несколько «горячих» товаров с заданным остатком — так
+проверяется оформление заказа при конкуренции. После прогона остатки сверяются с
+проданным: oversold — продано больше, чем было, lost_updates — остаток уменьшился меньше,
+чем продано (потерянные обновления при одновременных заказах). Попытка положить в корзину
+раскупленный товар (404) считается отказом (rejected), а не ошибкой.
+"""
+import http.cookiejar
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.db.models import Count, Max, Sum
+from django.test import Client
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from . import provisioning
+from .models import Genre, Order, OrderItem, PaymentMethod, Product
+
+User = get_user_model()
+
+USERNAME_PREFIX = "loadtest_vu_"
+PAYMENT_RE = re.compile(r"/payments/mock/(\d+)/")
+SORTS = ["new", "price_asc", "price_desc", "rating_desc", "popular"]
+
+
+class InProcessTransport:
+    """Запросы через django.test.Client в этом процессе (WSGI-обработчик без сети)."""
+
+    def __init__(self):
+        hosts = [h for h in settings.ALLOWED_HOSTS if h and h != "*" and not h.startswith(".")]
+        self.client = Client(raise_request_exception=False, HTTP_HOST=hosts[0] if hosts else "testserver")
+
+    def login(self, user, password):
+        self.client.force_login(user)
+
+    def request(self, method, path, data=None):
+        response = getattr(self.client, method)(path, data or {})
+        return response.status_code, response.get("Location", "")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTransport:
+    """Запросы по HTTP к запущенному серверу: свои cookie на пользователя, CSRF-токен из cookie."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+
+    def _csrf(self):
+        return next((c.value for c in self.cookies if c.name == settings.CSRF_COOKIE_NAME), "")
+
+    def login(self, user, password):
+        path = reverse("store:login")
+        self.request("get", path)
+        status, _ = self.request("post", path, {"username": user.username, "password": password})
+        if status != 302:
+            raise RuntimeError(f"вход {user.username} не удался: HTTP {status}")
+
+    def request(self, method, path, data=None):
+        url = self.base_url + path
+        body = None
+        headers = {"Referer": url}
+        if method == "post":
+            data = {**(data or {}), "csrfmiddlewaretoken": self._csrf()}
+            body = urllib.parse.urlencode(data).encode()
+            headers["X-CSRFToken"] = data["csrfmiddlewaretoken"]
+        req = urllib.request.Request(url, data=body, headers=headers, method=method.upper())
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                response.read()
+                return response.status, response.headers.get("Location", "")
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get("Location", "")
+
+
+class Stats:
+    """Задержки и ошибки по шагам сценария (потокобезопасно)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self.error_samples = defaultdict(list)
+        self.journeys = 0
+
+    def record(self, step, seconds, error=None, rejected=False):
+        with self.lock:
+            self.latency[step].append(seconds)
+            if rejected:
+                self.rejected[step] += 1
+            if error:
+                self.errors[step] += 1
+                if len(self.error_samples[step]) < 5:
+                    self.error_samples[step].append(error)
+
+    def journey_done(self):
+        with self.lock:
+            self.journeys += 1
+
+    @staticmethod
+    def _percentile(sorted_values, q):
+        return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for step, values in self.latency.items():
+            values = sorted(values)
+            endpoints[step] = {
+                "requests": len(values),
+                "errors": self.errors[step],
+                "rejected": self.rejected[step],
+                "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+                **{f"p{int(q * 100)}_ms": round(self._percentile(values, q) * 1000, 1) for q in (0.5, 0.95, 0.99)},
+                "max_ms": round(values[-1] * 1000, 1),
+                "error_samples": self.error_samples[step],
+            }
+        requests = sum(len(v) for v in self.latency.values())
+        return {
+            "elapsed": round(elapsed, 2),
+            "requests": requests,
+            "rps": round(requests / elapsed, 1) if elapsed else 0.0,
+            "journeys": self.journeys,
+            "journeys_per_sec": round(self.journeys / elapsed, 2) if elapsed else 0.0,
+            "errors": sum(self.errors.values()),
+            "rejected": sum(self.rejected.values()),
+            "endpoints": endpoints,
+        }
+
+
+def ensure_users(count, password):
+    """Аккаунты виртуальных пользователей loadtest_vu_NNNN (создаются один раз через provisioning)."""
+    password_hash = make_password(password)
+    provisioning.provision_users(
+        {"username": f"{USERNAME_PREFIX}{i:04d}", "password_hash": password_hash} for i in range(count)
+    )
+    users = User.objects.filter(username__startswith=USERNAME_PREFIX).order_by("username")[:count]
+    return list(users)
+
+
+def prepare(hot_products=3, hot_stock=None):
+    """Товары и справочники для сценария; при hot_stock выставляет остаток горячим товарам."""
+    products = list(Product.objects.filter(stock__gt=0).values_list("id", flat=True)[:5000])
+    if not products:
+        raise ValueError("Нет товаров в наличии — выполните generate_dataset")
+    hot = list(
+        Product.objects.filter(stock__gt=0).annotate(n=Count("orderitem"))
+        .order_by("-n", "id").values_list("id", flat=True)[:hot_products]
+    )
+    if hot_stock is not None:
+        Product.objects.filter(id__in=hot).update(stock=hot_stock)
+    card = PaymentMethod.objects.filter(code="card", is_active=True).values_list("id", flat=True).first()
+    if card is None:
+        raise ValueError("Нет способа оплаты card — выполните migrate")
+    return {
+        "products": products,
+        "hot": hot,
+        "genres": list(Genre.objects.values_list("id", flat=True)),
+        "card_method_id": card,
+        "initial_stock": dict(Product.objects.filter(id__in=hot).values_list("id", "stock")),
+        "order_id_before": Order.objects.aggregate(m=Max("id"))["m"] or 0,
+    }
+
+
+def stock_check(plan):
+    """Сверка остатков горячих товаров с проданным за прогон."""
+    sold = dict(
+        OrderItem.objects.filter(order_id__gt=plan["order_id_before"], product_id__in=plan["hot"])
+        .values("product_id").annotate(q=Sum("quantity")).values_list("product_id", "q")
+    )
+    final = dict(Product.objects.filter(id__in=plan["hot"]).values_list("id", "stock"))
+    report = {}
+    for pid, initial in plan["initial_stock"].items():
+        units = sold.get(pid, 0)
+        report[pid] = {
+            "initial": initial,
+            "final": final.get(pid),
+            "sold": units,
+            "oversold": max(0, units - initial),
+            "lost_updates": max(0, units - (initial - final.get(pid, initial))),
+        }
+    return report
+
+
+class VirtualUser:
+    def __init__(self, transport, plan, stats, rng, options):
+        self.t = transport
+        self.plan = plan
+        self.stats = stats
+        self.rng = rng
+        self.options = options
+
+    def step(self, name, method, path, data=None, expect=(200,), reject=()):
+        """Один замеряемый запрос. Статусы из reject — штатный отказ (например, товар кончился), не ошибка."""
+        t0 = time.perf_counter()
+        try:
+            status, location = self.t.request(method, path, data)
+        except Exception as e:  # сетевые ошибки тоже считаются
+            self.stats.record(name, time.perf_counter() - t0, f"{type(e).__name__}: {e}")
+            return None, ""
+        error = None if status in expect or status in reject else f"HTTP {status}"
+        self.stats.record(name, time.perf_counter() - t0, error, rejected=status in reject)
+        return status, location
+
+    def journey(self):
+        rng, plan = self.rng, self.plan
+        catalog = reverse("store:product_list")
+        self.step("catalog", "get", catalog)
+        params = {"sort": rng.choice(SORTS), "in_stock": "1"}
+        if plan["genres"]:
+            params["genre"] = rng.choice(plan["genres"])
+        self.step("catalog_filter", "get", f"{catalog}?{urlencode(params)}")
+
+        hot = plan["hot"] and rng.random() < self.options["hot_ratio"]
+        product_id = rng.choice(plan["hot"] if hot else plan["products"])
+        self.step("product", "get", reverse("store:product_detail", args=[product_id]))
+        status, _ = self.step("cart_add_gate", "get",
+                              reverse("store:cart_add_gate", args=[product_id]) + f"?qty={self.options['qty']}",
+                              expect=(302,), reject=(404,))
+        if status != 302:  # товар раскупили — покупка не состоялась
+            self.stats.journey_done()
+            return
+
+        status, location = self.step("order_create", "post", reverse("store:create_order"), {
+            "address": "ул. Нагрузочная, 1", "payment_method": plan["card_method_id"],
+        }, expect=(302,))
+        match = PAYMENT_RE.search(location or "")
+        if match:
+            outcome = "fail" if rng.random() < self.options["fail_ratio"] else "success"
+            self.step("payment_callback", "post", reverse("store:payment_mock_callback", args=[match.group(1)]),
+                      {"outcome": outcome}, expect=(200, 302))
+        self.stats.journey_done()
+
+
+def _vu_loop(vu, deadline, iterations, think, close_connections=True):
+    try:
+        done = 0
+        while (iterations and done < iterations) or (not iterations and time.monotonic() < deadline):
+            vu.journey()
+            done += 1
+            if think:
+                time.sleep(vu.rng.uniform(0, 2 * think))
+    finally:
+        if close_connections:
+            connections.close_all()
+
+
+def run(vus=10, duration=30, iterations=0, base_url=None, password="loadtest123", think_ms=0,
+        hot_products=3, hot_stock=None, hot_ratio=0.5, qty=1, fail_ratio=0.1, seed=None):
+    """Запускает нагрузку. Возвращает сводку: задержки по шагам, ошибки, сверку остатков."""
+    users = ensure_users(vus, password)
+    plan = prepare(hot_products, hot_stock)
+    options = {"hot_ratio": hot_ratio, "qty": qty, "fail_ratio": fail_ratio}
+    stats = Stats()
+    master = random.Random(seed)
+    vus_list = []
+    for user in users:
+        transport = HttpTransport(base_url) if base_url else InProcessTransport()
+        transport.login(user, password)
+        vus_list.append(VirtualUser(transport, plan, stats, random.Random(master.random()), options))
+
+    think = think_ms / 1000
+    t0 = time.perf_counter()
+    deadline = time.monotonic() + duration
+    if len(vus_list) == 1:
+        # один пользователь — в этом же потоке и соединении
+        _vu_loop(vus_list[0], deadline, iterations, think, close_connections=False)
+    else:
+        with ThreadPoolExecutor(max_workers=len(vus_list)) as pool:
+            for future in [pool.submit(_vu_loop, vu, deadline, iterations, think) for vu in vus_list]:
+                future.result()
+    summary = stats.summary(time.perf_counter() - t0)
+    summary["mode"] = f"http {base_url}" if base_url else "in-process"
+    summary["virtual_users"] = len(vus_list)
+    summary["stock"] = stock_check(plan)
+    summary["oversold_units"] = sum(s["oversold"] for s in summary["stock"].values())
+    summary["lost_updates"] = sum(s["lost_updates"] for s in summary["stock"].values())
+    return summary
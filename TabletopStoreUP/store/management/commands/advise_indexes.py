@@ -0,0 +1,83 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import benchmarks, index_advisor
+
+
+class Command(BaseCommand):
+    help = (
+        "Советник по индексам: прогоняет типовую нагрузку (каталог, заказы, аналитика), добавляет "
+        "медленные запросы и pg_stat_statements, предлагает составные и частичные индексы с замером "
+        "выигрыша и находит неиспользуемые. Печатает готовые операции миграции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--only", action="append",
+            help="Прогонять только сценарии, в имени которых есть подстрока (можно несколько раз).",
+        )
+        parser.add_argument("--no-replay", action="store_true", help="Не прогонять сценарии.")
+        parser.add_argument("--no-slow-queries", action="store_true", help="Не брать медленные запросы из админки.")
+        parser.add_argument("--no-measure", action="store_true",
+                            help="Не строить индексы для замера (на рабочей базе без копии).")
+        parser.add_argument("--repeat", type=int, default=5, help="Замеров запроса до и после (по умолчанию 5).")
+        parser.add_argument("--top", type=int, default=10, help="Сколько кандидатов замерять (по умолчанию 10).")
+        parser.add_argument(
+            "--min-benefit-ms", type=float, default=0.5,
+            help="Минимальный выигрыш на прогон нагрузки, если планировщик индекс не выбрал (по умолчанию 0.5 мс).",
+        )
+        parser.add_argument("--output", help="Сохранить заготовку миграции в файл.")
+
+    def handle(self, *args, **opts):
+        replayed, extra = [], []
+        if not opts["no_replay"]:
+            self.stdout.write("→ Прогон нагрузки…")
+            try:
+                replayed = index_advisor.collect_replay(only=opts.get("only"))
+            except benchmarks.BenchmarkError as e:
+                raise CommandError(str(e))
+        if not opts["no_slow_queries"]:
+            extra += index_advisor.collect_slow_queries()
+        statements = index_advisor.collect_pg_stat_statements()
+        extra += statements
+        workload = index_advisor.build_workload(replayed, extra)
+        if not workload:
+            raise CommandError("Нагрузка пуста: нечего анализировать")
+        self.stdout.write(
+            f"→ Запросов: {len(workload)} уникальных (прогон {len(replayed)}, "
+            f"медленных и pg_stat_statements {len(extra)})"
+        )
+
+        candidates = index_advisor.find_candidates(workload)[:opts["top"]]
+        if candidates and not opts["no_measure"]:
+            self.stdout.write(f"→ Замер {len(candidates)} кандидатов (индексы создаются и откатываются)…")
+            index_advisor.measure(candidates, repeat=opts["repeat"])
+        for c in candidates:
+            cols = ", ".join(col + (" DESC" if desc else "") for col, desc in c.columns)
+            where = f" WHERE {c.condition[0]} {c.condition[1]} {c.condition[2]!r}" if c.condition else ""
+            measured = (
+                f"{c.before_ms:8.1f} → {c.after_ms:8.1f} мс{'  [используется]' if c.used else ''}"
+                if c.measured else "не замерялся"
+            )
+            self.stdout.write(f"  {c.table}({cols}){where}: вес {c.weight:g}, {measured}")
+
+        unused = index_advisor.find_unused(workload)
+        for item in unused:
+            scans = f", idx_scan={item.scans}" if item.scans is not None else ""
+            self.stdout.write(self.style.WARNING(
+                f"  не используется: {item.name} на {item.table}({', '.join(item.columns)}){scans}"
+            ))
+
+        lines = index_advisor.migration_operations(candidates, unused, opts["min_benefit_ms"])
+        if not lines:
+            self.stdout.write(self.style.SUCCESS("✅ Предложений нет: индексы соответствуют нагрузке."))
+            return
+        self.stdout.write("\n# Операции миграции:")
+        self.stdout.write("\n".join(lines))
+        if opts.get("output"):
+            Path(opts["output"]).write_text(index_advisor.render_migration(lines), encoding="utf-8")
+            self.stdout.write(f"→ Заготовка миграции: {opts['output']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Анализ завершён: предложений {sum(1 for l in lines if not l.lstrip().startswith('#'))}."
+        ))
@@ -2,11 +2,50 @@ import os
 from datetime import datetime
 from django.core.management import call_command
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from store import backup_downloads, backup_engine, media_backup
+
 
 class Command(BaseCommand):
     help = "Создаёт резервную копию базы данных и медиа."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=["json", "ndjson"], default="json",
+            help="json — один дамп dumpdata (по умолчанию); ndjson — каталог со сжатым файлом на модель и манифестом.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=min(4, os.cpu_count() or 1),
+            help="Процессов для выгрузки таблиц в формате ndjson.",
+        )
+        parser.add_argument(
+            "--compression", choices=["auto", "gzip", "zstd"], default="auto",
+            help="Сжатие для ndjson: auto — zstd, если установлен zstandard, иначе gzip.",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=5000,
+            help="Строк за одно чтение из курсора (ndjson).",
+        )
+        kind = parser.add_mutually_exclusive_group()
+        kind.add_argument(
+            "--incremental", action="store_const", const="incremental", dest="kind",
+            help="Только изменения после последнего бэкапа ndjson (любого вида). Медиа — только с --media-mode cas.",
+        )
+        kind.add_argument(
+            "--differential", action="store_const", const="differential", dest="kind",
+            help="Только изменения после последнего полного бэкапа ndjson. Медиа — только с --media-mode cas.",
+        )
+        parser.add_argument(
+            "--media-mode", choices=["tar", "cas"], default="tar",
+            help="tar — полный архив media_*.tar.gz (по умолчанию); cas — манифест media_*.json и "
+                 "хранилище уникальных файлов backups/media_store (работает и с --incremental/--differential).",
+        )
+        parser.add_argument(
+            "--media-workers", type=int, default=8,
+            help="Потоков для хэширования медиа в режиме cas.",
+        )
+
     def handle(self, *args, **options):
         # Каталог для бэкапов
         backup_dir = os.path.join(settings.BASE_DIR, "backups")
@@ -14,8 +53,29 @@ class Command(BaseCommand):
 
         # Имя файла по дате
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        dump_path = os.path.join(backup_dir, f"backup_{timestamp}.json")
 
+        kind = options.get("kind") or "full"
+        if options["format"] == "ndjson" or kind != "full":
+            self._backup_ndjson(os.path.join(backup_dir, f"backup_{timestamp}"), options, kind)
+        else:
+            self._backup_json(os.path.join(backup_dir, f"backup_{timestamp}.json"))
+
+        # (опционально) — медиа: манифест с дедупликацией или полный архив (только для полного бэкапа)
+        media_dir = getattr(settings, "MEDIA_ROOT", None)
+        if media_dir and os.path.exists(media_dir):
+            if options["media_mode"] == "cas":
+                self._backup_media_cas(media_dir, backup_dir, timestamp, options["media_workers"])
+            elif kind == "full":
+                archive_name = os.path.join(backup_dir, f"media_{timestamp}")
+                import tarfile
+                with tarfile.open(f"{archive_name}.tar.gz", "w:gz") as tar:
+                    tar.add(media_dir, arcname=".")
+                backup_downloads.write_checksum(f"{archive_name}.tar.gz")
+                self.stdout.write(f"→ Архив медиа сохранён: {archive_name}.tar.gz")
+
+        self.stdout.write(self.style.SUCCESS("✅ Бэкап успешно создан."))
+
+    def _backup_json(self, dump_path):
         # Создаём дамп базы
         self.stdout.write(f"→ Создаю бэкап базы данных: {dump_path}")
         with open(dump_path, "w", encoding="utf-8") as f:
@@ -27,14 +87,46 @@ class Command(BaseCommand):
                 "--exclude", "sessions",
                 stdout=f
             )
+        # sha256 для ETag при скачивании — сейчас, а не при просмотре списка бэкапов
+        backup_downloads.write_checksum(dump_path)
 
-        # (опционально) — архив медиа
-        media_dir = getattr(settings, "MEDIA_ROOT", None)
-        if media_dir and os.path.exists(media_dir):
-            archive_name = os.path.join(backup_dir, f"media_{timestamp}")
-            import tarfile
-            with tarfile.open(f"{archive_name}.tar.gz", "w:gz") as tar:
-                tar.add(media_dir, arcname=".")
-            self.stdout.write(f"→ Архив медиа сохранён: {archive_name}.tar.gz")
+    def _backup_ndjson(self, target, options, kind):
+        self.stdout.write(f"→ Создаю бэкап базы данных ({kind}): {target}/")
 
-        self.stdout.write(self.style.SUCCESS("✅ Бэкап успешно создан."))
+        def report(entry):
+            deleted = f", удалено {len(entry['deleted'])}" if entry["deleted"] else ""
+            self.stdout.write(
+                f"  {entry['label']}: {entry['rows']} строк{deleted}, {entry['bytes'] / 1024:.1f} КБ, "
+                f"{entry['seconds']:.2f} с [{entry['mode']}]"
+            )
+
+        try:
+            manifest = backup_engine.create_backup(
+                target,
+                workers=options["workers"],
+                compression=options["compression"],
+                chunk_size=options["chunk_size"],
+                on_model_done=report,
+                kind=kind,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        backup_downloads.write_checksum(os.path.join(target, backup_engine.MANIFEST_NAME))
+        rows = sum(m["rows"] for m in manifest["models"])
+        size = sum(m["bytes"] for m in manifest["models"])
+        self.stdout.write(
+            f"→ Таблиц: {len(manifest['models'])}, строк: {rows}, {size / 1024 / 1024:.1f} МБ "
+            f"({manifest['compression']}) за {manifest['seconds']:.1f} с"
+        )
+        if manifest["parent"]:
+            self.stdout.write(f"→ Родитель: {manifest['parent']}, полный бэкап цепочки: {manifest['base']}")
+
+    def _backup_media_cas(self, media_dir, backup_dir, timestamp, workers):
+        manifest_path = os.path.join(backup_dir, f"media_{timestamp}.json")
+        manifest = media_backup.backup_media(media_dir, backup_dir, manifest_path, workers=workers)
+        backup_downloads.write_checksum(manifest_path)
+        self.stdout.write(
+            f"→ Манифест медиа сохранён: {manifest_path} — файлов: {len(manifest['files'])}, "
+            f"хэшировано: {manifest['hashed']}, новых блобов: {manifest['new_blobs']} "
+            f"({manifest['new_bytes'] / 1024 / 1024:.1f} МБ) за {manifest['seconds']:.1f} с"
+        )
@@ -0,0 +1,67 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарки сценариев (каталог, карточка товара, корзина, оформление заказа, API, "
+        "аналитика, экспорт/импорт): время, число запросов и время в БД, сравнение с базовой линией."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Замеров на сценарий (по умолчанию 5).")
+        parser.add_argument("--warmup", type=int, default=1, help="Прогревочных прогонов (по умолчанию 1).")
+        parser.add_argument(
+            "--only", action="append",
+            help="Запустить только сценарии, в имени которых есть подстрока (можно несколько раз).",
+        )
+        parser.add_argument("--output", help="Сохранить результаты в JSON.")
+        parser.add_argument("--baseline", help="JSON базовой линии для сравнения.")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.25,
+            help="Допустимый рост медианного времени относительно базовой линии (по умолчанию 0.25 = 25%%).",
+        )
+        parser.add_argument(
+            "--min-delta-ms", type=float, default=2.0,
+            help="Рост времени меньше этого порога не считается регрессией (по умолчанию 2 мс).",
+        )
+
+    def handle(self, *args, **opts):
+        baseline = None
+        if opts.get("baseline"):
+            try:
+                baseline = json.loads(Path(opts["baseline"]).read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Не удалось прочитать базовую линию: {e}")
+
+        self.stdout.write(f"{'сценарий':<40} {'мс (мед.)':>10} {'мс p95':>9} {'запросов':>9} {'мс в БД':>9}")
+
+        def show(name, s):
+            self.stdout.write(f"{name:<40} {s['wall_ms']:>10.2f} {s['wall_p95_ms']:>9.2f} {s['queries']:>9} {s['db_ms']:>9.2f}")
+
+        try:
+            results = benchmarks.run(repeat=opts["repeat"], warmup=opts["warmup"], only=opts.get("only"), on_result=show)
+        except benchmarks.BenchmarkError as e:
+            raise CommandError(str(e))
+        if not results:
+            raise CommandError("Ни один сценарий не подошёл под --only.")
+
+        if opts.get("output"):
+            Path(opts["output"]).write_text(
+                json.dumps(benchmarks.make_report(results), ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            self.stdout.write(f"→ Результаты сохранены: {opts['output']}")
+
+        if baseline is not None:
+            regressions = benchmarks.compare(results, baseline, opts["tolerance"], opts["min_delta_ms"])
+            for name, message in regressions:
+                self.stdout.write(self.style.ERROR(f"  ✗ {name}: {message}"))
+            if regressions:
+                raise CommandError(f"Регрессий относительно базовой линии: {len(regressions)}")
+            self.stdout.write(self.style.SUCCESS("✅ Регрессий относительно базовой линии нет."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"✅ Сценариев: {len(results)}."))
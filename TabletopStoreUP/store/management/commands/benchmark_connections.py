@@ -0,0 +1,67 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import db_connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Задержка запросов при конкуренции в режимах работы с соединениями: новое соединение на запрос, "
+        "постоянные соединения с проверкой, пул psycopg 3. Выводит rps, p50/p95/p99 и число подключений."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mode", action="append", choices=db_connections.MODES,
+            help="Режим (можно несколько раз; по умолчанию все).",
+        )
+        parser.add_argument("--concurrency", type=int, default=20, help="Параллельных клиентов (по умолчанию 20).")
+        parser.add_argument("--requests", type=int, default=200, help="Запросов на клиента (по умолчанию 200).")
+        parser.add_argument("--pool-min", type=int, default=2, help="min_size пула (по умолчанию 2).")
+        parser.add_argument("--pool-max", type=int, help="max_size пула (по умолчанию = --concurrency).")
+        parser.add_argument("--pool-timeout", type=float, default=10, help="Ожидание соединения из пула, с.")
+        parser.add_argument("--seed", type=int, help="Зерно выбора товаров.")
+        parser.add_argument("--output", help="Сохранить результаты в JSON.")
+
+    def handle(self, *args, **opts):
+        if opts["concurrency"] < 1 or opts["requests"] < 1:
+            raise CommandError("--concurrency и --requests должны быть положительными")
+        modes = opts.get("mode") or db_connections.MODES
+        pool_options = {
+            "min_size": opts["pool_min"],
+            "max_size": opts.get("pool_max") or opts["concurrency"],
+            "timeout": opts["pool_timeout"],
+        }
+        self.stdout.write(f"→ {opts['concurrency']} клиентов × {opts['requests']} запросов, режимы: {', '.join(modes)}")
+        try:
+            report = db_connections.run(
+                modes=modes, concurrency=opts["concurrency"], requests=opts["requests"],
+                pool_options=pool_options, seed=opts.get("seed"),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{'режим':<12} {'запросов':>9} {'ошибок':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'подключений':>12}")
+        for mode, r in report.items():
+            if "skipped" in r:
+                self.stdout.write(self.style.WARNING(f"{mode:<12} пропущен: {r['skipped']}"))
+                continue
+            self.stdout.write(
+                f"{mode:<12} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+                f"{r['p99_ms']:>8} {r['connects']:>12}"
+            )
+            for sample in r["error_samples"]:
+                self.stdout.write(self.style.WARNING(f"    {sample}"))
+            if r["pool"]:
+                pool = r["pool"]
+                self.stdout.write(
+                    f"    пул: соединений открыто {pool.get('connections_num', 0)}, "
+                    f"ожидание {pool.get('requests_wait_ms', 0)} мс на {pool.get('requests_num', 0)} выдач, "
+                    f"очередь {pool.get('requests_queued', 0)}"
+                )
+        if opts.get("output"):
+            Path(opts["output"]).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+            self.stdout.write(f"→ Результаты: {opts['output']}")
+        self.stdout.write(self.style.SUCCESS("✅ Замер завершён."))
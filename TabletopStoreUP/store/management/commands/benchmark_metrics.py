@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Накладные расходы метрик: запись счётчика и гистограммы (в памяти и в mmap-файле), "
+        "MetricsMiddleware на пустом ответе, сборка /metrics из файлов нескольких воркеров."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000, help="Повторов на замер (по умолчанию 20000).")
+        parser.add_argument("--workers", type=int, default=8, help="Файлов воркеров при сборке /metrics (по умолчанию 8).")
+
+    def handle(self, *args, **opts):
+        if opts["iterations"] < 1 or opts["workers"] < 1:
+            raise CommandError("--iterations и --workers должны быть положительными")
+        self.stdout.write(f"→ Замер: {opts['iterations']} повторов…")
+        r = metrics.measure_overhead(iterations=opts["iterations"], workers=opts["workers"])
+
+        self.stdout.write(f"{'операция':<28} {'память, мкс':>12} {'файл, мкс':>12}")
+        for label, name in (("counter.inc", "counter_inc"), ("histogram.observe", "histogram_observe"),
+                            ("middleware (пустой ответ)", "middleware")):
+            self.stdout.write(f"{label:<28} {r[name + '_memory_us']:>12.2f} {r[name + '_file_us']:>12.2f}")
+        overhead = r["middleware_file_us"] - r["bare_view_us"]
+        self.stdout.write(f"→ Middleware добавляет к запросу ≈{overhead:.1f} мкс (с файлами воркеров)")
+        self.stdout.write(
+            f"→ Сборка /metrics: {r['scrape_us'] / 1000:.2f} мс на {r['scrape_workers']} воркеров, "
+            f"{r['scrape_series']} рядов"
+        )
+        self.stdout.write(self.style.SUCCESS("✅ Замер завершён."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import customer_analytics
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает RFM-сегменты покупателей и матрицу удержания когорт (NumPy, один потоковый проход по заказам)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=100_000,
+            help="Сколько заказов читать из курсора за раз (по умолчанию 100000).",
+        )
+
+    def handle(self, *args, **opts):
+        with customer_analytics.run_lock() as acquired:
+            if not acquired:
+                raise CommandError("Пересчёт уже выполняется другим процессом.")
+            stats = customer_analytics.run(chunk_size=opts["chunk_size"])
+        self.stdout.write(
+            f"→ Заказов: {stats['orders']}, покупателей: {stats['customers']}, ячеек когорт: {stats['cohort_cells']}"
+        )
+        self.stdout.write(
+            f"  загрузка {stats['load_s']:.2f} с, расчёт {stats['compute_s']:.2f} с, запись {stats['persist_s']:.2f} с"
+        )
+        self.stdout.write(self.style.SUCCESS("✅ Клиентская аналитика пересчитана."))
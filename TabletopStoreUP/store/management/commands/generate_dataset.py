@@ -0,0 +1,102 @@
+import datetime
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.dateparse import parse_date
+
+from store import backup_engine, dataset, rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует детерминированный синтетический набор данных (пользователи, товары, заказы "
+        "с позициями, оплатами и доставками, отзывы) для нагрузочного тестирования."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=42, help="Зерно генератора (по умолчанию 42).")
+        parser.add_argument("--users", type=int, default=1000, help="Пользователей (по умолчанию 1000).")
+        parser.add_argument("--products", type=int, default=500, help="Товаров (по умолчанию 500).")
+        parser.add_argument("--orders", type=int, default=5000, help="Заказов (по умолчанию 5000).")
+        parser.add_argument("--reviews", type=int, default=5000, help="Отзывов, примерно (по умолчанию 5000).")
+        parser.add_argument("--days", type=int, default=730, help="Глубина истории заказов в днях (по умолчанию 730).")
+        parser.add_argument("--end-date", help="Последний день истории (YYYY-MM-DD). По умолчанию — сегодня.")
+        parser.add_argument("--password", default="demo12345", help="Пароль всех сгенерированных пользователей.")
+        parser.add_argument(
+            "--workers", type=int, default=min(4, os.cpu_count() or 1),
+            help="Процессов для записи кусков (на SQLite всегда 1).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=20000, help="Строк в одном куске (по умолчанию 20000).")
+        parser.add_argument(
+            "--skip-rollup", action="store_true",
+            help="Не перестраивать дневной срез продаж после генерации.",
+        )
+
+    def handle(self, *args, **opts):
+        end_date = None
+        if opts.get("end_date"):
+            end_date = parse_date(opts["end_date"])
+            if end_date is None:
+                raise CommandError("--end-date ожидается в формате YYYY-MM-DD.")
+        t0 = time.perf_counter()
+        try:
+            plan = dataset.build_plan(
+                seed=opts["seed"], users=opts["users"], products=opts["products"], orders=opts["orders"],
+                reviews=opts["reviews"], days=opts["days"], end_date=end_date, password=opts["password"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"→ Пользователи: {plan['users']} (seed {plan['seed']})")
+        report = dataset.create_users(plan)
+        self.stdout.write(f"  создано {report.created}, уже было {report.skipped} за {report.elapsed:.1f} с")
+        if report.errors:
+            raise CommandError("; ".join(report.errors[:5]))
+
+        workers = 1 if connection.vendor == "sqlite" else max(1, opts["workers"])
+        totals = Counter()
+        for phase in dataset.tasks(plan, opts["chunk_size"]):
+            if not phase:
+                continue
+            started = time.perf_counter()
+            for result in self._run_phase(plan, phase, workers):
+                totals.update(result)
+            kinds = sorted({kind for kind, *_ in phase})
+            self.stdout.write(
+                f"→ {', '.join(kinds)}: кусков {len(phase)} за {time.perf_counter() - started:.1f} с"
+            )
+
+        backup_engine.reset_sequences(["store.product", "store.order"])
+        for table, rows in sorted(totals.items()):
+            self.stdout.write(f"  {table}: {rows}")
+
+        if not opts["skip_rollup"] and totals["orders"]:
+            self.stdout.write("→ Перестраиваю дневной срез продаж")
+            end = plan["start_date"] + datetime.timedelta(days=plan["days"])
+            if workers == 1:
+                # в этом же соединении: потоки rebuild_sales_rollup на SQLite упираются в блокировку
+                rows = rollup.rebuild_range(plan["start_date"], end)
+                self.stdout.write(f"  строк среза: {rows}")
+            else:
+                call_command(
+                    "rebuild_sales_rollup", start=plan["start_date"].isoformat(), end=end.isoformat(),
+                    workers=workers, stdout=self.stdout,
+                )
+        self.stdout.write(self.style.SUCCESS(f"✅ Набор данных создан за {time.perf_counter() - t0:.1f} с."))
+
+    def _run_phase(self, plan, phase, workers):
+        if workers == 1:
+            for task in phase:
+                yield dataset.run_task(plan, *task)
+            return
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=backup_engine._init_worker) as pool:
+            futures = [pool.submit(dataset.run_task_in_worker, plan, *task) for task in phase]
+            for future in as_completed(futures):
+                yield future.result()
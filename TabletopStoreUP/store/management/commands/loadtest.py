@@ -0,0 +1,79 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест: N виртуальных покупателей проходят сценарий каталог → фильтр → товар → "
+        "корзина → заказ → оплата, в этом процессе или по HTTP. Выводит пропускную способность, "
+        "p50/p95/p99 по шагам, ошибки и сверку остатков (перепродажи)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10, help="Виртуальных пользователей (по умолчанию 10).")
+        parser.add_argument("--duration", type=float, default=30, help="Длительность, секунд (по умолчанию 30).")
+        parser.add_argument(
+            "--iterations", type=int, default=0,
+            help="Сценариев на пользователя вместо ограничения по времени.",
+        )
+        parser.add_argument(
+            "--base-url",
+            help="Адрес запущенного сервера (например, http://127.0.0.1:8000). Без него — в этом процессе.",
+        )
+        parser.add_argument("--password", default="loadtest123", help="Пароль аккаунтов loadtest_vu_*.")
+        parser.add_argument("--think-ms", type=float, default=0, help="Средняя пауза между сценариями, мс.")
+        parser.add_argument("--hot-products", type=int, default=3, help="Горячих товаров для конкуренции (по умолчанию 3).")
+        parser.add_argument("--hot-stock", type=int, help="Выставить горячим товарам этот остаток перед прогоном.")
+        parser.add_argument("--hot-ratio", type=float, default=0.5, help="Доля покупок горячих товаров (по умолчанию 0.5).")
+        parser.add_argument("--qty", type=int, default=1, help="Количество товара в одной покупке.")
+        parser.add_argument("--fail-ratio", type=float, default=0.1, help="Доля неуспешных оплат (по умолчанию 0.1).")
+        parser.add_argument("--seed", type=int, help="Зерно для выбора товаров и исходов оплаты.")
+        parser.add_argument("--output", help="Сохранить сводку в JSON.")
+
+    def handle(self, *args, **opts):
+        self.stdout.write(
+            f"→ Нагрузка: {opts['users']} польз., "
+            f"{str(opts['iterations']) + ' сценариев на польз.' if opts['iterations'] else str(opts['duration']) + ' с'}, "
+            f"{opts.get('base_url') or 'в процессе'}"
+        )
+        try:
+            summary = loadtest.run(
+                vus=opts["users"], duration=opts["duration"], iterations=opts["iterations"],
+                base_url=opts.get("base_url"), password=opts["password"], think_ms=opts["think_ms"],
+                hot_products=opts["hot_products"], hot_stock=opts.get("hot_stock"), hot_ratio=opts["hot_ratio"],
+                qty=opts["qty"], fail_ratio=opts["fail_ratio"], seed=opts.get("seed"),
+            )
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{'шаг':<18} {'запросов':>9} {'ошибок':>7} {'отказов':>8} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+        for step, s in summary["endpoints"].items():
+            self.stdout.write(
+                f"{step:<18} {s['requests']:>9} {s['errors']:>7} {s['rejected']:>8} {s['rps']:>7} {s['p50_ms']:>8} "
+                f"{s['p95_ms']:>8} {s['p99_ms']:>8} {s['max_ms']:>8}"
+            )
+            for sample in s["error_samples"]:
+                self.stdout.write(self.style.WARNING(f"    {sample}"))
+        self.stdout.write(
+            f"→ {summary['requests']} запросов за {summary['elapsed']} с ({summary['rps']} rps), "
+            f"сценариев {summary['journeys']} ({summary['journeys_per_sec']}/с), ошибок {summary['errors']}, отказов {summary['rejected']}"
+        )
+        for pid, s in summary["stock"].items():
+            self.stdout.write(
+                f"  товар #{pid}: остаток {s['initial']} → {s['final']}, продано {s['sold']}, "
+                f"перепродано {s['oversold']}, потеряно списаний {s['lost_updates']}"
+            )
+        if opts.get("output"):
+            Path(opts["output"]).write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+            self.stdout.write(f"→ Сводка сохранена: {opts['output']}")
+
+        if summary["oversold_units"] or summary["lost_updates"]:
+            self.stdout.write(self.style.ERROR(
+                f"✗ Перепродано единиц: {summary['oversold_units']}, потеряно списаний: {summary['lost_updates']}"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Нагрузочный тест завершён, перепродаж нет."))
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from store import import_jobs
+
+
+class Command(BaseCommand):
+    help = "Обрабатывает очередь фонового импорта каталога (CatalogImportJob)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Разобрать текущую очередь и завершиться (так запускается обработчик после загрузки).",
+        )
+        parser.add_argument(
+            "--poll", type=float, default=2.0,
+            help="Пауза между проверками очереди в режиме демона, секунд (по умолчанию 2).",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000,
+            help="Строк в одной транзакции импорта (по умолчанию 1000).",
+        )
+
+    def handle(self, *args, **opts):
+        if not opts["once"]:
+            self._run_daemon(opts)
+            return
+        processed = 0
+        # отпустив блокировку, проверяем очередь ещё раз: задачу, поставленную, пока мы работали,
+        # загрузка не отдала новому обработчику (видела блокировку)
+        while import_jobs.acquire_worker_lock():
+            try:
+                processed += self._drain(opts)
+            finally:
+                import_jobs.release_worker_lock()
+            if not import_jobs.has_queued():
+                break
+        self.stdout.write(self.style.SUCCESS(f"✅ Обработано задач импорта: {processed}."))
+
+    def _run_daemon(self, opts):
+        while True:
+            import_jobs.refresh_worker_lock()  # загрузки не запускают лишних обработчиков
+            if not self._drain(opts):
+                time.sleep(opts["poll"])
+
+    def _drain(self, opts):
+        processed = 0
+        while True:
+            if not connection.in_atomic_block:  # внутри транзакции (call_command в тестах) соединение не трогаем
+                close_old_connections()
+            job = import_jobs.claim_next()
+            if job is None:
+                return processed
+            self.stdout.write(f"→ Импорт #{job.pk}: {job.original_name}")
+            job = import_jobs.process_job(job, chunk_size=opts["chunk_size"])
+            self.stdout.write(
+                f"  {job.get_status_display()}: строк {job.rows_done}, создано {job.created_count}, "
+                f"обновлено {job.updated_count}, ошибок {job.error_count} ({job.rows_per_sec} строк/с)"
+            )
+            import_jobs.refresh_worker_lock()
+            processed += 1
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import catalog_import, provisioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Массово создаёт пользователей с профилями и настройками из CSV/TSV/JSON/NDJSON "
+        "(колонки: username, email, password или password_hash, full_name, phone, role, "
+        "is_staff, is_superuser, first_name, last_name, date_joined). Сигналы post_save не вызываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл с пользователями.")
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000,
+            help="Пользователей в одной транзакции (по умолчанию 1000).",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4,
+            help="Потоков для хэширования открытых паролей (по умолчанию 4).",
+        )
+        parser.add_argument(
+            "--default-role", default="client",
+            help="Роль для строк без колонки role (по умолчанию client).",
+        )
+
+    def handle(self, *args, **opts):
+        def progress(report):
+            self.stdout.write(
+                f"  строк {report.rows}: создано {report.created}, пропущено {report.skipped}, "
+                f"ошибок {len(report.errors)} ({report.rows_per_sec} строк/с)"
+            )
+
+        try:
+            fh = open(opts["path"], "rb")
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"→ Создаю пользователей из {opts['path']}")
+        with fh:
+            try:
+                report = provisioning.UserProvisioner(
+                    chunk_size=opts["chunk_size"],
+                    workers=opts["workers"],
+                    default_role=opts["default_role"],
+                    on_progress=progress,
+                ).run(catalog_import.iter_rows(fh, opts["path"]))
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        for message in report.errors[:20]:
+            self.stdout.write(self.style.WARNING(f"  {message}"))
+        if len(report.errors) > 20:
+            self.stdout.write(self.style.WARNING(f"  … и ещё {len(report.errors) - 20}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Создано пользователей: {report.created}, пропущено существующих: {report.skipped} "
+            f"за {report.elapsed:.1f} с."
+        ))
@@ -2,15 +2,18 @@ import os
 import re
 import sys
 import glob
+import time
 import tarfile
 from pathlib import Path
 from django.conf import settings
 from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
 
+from store import backup_engine, media_backup
+
 BACKUP_DIR = Path(settings.BASE_DIR) / "backups"
-DUMP_PATTERN = re.compile(r"backup_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}\.json$")
-MEDIA_PATTERN = re.compile(r"media_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}\.tar\.gz$")
+DUMP_PATTERN = re.compile(r"backup_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(\.json)?$")
+MEDIA_PATTERN = re.compile(r"media_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(\.tar\.gz|\.json)$")
 
 class Command(BaseCommand):
     help = "Восстанавливает базу данных (и, опционально, медиа) из резервной копии в backups/"
@@ -19,7 +22,7 @@ class Command(BaseCommand):
         parser.add_argument(
             "--file",
             dest="file",
-            help="Путь к конкретному JSON дампу (например, backups/backup_2025-10-25_12-34-56.json)",
+            help="Путь к JSON дампу или каталогу бэкапа ndjson (например, backups/backup_2025-10-25_12-34-56.json)",
         )
         parser.add_argument(
             "--latest",
@@ -29,7 +32,8 @@ class Command(BaseCommand):
         parser.add_argument(
             "--media",
             action="store_true",
-            help="Также восстановить архив медиа, если найден (media_*.tar.gz).",
+            help="Также восстановить медиа, если найдены: манифест media_*.json (копируются только "
+                 "отсутствующие и изменённые файлы) или архив media_*.tar.gz.",
         )
         parser.add_argument(
             "--skip-flush",
@@ -41,6 +45,17 @@ class Command(BaseCommand):
             action="store_true",
             help="Не спрашивать подтверждение (удобно для CI/скриптов).",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Потоков для параллельной загрузки независимых таблиц (бэкап ndjson).",
+        )
+        parser.add_argument(
+            "--no-verify",
+            action="store_true",
+            help="Не сверять sha256 файлов бэкапа ndjson с манифестом.",
+        )
 
     def handle(self, *args, **opts):
         dump_path = self._resolve_dump_path(opts.get("file"), opts.get("latest"))
@@ -58,20 +73,26 @@ class Command(BaseCommand):
                 self.stdout.write("Операция отменена.")
                 return
 
-        # 1) Очистка БД
-        if not opts.get("skip_flush"):
-            self.stdout.write("→ Очищаю текущую БД (flush)...")
-            call_command("flush", verbosity=0, interactive=False)
+        if dump_path.is_dir():
+            self._restore_ndjson(dump_path, opts)
+        else:
+            # 1) Очистка БД
+            if not opts.get("skip_flush"):
+                self.stdout.write("→ Очищаю текущую БД (flush)...")
+                call_command("flush", verbosity=0, interactive=False)
 
-        # 2) Восстановление данных
-        self.stdout.write(f"→ Загружаю дамп: {dump_path.name}")
-        call_command("loaddata", str(dump_path), verbosity=1)
+            # 2) Восстановление данных
+            self.stdout.write(f"→ Загружаю дамп: {dump_path.name}")
+            call_command("loaddata", str(dump_path), verbosity=1)
 
         # 3) (опц.) Восстановление медиа
         if opts.get("media"):
             media_archive = self._find_matching_media(dump_path)
             if media_archive and media_archive.exists():
-                self._restore_media(media_archive)
+                if media_archive.suffix == ".json":
+                    self._restore_media_cas(media_archive)
+                else:
+                    self._restore_media(media_archive)
             else:
                 self.stdout.write(self.style.WARNING(
                     "Архив медиа не найден для этого дампа. Пропускаю восстановление медиа."
@@ -90,21 +111,53 @@ class Command(BaseCommand):
             return p
 
         dumps = sorted(
-            (p for p in BACKUP_DIR.glob("backup_*.json") if DUMP_PATTERN.search(p.name)),
+            (
+                p for p in BACKUP_DIR.glob("backup_*")
+                if DUMP_PATTERN.search(p.name) and (p.is_file() or (p / backup_engine.MANIFEST_NAME).exists())
+            ),
             key=lambda p: p.stat().st_mtime,
             reverse=True,
         )
         if not dumps:
-            raise CommandError(f"В каталоге {BACKUP_DIR} не найдено файлов backup_*.json")
+            raise CommandError(f"В каталоге {BACKUP_DIR} не найдено бэкапов backup_*")
         return dumps[0]
 
+    def _restore_ndjson(self, backup_path: Path, opts):
+        """
+        Быстрая загрузка бэкапа по таблицам: пакетные INSERT/COPY без сигналов, по уровням зависимостей.
+        Инкрементальный бэкап восстанавливается вместе со всей цепочкой от полного.
+        """
+        self.stdout.write(f"→ Загружаю бэкап: {backup_path.name}/ (flush: {'нет' if opts.get('skip_flush') else 'да'})")
+
+        def report(r):
+            mark = "" if r["rows"] == r["expected"] else self.style.WARNING(f" (в манифесте {r['expected']})")
+            self.stdout.write(
+                f"  {r['backup']} · {r['label']}: {r['rows']} строк за {r['seconds']:.2f} с [{r['method']}]{mark}"
+            )
+            if r["dropped_columns"]:
+                self.stdout.write(self.style.WARNING(f"    пропущены колонки: {', '.join(r['dropped_columns'])}"))
+
+        t0 = time.perf_counter()
+        try:
+            reports = backup_engine.restore_backup(
+                backup_path,
+                workers=opts["workers"],
+                flush=not opts.get("skip_flush"),
+                verify=not opts.get("no_verify"),
+                on_table_done=report,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        rows = sum(r["rows"] for r in reports)
+        self.stdout.write(f"→ Таблиц: {len(reports)}, строк: {rows}, всего {time.perf_counter() - t0:.1f} с")
+
     def _find_matching_media(self, dump_path: Path) -> Path | None:
-        ts = dump_path.stem.replace("backup_", "")
-        exact = BACKUP_DIR / f"media_{ts}.tar.gz"
-        if exact.exists():
-            return exact
+        ts = dump_path.name.replace("backup_", "").replace(".json", "")
+        for exact in (BACKUP_DIR / f"media_{ts}.json", BACKUP_DIR / f"media_{ts}.tar.gz"):
+            if exact.exists():
+                return exact
         medias = sorted(
-            (p for p in BACKUP_DIR.glob("media_*.tar.gz") if MEDIA_PATTERN.search(p.name)),
+            (p for p in BACKUP_DIR.glob("media_*") if MEDIA_PATTERN.search(p.name)),
             key=lambda p: p.stat().st_mtime,
             reverse=True,
         )
@@ -120,3 +173,15 @@ class Command(BaseCommand):
                 if not str(member_path.resolve()).startswith(str(media_root.resolve())):
                     raise CommandError("Небезопасный путь внутри архива медиа.")
             tar.extractall(path=media_root)
+
+    def _restore_media_cas(self, manifest_path: Path):
+        media_root = Path(getattr(settings, "MEDIA_ROOT", "media"))
+        self.stdout.write(f"→ Синхронизирую медиа в: {media_root} по манифесту {manifest_path.name}")
+        try:
+            stats = media_backup.restore_media(manifest_path, media_root)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"  файлов: {stats['files']}, скопировано: {stats['copied']} "
+            f"({stats['copied_bytes'] / 1024 / 1024:.1f} МБ)"
+        )
@@ -0,0 +1,174 @@
+"""
+Бэкап медиа с дедупликацией по содержимому.
+
+Каждый уникальный файл хранится один раз в backups/media_store/objects/<2 символа>/<sha256>,
+а бэкап — это только манифест media_<ts>.json: относительный путь → sha256, размер, mtime.
+Хэши считаются в пуле потоков; файлы, у которых размер и mtime совпали с предыдущим
+манифестом, не перечитываются. Восстановление копирует только отсутствующие или
+изменившиеся файлы.
+"""
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+FORMAT_NAME = "media-cas"
+FORMAT_VERSION = 1
+STORE_NAME = "media_store"
+
+
+def _sha256(path, block=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def blob_path(store, sha):
+    return Path(store) / "objects" / sha[:2] / sha
+
+
+def scan(root):
+    """{относительный путь (через /): os.stat_result} для всех файлов под root."""
+    root = Path(root)
+    found = {}
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    found[Path(entry.path).relative_to(root).as_posix()] = entry.stat(follow_symlinks=False)
+    return found
+
+
+def latest_manifest(backup_dir):
+    manifests = sorted(Path(backup_dir).glob("media_*.json"))
+    for path in reversed(manifests):
+        try:
+            return read_manifest(path)
+        except ValueError:
+            continue
+    return None
+
+
+def read_manifest(path):
+    manifest = json.loads(Path(path).read_text(encoding="utf-8"))
+    if manifest.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path}: это не манифест медиа-бэкапа")
+    return manifest
+
+
+def _store_blob(store, sha, source):
+    target = blob_path(store, sha)
+    if target.exists():
+        return 0
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{sha}.{os.getpid()}.tmp")
+    shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+    return target.stat().st_size
+
+
+def backup_media(media_root, backup_dir, manifest_path, workers=8):
+    """Сохраняет MEDIA_ROOT в хранилище блобов и пишет манифест. Возвращает манифест."""
+    t0 = time.perf_counter()
+    media_root, backup_dir = Path(media_root), Path(backup_dir)
+    store = backup_dir / STORE_NAME
+    previous = (latest_manifest(backup_dir) or {}).get("files", {})
+    files = scan(media_root)
+
+    known, to_hash = {}, []
+    for rel, st in files.items():
+        prev = previous.get(rel)
+        if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns \
+                and blob_path(store, prev["sha256"]).exists():
+            known[rel] = prev["sha256"]
+        else:
+            to_hash.append(rel)
+
+    claimed, lock = set(), threading.Lock()
+
+    def hash_and_store(rel):
+        source = media_root / rel
+        sha = _sha256(source)
+        # одинаковые файлы хэшируются параллельно: блоб пишет только первый поток
+        with lock:
+            first = sha not in claimed
+            claimed.add(sha)
+        return rel, sha, _store_blob(store, sha, source) if first else 0
+
+    new_bytes = new_blobs = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for rel, sha, written in pool.map(hash_and_store, to_hash):
+            known[rel] = sha
+            if written:
+                new_blobs += 1
+                new_bytes += written
+
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "files": {
+            rel: {"sha256": known[rel], "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            for rel, st in sorted(files.items())
+        },
+        "total_bytes": sum(st.st_size for st in files.values()),
+        "hashed": len(to_hash),
+        "new_blobs": new_blobs,
+        "new_bytes": new_bytes,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+    tmp = Path(manifest_path).with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, manifest_path)
+    return manifest
+
+
+def _safe_target(media_root, rel):
+    target = (media_root / rel).resolve()
+    if media_root.resolve() not in target.parents:
+        raise ValueError(f"Небезопасный путь в манифесте медиа: {rel}")
+    return target
+
+
+def restore_media(manifest_path, media_root, workers=8):
+    """
+    Восстанавливает медиа по манифесту: копирует только отсутствующие или отличающиеся файлы.
+    Файл считается неизменным, если совпадают размер и mtime, иначе сверяется sha256.
+    Возвращает статистику.
+    """
+    manifest_path, media_root = Path(manifest_path), Path(media_root)
+    manifest = read_manifest(manifest_path)
+    store = manifest_path.parent / STORE_NAME
+    media_root.mkdir(parents=True, exist_ok=True)
+
+    def sync(item):
+        rel, meta = item
+        target = _safe_target(media_root, rel)
+        if target.is_file():
+            st = target.stat()
+            if st.st_size == meta["size"] and (st.st_mtime_ns == meta["mtime_ns"] or _sha256(target) == meta["sha256"]):
+                return 0
+        source = blob_path(store, meta["sha256"])
+        if not source.exists():
+            raise ValueError(f"В хранилище нет блоба {meta['sha256']} для {rel}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        shutil.copyfile(source, tmp)
+        os.utime(tmp, ns=(meta["mtime_ns"], meta["mtime_ns"]))
+        os.replace(tmp, target)
+        return meta["size"]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        copied = list(pool.map(sync, manifest["files"].items()))
+    changed = [size for size in copied if size]
+    return {"files": len(copied), "copied": len(changed), "copied_bytes": sum(changed)}
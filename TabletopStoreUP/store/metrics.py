@@ -0,0 +1,516 @@
+"""
+Метрики в текстовом формате Prometheus: /metrics.
+
+MetricsMiddleware на каждый запрос пишет гистограммы времени ответа, числа SQL-запросов
+и времени в БД с меткой имени URL (store:product_list и т. п.). Счётчики кэша и
+оформления заказа ведут сами модули, где это происходит (analytics_cache, views).
+
+Значения лежат в хранилище процесса. Без METRICS_DIR это словарь в памяти — годится для
+runserver и одного процесса. С METRICS_DIR каждый процесс (воркер gunicorn) пишет в свой
+файл metrics_<pid>.db, отображённый в память (mmap): запись — обновление числа на месте,
+без системных вызовов. /metrics, какой бы воркер его ни отдавал, складывает файлы всех
+процессов, так что счётчики и гистограммы суммируются по всему серверу, а текущие
+значения (Gauge) — по ещё живым процессам. Каталог нужно очищать перед запуском
+сервера, иначе в сумму попадут процессы прошлого запуска.
+
+Глубина очереди импорта каталога и товары в корзинах — это состояние БД, а не события;
+они считаются запросом к базе в момент опроса.
+"""
+import bisect
+import hmac
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.models import Count, Sum
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .profiling import RequestTimer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+UNMATCHED = "<unmatched>"
+
+# файл: [used: uint32, 4 байта выравнивания], затем записи
+# [длина ключа: uint32][ключ UTF-8, дополненный до 8 байт][значение: double]
+_USED = struct.Struct("I4x")
+_LENGTH = struct.Struct("I")
+_VALUE = struct.Struct("d")
+FILE_PREFIX = "metrics_"
+FILE_SUFFIX = ".db"
+
+REGISTRY = {}
+
+
+def _align(position):
+    return (position + 7) // 8 * 8
+
+
+def _entries(buffer, used):
+    """(ключ, значение, позиция значения) всех записей файла до отметки used."""
+    position = _USED.size
+    while position < used:
+        (length,) = _LENGTH.unpack_from(buffer, position)
+        start = position + _LENGTH.size
+        key = bytes(buffer[start:start + length]).decode()
+        value_at = _align(start + length)
+        (value,) = _VALUE.unpack_from(buffer, value_at)
+        yield key, value, value_at
+        position = value_at + _VALUE.size
+
+
+class MemoryStore:
+    """Значения одного процесса в памяти."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = float(value)
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def close(self):
+        pass
+
+
+class FileStore:
+    """Значения одного процесса в файле, отображённом в память; его читают другие процессы."""
+
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._capacity = os.fstat(self._fd).st_size
+        if self._capacity < self.INITIAL_SIZE:
+            self._capacity = self.INITIAL_SIZE
+            os.ftruncate(self._fd, self._capacity)
+        self._map = mmap.mmap(self._fd, self._capacity)
+        self._used = _USED.unpack_from(self._map, 0)[0] or _USED.size
+        self._positions = {key: at for key, _, at in _entries(self._map, self._used)}
+
+    def _grow(self):
+        self._map.close()
+        self._capacity *= 2
+        os.ftruncate(self._fd, self._capacity)
+        self._map = mmap.mmap(self._fd, self._capacity)
+
+    def _position(self, key):
+        encoded = key.encode()
+        value_at = _align(self._used + _LENGTH.size + len(encoded))
+        end = value_at + _VALUE.size
+        while end > self._capacity:
+            self._grow()
+        _LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[self._used + _LENGTH.size:self._used + _LENGTH.size + len(encoded)] = encoded
+        _VALUE.pack_into(self._map, value_at, 0.0)
+        # отметку двигаем последней: читатель видит только дописанные записи
+        self._used = end
+        _USED.pack_into(self._map, 0, end)
+        self._positions[key] = value_at
+        return value_at
+
+    def add(self, key, amount):
+        with self._lock:
+            at = self._positions.get(key)
+            if at is None:
+                at = self._position(key)
+            _VALUE.pack_into(self._map, at, _VALUE.unpack_from(self._map, at)[0] + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            at = self._positions.get(key)
+            if at is None:
+                at = self._position(key)
+            _VALUE.pack_into(self._map, at, float(value))
+
+    def items(self):
+        with self._lock:
+            return [(key, value) for key, value, _ in _entries(self._map, self._used)]
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+def read_file(path):
+    """Записи файла другого процесса: [(ключ, значение)]."""
+    data = Path(path).read_bytes()
+    if len(data) < _USED.size:
+        return []
+    used = min(_USED.unpack_from(data, 0)[0], len(data))
+    return [(key, value) for key, value, _ in _entries(data, used)]
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def metrics_dir():
+    return getattr(settings, "METRICS_DIR", "")
+
+
+def store():
+    """Хранилище текущего процесса (после fork воркер получает своё)."""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store is None or _store_pid != pid:
+        with _store_lock:
+            if _store is None or _store_pid != pid:
+                directory = metrics_dir()
+                if directory:
+                    Path(directory).mkdir(parents=True, exist_ok=True)
+                    _store = FileStore(Path(directory) / f"{FILE_PREFIX}{pid}{FILE_SUFFIX}")
+                else:
+                    _store = MemoryStore()
+                _store_pid = pid
+    return _store
+
+
+def reset():
+    """Закрывает хранилище процесса; следующая запись откроет новое (для тестов и бенчмарка)."""
+    global _store, _store_pid
+    with _store_lock:
+        if _store is not None and _store_pid == os.getpid():
+            _store.close()
+        _store = _store_pid = None
+
+
+def _format(value):
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sample_line(sample, labelnames, values, value):
+    labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(labelnames, values))
+    return f"{sample}{{{labels}}} {_format(value)}" if labels else f"{sample} {_format(value)}"
+
+
+def _key(family, sample, labels):
+    return json.dumps([family, sample, labels], ensure_ascii=False, separators=(",", ":"))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+        REGISTRY[name] = self
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {', '.join(self.labelnames) or '(нет)'}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        values = self._labels(labels)
+        key = self._keys.get(values)
+        if key is None:
+            key = self._keys[values] = _key(self.name, self.name + "_total", list(values))
+        store().add(key, amount)
+
+
+class Gauge(Metric):
+    """Текущее значение процесса; /metrics суммирует значения живых процессов."""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        values = self._labels(labels)
+        pid = os.getpid()
+        key = self._keys.get((values, pid))
+        if key is None:
+            key = self._keys[(values, pid)] = _key(self.name, self.name, list(values) + [str(pid)])
+        store().set(key, value)
+
+
+def _alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError, OverflowError):
+        return True
+    return True
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.bounds = [_format(b) for b in self.buckets] + ["+Inf"]
+
+    def _sample_keys(self, values):
+        keys = self._keys.get(values)
+        if keys is None:
+            labels = list(values)
+            keys = self._keys[values] = (
+                [_key(self.name, self.name + "_bucket", labels + [le]) for le in self.bounds],
+                _key(self.name, self.name + "_sum", labels),
+                _key(self.name, self.name + "_count", labels),
+            )
+        return keys
+
+    def observe(self, value, **labels):
+        buckets, total, count = self._sample_keys(self._labels(labels))
+        s = store()
+        # в файле — число попаданий в свою корзину; накопительные le считаются при выдаче
+        s.add(buckets[bisect.bisect_left(self.buckets, value)], 1)
+        s.add(total, value)
+        s.add(count, 1)
+
+
+REQUEST_LATENCY = Histogram(
+    "store_http_request_duration_seconds", "Время ответа по имени URL.", ["view", "method", "status"],
+)
+DB_QUERIES = Histogram(
+    "store_db_queries_per_request", "Число SQL-запросов на HTTP-запрос.", ["view"], buckets=QUERY_COUNT_BUCKETS,
+)
+DB_TIME = Histogram(
+    "store_db_time_seconds", "Время в БД на HTTP-запрос.", ["view"], buckets=DB_TIME_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "store_cache_requests", "Обращения к кэшу: result=hit|miss.", ["cache", "result"],
+)
+CHECKOUT = Counter(
+    "store_checkout",
+    "Оформление заказа: success — заказ оплачен или принят с оплатой при получении, "
+    "failure — оплата не прошла, out_of_stock — товара не хватило.",
+    ["result"],
+)
+OVERSELL_UNITS = Counter(
+    "store_checkout_oversell_units", "Единиц товара в корзинах сверх остатка на момент оформления.",
+)
+
+
+def cache_lookup(cache_name, hits, misses=0):
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache_name, result="hit")
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache_name, result="miss")
+
+
+def _all_values():
+    """Суммы по ключам: все файлы каталога (все процессы) или память этого процесса."""
+    directory = metrics_dir()
+    if not directory:
+        return dict(store().items())
+    totals = {}
+    for path in Path(directory).glob(f"{FILE_PREFIX}*{FILE_SUFFIX}"):
+        try:
+            entries = read_file(path)
+        except (OSError, struct.error, UnicodeDecodeError):
+            continue  # файл создаётся прямо сейчас или обрезан
+        for key, value in entries:
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _event_lines():
+    families = {}
+    for key, value in _all_values().items():
+        family, sample, labels = json.loads(key)
+        families.setdefault(family, {})[(sample, tuple(labels))] = value
+    lines = []
+    for name, metric in REGISTRY.items():
+        samples = families.get(name, {})
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        if metric.kind == "counter":
+            for (sample, values), value in sorted(samples.items()):
+                lines.append(_sample_line(sample, metric.labelnames, values, value))
+            continue
+        if metric.kind == "gauge":
+            # последняя метка — pid; завершившиеся воркеры не учитываются
+            live = {}
+            for (sample, values), value in samples.items():
+                if _alive(values[-1]):
+                    live[values[:-1]] = live.get(values[:-1], 0.0) + value
+            for values, value in sorted(live.items()):
+                lines.append(_sample_line(name, metric.labelnames, values, value))
+            continue
+        labelsets = sorted({values for (sample, values) in samples if sample == name + "_count"})
+        names = metric.labelnames + ("le",)
+        for values in labelsets:
+            cumulative = 0.0
+            for le in metric.bounds:
+                cumulative += samples.get((name + "_bucket", values + (le,)), 0.0)
+                lines.append(_sample_line(name + "_bucket", names, values + (le,), cumulative))
+            lines.append(_sample_line(name + "_sum", metric.labelnames, values, samples.get((name + "_sum", values), 0.0)))
+            lines.append(_sample_line(name + "_count", metric.labelnames, values, samples.get((name + "_count", values), 0.0)))
+    return lines
+
+
+def _state_lines():
+    """Состояние из БД на момент опроса: очередь импорта и товары в корзинах."""
+    from .models import CartItem, CatalogImportJob
+
+    jobs = dict(CatalogImportJob.objects.values_list("status").annotate(n=Count("id")))
+    carts = CartItem.objects.aggregate(units=Sum("quantity"), lines=Count("id"), carts=Count("cart", distinct=True))
+    lines = [
+        "# HELP store_catalog_import_jobs Задания импорта каталога по статусу (queued — глубина очереди).",
+        "# TYPE store_catalog_import_jobs gauge",
+    ]
+    for status, _ in CatalogImportJob.STATUS_CHOICES:
+        lines.append(_sample_line("store_catalog_import_jobs", ("status",), (status,), jobs.get(status, 0)))
+    lines += [
+        "# HELP store_cart_reserved_units Единиц товара, отложенных в корзинах.",
+        "# TYPE store_cart_reserved_units gauge",
+        _sample_line("store_cart_reserved_units", (), (), carts["units"] or 0),
+        "# HELP store_cart_lines Позиций в корзинах.",
+        "# TYPE store_cart_lines gauge",
+        _sample_line("store_cart_lines", (), (), carts["lines"]),
+        "# HELP store_carts_active Непустых корзин.",
+        "# TYPE store_carts_active gauge",
+        _sample_line("store_carts_active", (), (), carts["carts"]),
+    ]
+    return lines
+
+
+def exposition(with_state=True):
+    """Текст для Prometheus: события всех процессов и (по умолчанию) состояние из БД."""
+    lines = _event_lines()
+    if with_state:
+        lines += _state_lines()
+    return "\n".join(lines) + "\n"
+
+
+def _allowed_ip(addr):
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in ipaddress.ip_network(net, strict=False) for net in getattr(settings, "METRICS_ALLOWED_IPS", []))
+
+
+def metrics_allowed(request):
+    """Доступ к /metrics: Bearer-токен METRICS_TOKEN, адрес из METRICS_ALLOWED_IPS или сотрудник."""
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    if _allowed_ip(request.META.get("REMOTE_ADDR", "")):
+        return True
+    user = getattr(request, "user", None)
+    return bool(user is not None and user.is_active and user.is_staff)
+
+
+def metrics_view(request):
+    """Ответ /metrics; без токена, разрешённого адреса или входа сотрудника — 403."""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden("metrics token required")
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """Гистограммы времени ответа, числа SQL-запросов и времени в БД по имени URL."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, "METRICS_ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timer))
+            response = self.get_response(request)
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match and match.view_name else UNMATCHED
+        REQUEST_LATENCY.observe(
+            timer.total_seconds, view=view, method=request.method, status=f"{response.status_code // 100}xx",
+        )
+        DB_QUERIES.observe(timer.sql_count, view=view)
+        DB_TIME.observe(timer.sql_seconds, view=view)
+        return response
+
+
+def _per_call_us(func, iterations):
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def measure_overhead(iterations=20000, workers=8):
+    """
+    Стоимость сбора метрик: запись в память и в файл, middleware на пустом ответе,
+    сборка /metrics из файлов workers процессов. Времена — микросекунды.
+    """
+    from django.test import RequestFactory, override_settings
+
+    counter = Counter("store_benchmark_counter", "Бенчмарк метрик.", ["kind"])
+    histogram = Histogram("store_benchmark_seconds", "Бенчмарк метрик.", ["kind"])
+    request = RequestFactory().get("/")
+
+    def empty_view(request):
+        return HttpResponse("")
+
+    middleware = MetricsMiddleware.__new__(MetricsMiddleware)
+    middleware.get_response = empty_view
+    report = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for mode, directory in (("memory", ""), ("file", tmp)):
+                with override_settings(METRICS_DIR=directory):
+                    reset()
+                    report[f"counter_inc_{mode}_us"] = _per_call_us(lambda: counter.inc(kind=mode), iterations)
+                    report[f"histogram_observe_{mode}_us"] = _per_call_us(
+                        lambda: histogram.observe(0.042, kind=mode), iterations,
+                    )
+                    report[f"middleware_{mode}_us"] = _per_call_us(lambda: middleware(request), iterations)
+            report["bare_view_us"] = _per_call_us(lambda: empty_view(request), iterations)
+
+            with override_settings(METRICS_DIR=tmp):
+                # файлы соседних воркеров: копии нашего — тот же набор рядов
+                ours = store().path
+                for n in range(1, workers):
+                    (Path(tmp) / f"{FILE_PREFIX}bench{n}{FILE_SUFFIX}").write_bytes(ours.read_bytes())
+                rounds = max(1, iterations // 1000)
+                t0 = time.perf_counter()
+                for _ in range(rounds):
+                    text = exposition(with_state=False)
+                report["scrape_us"] = (time.perf_counter() - t0) / rounds * 1e6
+                report["scrape_workers"] = workers
+                report["scrape_series"] = sum(1 for line in text.splitlines() if line and not line.startswith("#"))
+                reset()
+    finally:
+        REGISTRY.pop(counter.name, None)
+        REGISTRY.pop(histogram.name, None)
+    return report
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-19 10:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_salesdailyrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CohortRetention',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort', models.DateField()),
+                ('month_offset', models.PositiveSmallIntegerField()),
+                ('customers', models.PositiveIntegerField()),
+            ],
+            options={
+                'ordering': ('cohort', 'month_offset'),
+                'unique_together': {('cohort', 'month_offset')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerRFM',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recency_days', models.PositiveIntegerField()),
+                ('frequency', models.PositiveIntegerField()),
+                ('monetary', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('r_score', models.PositiveSmallIntegerField()),
+                ('f_score', models.PositiveSmallIntegerField()),
+                ('m_score', models.PositiveSmallIntegerField()),
+                ('segment', models.CharField(db_index=True, max_length=20)),
+                ('cohort', models.DateField(help_text='Месяц первой покупки')),
+                ('computed_at', models.DateTimeField()),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rfm', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
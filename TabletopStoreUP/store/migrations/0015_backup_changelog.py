@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-19 10:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def install_triggers(apps, schema_editor):
+    from store import backup_changes
+    backup_changes.install_triggers(apps.get_models(include_auto_created=True), schema_editor.connection)
+
+
+def drop_triggers(apps, schema_editor):
+    from store import backup_changes
+    backup_changes.drop_triggers(apps.get_models(include_auto_created=True), schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_product_updated_at_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackupChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=100)),
+                ('row_pk', models.CharField(max_length=64)),
+                ('op', models.CharField(max_length=1)),
+                ('txid', models.BigIntegerField(blank=True, db_index=True, null=True)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['table_name', 'id'], name='store_backupchg_table_idx')],
+            },
+        ),
+        migrations.RunPython(install_triggers, reverse_code=drop_triggers),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_request_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQueryFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True)),
+                ('normalized_sql', models.TextField()),
+                ('example_sql', models.TextField(blank=True)),
+                ('example_params', models.TextField(blank=True)),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('p50_ms', models.FloatField(default=0)),
+                ('p95_ms', models.FloatField(default=0)),
+                ('p99_ms', models.FloatField(default=0)),
+                ('recent_ms', models.JSONField(blank=True, default=list)),
+                ('origins', models.JSONField(blank=True, default=dict)),
+                ('plan', models.TextField(blank=True)),
+                ('plan_status', models.CharField(choices=[('pending', 'Ожидает'), ('done', 'Получен'), ('failed', 'Ошибка'), ('skipped', 'Не SELECT')], default='pending', max_length=10)),
+            ],
+            options={
+                'ordering': ('-total_ms',),
+            },
+        ),
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('captured_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('duration_ms', models.FloatField()),
+                ('sql', models.TextField()),
+                ('params', models.TextField(blank=True)),
+                ('origin', models.CharField(blank=True, max_length=200)),
+                ('stack', models.TextField(blank=True)),
+                ('fingerprint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='samples', to='store.slowqueryfingerprint')),
+            ],
+            options={
+                'ordering': ('-captured_at',),
+            },
+        ),
+    ]
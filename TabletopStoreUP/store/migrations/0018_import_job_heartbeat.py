@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_slow_queries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogimportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='catalogimportjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
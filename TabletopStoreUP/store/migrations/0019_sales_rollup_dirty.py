@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_import_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupDirty',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(blank=True, null=True)),
+                ('order_id', models.BigIntegerField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User as DjangoUser
 from django.contrib.auth import get_user_model
 from django.db.models import Avg, JSONField
 from django.conf import settings
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -74,6 +75,15 @@ class Product(models.Model):
     genre = models.ForeignKey(Genre, on_delete=models.PROTECT)
     player_ranges = models.ManyToManyField(PlayerRange, related_name="products")
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        # частичное сохранение (например, update_fields=['stock']) тоже должно сдвигать updated_at,
+        # иначе изменение не попадёт в инкрементальную выгрузку
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'updated_at' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'updated_at']
+        super().save(*args, **kwargs)
 
     def average_rating(self):
         return self.reviews.aggregate(avg=Avg('rating'))['avg'] or 0
@@ -82,9 +92,18 @@ class Product(models.Model):
         return self.name
 
 
+class ProductTombstone(models.Model):
+    """След удалённого товара для инкрементальной выгрузки каталога."""
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Товар #{self.product_id} удалён {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
 class Order(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='orders')
-    order_date = models.DateTimeField(auto_now_add=True)
+    order_date = models.DateTimeField(auto_now_add=True, db_index=True)
     status = models.ForeignKey(OrderStatus, on_delete=models.PROTECT)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
@@ -177,4 +196,223 @@ class UserSettings(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f'Настройки {self.user}'
\ No newline at end of file
+        return f'Настройки {self.user}'
+
+
+class SalesDailyRollup(models.Model):
+    """
+    Дневной срез продаж для аналитики.
+    Строки с product=NULL — итоги по заказам (orders_count, units, revenue = Order.total),
+    остальные — по позициям заказов в разрезе товара/жанра.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, null=True, blank=True)
+    payment_method = models.ForeignKey(PaymentMethod, on_delete=models.CASCADE, null=True, blank=True)
+    orders_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "product", "genre", "payment_method"],
+                name="store_salesrollup_key_uniq",
+                nulls_distinct=False,
+            ),
+        ]
+        indexes = [models.Index(fields=["day", "product"], name="store_salesrollup_day_idx")]
+
+    def __str__(self):
+        return f"{self.day} {self.product or 'Итого'}: {self.revenue}"
+
+
+class SalesRollupDirty(models.Model):
+    """
+    Отметка «срез за день устарел». Пишется в транзакции заказа (день или id заказа, если
+    меняли позицию/оплату) и разбирается rollup.refresh_dirty() — командой
+    rebuild_sales_rollup --dirty, а не в запросе покупателя.
+    """
+    day = models.DateField(null=True, blank=True)
+    order_id = models.BigIntegerField(null=True, blank=True)  # не FK: заказ могут удалить
+
+    def __str__(self):
+        return f"{self.day or f'заказ {self.order_id}'}"
+
+
+class CustomerRFM(models.Model):
+    """RFM-оценка покупателя (пересчитывается пакетно командой build_customer_analytics)."""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='rfm')
+    recency_days = models.PositiveIntegerField()
+    frequency = models.PositiveIntegerField()
+    monetary = models.DecimalField(max_digits=14, decimal_places=2)
+    r_score = models.PositiveSmallIntegerField()
+    f_score = models.PositiveSmallIntegerField()
+    m_score = models.PositiveSmallIntegerField()
+    segment = models.CharField(max_length=20, db_index=True)
+    cohort = models.DateField(help_text='Месяц первой покупки')
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id}: R{self.r_score}F{self.f_score}M{self.m_score} ({self.segment})"
+
+
+class CohortRetention(models.Model):
+    """Сколько покупателей когорты (месяц первой покупки) купили снова через month_offset месяцев."""
+    cohort = models.DateField()
+    month_offset = models.PositiveSmallIntegerField()
+    customers = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('cohort', 'month_offset')
+        ordering = ('cohort', 'month_offset')
+
+    def __str__(self):
+        return f"{self.cohort:%Y-%m} +{self.month_offset}: {self.customers}"
+
+
+class CatalogImportJob(models.Model):
+    """Фоновый импорт каталога: файл сохраняется на диск, обрабатывает его команда process_import_jobs."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    file_path = models.CharField(max_length=500)
+    original_name = models.CharField(max_length=255, blank=True)
+    file_size = models.PositiveBigIntegerField(default=0)
+    dry_run = models.BooleanField(default=False)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # обработчик отмечается здесь при каждом обновлении прогресса; давно молчащая задача — его сбой
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    unchanged_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    rows_per_sec = models.FloatField(default=0)
+    errors = JSONField(default=list, blank=True)
+    diff = JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f"Импорт #{self.pk} {self.original_name} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+
+class BackupChangeLog(models.Model):
+    """Журнал изменённых строк для инкрементальных бэкапов (на PostgreSQL пишется триггерами)."""
+    table_name = models.CharField(max_length=100)
+    row_pk = models.CharField(max_length=64)
+    op = models.CharField(max_length=1)  # I / U / D
+    txid = models.BigIntegerField(null=True, blank=True, db_index=True)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['table_name', 'id'], name='store_backupchg_table_idx')]
+
+    def __str__(self):
+        return f"{self.op} {self.table_name}#{self.row_pk}"
+
+
+class RequestProfile(models.Model):
+    """Профиль запроса (cProfile), снятый ProfilingMiddleware по запросу персонала или по выборке."""
+    TRIGGER_STAFF = 'staff'
+    TRIGGER_SAMPLE = 'sample'
+    TRIGGER_CHOICES = [
+        (TRIGGER_STAFF, 'По запросу персонала'),
+        (TRIGGER_SAMPLE, 'Выборка'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=8)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField(default=0)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    total_ms = models.FloatField(default=0)
+    sql_count = models.PositiveIntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    template_ms = models.FloatField(default=0)
+    stats = models.TextField(blank=True)
+    dump = models.BinaryField(blank=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f"{self.method} {self.path} — {self.total_ms:.0f} мс"
+
+
+class SlowQueryFingerprint(models.Model):
+    """Медленные запросы, сгруппированные по отпечатку (SQL с заменёнными литералами)."""
+    PLAN_PENDING = 'pending'
+    PLAN_DONE = 'done'
+    PLAN_FAILED = 'failed'
+    PLAN_SKIPPED = 'skipped'
+    PLAN_CHOICES = [
+        (PLAN_PENDING, 'Ожидает'),
+        (PLAN_DONE, 'Получен'),
+        (PLAN_FAILED, 'Ошибка'),
+        (PLAN_SKIPPED, 'Не SELECT'),
+    ]
+
+    fingerprint = models.CharField(max_length=40, unique=True)
+    normalized_sql = models.TextField()
+    example_sql = models.TextField(blank=True)
+    example_params = models.TextField(blank=True)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now, db_index=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    p50_ms = models.FloatField(default=0)
+    p95_ms = models.FloatField(default=0)
+    p99_ms = models.FloatField(default=0)
+    recent_ms = JSONField(default=list, blank=True)
+    origins = JSONField(default=dict, blank=True)
+    plan = models.TextField(blank=True)
+    plan_status = models.CharField(max_length=10, choices=PLAN_CHOICES, default=PLAN_PENDING)
+
+    class Meta:
+        ordering = ('-total_ms',)
+
+    def __str__(self):
+        return f"{self.normalized_sql[:80]} ×{self.count}"
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+
+class SlowQuery(models.Model):
+    """Отдельный медленный запрос: SQL, параметры, откуда вызван."""
+    fingerprint = models.ForeignKey(SlowQueryFingerprint, on_delete=models.CASCADE, related_name='samples')
+    captured_at = models.DateTimeField(default=timezone.now, db_index=True)
+    duration_ms = models.FloatField()
+    sql = models.TextField()
+    params = models.TextField(blank=True)
+    origin = models.CharField(max_length=200, blank=True)
+    stack = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ('-captured_at',)
+
+    def __str__(self):
+        return f"{self.duration_ms:.0f} мс — {self.origin}"
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def _estimated_table_rows(queryset):
+    """Оценка числа строк таблицы по статистике планировщика PostgreSQL (pg_class.reltuples)."""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    # reltuples = -1, если таблица ещё ни разу не анализировалась
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def _is_filtered(queryset):
+    query = queryset.query
+    return bool(query.where) or query.distinct or query.low_mark or query.high_mark is not None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц админки.
+    Для нефильтрованного списка берёт оценку планировщика (reltuples), если она выше порога;
+    на маленьких или отфильтрованных выборках считает точный COUNT(*).
+    Оценка может разойтись с таблицей (ANALYZE давно не было): на последней по оценке
+    странице и за ней число строк пересчитывается точно — хвост таблицы не теряется при
+    заниженной оценке; пустая страница при завышенной заменяется последней настоящей.
+    """
+    estimated = False
+
+    @cached_property
+    def count(self):
+        threshold = getattr(settings, "ADMIN_ESTIMATED_COUNT_THRESHOLD", 100_000)
+        qs = self.object_list
+        if hasattr(qs, "query") and not _is_filtered(qs):
+            estimate = _estimated_table_rows(qs)
+            if estimate is not None and estimate >= threshold:
+                self.estimated = True
+                return estimate
+        return super().count
+
+    def _exact_count(self):
+        self.__dict__["count"] = super().count
+        self.__dict__.pop("num_pages", None)
+        self.estimated = False
+
+    def page(self, number):
+        try:
+            last = self.validate_number(number) == self.num_pages
+        except EmptyPage:
+            if not self.estimated:
+                raise
+            last = True  # reltuples занижен (массовая загрузка до ANALYZE)
+        if self.estimated and last:
+            self._exact_count()
+        page = super().page(number)
+        if not self.estimated or len(page):
+            return page
+        # reltuples завышен (строки удалены после ANALYZE): точный COUNT(*) и последняя страница
+        self._exact_count()
+        return super().page(self.num_pages)
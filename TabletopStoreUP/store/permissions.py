@@ -1,24 +1,24 @@
 from rest_framework import permissions
 
-def _get_role_name(user):
-    try:
-        return user.profile.role.name
-    except Exception:
+from . import user_context
+
+
+def _get_role_name(request):
+    # claim JWT-токена или закэшированный контекст пользователя — без запросов к БД
+    if not request.user.is_authenticated:
         return None
+    return user_context.role(request)
 
 class IsAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
-        profile = getattr(request.user, 'profile', None)
-        return request.user.is_authenticated and getattr(profile.role, 'name', '') == 'admin'
+        return _get_role_name(request) == 'admin'
 
 class IsManagerOrAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
-        profile = getattr(request.user, 'profile', None)
-        return request.user.is_authenticated and getattr(profile.role, 'name', '') in ['manager', 'admin']
+        return _get_role_name(request) in ['manager', 'admin']
 
 class IsClientOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.method in permissions.SAFE_METHODS:
             return True
-        profile = getattr(request.user, 'profile', None)
-        return request.user.is_authenticated and getattr(profile.role, 'name', '') == 'client'
+        return _get_role_name(request) == 'client'
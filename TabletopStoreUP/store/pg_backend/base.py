@@ -0,0 +1,29 @@
+"""
+PostgreSQL с замером выдачи соединений для /metrics (ENGINE = 'store.pg_backend').
+
+Всё остальное — штатный бэкенд django.db.backends.postgresql, включая пул psycopg 3.
+"""
+import time
+
+from django.db.backends.postgresql import base
+
+from store import db_connections
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        t0 = time.perf_counter()
+        try:
+            connection = super().get_new_connection(conn_params)
+        except Exception as e:
+            db_connections.record_error(self, e)
+            raise
+        db_connections.record_acquire(self, time.perf_counter() - t0)
+        return connection
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            if self.pool:
+                db_connections.record_pool(self)
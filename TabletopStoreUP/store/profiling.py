@@ -0,0 +1,199 @@
+"""
+Профилирование запросов: ProfilingMiddleware.
+
+На каждый запрос считает число и время SQL (connection.execute_wrapper на всех базах),
+время рендеринга шаблонов и общее время; отдаёт их в заголовке Server-Timing
+(видно во вкладке Network браузера) и пишет строку JSON в логгер store.profiling.
+
+Полный профиль cProfile снимается, если персонал добавил к адресу ?_profile=1 (или
+заголовок X-Profile: 1), либо с вероятностью PROFILING_SAMPLE_RATE. Профиль сохраняется
+в RequestProfile: топ функций по cumulative — в админке, сам дамп можно скачать
+и открыть в snakeviz или pstats.
+
+PROFILING_ENABLED=False — middleware снимает себя при старте (MiddlewareNotUsed),
+накладных расходов нет совсем.
+"""
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import marshal
+import pstats
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import base as template_base
+
+logger = logging.getLogger("store.profiling")
+
+PROFILE_PARAM = "_profile"
+PROFILE_HEADER = "X-Profile"
+STATS_LINES = 60
+
+_current = contextvars.ContextVar("store_profiling_timer", default=None)
+_template_patched = False
+
+
+class RequestTimer:
+    """Счётчики одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_seconds += time.perf_counter() - t0
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        # SQL из шаблонов (ленивые QuerySet) входит и в db, и в tpl; app — остаток, не меньше нуля
+        app = max(0.0, total - self.sql_seconds - self.template_seconds)
+        return ", ".join([
+            f'db;dur={self.sql_seconds * 1000:.1f};desc="SQL x{self.sql_count}"',
+            f'tpl;dur={self.template_seconds * 1000:.1f};desc="Templates"',
+            f'app;dur={app * 1000:.1f};desc="Python"',
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+
+def _patch_template_render():
+    """Template.render в обёртке с замером; вложенные include считаются один раз (по внешнему)."""
+    global _template_patched
+    if _template_patched:
+        return
+    original = template_base.Template.render
+
+    def render(self, context):
+        timer = _current.get()
+        if timer is None:
+            return original(self, context)
+        timer.template_depth += 1
+        t0 = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            timer.template_depth -= 1
+            if timer.template_depth == 0:
+                timer.template_seconds += time.perf_counter() - t0
+
+    template_base.Template.render = render
+    _template_patched = True
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not _setting("PROFILING_ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = float(_setting("PROFILING_SAMPLE_RATE", 0.0))
+        self.keep = int(_setting("PROFILING_KEEP", 500))
+        self.log_min_ms = float(_setting("PROFILING_LOG_MIN_MS", 0))
+        _patch_template_render()
+
+    def _trigger(self, request):
+        from .models import RequestProfile
+
+        asked = request.GET.get(PROFILE_PARAM) == "1" or request.headers.get(PROFILE_HEADER) == "1"
+        if asked and getattr(request, "user", None) is not None and request.user.is_staff:
+            return RequestProfile.TRIGGER_STAFF
+        if self.sample_rate and random.random() < self.sample_rate:
+            return RequestProfile.TRIGGER_SAMPLE
+        return None
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        token = _current.set(timer)
+        trigger = self._trigger(request)
+        profiler = None
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(timer))
+                if trigger:
+                    profiler = cProfile.Profile()
+                    try:
+                        profiler.enable()
+                    except ValueError:  # уже работает другой профилировщик
+                        profiler = None
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _current.reset(token)
+
+        total = timer.total_seconds
+        response["Server-Timing"] = timer.server_timing(total)
+        if total * 1000 >= self.log_min_ms:
+            logger.info(json.dumps({
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "user_id": getattr(getattr(request, "user", None), "pk", None),
+                "total_ms": round(total * 1000, 1),
+                "sql_count": timer.sql_count,
+                "sql_ms": round(timer.sql_seconds * 1000, 1),
+                "template_ms": round(timer.template_seconds * 1000, 1),
+                "profiled": bool(profiler),
+            }, ensure_ascii=False))
+        if profiler is not None:
+            try:
+                self._save(request, response, timer, total, trigger, profiler)
+            except Exception:
+                logger.exception("Не удалось сохранить профиль %s", request.path)
+        return response
+
+    def _save(self, request, response, timer, total, trigger, profiler):
+        from .models import RequestProfile
+
+        profiler.create_stats()
+        dump = marshal.dumps(profiler.stats)  # pstats.Stats(profiler) забирает stats у профилировщика
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).strip_dirs().sort_stats("cumulative").print_stats(STATS_LINES)
+        user = getattr(request, "user", None)
+        profile = RequestProfile.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:500],
+            status_code=response.status_code,
+            user=user if user is not None and user.is_authenticated else None,
+            trigger=trigger,
+            total_ms=round(total * 1000, 1),
+            sql_count=timer.sql_count,
+            sql_ms=round(timer.sql_seconds * 1000, 1),
+            template_ms=round(timer.template_seconds * 1000, 1),
+            stats=out.getvalue(),
+            dump=dump,
+        )
+        response["X-Profile-Id"] = str(profile.pk)
+        if self.keep and profile.pk % 50 == 0:
+            prune(self.keep)
+
+
+def prune(keep):
+    """Оставляет только keep последних профилей."""
+    from .models import RequestProfile
+
+    edge = list(RequestProfile.objects.order_by("-id").values_list("id", flat=True)[keep:keep + 1])
+    if edge:
+        RequestProfile.objects.filter(id__lte=edge[0]).delete()
@@ -0,0 +1,211 @@
+"""
+Массовое создание пользователей (перенос клиентов из старого магазина).
+
+User.save() запускает три обработчика post_save, которые вместе делают около восьми
+запросов на пользователя. Здесь пользователи, профили и настройки создаются кусками через
+bulk_create (сигналы не срабатывают), роли читаются один раз. Инварианты те же, что
+у сигналов и RegisterSerializer: у каждого пользователя есть UserProfile
+(full_name по умолчанию — username, роль admin для суперпользователя, иначе указанная
+или роль по умолчанию) и UserSettings со значениями по умолчанию.
+
+Пароль можно передать готовым хэшем (password_hash в формате Django, например
+из PASSWORD_HASHERS старого магазина) — тогда он не пересчитывается. Открытые пароли
+хэшируются в пуле потоков: PBKDF2 из hashlib отпускает GIL. Без пароля пользователь
+получает непригодный пароль (set_unusable_password).
+"""
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import UserProfile, UserRole, UserSettings
+
+User = get_user_model()
+
+MAX_ERRORS = 1000
+TRUE_VALUES = ("1", "true", "yes", "y", "on")
+
+
+@dataclass
+class ProvisionReport:
+    created: int = 0
+    skipped: int = 0
+    rows: int = 0
+    errors: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return round(self.rows / self.elapsed, 1) if self.elapsed else 0.0
+
+    def add_error(self, message):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+
+def _flag(value):
+    return str(value).strip().lower() in TRUE_VALUES if value not in (None, "") else False
+
+
+def _text(row, key):
+    return str(row.get(key) or "").strip()
+
+
+class UserProvisioner:
+    """
+    Создаёт пользователей кусками по chunk_size: на кусок — проверка занятых логинов
+    и телефонов и три bulk_create в одной транзакции. Уже существующие логины пропускаются.
+    """
+
+    def __init__(self, chunk_size=1000, workers=4, default_role="client", on_progress=None):
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.default_role = default_role
+        self.on_progress = on_progress
+        self.report = ProvisionReport()
+        self.roles = {}
+        self._seen_usernames = set()
+        self._seen_phones = set()
+
+    def _resolve_roles(self):
+        self.roles = dict(UserRole.objects.values_list("name", "id"))
+        for name in {self.default_role, "admin"} - set(self.roles):
+            self.roles[name] = UserRole.objects.get_or_create(name=name)[0].id
+
+    @staticmethod
+    def _date_joined(value):
+        if not value:
+            return timezone.now()
+        dt = parse_datetime(value)
+        if dt is None:
+            raise ValueError(f"некорректная date_joined: {value!r}")
+        return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+    def parse_row(self, row):
+        """dict строки → (User без пароля, открытый пароль или None, поля профиля). ValueError — ошибка строки."""
+        if not isinstance(row, dict):
+            raise ValueError("ожидался объект")
+        username = _text(row, "username")
+        if not username:
+            raise ValueError("пустой username")
+        is_superuser = _flag(row.get("is_superuser"))
+        role_name = "admin" if is_superuser else (_text(row, "role") or self.default_role)
+        if role_name not in self.roles:
+            raise ValueError(f"неизвестная роль {role_name!r}")
+
+        user = User(
+            username=username,
+            email=_text(row, "email"),
+            first_name=_text(row, "first_name"),
+            last_name=_text(row, "last_name"),
+            is_staff=_flag(row.get("is_staff")) or is_superuser,
+            is_superuser=is_superuser,
+            is_active=_flag(row["is_active"]) if row.get("is_active") not in (None, "") else True,
+            date_joined=self._date_joined(_text(row, "date_joined")),
+        )
+        raw_password = None
+        password_hash = _text(row, "password_hash")
+        if password_hash:
+            identify_hasher(password_hash)  # ValueError, если формат не поддерживается
+            user.password = password_hash
+        elif row.get("password"):
+            raw_password = str(row["password"])
+        else:
+            user.set_unusable_password()
+
+        profile = {
+            "full_name": _text(row, "full_name") or username,
+            "phone": _text(row, "phone") or None,
+            "role_id": self.roles[role_name],
+        }
+        return user, raw_password, profile
+
+    def _process_chunk(self, chunk):
+        parsed = []
+        for line_no, row in chunk:
+            self.report.rows += 1
+            try:
+                user, raw_password, profile = self.parse_row(row)
+            except ValueError as e:
+                self.report.add_error(f"строка {line_no}: {e}")
+                continue
+            if user.username in self._seen_usernames:
+                self.report.add_error(f"строка {line_no}: повтор username {user.username!r}")
+                continue
+            if profile["phone"] and profile["phone"] in self._seen_phones:
+                self.report.add_error(f"строка {line_no}: повтор телефона {profile['phone']}")
+                continue
+            self._seen_usernames.add(user.username)
+            if profile["phone"]:
+                self._seen_phones.add(profile["phone"])
+            parsed.append((line_no, user, raw_password, profile))
+        if not parsed:
+            return
+
+        existing = set(User.objects.filter(username__in=[p[1].username for p in parsed])
+                       .values_list("username", flat=True))
+        taken_phones = set(UserProfile.objects.filter(phone__in=[p[3]["phone"] for p in parsed if p[3]["phone"]])
+                           .values_list("phone", flat=True))
+        todo = []
+        for line_no, user, raw_password, profile in parsed:
+            if user.username in existing:
+                self.report.skipped += 1
+            elif profile["phone"] in taken_phones:
+                self.report.add_error(f"строка {line_no}: телефон {profile['phone']} уже занят")
+            else:
+                todo.append((user, raw_password, profile))
+        if not todo:
+            return
+
+        raw = [(user, password) for user, password, _ in todo if password is not None]
+        if raw:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                hashes = pool.map(make_password, [password for _, password in raw])
+                for (user, _), encoded in zip(raw, hashes):
+                    user.password = encoded
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([user for user, _, _ in todo])
+            if any(u.pk is None for u in users):
+                ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list("username", "id"))
+                for u in users:
+                    u.pk = ids[u.username]
+            UserProfile.objects.bulk_create(
+                [UserProfile(user_id=user.pk, **profile) for user, _, profile in todo]
+            )
+            UserSettings.objects.bulk_create([UserSettings(user_id=user.pk) for user, _, _ in todo])
+        self.report.created += len(todo)
+
+    def run(self, rows):
+        """rows — итерируемое (номер строки, dict)."""
+        t0 = time.perf_counter()
+        self._resolve_roles()
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self._process_chunk(chunk)
+            self.report.elapsed = time.perf_counter() - t0
+            if self.on_progress:
+                self.on_progress(self.report)
+        self.report.elapsed = time.perf_counter() - t0
+        return self.report
+
+
+def provision_users(rows, chunk_size=1000, workers=4, default_role="client", on_progress=None):
+    """Создаёт пользователей из dict-ов (или пар (номер строки, dict)). Возвращает ProvisionReport."""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return ProvisionReport()
+    rows = itertools.chain([first], rows)
+    if isinstance(first, dict):
+        rows = enumerate(rows, start=1)
+    return UserProvisioner(chunk_size, workers, default_role, on_progress).run(rows)
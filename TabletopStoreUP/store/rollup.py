@@ -0,0 +1,159 @@
+"""
+Дневной срез продаж (SalesDailyRollup).
+
+Заказ, его позиции и оплаты в своей транзакции только отмечают день устаревшим
+(SalesRollupDirty — одна вставка, без чтений и блокировок), а пересчёт отмеченных дней
+идёт отдельно: refresh_dirty() из команды rebuild_sales_rollup --dirty (cron раз в минуту).
+Так оформление заказов в один день не выстраивается в очередь за пересчётом дня.
+Пересчёты одного дня идут по очереди (advisory-блокировка дня на PostgreSQL).
+"""
+import datetime
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import analytics_cache
+from .models import Order, OrderItem, SalesDailyRollup, SalesRollupDirty
+
+# Заказы в этих статусах в выручку не попадают
+EXCLUDED_ORDER_STATUSES = ("Cancelled", "Payment Failed")
+LOCK_NAMESPACE = 27027  # первый ключ pg_advisory_xact_lock для дней среза
+DIRTY_CHUNK = 1000
+
+
+def day_bounds(start_day, end_day=None):
+    """Полуинтервал [start, end) в текущей таймзоне для дней start_day..end_day."""
+    end_day = end_day or start_day
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.datetime.combine(start_day, datetime.time.min), tz)
+    end = timezone.make_aware(datetime.datetime.combine(end_day + datetime.timedelta(days=1), datetime.time.min), tz)
+    return start, end
+
+
+def counted_orders(start_day, end_day=None):
+    """Заказы, учитываемые в аналитике за период (диапазон по индексу order_date)."""
+    start, end = day_bounds(start_day, end_day)
+    return (
+        Order.objects
+        .filter(order_date__gte=start, order_date__lt=end)
+        .exclude(status__name__in=EXCLUDED_ORDER_STATUSES)
+    )
+
+
+def _lock_days(start_day, end_day):
+    """
+    Пересчёты одного дня идут по очереди: без этого два параллельных заказа удаляют строки
+    дня и вставляют их заново, и вторая вставка падает на уникальном ключе среза.
+    На SQLite запись и так последовательна.
+    """
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        for n in range((end_day - start_day).days + 1):
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)",
+                           [LOCK_NAMESPACE, (start_day + datetime.timedelta(days=n)).toordinal()])
+
+
+def rebuild_range(start_day, end_day=None):
+    """Перестраивает срез за дни start_day..end_day. Возвращает число записанных строк."""
+    end_day = end_day or start_day
+    start, end = day_bounds(start_day, end_day)
+
+    orders = counted_orders(start_day, end_day)
+    items = (
+        OrderItem.objects
+        .filter(order__order_date__gte=start, order__order_date__lt=end)
+        .exclude(order__status__name__in=EXCLUDED_ORDER_STATUSES)
+    )
+
+    with transaction.atomic():
+        _lock_days(start_day, end_day)
+        order_rows = (
+            orders
+            .annotate(day=TruncDate("order_date"))
+            .values("day", "payment__method_id")
+            .annotate(orders_count=Count("id"), revenue=Sum("total"))
+            .order_by()
+        )
+        item_rows = (
+            items
+            .annotate(day=TruncDate("order__order_date"))
+            .values("day", "product_id", "product__genre_id", "order__payment__method_id")
+            .annotate(
+                orders_count=Count("order_id", distinct=True),
+                units=Sum("quantity"),
+                revenue=Sum(F("quantity") * F("price")),
+            )
+            .order_by()
+        )
+        unit_rows = (
+            items
+            .annotate(day=TruncDate("order__order_date"))
+            .values("day", "order__payment__method_id")
+            .annotate(units=Sum("quantity"))
+            .order_by()
+        )
+        units_by_order_key = {(r["day"], r["order__payment__method_id"]): r["units"] or 0 for r in unit_rows}
+
+        objs = [
+            SalesDailyRollup(
+                day=r["day"],
+                product_id=r["product_id"],
+                genre_id=r["product__genre_id"],
+                payment_method_id=r["order__payment__method_id"],
+                orders_count=r["orders_count"],
+                units=r["units"] or 0,
+                revenue=r["revenue"] or Decimal("0"),
+            )
+            for r in item_rows
+        ]
+        for r in order_rows:
+            objs.append(SalesDailyRollup(
+                day=r["day"],
+                payment_method_id=r["payment__method_id"],
+                orders_count=r["orders_count"],
+                units=units_by_order_key.get((r["day"], r["payment__method_id"]), 0),
+                revenue=r["revenue"] or Decimal("0"),
+            ))
+
+        SalesDailyRollup.objects.filter(day__gte=start_day, day__lte=end_day).delete()
+        SalesDailyRollup.objects.bulk_create(objs, batch_size=1000)
+    analytics_cache.invalidate(start_day, end_day)
+    return len(objs)
+
+
+def mark_day(dt):
+    """Отмечает день заказа устаревшим (в текущей транзакции, вместе с заказом)."""
+    if dt is None:
+        return
+    day = timezone.localdate(dt) if isinstance(dt, datetime.datetime) else dt
+    SalesRollupDirty.objects.create(day=day)
+
+
+def mark_order(order_id):
+    """Отмечает устаревшим день заказа order_id; день находит refresh_dirty()."""
+    SalesRollupDirty.objects.create(order_id=order_id)
+
+
+def refresh_dirty():
+    """
+    Пересчитывает отмеченные дни целиком, по одному. Возвращает список пересчитанных дней.
+    Снимаются только прочитанные отметки: отметка заказа, закоммиченного во время пересчёта,
+    остаётся до следующего запуска. Если пересчёт упал, отметки не снимаются.
+    """
+    marks = list(SalesRollupDirty.objects.values_list("id", "day", "order_id"))
+    days = {day for _, day, _ in marks if day}
+    order_ids = sorted({order_id for _, _, order_id in marks if order_id})
+    for i in range(0, len(order_ids), DIRTY_CHUNK):
+        chunk = order_ids[i:i + DIRTY_CHUNK]
+        dates = Order.objects.filter(pk__in=chunk).values_list("order_date", flat=True)
+        days.update(timezone.localdate(dt) for dt in dates)
+    for day in sorted(days):
+        rebuild_range(day)
+    ids = [mark_id for mark_id, _, _ in marks]
+    for i in range(0, len(ids), DIRTY_CHUNK):
+        SalesRollupDirty.objects.filter(id__in=ids[i:i + DIRTY_CHUNK]).delete()
+    return sorted(days)
@@ -1,7 +1,12 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
 from django.db import transaction
 
+from . import user_context
+from .cache import cached
 from .models import (
     UserRole, UserProfile, UserSettings,
     Genre, PlayerRange, Product, Review,
@@ -128,6 +133,7 @@ class ProductSerializer(serializers.ModelSerializer):
             "image": {"write_only": True, "required": False, "allow_null": True},
         }
 
+    @cached("product:{obj.pk}:avg_rating:api", tags=["product:{obj.pk}"])
     def get_avg_rating(self, obj):
         return round(obj.average_rating() or 0, 2)
 
@@ -363,4 +369,25 @@ class UserSerializer(serializers.ModelSerializer):
             profile.phone = profile_data["phone"] or profile.phone
         profile.save()
 
-        return instance
\ No newline at end of file
+        return instance
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Токены с ролью пользователя (claim role): права в API проверяются без запросов к БД."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[user_context.ROLE_CLAIM] = user_context.for_user_id(user.pk).role
+        return token
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Новый access-токен получает текущую роль, а не ту, что была при входе."""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data["access"])
+        access[user_context.ROLE_CLAIM] = user_context.for_user_id(access[api_settings.USER_ID_CLAIM]).role
+        data["access"] = str(access)
+        return data
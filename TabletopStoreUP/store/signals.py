@@ -1,8 +1,12 @@
-from django.db.models.signals import post_save, post_migrate
+from django.db.models.signals import post_save, post_delete, post_migrate, m2m_changed
 from django.dispatch import receiver
 from django.conf import settings
 from django.contrib.auth.models import User
-from .models import UserProfile, UserRole, UserSettings, OrderStatus, PaymentStatus, PaymentMethod, DeliveryMethod, DeliveryStatus, Genre, PlayerRange, Product
+from django.contrib.auth.signals import user_logged_in
+from django.utils import timezone
+from .models import UserProfile, UserRole, UserSettings, OrderStatus, PaymentStatus, PaymentMethod, DeliveryMethod, DeliveryStatus, Genre, PlayerRange, Product, ProductTombstone, Order, OrderItem, Payment, Review
+from . import db_routing, rollup
+from . import cache as store_cache
 from decimal import Decimal
 
 
@@ -152,4 +156,98 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def create_user_settings(sender, instance, created, **kwargs):
     if created:
-        UserSettings.objects.get_or_create(user=instance)
\ No newline at end of file
+        UserSettings.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def mark_sales_rollup_day_for_order(sender, instance, **kwargs):
+    rollup.mark_day(instance.order_date)
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_delete, sender=Payment)
+def mark_sales_rollup_day_for_order_part(sender, instance, **kwargs):
+    rollup.mark_order(instance.order_id)
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    ProductTombstone.objects.create(product_id=instance.pk)
+
+
+@receiver(m2m_changed, sender=Product.player_ranges.through)
+def touch_products_on_ranges_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        Product.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+    elif pk_set:
+        Product.objects.filter(pk__in=pk_set).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Genre)
+def touch_products_on_genre_change(sender, instance, created, **kwargs):
+    # имя жанра входит в выгрузку товара
+    if not created:
+        Product.objects.filter(genre=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    store_cache.invalidate_on_commit(f"product:{instance.pk}", "catalog")
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_cache_on_review(sender, instance, **kwargs):
+    # средняя оценка — в карточке товара и в сортировке каталога
+    store_cache.invalidate_on_commit(f"product:{instance.product_id}", "catalog")
+
+
+@receiver(m2m_changed, sender=Product.player_ranges.through)
+def invalidate_product_cache_on_ranges_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    pks = [instance.pk] if not reverse else (pk_set or [])
+    store_cache.invalidate_on_commit(*(f"product:{pk}" for pk in pks), "catalog")
+
+
+def invalidate_lookups_cache(sender, instance, **kwargs):
+    # справочники выводятся в фильтрах каталога и в карточках товаров
+    store_cache.invalidate_on_commit("lookups", "catalog")
+
+
+for _lookup_model in (Genre, PlayerRange, UserRole, OrderStatus, PaymentStatus, PaymentMethod, DeliveryMethod, DeliveryStatus):
+    post_save.connect(invalidate_lookups_cache, sender=_lookup_model)
+    post_delete.connect(invalidate_lookups_cache, sender=_lookup_model)
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def invalidate_role_cache(sender, instance, **kwargs):
+    # имя роли хранится в закэшированном контексте каждого пользователя
+    store_cache.invalidate_on_commit("roles")
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    store_cache.invalidate_on_commit(f"user:{instance.pk}")
+
+
+@receiver(post_save, sender=UserSettings)
+@receiver(post_delete, sender=UserSettings)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_user_cache_on_settings_change(sender, instance, **kwargs):
+    store_cache.invalidate_on_commit(f"user:{instance.user_id}")
+
+
+@receiver(user_logged_in)
+def last_login_does_not_pin_to_primary(sender, user, **kwargs):
+    # update_last_login (подключён раньше) уже записал last_login — это не повод читать с основной базы
+    if 'last_login' in [f.name for f in user._meta.concrete_fields]:
+        db_routing.forget_write(type(user))
@@ -0,0 +1,332 @@
+"""
+Сбор медленных запросов.
+
+На каждое новое соединение (сигнал connection_created) ставится execute_wrapper:
+запрос дольше SLOW_QUERY_MS попадает в очередь вместе с SQL, параметрами, источником
+(имя view из SlowQueryMiddleware или команда manage.py) и короткой выжимкой стека
+из кода проекта. Запись в БД делает фоновый поток со своим соединением — вне
+транзакции запроса, которая может откатиться. Он же складывает запросы по отпечатку
+(литералы и списки IN заменены на ?) в SlowQueryFingerprint: число, суммарное
+и максимальное время, p50/p95/p99 по последним замерам — и для нового отпечатка
+снимает план EXPLAIN (без ANALYZE: запрос повторно не выполняется).
+
+Параметры сохраняются только у SELECT к таблицам без учётных данных: у записей и у запросов
+к SENSITIVE_TABLES (пользователи, сессии, профили, токены) вместо них пишется REDACTED —
+там хэши паролей, e-mail, телефоны и ключи сессий. Поток-писатель живёт долго, поэтому
+перед каждой записью закрывает устаревшее или разорванное соединение (close_old_connections).
+
+SLOW_QUERY_BACKGROUND=False (и всегда на SQLite, где писатель может быть только один) —
+без потока: очередь разбирается в конце запроса middleware, при выходе из команды
+или вызовом flush().
+"""
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import queue
+import re
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger("store.slow_queries")
+
+RECENT_SAMPLES = 200
+STACK_FRAMES = 8
+QUEUE_SIZE = 1000
+REDACTED = "[скрыто]"
+SENSITIVE_TABLES = re.compile(
+    r"\b(auth_user\w*|django_session|store_userprofile|token_blacklist_\w+|authtoken_\w+)\b", re.IGNORECASE,
+)
+
+_origin = contextvars.ContextVar("store_slow_query_origin", default=None)
+_local = threading.local()
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+_exit_hook = False
+dropped = 0
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(sql):
+    """SQL без конкретных значений: строки, числа и параметры → ?, IN (?, ?, …) → IN (…)."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (…)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+def fingerprint(sql):
+    normalized = normalize(sql)
+    return hashlib.sha1(normalized.encode()).hexdigest(), normalized
+
+
+def current_origin():
+    origin = _origin.get()
+    if origin:
+        return origin
+    argv = sys.argv
+    if len(argv) > 1 and Path(argv[0]).name == "manage.py":
+        return f"command:{argv[1]}"
+    return "unknown"
+
+
+def _stack_summary():
+    base = str(settings.BASE_DIR)
+    frames = [
+        f for f in traceback.extract_stack()[:-3]
+        if f.filename.startswith(base) and "site-packages" not in f.filename and f.filename != __file__
+    ]
+    return "\n".join(
+        f"{Path(f.filename).relative_to(base)}:{f.lineno} in {f.name}" for f in frames[-STACK_FRAMES:]
+    )
+
+
+def params_allowed(sql):
+    """Можно ли хранить параметры запроса: только SELECT к таблицам без учётных данных."""
+    return sql.lstrip().upper().startswith(("SELECT", "WITH")) and not SENSITIVE_TABLES.search(sql)
+
+
+def _params_text(params, sql):
+    if params and not params_allowed(sql):
+        return REDACTED
+    try:
+        text = json.dumps(params, ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        text = repr(params)
+    return text[:2000]
+
+
+def writing():
+    """True, пока этот поток записывает собранные запросы (их собственный SQL не замеряется)."""
+    return getattr(_local, "suppressed", False)
+
+
+def capture(execute, sql, params, many, context):
+    """execute_wrapper: замер и постановка в очередь медленных запросов."""
+    if writing():
+        return execute(sql, params, many, context)
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        if ms >= getattr(settings, "SLOW_QUERY_MS", 200):
+            _enqueue({
+                "alias": context["connection"].alias,
+                "db": context["connection"].settings_dict["NAME"],
+                "sql": sql,
+                "params": None if many else params,
+                "many": many,
+                "duration_ms": round(ms, 2),
+                "origin": current_origin(),
+                "stack": _stack_summary(),
+                "captured_at": timezone.now(),
+            })
+
+
+def _enqueue(item):
+    global dropped
+    try:
+        _queue.put_nowait(item)
+    except queue.Full:
+        dropped += 1
+        return
+    if not _exit_hook:
+        _register_exit_hook()
+    if background():
+        _ensure_writer()
+
+
+def background():
+    """Писать ли фоновым потоком (на SQLite он блокировал бы запись основного потока)."""
+    return getattr(settings, "SLOW_QUERY_BACKGROUND", True) and connections["default"].vendor != "sqlite"
+
+
+def _register_exit_hook():
+    global _exit_hook
+    _exit_hook = True
+    atexit.register(_flush_at_exit)  # команды manage.py завершаются, не дожидаясь записи
+
+
+def install(sender, connection, **kwargs):
+    """Обработчик connection_created."""
+    if getattr(settings, "SLOW_QUERY_ENABLED", True) and capture not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capture)
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name="slow-query-writer", daemon=True)
+            _writer.start()
+
+
+def _writer_loop():
+    while True:
+        item = _queue.get()
+        close_old_connections()  # соединение могло устареть (CONN_MAX_AGE) или оборваться с прошлой записи
+        try:
+            flush([item])
+        except Exception:
+            logger.exception("Не удалось сохранить медленный запрос")
+
+
+def _drain():
+    items = []
+    while True:
+        try:
+            items.append(_queue.get_nowait())
+        except queue.Empty:
+            return items
+
+
+def _flush_at_exit():
+    # к выходу база могла смениться (тестовую уже удалили) — такие запросы не записываем
+    items = [i for i in _drain() if i["db"] == connections[i["alias"]].settings_dict["NAME"]]
+    try:
+        flush(items)
+    except Exception:
+        logger.exception("Не удалось сохранить медленные запросы")
+
+
+def _percentiles(values):
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return pick(0.5), pick(0.95), pick(0.99)
+
+
+def explain(alias, sql, params):
+    """План запроса без выполнения: EXPLAIN на PostgreSQL, EXPLAIN QUERY PLAN на SQLite."""
+    conn = connections[alias]
+    prefix = "EXPLAIN QUERY PLAN " if conn.vendor == "sqlite" else "EXPLAIN "
+    # savepoint: неудачный EXPLAIN не должен ломать внешнюю транзакцию на PostgreSQL
+    with transaction.atomic(using=alias), conn.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+    return "\n".join(" | ".join(str(c) for c in row) for row in rows)
+
+
+def _record(item):
+    from .models import SlowQuery, SlowQueryFingerprint
+
+    digest, normalized = fingerprint(item["sql"])
+    _, created = SlowQueryFingerprint.objects.get_or_create(
+        fingerprint=digest,
+        defaults={
+            "normalized_sql": normalized,
+            "example_sql": item["sql"],
+            "example_params": _params_text(item["params"], item["sql"]),
+            "first_seen": item["captured_at"],
+        },
+    )
+    if created:
+        _explain_new(digest, normalized, item)
+    with transaction.atomic():
+        # несколько процессов могут писать один отпечаток — счётчики под блокировкой строки
+        fp = SlowQueryFingerprint.objects.select_for_update().get(fingerprint=digest)
+        _accumulate(fp, item)
+        fp.save()
+    return SlowQuery.objects.create(
+        fingerprint=fp,
+        captured_at=item["captured_at"],
+        duration_ms=item["duration_ms"],
+        sql=item["sql"],
+        params=_params_text(item["params"], item["sql"]),
+        origin=item["origin"][:200],
+        stack=item["stack"],
+    )
+
+
+def _explain_new(digest, normalized, item):
+    from .models import SlowQueryFingerprint
+
+    if item["many"] or not normalized.upper().startswith(("SELECT", "WITH")):
+        status, plan = SlowQueryFingerprint.PLAN_SKIPPED, ""
+    else:
+        try:
+            status, plan = SlowQueryFingerprint.PLAN_DONE, explain(item["alias"], item["sql"], item["params"])
+        except Exception as e:
+            status, plan = SlowQueryFingerprint.PLAN_FAILED, f"{type(e).__name__}: {e}"
+    SlowQueryFingerprint.objects.filter(fingerprint=digest).update(plan=plan, plan_status=status)
+
+
+def _accumulate(fp, item):
+    fp.count += 1
+    fp.total_ms += item["duration_ms"]
+    fp.max_ms = max(fp.max_ms, item["duration_ms"])
+    fp.last_seen = item["captured_at"]
+    fp.recent_ms = (fp.recent_ms + [item["duration_ms"]])[-RECENT_SAMPLES:]
+    fp.p50_ms, fp.p95_ms, fp.p99_ms = _percentiles(fp.recent_ms)
+    fp.origins[item["origin"]] = fp.origins.get(item["origin"], 0) + 1
+
+
+def flush(items=None):
+    """Записывает переданные (или все накопленные в очереди) запросы. Возвращает их число."""
+    if items is None:
+        items = _drain()
+    if not items:
+        return 0
+    keep = getattr(settings, "SLOW_QUERY_KEEP", 5000)
+    _local.suppressed = True
+    try:
+        for item in items:
+            sample = _record(item)
+            if keep and sample.pk % 100 == 0:
+                prune(keep)
+    finally:
+        _local.suppressed = False
+    return len(items)
+
+
+def prune(keep):
+    """Оставляет только keep последних образцов SlowQuery (отпечатки не трогает)."""
+    from .models import SlowQuery
+
+    edge = list(SlowQuery.objects.order_by("-id").values_list("id", flat=True)[keep:keep + 1])
+    if edge:
+        SlowQuery.objects.filter(id__lte=edge[0]).delete()
+
+
+class SlowQueryMiddleware:
+    """Помечает запросы к БД именем view; без фонового потока записывает накопленное после ответа."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _origin.set(f"request:{request.method} {request.path}")
+        try:
+            response = self.get_response(request)
+        finally:
+            _origin.reset(token)
+        if not background():
+            try:
+                flush()
+            except Exception:
+                logger.exception("Не удалось сохранить медленные запросы")
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        _origin.set(f"view:{match.view_name}" if match and match.view_name else f"view:{view_func.__module__}.{view_func.__name__}")
@@ -0,0 +1,105 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from store import paginators
+from store.models import Genre, Order, OrderStatus
+from store.paginators import EstimatedCountPaginator
+
+User = get_user_model()
+
+
+@override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=100)
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Genre.objects.get_or_create(name=f"Жанр {i}")
+        self.total = Genre.objects.count()
+        self.qs = Genre.objects.order_by("pk")
+
+    def test_estimate_is_used_only_above_threshold_and_without_filters(self):
+        with mock.patch.object(paginators, "_estimated_table_rows", return_value=500):
+            self.assertEqual(EstimatedCountPaginator(self.qs, 10).count, 500)
+            self.assertEqual(EstimatedCountPaginator(self.qs.filter(name__startswith="Жанр"), 10).count, 5)
+        with mock.patch.object(paginators, "_estimated_table_rows", return_value=99):
+            self.assertEqual(EstimatedCountPaginator(self.qs, 10).count, self.total)
+        with mock.patch.object(paginators, "_estimated_table_rows", return_value=None):  # не PostgreSQL
+            self.assertEqual(EstimatedCountPaginator(self.qs, 10).count, self.total)
+
+    def test_empty_page_past_real_rows_falls_back_to_last_page(self):
+        with mock.patch.object(paginators, "_estimated_table_rows", return_value=500):
+            paginator = EstimatedCountPaginator(self.qs, 2)
+            self.assertEqual(paginator.num_pages, 250)
+            page = paginator.page(40)
+        last = (self.total + 1) // 2
+        self.assertEqual((page.number, paginator.count, paginator.num_pages), (last, self.total, last))
+        self.assertEqual(list(page), list(self.qs)[(last - 1) * 2:])
+
+    def test_underestimate_keeps_tail_pages_reachable(self):
+        for i in range(100):
+            Genre.objects.create(name=f"Массовая загрузка {i}")
+        total = Genre.objects.count()
+        with mock.patch.object(paginators, "_estimated_table_rows", return_value=100):
+            paginator = EstimatedCountPaginator(self.qs, 10)
+            self.assertEqual(paginator.num_pages, 10)
+            self.assertEqual(len(paginator.page(10)), 10)  # последняя по оценке страница — полная
+            self.assertEqual(paginator.count, total)
+
+            paginator = EstimatedCountPaginator(self.qs, 10)
+            page = paginator.page(11)  # за оценкой — без EmptyPage
+        self.assertEqual(list(page), list(self.qs)[100:110])
+        self.assertEqual(paginator.num_pages, (total + 9) // 10)
+
+
+class CachedDateHierarchyFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        User.objects.create_user("staff", password="pw", is_staff=True, is_superuser=True)
+        self.client.login(username="staff", password="pw")
+        customer = User.objects.create_user("customer", password="pw")
+        status, _ = OrderStatus.objects.get_or_create(name="New")
+        self.orders = {}
+        for day in (datetime.date(2023, 11, 5), datetime.date(2024, 2, 10), datetime.date(2024, 3, 1)):
+            order = Order.objects.create(user=customer, status=status, total=10)
+            Order.objects.filter(pk=order.pk).update(
+                order_date=datetime.datetime.combine(day, datetime.time(12), datetime.timezone.utc)
+            )
+            self.orders[day] = order.pk
+        self.url = reverse("admin:store_order_changelist")
+
+    def choices(self, response):
+        specs = response.context["cl"].filter_specs
+        spec = next(f for f in specs if getattr(f, "parameter_name", None) == "order_date_period")
+        return [value for value, _ in spec.lookup_choices]
+
+    def shown(self, response):
+        return sorted(o.pk for o in response.context["cl"].result_list)
+
+    def test_years_and_months_from_cached_bounds(self):
+        response = self.client.get(self.url)
+        self.assertEqual(self.choices(response), ["2024", "2023"])
+        self.assertEqual(len(self.shown(response)), 3)
+
+        response = self.client.get(self.url, {"order_date_period": "2024"})
+        self.assertEqual(self.choices(response), ["2024", "2024-01", "2024-02", "2024-03", "2023"])
+        self.assertEqual(self.shown(response), sorted([self.orders[datetime.date(2024, 2, 10)],
+                                                       self.orders[datetime.date(2024, 3, 1)]]))
+
+        response = self.client.get(self.url, {"order_date_period": "2023-11"})
+        self.assertEqual(self.choices(response), ["2024", "2023", "2023-11", "2023-12"])
+        self.assertEqual(self.shown(response), [self.orders[datetime.date(2023, 11, 5)]])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse([q["sql"] for q in queries if "MIN(" in q["sql"].upper()])  # границы из кэша
+
+    def test_bad_period_is_ignored(self):
+        response = self.client.get(self.url, {"order_date_period": "2024-13"})
+        self.assertEqual(len(self.shown(response)), 3)
@@ -0,0 +1,47 @@
+import datetime
+from django.core.cache import cache
+from django.test import TestCase, SimpleTestCase, Client
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from store import timeseries
+
+User = get_user_model()
+
+class TimeseriesTests(SimpleTestCase):
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        points = [(x, 0.0) for x in range(1000)]
+        points[500] = (500, 100.0)
+        sampled = timeseries.lttb(points, 50)
+        self.assertEqual(len(sampled), 50)
+        self.assertEqual(sampled[0], points[0])
+        self.assertEqual(sampled[-1], points[-1])
+        self.assertIn((500, 100.0), sampled)
+
+    def test_bucket_choice_and_rebucket(self):
+        start = datetime.date(2025, 1, 1)
+        self.assertEqual(timeseries.choose_bucket(start, start + datetime.timedelta(days=30)), "day")
+        self.assertEqual(timeseries.choose_bucket(start, start + datetime.timedelta(days=300)), "week")
+        self.assertEqual(timeseries.choose_bucket(start, start + datetime.timedelta(days=1000)), "month")
+        days = [(start + datetime.timedelta(days=i), 1) for i in range(40)]
+        self.assertEqual(timeseries.rebucket(days, "month"), [(datetime.date(2025, 1, 1), 31), (datetime.date(2025, 2, 1), 9)])
+
+
+class AnalyticsSeriesEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user("staff", password="pw", is_staff=True)
+        self.client = Client()
+        self.client.login(username="staff", password="pw")
+
+    def test_series_json_is_bucketed_and_cacheable(self):
+        url = reverse("admin_analytics_series")
+        resp = self.client.get(url, {"start_date": "2022-01-01", "end_date": "2024-12-31", "points": 20})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data["bucket"], "month")
+        self.assertEqual(len(data["revenue"]), 20)
+        self.assertIn("max-age", resp["Cache-Control"])
+
+        again = self.client.get(url, {"start_date": "2022-01-01", "end_date": "2024-12-31", "points": 20},
+                                HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(again.status_code, 304)
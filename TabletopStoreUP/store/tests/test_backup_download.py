@@ -1,10 +1,14 @@
 import os
+import unittest
 from pathlib import Path
-from django.test import TestCase, Client, override_settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.core.management import call_command
 
+from store import backup_downloads
+
 User = get_user_model()
 
 class BackupDownloadTests(TestCase):
@@ -29,3 +33,299 @@ class BackupDownloadTests(TestCase):
         resp = self.client.get(url)
         self.assertEqual(resp.status_code, 200)
         self.assertIn("application", resp["Content-Type"])
+        self.assertTrue((backups_dir / f"{fname}.sha256").exists())  # sha256 считает команда backup
+        self.assertEqual(resp["ETag"], f'"{backup_downloads.known_checksum(files[-1])}"')
+
+
+class NdjsonBackupTests(TransactionTestCase):
+    # снимок бэкапа — своя транзакция (REPEATABLE READ), а потоки восстановления видят только закоммиченное
+    def test_ndjson_backup_writes_manifest_per_model(self):
+        import json, tempfile
+        from io import StringIO
+        from store import backup_engine
+        from store.models import Genre, Product
+
+        genre = Genre.objects.create(name="Backup genre")
+        Product.objects.create(name="Backup product", price="12.50", stock=3, genre=genre)
+
+        with tempfile.TemporaryDirectory() as tmp, override_settings(BASE_DIR=Path(tmp), MEDIA_ROOT=Path(tmp) / "none"):
+            call_command("backup", "--format", "ndjson", "--compression", "gzip", stdout=StringIO())
+            target = next((Path(tmp) / "backups").glob("backup_*"))
+            manifest = backup_engine.read_manifest(target)
+
+            entries = {m["label"]: m for m in manifest["models"]}
+            self.assertIn("store.product_player_ranges", entries)
+            self.assertNotIn("sessions.session", entries)
+            product = entries["store.product"]
+            self.assertEqual(product["rows"], Product.objects.count())
+            self.assertEqual(backup_engine.file_sha256(target / product["file"]), product["sha256"])
+
+            with backup_engine.open_compressed_reader(target / product["file"], "gzip") as fh:
+                rows = [dict(zip(product["columns"], json.loads(line))) for line in fh]
+            row = next(r for r in rows if r["name"] == "Backup product")
+            self.assertEqual((row["price"], row["genre_id"]), ("12.50", genre.pk))
+
+    def test_restore_ndjson_round_trip(self):
+        import tempfile
+        from decimal import Decimal
+        from io import StringIO
+        from store import backup_engine
+        from store.models import Genre, PlayerRange, Product, UserProfile
+
+        user = User.objects.create_user("buyer", password="pw")
+        genre = Genre.objects.create(name="Restore genre")
+        product = Product.objects.create(name="Restore product", price="7.25", stock=4, genre=genre)
+        product.player_ranges.add(PlayerRange.objects.create(min_players=2, max_players=5))
+        profiles = UserProfile.objects.count()
+        product_id, user_id = product.pk, user.pk
+
+        with tempfile.TemporaryDirectory() as tmp:
+            backup_engine.create_backup(Path(tmp) / "backup", compression="gzip")
+            product.delete()
+            user.delete()
+            Product.objects.create(name="Created after backup", price=1, stock=1, genre=genre)
+
+            out = StringIO()
+            call_command("restore", "--file", str(Path(tmp) / "backup"), "--noinput", stdout=out)
+
+        self.assertIn("store.product: ", out.getvalue())
+        restored = Product.objects.get(pk=product_id)
+        self.assertEqual((restored.price, restored.stock, restored.genre_id), (Decimal("7.25"), 4, genre.pk))
+        self.assertEqual([str(r) for r in restored.player_ranges.all()], ["2-5 players"])
+        self.assertFalse(Product.objects.filter(name="Created after backup").exists())
+        self.assertTrue(User.objects.get(pk=user_id).check_password("pw"))
+        # сигналы создания профиля при загрузке не срабатывают — дублей нет
+        self.assertEqual(UserProfile.objects.count(), profiles)
+        self.assertGreater(Product.objects.create(name="Next", price=1, stock=1, genre=genre).pk, product_id)
+
+    def test_incremental_chain_restores_latest_state(self):
+        import tempfile
+        from io import StringIO
+        from store import backup_engine
+        from store.models import Genre, PlayerRange, Product
+
+        genre = Genre.objects.create(name="Chain genre")
+        kept = Product.objects.create(name="Kept", price=1, stock=1, genre=genre)
+        edited = Product.objects.create(name="Edited", price=1, stock=1, genre=genre)
+        removed = Product.objects.create(name="Removed", price=1, stock=1, genre=genre)
+        removed_id = removed.pk
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            backup_engine.create_backup(root / "backup_1", compression="gzip")
+
+            edited.stock = 9
+            edited.save()
+            removed.delete()
+            inc = backup_engine.create_backup(root / "backup_2", compression="gzip", kind="incremental")
+            entries = {e["label"]: e for e in inc["models"]}
+            self.assertEqual(inc["parent"], "backup_1")
+            self.assertEqual((entries["store.product"]["rows"], entries["store.product"]["deleted"]), (1, [removed_id]))
+            self.assertNotIn("store.genre", entries)
+
+            added = Product.objects.create(name="Added", price=2, stock=2, genre=genre)
+            added.player_ranges.add(PlayerRange.objects.create(min_players=3, max_players=6))
+            backup_engine.create_backup(root / "backup_3", compression="gzip", kind="incremental")
+            diff = backup_engine.create_backup(root / "backup_4", compression="gzip", kind="differential")
+            self.assertEqual(diff["parent"], "backup_1")
+            self.assertEqual({e["label"]: e["rows"] for e in diff["models"]}["store.product"], 2)
+
+            # портим текущую БД и восстанавливаем последний инкремент (с цепочкой)
+            Product.objects.filter(pk=kept.pk).update(name="Broken")
+            out = StringIO()
+            call_command("restore", "--file", str(root / "backup_3"), "--noinput", stdout=out)
+
+        self.assertEqual(Product.objects.get(pk=kept.pk).name, "Kept")
+        self.assertEqual(Product.objects.get(pk=edited.pk).stock, 9)
+        self.assertFalse(Product.objects.filter(pk=removed_id).exists())
+        self.assertEqual([str(r) for r in Product.objects.get(name="Added").player_ranges.all()], ["3-6 players"])
+        self.assertIn("backup_3 · store.product: 1 строк", out.getvalue())
+
+    @unittest.skipIf(connection.vendor == "postgresql", "на PostgreSQL журнал пишут триггеры, а не сигналы")
+    def test_changelog_signals_skip_excluded_models_and_missing_table(self):
+        from types import SimpleNamespace
+        from unittest import mock
+        from django.db.models.deletion import Collector
+        from store import backup_changes
+        from store.models import BackupChangeLog, Genre, RequestProfile
+
+        genre = Genre.objects.create(name="Logged by signal")
+        self.assertTrue(BackupChangeLog.objects.filter(table_name="store_genre", row_pk=str(genre.pk)).exists())
+        backup_changes.record(RequestProfile, SimpleNamespace(pk=1), "I")
+        self.assertFalse(BackupChangeLog.objects.filter(table_name=RequestProfile._meta.db_table).exists())
+        # сигналы подключены только к моделям бэкапа — у остальных остаётся быстрое удаление
+        self.assertTrue(Collector(using="default").can_fast_delete(RequestProfile.objects.all()))
+
+        # migrate до создания журнала: сигналы не должны падать на отсутствующей таблице
+        with mock.patch.object(backup_changes, "_changelog_exists", False), \
+                mock.patch("django.db.connection.introspection.table_names", return_value=[]):
+            genre = Genre.objects.create(name="Before changelog")
+        self.assertFalse(BackupChangeLog.objects.filter(table_name="store_genre", row_pk=str(genre.pk)).exists())
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "триггеры журнала есть только на PostgreSQL")
+    def test_changelog_triggers_cover_backup_tables_only(self):
+        from django.db.models.deletion import Collector
+        from store import backup_changes
+        from store.models import BackupChangeLog, Genre, RequestProfile
+
+        with connection.cursor() as cursor:
+            triggered = backup_changes._triggered_tables(cursor)
+        self.assertIn("store_genre", triggered)
+        self.assertNotIn(RequestProfile._meta.db_table, triggered)
+
+        genre = Genre.objects.create(name="Logged by trigger")
+        self.assertTrue(BackupChangeLog.objects.filter(table_name="store_genre", row_pk=str(genre.pk)).exists())
+        # сигналов журнала на PostgreSQL нет — массовое удаление идёт без загрузки строк
+        self.assertTrue(Collector(using="default").can_fast_delete(RequestProfile.objects.all()))
+
+
+class MediaCasBackupTests(TestCase):
+    def test_cas_backup_dedups_and_restore_copies_only_changes(self):
+        import tempfile
+        from io import StringIO
+        from store import media_backup
+
+        with tempfile.TemporaryDirectory() as tmp:
+            media = Path(tmp) / "media"
+            (media / "product_images").mkdir(parents=True)
+            (media / "product_images" / "a.jpg").write_bytes(b"same image")
+            (media / "product_images" / "b.jpg").write_bytes(b"same image")
+            (media / "logo.png").write_bytes(b"logo")
+
+            with override_settings(BASE_DIR=Path(tmp), MEDIA_ROOT=media):
+                call_command("backup", "--media-mode", "cas", stdout=StringIO())
+            backups = Path(tmp) / "backups"
+            first = next(backups.glob("media_*.json"))
+            manifest = media_backup.read_manifest(first)
+            self.assertEqual(set(manifest["files"]), {"logo.png", "product_images/a.jpg", "product_images/b.jpg"})
+            self.assertEqual(manifest["new_blobs"], 2)
+            self.assertFalse(list(backups.glob("media_*.tar.gz")))
+
+            # Повторный бэкап без изменений не перечитывает файлы
+            again = media_backup.backup_media(media, backups, backups / "media_9999-01-01_00-00-00.json")
+            self.assertEqual((again["hashed"], again["new_blobs"]), (0, 0))
+
+            target = Path(tmp) / "restored"
+            stats = media_backup.restore_media(first, target)
+            self.assertEqual((stats["files"], stats["copied"]), (3, 3))
+            self.assertEqual((target / "product_images" / "b.jpg").read_bytes(), b"same image")
+
+            (target / "logo.png").write_bytes(b"edit")
+            stats = media_backup.restore_media(first, target)
+            self.assertEqual(stats["copied"], 1)
+            self.assertEqual((target / "logo.png").read_bytes(), b"logo")
+
+    def test_identical_files_hashed_concurrently_store_one_blob(self):
+        import tempfile, threading, time
+        from unittest import mock
+        from store import media_backup
+
+        data = b"x" * 4096
+        real_sha256 = media_backup._sha256
+        barrier = threading.Barrier(2, timeout=5)
+
+        real_copyfile = media_backup.shutil.copyfile
+
+        def sha256_together(path):
+            sha = real_sha256(path)
+            barrier.wait()  # оба потока доходят до записи блоба одновременно
+            return sha
+
+        def slow_copyfile(source, target):
+            time.sleep(0.2)  # пока копия не готова, блоба в хранилище ещё нет
+            return real_copyfile(source, target)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            media, backups = Path(tmp) / "media", Path(tmp) / "backups"
+            media.mkdir()
+            (media / "a.jpg").write_bytes(data)
+            (media / "b.jpg").write_bytes(data)
+
+            with mock.patch.object(media_backup, "_sha256", sha256_together), \
+                    mock.patch.object(media_backup.shutil, "copyfile", slow_copyfile):
+                manifest = media_backup.backup_media(media, backups, backups / "media_2025-01-01_00-00-00.json",
+                                                     workers=2)
+
+            blobs = [p for p in (backups / media_backup.STORE_NAME).rglob("*") if p.is_file()]
+            self.assertEqual([p.read_bytes() for p in blobs], [data])  # один блоб, без .tmp
+            self.assertEqual((manifest["hashed"], manifest["new_blobs"]), (2, 1))
+            self.assertEqual((manifest["new_bytes"], manifest["total_bytes"]), (len(data), 2 * len(data)))
+
+    def test_cas_restore_rejects_unsafe_paths(self):
+        import json, tempfile
+        from store import media_backup
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "media_2025-01-01_00-00-00.json"
+            path.write_text(json.dumps({
+                "format": media_backup.FORMAT_NAME,
+                "files": {"../evil.txt": {"sha256": "0" * 64, "size": 1, "mtime_ns": 0}},
+            }))
+            with self.assertRaises(ValueError):
+                media_backup.restore_media(path, Path(tmp) / "media")
+
+
+class RangeDownloadTests(TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        backups = Path(self.tmp.name) / "backups"
+        backups.mkdir()
+        (backups / "backup_2025-01-01_00-00-00.json").write_bytes(b"0123456789")
+        (Path(self.tmp.name) / "secret.txt").write_text("secret")
+        self.settings_override = override_settings(BASE_DIR=Path(self.tmp.name), BACKUP_DOWNLOAD_ACCEL_REDIRECT="")
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        User.objects.create_user("admin", password="pw", is_staff=True)
+        self.client.login(username="admin", password="pw")
+        self.url = reverse("store:download_backup", args=["backup_2025-01-01_00-00-00.json"])
+
+    def test_range_and_if_range(self):
+        full = self.client.get(self.url)
+        self.assertEqual(full["Accept-Ranges"], "bytes")
+        etag = full["ETag"]
+
+        resp = self.client.get(self.url, HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE=etag)
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(b"".join(resp.streaming_content), b"2345")
+
+        resp = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(resp.streaming_content), b"789")
+
+        # Файл сменился — If-Range не совпал, отдаётся целиком
+        resp = self.client.get(self.url, HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b"".join(resp.streaming_content), b"0123456789")
+
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=10-").status_code, 416)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_listing_checksums_become_etags(self):
+        import hashlib
+        from unittest import mock
+        from store import backup_downloads
+
+        with mock.patch.object(backup_downloads, "_sha256") as sha:
+            data = self.client.get(reverse("store:backup_list")).json()["backups"]
+        sha.assert_not_called()  # список только читает готовые .sha256
+        self.assertEqual([b["name"] for b in data], ["backup_2025-01-01_00-00-00.json"])
+        self.assertIsNone(data[0]["sha256"])
+
+        path = Path(self.tmp.name) / "backups" / "backup_2025-01-01_00-00-00.json"
+        self.assertEqual(backup_downloads.write_checksum(path), hashlib.sha256(b"0123456789").hexdigest())
+        data = self.client.get(reverse("store:backup_list")).json()["backups"]
+        self.assertEqual(data[0]["sha256"], hashlib.sha256(b"0123456789").hexdigest())
+        self.assertEqual(self.client.get(self.url)["ETag"], f'"{data[0]["sha256"]}"')
+
+    def test_old_admin_url_still_downloads(self):
+        resp = self.client.get("/admin/backups/backup_2025-01-01_00-00-00.json/", HTTP_RANGE="bytes=2-5")
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b"".join(resp.streaming_content), b"2345")
+
+    def test_traversal_and_accel_redirect(self):
+        self.assertEqual(self.client.get(reverse("store:download_backup", args=["../secret.txt"])).status_code, 404)
+        with override_settings(BACKUP_DOWNLOAD_ACCEL_REDIRECT="/_backups/"):
+            resp = self.client.get(self.url)
+        self.assertEqual(resp["X-Accel-Redirect"], "/_backups/backup_2025-01-01_00-00-00.json")
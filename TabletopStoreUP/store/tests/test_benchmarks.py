@@ -0,0 +1,57 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from store import benchmarks
+from store import cache as store_cache
+from store.models import Cart, Genre, Order, Product
+
+User = get_user_model()
+
+
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        genre, _ = Genre.objects.get_or_create(name="Евро")
+        Product.objects.create(name="Bench game", price="1500.00", stock=5, genre=genre)
+
+    def test_runs_scenarios_in_rolled_back_transaction_and_compares_baseline(self):
+        users, orders = User.objects.count(), Order.objects.count()
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "bench.json"
+            call_command("benchmark", "--repeat=2", "--only=catalog.new", "--only=checkout.cod",
+                         f"--output={output}", stdout=StringIO())
+            report = json.loads(output.read_text(encoding="utf-8"))
+            self.assertIn("checkout.cod", report["scenarios"])
+            self.assertEqual(report["scenarios"]["catalog.new.all"]["runs"], 2)
+            self.assertGreater(report["scenarios"]["checkout.cod"]["queries"], 0)
+
+            # служебные пользователи, корзины и заказы откатываются
+            self.assertEqual((User.objects.count(), Order.objects.count()), (users, orders))
+            self.assertFalse(Cart.objects.exists())
+
+            # базовая линия с меньшим числом запросов → регрессия
+            report["scenarios"]["checkout.cod"]["queries"] -= 1
+            output.write_text(json.dumps(report), encoding="utf-8")
+            with self.assertRaises(CommandError):
+                call_command("benchmark", "--repeat=1", "--only=checkout.cod", f"--baseline={output}", stdout=StringIO())
+
+    def test_compare_ignores_small_time_noise(self):
+        baseline = {"scenarios": {"a": {"wall_ms": 1.0, "queries": 3}, "b": {"wall_ms": 10.0, "queries": 3}}}
+        current = {"a": {"wall_ms": 2.5, "queries": 3}, "b": {"wall_ms": 20.0, "queries": 3}}
+        self.assertEqual([name for name, _ in benchmarks.compare(current, baseline)], ["b"])
+
+    def test_product_pages_bypass_shared_cache(self):
+        store_cache.reset()
+        self.addCleanup(store_cache.reset)
+        store_cache.backend().clear()
+        results = benchmarks.run(repeat=2, only=["product_detail.popular"])
+        # каждый повтор рендерит страницу заново, а не отдаёт её из кэша
+        self.assertGreater(results["product_detail.popular"]["queries"], 0)
+        self.assertFalse([k for k in store_cache.backend()._cache if "view:" in k])
+        self.assertEqual(store_cache.stats()["hit_ratio"], None)
@@ -0,0 +1,113 @@
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from store import cache as store_cache
+from store.models import Genre, Product, Review
+from store.serializers import ProductSerializer
+
+User = get_user_model()
+
+
+@override_settings(CACHE_L1_MAX_ENTRIES=3, CACHE_TAG_CHECK_SECONDS=60)
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        store_cache.backend().clear()
+        store_cache.reset()
+        self.addCleanup(store_cache.reset)
+
+    def test_levels_lru_and_tag_invalidation(self):
+        calls = []
+
+        def compute(value):
+            calls.append(value)
+            return value
+
+        self.assertEqual(store_cache.get_or_set("a", lambda: compute(1), tags=["product:1"]), 1)
+        self.assertEqual(store_cache.get_or_set("a", lambda: compute(2), tags=["product:1"]), 1)
+        for key in "bcd":  # L1 на 3 записи: "a" вытесняется, но остаётся в L2
+            store_cache.set(key, key)
+        self.assertEqual(store_cache.get("a"), 1)
+        self.assertEqual(calls, [1])
+
+        store_cache.invalidate("product:1")
+        self.assertIsNone(store_cache.get("a"))
+        self.assertEqual(store_cache.get_or_set("a", lambda: compute(3), tags=["product:1"]), 3)
+        stats = store_cache.stats()
+        self.assertEqual((stats["l1_hits"], stats["l2_hits"], stats["misses"]), (1, 1, 3))
+
+        # другой процесс: пустой L1 и устаревшее знание версий, сброс виден через L2
+        store_cache.reset()
+        self.assertEqual(store_cache.get("a"), 3)
+        store_cache.backend().set(store_cache._tag_key("product:1"), time.time_ns(), None)
+        with override_settings(CACHE_TAG_CHECK_SECONDS=0):
+            self.assertIsNone(store_cache.get("a"))
+
+    def test_concurrent_misses_compute_once_and_expiry_refreshes_early(self):
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return "value"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(store_cache.get_or_set("slow", slow)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ["value"] * 8)
+        self.assertEqual(len(calls), 1)
+
+        # пока блокировку держит другой процесс, вызывающий ждёт его результат
+        store_cache.backend().add(store_cache._lock_key("other"), 1, 10)
+        threading.Timer(0.1, lambda: store_cache.backend().set(
+            store_cache._full_key("other"), store_cache.Entry("theirs", (), time.time() + 60, 0.1), 60,
+        )).start()
+        self.assertEqual(store_cache.get_or_set("other", lambda: "ours"), "theirs")
+
+        # до истечения далеко, но пересчёт дорогой — XFetch обновляет заранее
+        store_cache.backend().set(store_cache._full_key("hot"), store_cache.Entry("old", (), time.time() + 5, 10.0), 60)
+        with mock.patch.object(store_cache.random, "random", return_value=0.5):
+            self.assertEqual(store_cache.get_or_set("hot", lambda: "new"), "new")
+        self.assertEqual(store_cache.stats()["early_refreshes"], 1)
+
+    def test_l2_failure_falls_back_to_compute(self):
+        with mock.patch.object(store_cache, "backend", side_effect=ConnectionError("redis down")), \
+                self.assertLogs("store.cache", "WARNING"):
+            self.assertEqual(store_cache.get_or_set("k", lambda: 42, tags=["catalog"]), 42)
+        self.assertGreater(store_cache.stats()["l2_errors"], 0)
+
+
+class CacheInvalidationTests(TestCase):
+    def setUp(self):
+        store_cache.backend().clear()
+        store_cache.reset()
+        self.addCleanup(store_cache.reset)
+        genre, _ = Genre.objects.get_or_create(name="Евро")
+        self.product = Product.objects.create(name="Cached game", price="900.00", stock=4, genre=genre)
+        self.user = User.objects.create_user("reviewer", password="x")
+
+    def test_review_invalidates_cached_rating_and_anonymous_page(self):
+        self.assertEqual(ProductSerializer(self.product).data["avg_rating"], 0)
+        url = reverse("store:product_detail", args=[self.product.pk])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        Review.objects.create(product=self.product, user=self.user, rating=4, comment="Хорошо")
+        self.assertEqual(ProductSerializer(self.product).data["avg_rating"], 4)
+        self.assertContains(self.client.get(url), "Хорошо")
+
+        self.client.force_login(self.user)  # вошедшему — без кэша страницы
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertGreater(len(queries), 0)
@@ -1,13 +1,33 @@
-from io import BytesIO
+import datetime
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from django.core.management import call_command
 from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from store.models import Genre, PlayerRange, Product
+from django.utils import timezone
+from store import import_jobs
+from store.models import Genre, PlayerRange, Product, CatalogImportJob
 
 User = get_user_model()
 
+
+def use_import_dir(test):
+    """Каталог загрузок на время теста — удаляется после него."""
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    overridden = override_settings(CATALOG_IMPORT_DIR=directory.name)
+    overridden.enable()
+    test.addCleanup(overridden.disable)
+    return directory.name
+
+
+@override_settings(CATALOG_IMPORT_SPAWN_WORKER=False)
 class CatalogImportExportTests(TestCase):
     def setUp(self):
+        use_import_dir(self)
         self.client = Client()
         self.staff = User.objects.create_user("staff", password="pw", is_staff=True)
         self.client.login(username="staff", password="pw")
@@ -43,6 +63,7 @@ class CatalogImportExportTests(TestCase):
         url = reverse("store:catalog_import")
         resp = self.client.post(url, data={"file": BytesIO(csv)}, format="multipart")
         self.assertEqual(resp.status_code, 200)
+        call_command("process_import_jobs", "--once", stdout=StringIO())
         self.assertTrue(Product.objects.filter(name__iexact="Alpha").exists())
         self.assertTrue(Product.objects.filter(name__iexact="Beta").exists())
         self.assertTrue(Genre.objects.filter(name="Card").exists())
@@ -52,4 +73,200 @@ class CatalogImportExportTests(TestCase):
         csv2 = "id,name,description,price,stock,genre,player_ranges\n,Alpha,,19.99,10,Card,2-4\n".encode()
         resp2 = self.client.post(url, data={"file": BytesIO(csv2)}, format="multipart")
         self.assertEqual(resp2.status_code, 200)
+        call_command("process_import_jobs", "--once", stdout=StringIO())
         self.assertEqual(Product.objects.get(name="Alpha").stock, 10)
+
+    def test_import_returns_job_and_reports_progress(self):
+        csv = "name,price,stock,genre\nDelta,5,1,Card\n".encode("utf-8")
+        upload = BytesIO(csv)
+        upload.name = "catalog.csv"
+        resp = self.client.post(
+            reverse("store:catalog_import"), data={"file": upload, "dry_run": "1"},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(resp.status_code, 202)
+        job = CatalogImportJob.objects.get(pk=resp.json()["job_id"])
+        self.assertEqual(job.status, CatalogImportJob.STATUS_QUEUED)
+        self.assertTrue(job.dry_run)
+        self.assertFalse(Product.objects.filter(name="Delta").exists())
+
+        status_url = reverse("store:catalog_import_job_status", args=[job.pk])
+        self.assertEqual(resp.json()["status_url"], status_url)
+        self.assertFalse(self.client.get(status_url).json()["finished"])
+
+        call_command("process_import_jobs", "--once", stdout=StringIO())
+        data = self.client.get(status_url).json()
+        self.assertEqual((data["status"], data["rows_done"], data["created"]), ("done", 1, 1))
+        self.assertFalse(Product.objects.filter(name="Delta").exists())
+        page = self.client.get(reverse("store:catalog_import_job", args=[job.pk]))
+        self.assertContains(page, "Delta")
+
+
+@override_settings(CATALOG_IMPORT_STALE_SECONDS=60, CATALOG_IMPORT_MAX_ATTEMPTS=2)
+class ImportJobQueueTests(TestCase):
+    def setUp(self):
+        self.directory = use_import_dir(self)
+        import_jobs.release_worker_lock()
+
+    def job(self, **fields):
+        return CatalogImportJob.objects.create(file_path=f"{self.directory}/missing.csv", **fields)
+
+    def test_abandoned_running_jobs_are_requeued_then_failed(self):
+        long_ago = timezone.now() - datetime.timedelta(minutes=5)
+        fresh = self.job(status=CatalogImportJob.STATUS_RUNNING, heartbeat_at=timezone.now(), attempts=1)
+        retry = self.job(status=CatalogImportJob.STATUS_RUNNING, heartbeat_at=long_ago, attempts=1)
+        legacy = self.job(status=CatalogImportJob.STATUS_RUNNING, started_at=long_ago, attempts=1)
+        exhausted = self.job(status=CatalogImportJob.STATUS_RUNNING, heartbeat_at=long_ago, attempts=2)
+        spooled = Path(self.directory) / "exhausted.csv"
+        spooled.write_text("name,price\n")
+        CatalogImportJob.objects.filter(pk=exhausted.pk).update(file_path=str(spooled))
+
+        self.assertEqual(import_jobs.reclaim_stale(), (2, 1))
+        self.assertFalse(spooled.exists())  # загруженный файл задачи в ошибках больше не нужен
+        statuses = dict(CatalogImportJob.objects.values_list("pk", "status"))
+        self.assertEqual(
+            [statuses[j.pk] for j in (fresh, retry, legacy, exhausted)],
+            ["running", "queued", "queued", "failed"],
+        )
+        job = import_jobs.claim_next()
+        self.assertEqual((job.pk, job.attempts), (retry.pk, 2))
+        self.assertEqual(CatalogImportJob.objects.get(pk=retry.pk).attempts, 2)
+
+    def test_late_result_of_reclaimed_job_is_dropped(self):
+        self.job()
+        job = import_jobs.claim_next()
+        CatalogImportJob.objects.filter(pk=job.pk).update(status=CatalogImportJob.STATUS_QUEUED)  # забрали как брошенную
+        import_jobs.process_job(job)
+        self.assertEqual(CatalogImportJob.objects.get(pk=job.pk).status, CatalogImportJob.STATUS_QUEUED)
+
+    def test_upload_reuses_running_worker(self):
+        with mock.patch.object(import_jobs.subprocess, "Popen") as popen:
+            self.assertTrue(import_jobs.acquire_worker_lock())
+            self.assertFalse(import_jobs.spawn_worker())
+            self.assertEqual(popen.call_count, 0)
+
+            # обработчик, отпустив блокировку, сам заберёт то, что поставили, пока он работал
+            self.job()
+            import_jobs.release_worker_lock()
+            out = StringIO()
+            call_command("process_import_jobs", "--once", stdout=out)
+            self.assertIn("Обработано задач импорта: 1", out.getvalue())
+
+            self.assertTrue(import_jobs.spawn_worker())
+            self.assertEqual(popen.call_count, 1)
+
+
+class CatalogImportEngineTests(TestCase):
+    def setUp(self):
+        self.genre = Genre.objects.create(name="Board")
+        self.existing = Product.objects.create(name="Alpha", description="", price=10, stock=1, genre=self.genre)
+
+    def test_ndjson_dry_run_reports_diff_without_writing(self):
+        from store.catalog_import import import_catalog
+        data = (
+            '{"name": "alpha", "price": "12.50", "stock": 1, "genre": "Board", "player_ranges": ["2-4"]}\n'
+            '{"name": "Gamma", "price": 5, "stock": 3, "genre": "Party"}\n'
+            '{"name": "", "genre": "Party"}\n'
+        ).encode("utf-8")
+        report = import_catalog(BytesIO(data), dry_run=True)
+        self.assertEqual((report.created, report.updated, report.rows), (1, 1, 3))
+        self.assertEqual(len(report.errors), 1)
+        update = next(d for d in report.diff if d["action"] == "update")
+        self.assertEqual(update["id"], self.existing.id)
+        self.assertEqual(update["changes"]["price"], ["10.00", "12.50"])
+        self.assertIn("player_ranges", update["changes"])
+        self.assertFalse(Product.objects.filter(name="Gamma").exists())
+        self.assertFalse(Genre.objects.filter(name="Party").exists())
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.price, 10)
+
+    def test_dry_run_counts_new_product_once_across_chunks(self):
+        from store.catalog_import import import_catalog
+        data = (
+            "name,price,stock,genre\n"
+            "Gamma,5,3,Party\n"
+            "Gamma,5,3,Party\n"  # тот же товар в следующем куске, без изменений
+            "Gamma,6,3,Party\n"
+        ).encode("utf-8")
+        report = import_catalog(BytesIO(data), name="catalog.csv", dry_run=True, chunk_size=1)
+        self.assertEqual((report.created, report.updated, report.unchanged), (1, 1, 1))
+        update = next(d for d in report.diff if d["action"] == "update")
+        self.assertEqual((update["id"], update["changes"]["price"]), (None, ["5.00", "6.00"]))
+        self.assertFalse(Product.objects.filter(name="Gamma").exists())
+
+        report = import_catalog(BytesIO(data), name="catalog.csv", chunk_size=1)
+        self.assertEqual((report.created, report.updated, report.unchanged), (1, 1, 1))
+
+    def test_batched_import_uses_constant_queries_per_chunk(self):
+        from store.catalog_import import import_catalog
+        lines = ["id,name,description,price,stock,genre,player_ranges"]
+        lines.append(f"{self.existing.id},Alpha renamed,,11,2,Board,2-4")
+        lines += [f",Item {i},,1.00,{i},Card,1-2;3-5" for i in range(50)]
+        data = "\n".join(lines).encode("utf-8")
+        with self.assertNumQueries(15):
+            report = import_catalog(BytesIO(data), name="catalog.csv", chunk_size=100)
+        self.assertEqual((report.created, report.updated, report.errors), (50, 1, []))
+        self.assertEqual(Product.objects.get(pk=self.existing.pk).name, "Alpha renamed")
+        self.assertEqual(Product.objects.get(name="Item 7").player_ranges.count(), 2)
+
+        # повторный импорт тех же строк ничего не меняет
+        report = import_catalog(BytesIO(data), name="catalog.csv", chunk_size=100)
+        self.assertEqual((report.created, report.updated, report.unchanged), (0, 0, 51))
+        self.assertGreater(report.rows_per_sec, 0)
+
+    def test_failed_chunk_is_retried_row_by_row(self):
+        from store.catalog_import import import_catalog
+        data = (
+            "name,price,stock,genre,player_ranges\n"
+            "Good,1,1,Fresh,7-9\n"
+            "Bad,1,-5,Fresh,7-9\n"  # отрицательный остаток валит bulk_create всего куска
+            "Other,1,2,Board,\n"
+        ).encode("utf-8")
+        report = import_catalog(BytesIO(data), name="catalog.csv", chunk_size=10)
+        self.assertEqual((report.created, report.rows), (2, 3))
+        self.assertEqual(len(report.errors), 1)
+        self.assertTrue(report.errors[0].startswith("Строка 2:"), report.errors)
+        # жанр и диапазон из откатившегося куска созданы заново, а не взяты по устаревшему id
+        good = Product.objects.get(name="Good")
+        self.assertEqual(good.genre.name, "Fresh")
+        self.assertEqual([str(r) for r in good.player_ranges.all()], ["7-9 players"])
+        self.assertFalse(Product.objects.filter(name="Bad").exists())
+
+
+@override_settings(CATALOG_WATERMARK_OVERLAP_SECONDS=0)
+class CatalogIncrementalExportTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.staff = User.objects.create_user("staff", password="pw", is_staff=True)
+        self.client.login(username="staff", password="pw")
+        self.genre = Genre.objects.create(name="Board Games")
+        self.kept = Product.objects.create(name="Kept", price=1, stock=1, genre=self.genre)
+        self.changed = Product.objects.create(name="Changed", price=1, stock=1, genre=self.genre)
+        self.removed = Product.objects.create(name="Removed", price=1, stock=1, genre=self.genre)
+
+    def test_since_returns_only_deltas(self):
+        url = reverse("store:catalog_export_json")
+        full = self.client.get(url)
+        self.assertIsInstance(full.json(), list)
+        watermark = full["X-Catalog-Watermark"]
+
+        self.changed.stock = 0
+        self.changed.save(update_fields=["stock"])
+        removed_id = self.removed.pk
+        self.removed.delete()
+        added = Product.objects.create(name="Added", price=2, stock=3, genre=self.genre)
+
+        resp = self.client.get(url, {"since": watermark})
+        data = resp.json()
+        self.assertEqual(resp["X-Catalog-Watermark"], data["watermark"])
+        self.assertEqual(sorted(p["id"] for p in data["changed"]), sorted([self.changed.pk, added.pk]))
+        self.assertEqual(data["deleted"], [removed_id])
+
+        # тот же дельта-фид в API; смена диапазонов игроков тоже считается изменением
+        since = data["watermark"]
+        self.kept.player_ranges.add(PlayerRange.objects.create(min_players=1, max_players=2))
+        api = self.client.get("/api/products/changes/", {"since": since}).json()
+        self.assertEqual([p["id"] for p in api["changed"]], [self.kept.pk])
+        self.assertEqual(api["deleted"], [])
+
+        self.assertEqual(self.client.get(url, {"since": "yesterday"}).status_code, 400)
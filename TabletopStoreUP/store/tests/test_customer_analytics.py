@@ -0,0 +1,118 @@
+import datetime
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from store import customer_analytics
+from store.models import CohortRetention, CustomerRFM, Order, OrderStatus
+
+User = get_user_model()
+
+
+def ts(day):
+    return int(datetime.datetime.combine(day, datetime.time(12), datetime.timezone.utc).timestamp())
+
+
+# покупатель → [(дата заказа, сумма)]
+HISTORY = {
+    1: [(datetime.date(2024, 1, 10), 100), (datetime.date(2024, 2, 5), 50), (datetime.date(2024, 6, 25), 200)],
+    2: [(datetime.date(2024, 1, 20), 30)],
+    3: [(datetime.date(2024, 2, 14), 80), (datetime.date(2024, 3, 1), 20)],
+}
+NOW = ts(datetime.date(2024, 6, 30))
+
+
+def columns():
+    rows = [(user, ts(day), total) for user, orders in HISTORY.items() for day, total in orders]
+    rows.reverse()  # compute сам сортирует по (покупатель, дата)
+    users, stamps, totals = zip(*rows)
+    return np.array(users, dtype=np.int64), np.array(stamps, dtype=np.int64), np.array(totals, dtype=np.float64)
+
+
+class QuintileScoreTests(TestCase):
+    def test_scores_follow_quintiles_and_ties_get_the_better_score(self):
+        values = np.arange(1, 11)
+        self.assertEqual(customer_analytics.quintile_scores(values).tolist(), [1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+        self.assertEqual(customer_analytics.quintile_scores(values, higher_is_better=False).tolist(),
+                         [5, 5, 4, 4, 3, 3, 2, 2, 1, 1])
+        same = np.array([7, 7, 7])
+        self.assertEqual(customer_analytics.quintile_scores(same).tolist(), [5, 5, 5])
+        self.assertEqual(customer_analytics.quintile_scores(same, higher_is_better=False).tolist(), [5, 5, 5])
+        self.assertEqual(customer_analytics.quintile_scores(np.array([])).size, 0)
+
+
+class ComputeTests(TestCase):
+    def test_rfm_and_cohort_matrix(self):
+        result = customer_analytics.compute(*columns(), now_ts=NOW)
+        c = result["customers"]
+        self.assertEqual(c["user_id"].tolist(), [1, 2, 3])
+        self.assertEqual(c["frequency"].tolist(), [3, 1, 2])
+        self.assertEqual(c["monetary"].tolist(), [350.0, 30.0, 100.0])
+        self.assertEqual(c["recency_days"].tolist(), [5, 162, 121])
+        self.assertEqual([c["r"].tolist(), c["f"].tolist(), c["m"].tolist()], [[5, 1, 3]] * 3)
+        self.assertEqual(c["segment"].tolist(), ["champions", "lost", "promising"])
+
+        jan, feb = datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)
+        # январь: двое в первый месяц, один вернулся через 1 и через 5 месяцев; февраль: один и он же через месяц
+        self.assertEqual(result["retention"], [(jan, 0, 2), (jan, 1, 1), (jan, 5, 1), (feb, 0, 1), (feb, 1, 1)])
+
+    def test_no_orders(self):
+        empty = np.empty(0, dtype=np.int64)
+        self.assertEqual(customer_analytics.compute(empty, empty, np.empty(0)), {"customers": {}, "retention": []})
+
+
+class PersistAndAdminTests(TestCase):
+    def setUp(self):
+        status, _ = OrderStatus.objects.get_or_create(name="New")
+        self.users = {}
+        for number, orders in HISTORY.items():
+            user = self.users[number] = User.objects.create_user(f"customer{number}", password="pw")
+            for day, total in orders:
+                order = Order.objects.create(user=user, status=status, total=total)
+                Order.objects.filter(pk=order.pk).update(
+                    order_date=datetime.datetime.combine(day, datetime.time(12), datetime.timezone.utc)
+                )
+
+    def test_run_replaces_tables(self):
+        CohortRetention.objects.create(cohort=datetime.date(2000, 1, 1), month_offset=0, customers=99)
+        stats = customer_analytics.run(chunk_size=2)  # несколько кусков курсора
+        self.assertEqual((stats["orders"], stats["customers"], stats["cohort_cells"]), (6, 3, 5))
+
+        first = CustomerRFM.objects.get(user=self.users[1])
+        self.assertEqual((first.frequency, first.monetary, first.cohort), (3, Decimal("350.00"), datetime.date(2024, 1, 1)))
+        self.assertEqual(
+            sorted(CohortRetention.objects.values_list("cohort", "month_offset", "customers")),
+            [(datetime.date(2024, 1, 1), 0, 2), (datetime.date(2024, 1, 1), 1, 1), (datetime.date(2024, 1, 1), 5, 1),
+             (datetime.date(2024, 2, 1), 0, 1), (datetime.date(2024, 2, 1), 1, 1)],
+        )
+
+        customer_analytics.run()  # повторный расчёт заменяет, а не дописывает
+        self.assertEqual(CustomerRFM.objects.count(), 3)
+
+    def test_admin_starts_rebuild_in_background_once(self):
+        User.objects.create_user("staff", password="pw", is_staff=True)
+        self.client.login(username="staff", password="pw")
+        url = reverse("admin_customer_analytics")
+
+        with mock.patch.object(customer_analytics.subprocess, "Popen") as popen:
+            response = self.client.post(url, follow=True)
+            self.assertEqual(popen.call_count, 1)
+            self.assertIn("build_customer_analytics", popen.call_args[0][0])
+            self.assertContains(response, "Пересчёт запущен в фоне")
+            self.assertFalse(CustomerRFM.objects.exists())  # в запросе ничего не считается
+
+            with customer_analytics.run_lock():
+                response = self.client.post(url, follow=True)
+                with self.assertRaises(CommandError):
+                    call_command("build_customer_analytics", stdout=StringIO())
+            self.assertEqual(popen.call_count, 1)
+            self.assertContains(response, "Пересчёт уже выполняется")
+
+        call_command("build_customer_analytics", stdout=StringIO())
+        self.assertEqual(CustomerRFM.objects.count(), 3)
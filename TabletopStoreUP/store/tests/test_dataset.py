@@ -0,0 +1,62 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.test import TestCase
+
+from store import dataset
+from store.models import Delivery, Order, OrderItem, Payment, Product, Review, UserProfile
+
+
+class GenerateDatasetTests(TestCase):
+    volumes = dict(seed=7, users=40, products=30, orders=300, reviews=200, days=365, end_date=datetime.date(2025, 6, 30))
+
+    def _generate(self, chunk_size):
+        plan = dataset.build_plan(**self.volumes)
+        dataset.create_users(plan)
+        for phase in dataset.tasks(plan, chunk_size):
+            for task in phase:
+                dataset.run_task(plan, *task)
+        return plan
+
+    def _fingerprint(self, plan):
+        orders = Order.objects.filter(id__gte=plan["order_base"]).order_by("id")
+        return (
+            list(orders.values_list("user__username", "order_date", "status__name", "total")),
+            list(OrderItem.objects.filter(order__in=orders).order_by("order_id", "product_id")
+                 .values_list("order_id", "product_id", "quantity", "price")),
+            Review.objects.filter(product_id__gte=plan["product_base"]).count(),
+        )
+
+    def test_same_seed_gives_same_data(self):
+        with transaction.atomic():
+            first = self._fingerprint(self._generate(chunk_size=100))
+            transaction.set_rollback(True)
+        second = self._fingerprint(self._generate(chunk_size=100))
+        self.assertEqual(first, second)
+
+    def test_dataset_is_consistent_and_skewed(self):
+        out = StringIO()
+        call_command("generate_dataset", *[f"--{k.replace('_', '-')}={v}" for k, v in self.volumes.items()],
+                     "--chunk-size=100", stdout=out)
+        self.assertIn("✅", out.getvalue())
+
+        generated = Order.objects.filter(user__username__startswith="ds7_")
+        self.assertEqual(generated.count(), 300)
+        self.assertEqual(UserProfile.objects.filter(user__username__startswith="ds7_").count(), 40)
+        self.assertEqual(Payment.objects.filter(order__in=generated).count(), 300)
+        self.assertEqual(Delivery.objects.filter(order__in=generated).count(), 300)
+
+        # сумма заказа = сумма позиций
+        mismatched = generated.annotate(items_sum=Sum(F("items__quantity") * F("items__price"))).exclude(total=F("items_sum"))
+        self.assertFalse(mismatched.exists())
+
+        # Ципф: самый популярный товар встречается в заказах намного чаще медианного
+        per_product = sorted(
+            Product.objects.filter(name__contains="#").annotate(n=Count("orderitem")).values_list("n", flat=True),
+            reverse=True,
+        )
+        self.assertGreater(per_product[0], 4 * max(per_product[len(per_product) // 2], 1))
+        self.assertTrue(Review.objects.filter(user__username__startswith="ds7_").exists())
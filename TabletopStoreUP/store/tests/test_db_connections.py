@@ -0,0 +1,53 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.core.management import call_command
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from store import db_connections, metrics
+from store.models import Genre, Product
+
+
+class BenchmarkConnectionsTests(TransactionTestCase):
+    def test_persistent_connections_are_reused_across_requests(self):
+        genre, _ = Genre.objects.get_or_create(name="Евро")
+        Product.objects.create(name="Pooled game", price="10.00", stock=3, genre=genre)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "connections.json"
+            call_command("benchmark_connections", "--mode=new", "--mode=persistent", "--mode=pool",
+                         "--concurrency=2", "--requests=5", f"--output={output}", stdout=StringIO())
+            report = json.loads(output.read_text(encoding="utf-8"))
+
+        # тестовая SQLite в памяти не закрывает соединения, так что new здесь не переподключается
+        self.assertEqual((report["new"]["requests"], report["new"]["errors"]), (10, 0))
+        self.assertEqual((report["persistent"]["requests"], report["persistent"]["errors"]), (10, 0))
+        self.assertEqual(report["persistent"]["connects"], 2)  # одно на клиента
+        self.assertIn("skipped", report["pool"])  # SQLite
+        self.assertFalse([alias for alias in connections if alias.startswith("benchmark_")])
+
+
+class PoolMetricsTests(SimpleTestCase):
+    def test_pool_gauges_count_only_live_workers(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(METRICS_DIR=tmp):
+            metrics.reset()
+            try:
+                pool = SimpleNamespace(get_stats=lambda: {"pool_size": 4, "pool_available": 1, "pool_max": 10})
+                wrapper = SimpleNamespace(alias="default", pool=pool)
+                db_connections.record_acquire(wrapper, 0.003)
+                # файл завершившегося воркера: его состояние пула в сумму не попадает
+                dead = metrics.FileStore(Path(tmp) / "metrics_dead.db")
+                dead.set(metrics._key("store_db_pool_connections", "store_db_pool_connections",
+                                      ["default", "in_use", "999999999"]), 7)
+                dead.close()
+
+                text = metrics.exposition(with_state=False)
+            finally:
+                metrics.reset()
+        self.assertIn('store_db_pool_connections{alias="default",state="in_use"} 3', text)
+        self.assertIn('store_db_pool_connections{alias="default",state="max"} 10', text)
+        self.assertIn('store_db_connection_acquire_seconds_count{alias="default",mode="pool"} 1', text)
@@ -0,0 +1,120 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from store import cache as store_cache
+from store import db_routing, signals
+from store.api import ProductViewSet
+from store.models import Product, RequestProfile
+from store.views import ProductListView, cart_add
+
+router = db_routing.ReplicaRouter()
+
+
+@override_settings(REPLICA_DATABASES=["replica1"], REPLICA_PIN_SECONDS=5, REPLICA_MAX_LAG_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        db_routing.reset_health()
+        self.factory = RequestFactory()
+        self.lag = mock.patch.object(db_routing, "replica_lag", return_value=0.5)
+        self.lag.start()
+        self.addCleanup(self.lag.stop)
+
+    def serve(self, request, view_func, write=False):
+        """Проход через middleware: какие базы router выбрал для чтения до и после записи."""
+        seen = []
+
+        def get_response(request):
+            middleware.process_view(request, view_func, (), {})
+            seen.append(router.db_for_read(Product) or "default")
+            if write:
+                router.db_for_write(Product)
+                seen.append(router.db_for_read(Product) or "default")
+            return HttpResponse()
+
+        middleware = db_routing.ReplicaRoutingMiddleware(get_response)
+        return middleware(request), seen
+
+    def test_marked_views_and_api_reads_go_to_replica(self):
+        catalog = ProductListView.as_view()
+        self.assertEqual(self.serve(self.factory.get("/"), catalog)[1], ["replica1"])
+        self.assertEqual(self.serve(self.factory.get("/api/products/"), ProductViewSet.as_view({"get": "list"}))[1],
+                         ["replica1"])
+        self.assertEqual(self.serve(self.factory.post("/"), catalog)[1], ["default"])
+        self.assertEqual(self.serve(self.factory.get("/"), cart_add)[1], ["default"])
+        self.assertIsNone(router.db_for_read(Product))  # вне запроса — основная база
+
+    def test_write_pins_user_to_primary(self):
+        catalog = ProductListView.as_view()
+        response, seen = self.serve(self.factory.get("/"), catalog, write=True)
+        self.assertEqual(seen, ["replica1", "default"])
+        self.assertIn(db_routing.PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[db_routing.PIN_COOKIE]["max-age"], 5)
+
+        request = self.factory.get("/")
+        request.COOKIES[db_routing.PIN_COOKIE] = response.cookies[db_routing.PIN_COOKIE].value
+        self.assertEqual(self.serve(request, catalog)[1], ["default"])
+        request.COOKIES[db_routing.PIN_COOKIE] = "1"  # закрепление истекло
+        self.assertEqual(self.serve(request, catalog)[1], ["replica1"])
+
+    def test_incidental_writes_do_not_pin(self):
+        catalog = ProductListView.as_view()
+
+        def get_response(request):
+            router.db_for_write(Product)  # запись до view (например, другим middleware)
+            middleware.process_view(request, catalog, (), {})
+            router.db_for_write(Session)
+            router.db_for_write(RequestProfile)
+            router.db_for_write(User)  # update_last_login при входе
+            signals.last_login_does_not_pin_to_primary(sender=User, request=request, user=User(pk=1))
+            seen.append(router.db_for_read(Product) or "default")
+            return HttpResponse()
+
+        seen = []
+        middleware = db_routing.ReplicaRoutingMiddleware(get_response)
+        response = middleware(self.factory.get("/"))
+        self.assertEqual(seen, ["replica1"])
+        self.assertNotIn(db_routing.PIN_COOKIE, response.cookies)
+
+    def test_lagging_or_broken_replica_falls_back_to_primary(self):
+        catalog = ProductListView.as_view()
+        db_routing.replica_lag.return_value = 30
+        with self.assertLogs("store.db_routing", "WARNING"):
+            self.assertEqual(self.serve(self.factory.get("/"), catalog)[1], ["default"])
+
+        db_routing.replica_lag.return_value = 1
+        self.assertEqual(self.serve(self.factory.get("/"), catalog)[1], ["default"])  # проверка ещё не устарела
+        db_routing.reset_health()
+        self.assertEqual(self.serve(self.factory.get("/"), catalog)[1], ["replica1"])
+
+        db_routing.reset_health()
+        db_routing.replica_lag.side_effect = DatabaseError("connection refused")
+        with self.assertLogs("store.db_routing", "WARNING"):
+            self.assertEqual(self.serve(self.factory.get("/"), catalog)[1], ["default"])
+
+    def test_cache_fills_read_from_primary(self):
+        store_cache.reset()
+        self.addCleanup(store_cache.reset)
+        seen = []
+
+        def read():
+            seen.append(router.db_for_read(Product) or "default")
+            return seen[-1]
+
+        def get_response(request):
+            middleware.process_view(request, ProductListView.as_view(), (), {})
+            store_cache.get_or_set("routing:test", read, 60)  # значение для общего кэша
+            read()
+            return HttpResponse()
+
+        middleware = db_routing.ReplicaRoutingMiddleware(get_response)
+        middleware(self.factory.get("/"))
+        self.assertEqual(seen, ["default", "replica1"])
+
+    def test_replicas_are_never_migrated(self):
+        self.assertIs(router.allow_migrate("replica1", "store"), False)
+        self.assertIsNone(router.allow_migrate("default", "store"))
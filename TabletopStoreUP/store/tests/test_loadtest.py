@@ -0,0 +1,36 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from store.models import Genre, Order, Payment, Product
+
+
+class LoadTestCommandTests(TestCase):
+    def setUp(self):
+        genre, _ = Genre.objects.get_or_create(name="Евро")
+        self.hot = Product.objects.create(name="Hot game", price="1500.00", stock=50, genre=genre)
+
+    def test_single_user_journeys_reach_payment_without_oversell(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "load.json"
+            call_command("loadtest", "--users=1", "--iterations=3", "--hot-products=1", "--hot-stock=2",
+                         "--hot-ratio=1", "--fail-ratio=0", "--seed=7", f"--output={output}", stdout=StringIO())
+            summary = json.loads(output.read_text(encoding="utf-8"))
+
+        self.assertEqual(summary["journeys"], 3)
+        for step in ("catalog", "catalog_filter", "product", "cart_add_gate"):
+            self.assertEqual(summary["endpoints"][step]["errors"], 0, step)
+        self.assertEqual(summary["endpoints"]["catalog"]["requests"], 3)
+        # два заказа разбирают остаток, на третьей попытке товар уже раскуплен
+        self.assertEqual(summary["endpoints"]["cart_add_gate"]["rejected"], 1)
+        self.assertEqual(summary["endpoints"]["order_create"]["requests"], 2)
+        self.assertEqual(Order.objects.filter(items__product=self.hot).count(), 2)
+        self.assertEqual(Payment.objects.filter(status__name="Paid").count(), 2)
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.stock, 0)
+        self.assertEqual(summary["stock"][str(self.hot.id)]["sold"], 2)
+        self.assertEqual((summary["oversold_units"], summary["lost_updates"]), (0, 0))
@@ -0,0 +1,82 @@
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from store import metrics
+from store.models import Cart, CartItem, Genre, PaymentMethod, Product
+
+User = get_user_model()
+
+
+def sample(text, line_start):
+    return next(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(line_start))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(METRICS_DIR=self.tmp.name, METRICS_TOKEN="")
+        self.settings_override.enable()
+        metrics.reset()
+        genre, _ = Genre.objects.get_or_create(name="Евро")
+        self.product = Product.objects.create(name="Measured game", price="1500.00", stock=2, genre=genre)
+
+    def tearDown(self):
+        metrics.reset()
+        self.settings_override.disable()
+        self.tmp.cleanup()
+
+    def test_worker_files_are_summed_and_buckets_are_cumulative(self):
+        metrics.CHECKOUT.inc(result="success")
+        metrics.REQUEST_LATENCY.observe(0.02, view="store:product_list", method="GET", status="2xx")
+        # второй воркер со своим файлом в том же каталоге
+        other = metrics.FileStore(Path(self.tmp.name) / "metrics_99999.db")
+        other.add(metrics.CHECKOUT._keys[("success",)], 2)
+        other.close()
+
+        text = metrics.exposition(with_state=False)
+        self.assertEqual(sample(text, 'store_checkout_total{result="success"}'), 3)
+        labels = 'view="store:product_list",method="GET",status="2xx"'
+        self.assertEqual(sample(text, f'store_http_request_duration_seconds_bucket{{{labels},le="0.01"}}'), 0)
+        self.assertEqual(sample(text, f'store_http_request_duration_seconds_bucket{{{labels},le="0.025"}}'), 1)
+        self.assertEqual(sample(text, f'store_http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'), 1)
+        self.assertIn("# TYPE store_http_request_duration_seconds histogram", text)
+
+    def test_endpoint_reports_requests_db_and_state(self):
+        self.client.get(reverse("store:product_list"))
+        user = User.objects.create_user("buyer", password="x")
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+
+        self.assertEqual(self.client.get("/metrics").status_code, 403)  # без токена и разрешённых адресов
+        with override_settings(METRICS_ALLOWED_IPS=["127.0.0.0/8"]):
+            response = self.client.get("/metrics")
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        text = response.content.decode()
+        self.assertEqual(sample(text, 'store_http_request_duration_seconds_count{view="store:product_list"'), 1)
+        self.assertGreater(sample(text, 'store_db_queries_per_request_sum{view="store:product_list"}'), 0)
+        self.assertEqual(sample(text, "store_cart_reserved_units "), 2)
+        self.assertEqual(sample(text, 'store_catalog_import_jobs{status="queued"}'), 0)
+
+        with override_settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+        self.client.force_login(User.objects.create_user("ops", password="x", is_staff=True))
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_cash_on_delivery_checkout_counts_success_after_commit(self):
+        user = User.objects.create_user("buyer", password="x")
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        cod, _ = PaymentMethod.objects.get_or_create(code="cod", defaults={"name": "Наличными", "is_active": True})
+        self.client.force_login(user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("store:create_order"), {"address": "ул. Метрик, 1", "payment_method": cod.id})
+        self.assertEqual(response.status_code, 302)
+        text = metrics.exposition(with_state=False)
+        self.assertEqual(sample(text, 'store_checkout_total{result="success"}'), 1)
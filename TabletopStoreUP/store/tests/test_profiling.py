@@ -0,0 +1,49 @@
+import marshal
+import pstats
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from store.models import Genre, Product, RequestProfile
+
+User = get_user_model()
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        genre, _ = Genre.objects.get_or_create(name="Евро")
+        Product.objects.create(name="Profiled game", price="1500.00", stock=5, genre=genre)
+        self.catalog = reverse("store:product_list")
+
+    def test_server_timing_reports_sql_and_templates(self):
+        response = self.client.get(self.catalog)
+        metrics = {part.split(";")[0].strip(): part for part in response["Server-Timing"].split(",")}
+        self.assertEqual(set(metrics), {"db", "tpl", "app", "total"})
+        self.assertNotIn('"SQL x0"', metrics["db"])
+        self.assertNotIn("dur=0.0", metrics["tpl"])
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_profile_only_for_staff_and_downloadable(self):
+        customer = User.objects.create_user("customer", password="x")
+        self.client.force_login(customer)
+        self.client.get(self.catalog, {"_profile": "1"})
+        self.assertFalse(RequestProfile.objects.exists())
+
+        staff = User.objects.create_user("staff", password="x", is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+        response = self.client.get(self.catalog, {"_profile": "1"})
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual((profile.trigger, profile.user, profile.status_code), ("staff", staff, 200))
+        self.assertGreater(profile.sql_count, 0)
+        self.assertIn("cumulative", profile.stats)
+
+        download = self.client.get(reverse("admin:store_requestprofile_download", args=[profile.pk]))
+        stats = pstats.Stats()
+        stats.stats = marshal.loads(download.content)
+        self.assertTrue(stats.stats)
+        self.assertEqual(self.client.get(reverse("admin:store_requestprofile_change", args=[profile.pk])).status_code, 200)
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_middleware_is_removed(self):
+        self.assertNotIn("Server-Timing", self.client.get(self.catalog))
@@ -0,0 +1,49 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.test import TestCase
+
+from store.models import UserProfile, UserRole, UserSettings
+from store.provisioning import provision_users
+
+User = get_user_model()
+
+
+class ProvisionUsersTests(TestCase):
+    def test_bulk_provisioning_matches_signal_invariants(self):
+        manager, _ = UserRole.objects.get_or_create(name="manager")
+        User.objects.create_user("taken", password="x")
+        rows = [
+            {"username": "alice", "email": "a@example.com", "password_hash": make_password("secret"), "phone": "+700"},
+            {"username": "bob", "password": "bobpass", "role": "manager", "full_name": "Боб"},
+            {"username": "root", "is_superuser": "true"},
+            {"username": "taken"},
+            {"username": "eve", "role": "nope"},
+            {"username": "dup", "phone": "+700"},
+        ]
+        with self.assertNumQueries(8):
+            report = provision_users(rows, chunk_size=10, workers=2)
+
+        self.assertEqual((report.created, report.skipped, len(report.errors)), (3, 1, 2))
+        alice = User.objects.get(username="alice")
+        self.assertTrue(alice.check_password("secret"))
+        self.assertEqual((alice.profile.full_name, alice.profile.phone, alice.profile.role.name), ("alice", "+700", "client"))
+        bob = User.objects.get(username="bob")
+        self.assertTrue(bob.check_password("bobpass"))
+        self.assertEqual((bob.profile.role_id, bob.profile.full_name), (manager.id, "Боб"))
+        root = User.objects.get(username="root")
+        self.assertTrue(root.is_staff and not root.has_usable_password())
+        self.assertEqual(root.profile.role.name, "admin")
+        self.assertEqual(UserSettings.objects.filter(user__username__in=["alice", "bob", "root"]).count(), 3)
+
+    def test_command_reads_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "users.csv"
+            path.write_text("username,email,password\nu1,u1@example.com,pw1\nu2,,\n", encoding="utf-8")
+            call_command("provision_users", str(path), stdout=StringIO())
+        self.assertEqual(UserProfile.objects.filter(user__username__in=["u1", "u2"]).count(), 2)
+        self.assertTrue(User.objects.get(username="u1").check_password("pw1"))
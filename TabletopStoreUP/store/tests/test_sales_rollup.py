@@ -0,0 +1,114 @@
+import datetime
+from unittest import mock
+from decimal import Decimal
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from store.models import (
+    Genre, Product, Order, OrderItem, OrderStatus,
+    Payment, PaymentStatus, PaymentMethod, SalesDailyRollup, SalesRollupDirty,
+)
+from store import analytics_cache, rollup
+from store import cache as store_cache
+
+User = get_user_model()
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", password="pw")
+        self.genre = Genre.objects.create(name="Board")
+        self.p1 = Product.objects.create(name="P1", price=100, stock=10, genre=self.genre)
+        self.p2 = Product.objects.create(name="P2", price=50, stock=10, genre=self.genre)
+        self.new, _ = OrderStatus.objects.get_or_create(name="New")
+        self.pending, _ = PaymentStatus.objects.get_or_create(name="Pending")
+        self.card, _ = PaymentMethod.objects.get_or_create(code="card", defaults={"name": "Card"})
+        store_cache.backend().clear()
+        store_cache.reset()
+        self.addCleanup(store_cache.reset)
+
+    def _order(self, items, refresh=True):
+        total = sum(p.price * q for p, q in items)
+        order = Order.objects.create(user=self.user, status=self.new, total=total)
+        for p, q in items:
+            OrderItem.objects.create(order=order, product=p, quantity=q, price=p.price)
+        Payment.objects.create(order=order, amount=total, status=self.pending, method=self.card)
+        if refresh:
+            rollup.refresh_dirty()
+        return order
+
+    def test_rollup_tracks_created_and_cancelled_orders(self):
+        order = self._order([(self.p1, 2), (self.p2, 1)])
+        self._order([(self.p1, 1)])
+        today = timezone.localdate()
+
+        totals = SalesDailyRollup.objects.get(day=today, product__isnull=True)
+        self.assertEqual(totals.orders_count, 2)
+        self.assertEqual(totals.units, 4)
+        self.assertEqual(totals.revenue, Decimal("350.00"))
+        self.assertEqual(totals.payment_method, self.card)
+        p1_row = SalesDailyRollup.objects.get(day=today, product=self.p1)
+        self.assertEqual((p1_row.orders_count, p1_row.units, p1_row.genre), (2, 3, self.genre))
+
+        cancelled, _ = OrderStatus.objects.get_or_create(name="Cancelled")
+        order.status = cancelled
+        order.save(update_fields=["status"])
+        self.assertEqual(rollup.refresh_dirty(), [today])
+        totals = SalesDailyRollup.objects.get(day=today, product__isnull=True)
+        self.assertEqual((totals.orders_count, totals.revenue), (1, Decimal("100.00")))
+        self.assertFalse(SalesDailyRollup.objects.filter(day=today, product=self.p2).exists())
+
+    def test_rebuild_range_is_idempotent_and_dashboard_reads_rollup(self):
+        self._order([(self.p2, 3)])
+        today = timezone.localdate()
+        before = SalesDailyRollup.objects.count()
+        rollup.rebuild_range(today)
+        self.assertEqual(SalesDailyRollup.objects.count(), before)
+
+        User.objects.create_user("staff", password="pw", is_staff=True)
+        client = Client()
+        client.login(username="staff", password="pw")
+        resp = client.get(reverse("export_analytics_csv"), {"start_date": today, "end_date": today})
+        self.assertEqual(resp.status_code, 200)
+        self.assertRegex(resp.content.decode("utf-8-sig"), rf"{today},1,150(\.00)?\r\n")
+
+    def test_sealed_days_are_cached_until_rollup_rebuild(self):
+        order = self._order([(self.p1, 1)])
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        Order.objects.filter(pk=order.pk).update(order_date=order.order_date - datetime.timedelta(days=1))
+        rollup.rebuild_range(yesterday, timezone.localdate())
+
+        with mock.patch.object(analytics_cache, "compute_days", wraps=analytics_cache.compute_days) as compute:
+            self.assertEqual(analytics_cache.get_daily(yesterday, yesterday)[0]["orders"], 1)
+        compute.assert_called_once_with(yesterday, yesterday, using="default")  # в кэш — только с основной базы
+        # закрытый день отдаётся из кэша, даже если срез изменили в обход пересчёта
+        SalesDailyRollup.objects.filter(day=yesterday).delete()
+        self.assertEqual(analytics_cache.get_daily(yesterday, yesterday)[0]["orders"], 1)
+        # пересчёт среза (отмена/правка старого заказа) сбрасывает кэш дня
+        rollup.rebuild_range(yesterday)
+        daily = analytics_cache.get_daily(yesterday, timezone.localdate())
+        self.assertEqual([d["orders"] for d in daily], [1, 0])
+
+    def test_checkout_only_marks_the_day_and_refresh_coalesces_it(self):
+        with mock.patch.object(rollup, "rebuild_range", wraps=rollup.rebuild_range) as rebuild:
+            self._order([(self.p1, 1)], refresh=False)
+            self._order([(self.p2, 2)], refresh=False)
+            rebuild.assert_not_called()  # в транзакции заказа — только отметки
+            self.assertFalse(SalesDailyRollup.objects.exists())
+
+            today = timezone.localdate()
+            self.assertEqual(rollup.refresh_dirty(), [today])
+            rebuild.assert_called_once_with(today)  # два заказа — один пересчёт дня
+        self.assertFalse(SalesRollupDirty.objects.exists())
+        totals = SalesDailyRollup.objects.get(day=today, product__isnull=True, payment_method=self.card)
+        self.assertEqual((totals.orders_count, totals.units, totals.revenue), (2, 3, Decimal("200.00")))
+        self.assertEqual(rollup.refresh_dirty(), [])
+
+    def test_failed_refresh_keeps_marks_for_next_run(self):
+        self._order([(self.p2, 1)], refresh=False)
+        with mock.patch.object(rollup, "rebuild_range", side_effect=RuntimeError("deadlock")), \
+                self.assertRaises(RuntimeError):
+            rollup.refresh_dirty()
+        self.assertTrue(SalesRollupDirty.objects.exists())
+        rollup.refresh_dirty()
+        self.assertEqual(SalesDailyRollup.objects.get(day=timezone.localdate(), product=self.p2).units, 1)
@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from store import slow_queries
+from store.models import Genre, Product, SlowQuery, SlowQueryFingerprint
+
+User = get_user_model()
+
+
+class FingerprintTests(TestCase):
+    def test_literals_and_in_lists_are_normalized(self):
+        a = slow_queries.fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x' LIMIT 20")
+        b = slow_queries.fingerprint('SELECT * FROM t WHERE id IN (%s, %s)  AND name = %s LIMIT 5')
+        self.assertEqual(a, b)
+        self.assertEqual(a[1], "SELECT * FROM t WHERE id IN (…) AND name = ? LIMIT ?")
+        self.assertNotEqual(a[0], slow_queries.fingerprint('SELECT * FROM "t2" WHERE id = %s')[0])
+
+
+@override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_BACKGROUND=False)
+class SlowQueryCaptureTests(TestCase):
+    def setUp(self):
+        slow_queries.flush()  # запросы setUp не интересны
+        genre, _ = Genre.objects.get_or_create(name="Евро")
+        Product.objects.create(name="Slow game", price="1500.00", stock=5, genre=genre)
+        slow_queries.flush()
+        SlowQueryFingerprint.objects.all().delete()
+
+    def tearDown(self):
+        slow_queries.flush()  # не оставлять очередь следующим тестам и обработчику atexit
+
+    def test_request_queries_are_grouped_with_origin_and_plan(self):
+        catalog = reverse("store:product_list")
+        self.client.get(catalog, {"sort": "price_asc"})
+        self.client.get(catalog, {"sort": "price_asc"})
+
+        sample = SlowQuery.objects.filter(origin="view:store:product_list", sql__icontains="store_product").first()
+        self.assertIsNotNone(sample)
+        self.assertIn("views.py", sample.stack)
+        fp = sample.fingerprint
+        self.assertEqual(fp.count, 2)
+        self.assertEqual(fp.origins, {"view:store:product_list": 2})
+        self.assertEqual(fp.plan_status, SlowQueryFingerprint.PLAN_DONE)
+        self.assertTrue(fp.plan)
+        self.assertLessEqual(fp.p50_ms, fp.max_ms)
+
+        staff = User.objects.create_user("staff", password="x", is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse("admin:store_slowqueryfingerprint_changelist")).status_code, 200)
+        self.assertEqual(
+            self.client.get(reverse("admin:store_slowqueryfingerprint_change", args=[fp.pk])).status_code, 200
+        )
+
+    def test_params_are_kept_only_for_selects_outside_auth_tables(self):
+        user = User.objects.create_user("secret-user", email="secret@example.com", password="x")
+        self.client.login(username="secret-user", password="x")
+        self.client.get(reverse("store:product_list"), {"q": "Slow"})
+        slow_queries.flush()
+
+        auth = SlowQuery.objects.filter(sql__icontains="auth_user")
+        self.assertTrue(auth.exists())
+        for sample in SlowQuery.objects.all():
+            self.assertNotIn("secret", sample.params)
+            self.assertNotIn(user.password, sample.params)
+        self.assertTrue(auth.filter(params=slow_queries.REDACTED).exists())
+        self.assertFalse(SlowQueryFingerprint.objects.filter(example_params__icontains="secret").exists())
+        catalog = SlowQuery.objects.filter(origin="view:store:product_list", sql__icontains="store_product")
+        self.assertTrue(catalog.filter(params__contains="Slow").exists())
@@ -0,0 +1,106 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from store import cache as store_cache
+from store.models import Genre, Product, UserProfile, UserRole, UserSettings
+from store.permissions import IsClientOrReadOnly, IsManagerOrAdmin
+from store.user_context import AUTH_TIMEOUT, CachedJWTAuthentication
+
+User = get_user_model()
+
+
+def settings_queries(queries):
+    return [q["sql"] for q in queries if "store_usersettings" in q["sql"] or "store_userprofile" in q["sql"]]
+
+
+class UserContextTests(TestCase):
+    def setUp(self):
+        store_cache.backend().clear()
+        store_cache.reset()
+        self.addCleanup(store_cache.reset)
+        self.user = User.objects.create_user("reader", password="secret-pass")
+
+    def test_catalog_reads_settings_from_cache_until_they_change(self):
+        genre, _ = Genre.objects.get_or_create(name="Евро")
+        for i in range(3):
+            Product.objects.create(name=f"Game {i}", price="100.00", stock=1, genre=genre)
+        self.client.force_login(self.user)
+        url = reverse("store:product_list")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(len(settings_queries(queries)), 1)  # настройки и роль — одним запросом
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(settings_queries(queries), [])
+        self.assertEqual(len(response.context["page_obj"].object_list), 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse("store:update_page_size"), {"page_size": 2})
+        self.assertFalse([sql for sql in settings_queries(queries) if sql.startswith("SELECT")])
+        self.assertEqual(UserSettings.objects.get(user=self.user).page_size, 2)
+        response = self.client.get(url)
+        self.assertEqual(len(response.context["page_obj"].object_list), 2)
+
+        self.client.post(reverse("store:toggle_theme"))
+        self.assertContains(self.client.get(url), "theme-dark")
+
+    def test_jwt_carries_role_and_permission_checks_need_no_queries(self):
+        response = self.client.post("/api/auth/token/", {"username": "reader", "password": "secret-pass"})
+        access, refresh = response.json()["access"], response.json()["refresh"]
+        self.assertEqual(AccessToken(access)["role"], "client")
+
+        factory = APIRequestFactory()
+
+        def api_request(token):
+            request = Request(factory.post("/api/reviews/", HTTP_AUTHORIZATION=f"Bearer {token}"),
+                              authenticators=[CachedJWTAuthentication()])
+            request.user  # аутентификация
+            return request
+
+        api_request(access)  # пользователь попадает в кэш
+        with self.assertNumQueries(0):
+            request = api_request(access)
+            self.assertTrue(IsClientOrReadOnly().has_permission(request, None))
+            self.assertFalse(IsManagerOrAdmin().has_permission(request, None))
+        self.assertEqual(request.user.pk, self.user.pk)
+
+        profile = UserProfile.objects.get(user=self.user)
+        profile.role, _ = UserRole.objects.get_or_create(name="manager")
+        profile.save(update_fields=["role"])
+        access = self.client.post("/api/auth/token/refresh/", {"refresh": refresh}).json()["access"]
+        self.assertEqual(AccessToken(access)["role"], "manager")
+        self.assertTrue(IsManagerOrAdmin().has_permission(api_request(access), None))
+
+    def test_auth_cache_keeps_no_password_and_sees_deactivation(self):
+        token = AccessToken.for_user(self.user)
+        auth = CachedJWTAuthentication()
+        self.assertEqual(auth.get_user(token).pk, self.user.pk)
+        cached = store_cache.get(f"user:{self.user.pk}:auth_fields")
+        self.assertNotIn("password", cached)
+        self.assertTrue(cached["is_active"])
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)  # без сигналов
+        self.assertEqual(auth.get_user(token).pk, self.user.pk)
+        with mock.patch("store.cache.time.time", return_value=time.time() + AUTH_TIMEOUT + 1), \
+                self.assertRaises(AuthenticationFailed):
+            auth.get_user(token)
+
+    def test_api_partial_update_writes_only_sent_fields(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("store:product_list"))  # контекст в кэше: theme=light
+        UserSettings.objects.filter(user=self.user).update(theme="dark")  # в обход сигналов
+        response = self.client.patch("/api/api/user/settings/1/", {"page_size": 30}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        saved = UserSettings.objects.get(user=self.user)
+        self.assertEqual((saved.page_size, saved.theme), (30, "dark"))
@@ -0,0 +1,74 @@
+"""Агрегация временных рядов для графиков: бакеты день/неделя/месяц и прореживание LTTB."""
+import datetime
+
+BUCKETS = ("day", "week", "month")
+
+
+def choose_bucket(start, end):
+    """Гранулярность по длине периода: до квартала — дни, до двух лет — недели, дальше — месяцы."""
+    days = (end - start).days + 1
+    if days <= 92:
+        return "day"
+    if days <= 731:
+        return "week"
+    return "month"
+
+
+def bucket_start(day, bucket):
+    if bucket == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def rebucket(points, bucket):
+    """Суммирует точки (date, value) по началу бакета. Точки должны идти по возрастанию даты."""
+    out = []
+    for day, value in points:
+        key = bucket_start(day, bucket)
+        if out and out[-1][0] == key:
+            out[-1][1] += value
+        else:
+            out.append([key, value])
+    return [(k, v) for k, v in out]
+
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets: прореживает ряд (x, y) до threshold точек,
+    сохраняя визуальную форму (пики и провалы). x — число (например, ordinal даты).
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(p[0] for p in points[avg_start:avg_end]) / span
+        avg_y = sum(p[1] for p in points[avg_start:avg_end]) / span
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+        max_area, next_a = -1.0, range_start
+        for j in range(range_start, range_end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area, next_a = area, j
+        sampled.append(points[next_a])
+        a = next_a
+    sampled.append(points[-1])
+    return sampled
+
+
+def downsample(points, threshold):
+    """LTTB для ряда (date, value): x берётся как ordinal даты."""
+    numeric = [(d.toordinal(), float(v)) for d, v in points]
+    return [(datetime.date.fromordinal(int(x)), y) for x, y in lttb(numeric, threshold)]
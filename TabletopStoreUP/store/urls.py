@@ -65,6 +65,9 @@ path('password_reset/',
     path('catalog/export.csv', views.export_catalog_csv, name='catalog_export_csv'),
     path('catalog/export.json', views.export_catalog_json, name='catalog_export_json'),
     path('catalog/import/', views.import_catalog_view, name='catalog_import'),
+    path('catalog/import/jobs/<int:job_id>/', views.catalog_import_job_view, name='catalog_import_job'),
+    path('catalog/import/jobs/<int:job_id>/status/', views.catalog_import_job_status, name='catalog_import_job_status'),
     
-    path('admin/backups/<str:filename>/', views.download_backup, name='download_backup'),
+    path('backups/', views.backup_list, name='backup_list'),
+    path('backups/<path:filename>', views.download_backup, name='download_backup'),
 ]
@@ -0,0 +1,133 @@
+"""
+Контекст пользователя: настройки (тема, размер страницы, форматы) и роль.
+
+Собирается одним запросом (UserSettings + профиль + роль), хранится в кэше store.cache
+под тегом user:{id} и сбрасывается сигналами при сохранении User, UserSettings и
+UserProfile (а тегом roles — при изменении справочника ролей). Внутри HTTP-запроса
+контекст берётся один раз: get(request) запоминает его на запросе.
+
+API: access-токен JWT несёт роль (claim role), поэтому permissions не обращаются к БД,
+а CachedJWTAuthentication берёт поля пользователя из того же кэша — без хэша пароля и
+не дольше AUTH_TIMEOUT: блокировку через QuerySet.update() (без сигналов) API замечает
+за это время. Роль в токене живёт до истечения access-токена (ACCESS_TOKEN_LIFETIME);
+при обновлении токена она перечитывается.
+"""
+from dataclasses import dataclass
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from . import cache as store_cache
+from .models import UserSettings
+
+CONTEXT_TIMEOUT = 3600
+AUTH_TIMEOUT = 60
+AUTH_FIELDS = ("id", "username", "first_name", "last_name", "email", "is_active", "is_staff", "is_superuser")
+ROLE_CLAIM = "role"
+SETTINGS_FIELDS = ("theme", "page_size", "date_format", "number_format")
+
+
+@dataclass(frozen=True)
+class UserContext:
+    user_id: int
+    settings_id: int
+    role: str
+    theme: str
+    page_size: int
+    date_format: str
+    number_format: str
+
+
+def load(user_id):
+    """Настройки и роль одним запросом; пользователю без настроек они создаются."""
+    fields = ("id", *SETTINGS_FIELDS, "user__profile__role__name")
+    row = UserSettings.objects.filter(user_id=user_id).values(*fields).first()
+    if row is None:
+        UserSettings.objects.get_or_create(user_id=user_id)
+        row = UserSettings.objects.filter(user_id=user_id).values(*fields).get()
+    return UserContext(
+        user_id=user_id, settings_id=row["id"], role=row["user__profile__role__name"],
+        **{f: row[f] for f in SETTINGS_FIELDS},
+    )
+
+
+def for_user_id(user_id):
+    return store_cache.get_or_set(
+        f"user:{user_id}:context", lambda: load(user_id), CONTEXT_TIMEOUT, [f"user:{user_id}", "roles"],
+    )
+
+
+def get(request):
+    """Контекст текущего пользователя; None для анонима. Принимает и Request DRF."""
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    request = getattr(request, "_request", request)
+    context = getattr(request, "_user_context", None)
+    if context is None or context.user_id != user.pk:
+        context = request._user_context = for_user_id(user.pk)
+    return context
+
+
+def role(request):
+    """Роль из claim access-токена (без запросов), иначе из контекста."""
+    token = getattr(request, "auth", None)
+    if token is not None and hasattr(token, "get") and token.get(ROLE_CLAIM):
+        return token[ROLE_CLAIM]
+    context = get(request)
+    return context.role if context else None
+
+
+def _from_values(model, values):
+    # from_db ждёт значения в порядке полей модели; остальные поля — отложенные
+    loaded = [f.attname for f in model._meta.concrete_fields if f.attname in values]
+    return model.from_db(DEFAULT_DB_ALIAS, loaded, [values[f] for f in loaded])
+
+
+def user_settings(request, *fresh):
+    """
+    UserSettings текущего пользователя для изменения. Поля контекста заполняются без запроса,
+    поля из fresh (saved_filters, updated_at или то, что меняется от текущего значения)
+    читаются из основной базы одним SELECT. save() пишет только загруженные поля.
+    """
+    context = get(request)
+    known = {"id": context.settings_id, "user_id": context.user_id,
+             **{f: getattr(context, f) for f in SETTINGS_FIELDS if f not in fresh}}
+    instance = _from_values(UserSettings, known)
+    if fresh:
+        instance.refresh_from_db(fields=list(fresh))
+    return instance
+
+
+def context_processor(request):
+    return {"user_context": get(request) if hasattr(request, "user") else None}
+
+
+def _auth_fields(user_id):
+    values = get_user_model().objects.filter(pk=user_id).values(*AUTH_FIELDS).first()
+    if values is None:
+        raise AuthenticationFailed(_("User not found"), code="user_not_found")
+    return values
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication с полями пользователя из кэша (тег user:{id}): к БД — только при
+    промахе. Остальные поля (password и т. п.) отложены и читаются при обращении.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if (user_id is None or api_settings.CHECK_REVOKE_TOKEN
+                or api_settings.USER_ID_FIELD != get_user_model()._meta.pk.name):
+            return super().get_user(validated_token)
+        values = store_cache.get_or_set(
+            f"user:{user_id}:auth_fields", lambda: _auth_fields(user_id), AUTH_TIMEOUT, [f"user:{user_id}"],
+        )
+        if api_settings.CHECK_USER_IS_ACTIVE and not values["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return _from_values(get_user_model(), values)  # свой объект на каждый запрос
@@ -7,23 +7,26 @@ from django.db.models import Avg, Count, Q, Subquery, OuterRef, FloatField, Valu
 from django.db.models.functions import Coalesce
 from django.http import (
     JsonResponse, HttpResponseForbidden, HttpResponseRedirect,
-    FileResponse, HttpResponseBadRequest, HttpResponse
+    HttpResponseBadRequest, HttpResponse
 )
 from django.urls import reverse
 from django.utils.http import urlencode
 from django.views.decorators.http import require_POST
+from django.utils.decorators import method_decorator
 from django.views.generic import ListView, DetailView
 from django.contrib import messages
-from django.conf import settings
 from django.http import QueryDict
 from .forms import (
     RegisterForm, LoginForm, ReviewForm,
     OrderCreateForm, UserSettingsForm
 )
+from . import admin_reports, backup_downloads, metrics, user_context
+from .cache import cached, cached_view
+from .db_routing import replica_reads
 from .models import (
     UserRole, OrderStatus, PaymentStatus, DeliveryMethod, DeliveryStatus,
     Genre, PlayerRange, Product, Order, OrderItem, Payment, Delivery,
-    UserProfile, Cart, CartItem, Review, UserSettings, PaymentMethod
+    UserProfile, Cart, CartItem, Review, PaymentMethod
 )
 import csv, io, json, re
 
@@ -32,6 +35,22 @@ import os
 User = get_user_model()
 
 
+@cached("lookups:genres", timeout=3600, tags=["lookups"])
+def catalog_genres():
+    return list(Genre.objects.order_by('name'))
+
+
+@cached("lookups:player_ranges", timeout=3600, tags=["lookups"])
+def catalog_player_ranges():
+    return list(PlayerRange.objects.order_by('min_players', 'max_players'))
+
+
+@cached("product:{product_id}:avg_rating", tags=["product:{product_id}"])
+def product_avg_rating(product_id):
+    return Review.objects.filter(product_id=product_id).aggregate(average=Avg('rating'))['average'] or 0
+
+
+@replica_reads
 class ProductListView(ListView):
     model = Product
     template_name = 'store/product_list.html'
@@ -95,12 +114,8 @@ class ProductListView(ListView):
         return qs.order_by(sort_map.get(sort, '-id'))
 
     def get_paginate_by(self, queryset):
-        if self.request.user.is_authenticated and hasattr(self.request.user, 'settings'):
-            try:
-                return int(self.request.user.settings.page_size or self.paginate_by)
-            except Exception:
-                return self.paginate_by
-        return self.paginate_by
+        context = user_context.get(self.request)
+        return (context and context.page_size) or self.paginate_by
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -115,8 +130,8 @@ class ProductListView(ListView):
         ctx['next_page_url'] = _page_url(page_obj.next_page_number()) if page_obj and page_obj.has_next() else ''
         ctx['prev_page_url'] = _page_url(page_obj.previous_page_number()) if page_obj and page_obj.has_previous() else ''
 
-        ctx['genres'] = Genre.objects.all().order_by('name')
-        ctx['player_ranges'] = PlayerRange.objects.all().order_by('min_players', 'max_players')
+        ctx['genres'] = catalog_genres()
+        ctx['player_ranges'] = catalog_player_ranges()
 
         ctx['current'] = {
             'q': self.request.GET.get('q', ''),
@@ -142,6 +157,8 @@ class ProductListView(ListView):
         return ctx
 
 
+@replica_reads
+@method_decorator(cached_view(tags=["product:{pk}", "lookups"]), name='dispatch')
 class ProductDetailView(DetailView):
     model = Product
     template_name = 'store/product_detail.html'
@@ -149,10 +166,8 @@ class ProductDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        reviews = self.object.reviews.all()
-        avg_rating = reviews.aggregate(average=Avg('rating'))['average'] or 0
-        context['reviews'] = reviews
-        context['avg_rating'] = avg_rating
+        context['reviews'] = self.object.reviews.all()
+        context['avg_rating'] = product_avg_rating(self.object.pk)
         return context
 
 
@@ -288,6 +303,8 @@ def order_create(request):
 
             for item in items:
                 if item.product.stock < item.quantity:
+                    metrics.CHECKOUT.inc(result="out_of_stock")
+                    metrics.OVERSELL_UNITS.inc(item.quantity - item.product.stock)
                     messages.error(request, f"Недостаточно товара: {item.product.name}")
                     raise transaction.TransactionManagementError("Out of stock")
                 OrderItem.objects.create(
@@ -309,6 +326,7 @@ def order_create(request):
                 payment.status = ps; payment.save(update_fields=['status'])
                 order.status = os; order.save(update_fields=['status'])
                 items.delete()
+                transaction.on_commit(lambda: metrics.CHECKOUT.inc(result="success"))
                 messages.success(request, f'Заказ #{order.id} оформлен. Оплата при получении.')
                 return redirect('store:order_success', order.id)
 
@@ -373,65 +391,25 @@ def add_review(request, product_id):
 
 @staff_member_required
 def analytics_dashboard(request):
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-
-    orders = Order.objects.all()
-    if start_date:
-        orders = orders.filter(order_date__date__gte=start_date)
-    if end_date:
-        orders = orders.filter(order_date__date__lte=end_date)
-
-    total_orders = orders.count()
-    total_revenue = orders.aggregate_sum = orders.aggregate(total_sum=Count('id'))
-    total_revenue = orders.aggregate_sum if isinstance(total_revenue, (int, float)) else (orders.aggregate_sum or 0)
-
-    total_revenue = orders.aggregate_sum
-    total_revenue = orders.aggregate_sum or 0
-
-    total_revenue = orders.aggregate_sum if orders else 0
-
-    from django.db.models import Sum
-    total_revenue = orders.aggregate(Sum('total'))['total__sum'] or 0
-    avg_order = (total_revenue / total_orders) if total_orders else 0
-    unique_users = orders.values('user').distinct().count()
-
-    sales_by_date = (
-        orders.extra({'day': "date(order_date)"}).values('day').annotate(total=Sum('total')).order_by('day')
-    )
-    top_products = (
-        OrderItem.objects.filter(order__in=orders)
-        .values('product__name').annotate(total_quantity=Sum('quantity'))
-        .order_by('-total_quantity')[:5]
-    )
-    orders_by_user = (
-        orders.values('user__username').annotate(count=Count('id')).order_by('-count')[:5]
-    )
-
-    context = {
-        'total_orders': total_orders,
-        'total_revenue': total_revenue,
-        'avg_order': avg_order,
-        'unique_users': unique_users,
-        'sales_by_date': list(sales_by_date),
-        'top_products': list(top_products),
-        'orders_by_user': list(orders_by_user),
-        'start_date': start_date,
-        'end_date': end_date,
-    }
-    return render(request, 'store/analytics.html', context)
+    """Аналитика считается по дневному срезу продаж — см. admin_reports.analytics_dashboard."""
+    return admin_reports.analytics_dashboard(request)
 
 @staff_member_required
 def download_backup(request, filename):
-    path = os.path.join(settings.BASE_DIR, "backups", filename)
-    return FileResponse(open(path, "rb"), as_attachment=True)
+    """Файл из backups/ с поддержкой докачки (Range / If-Range) — см. backup_downloads."""
+    return backup_downloads.serve(request, backup_downloads.resolve(filename))
+
+
+@staff_member_required
+def backup_list(request):
+    return JsonResponse({"backups": backup_downloads.list_backups()})
 
 
 @login_required
 @require_POST
 def toggle_theme(request):
     with transaction.atomic():
-        us, _ = UserSettings.objects.get_or_create(user=request.user)
+        us = user_context.user_settings(request, 'theme')
         us.theme = 'dark' if us.theme != 'dark' else 'light'
         us.save(update_fields=['theme'])
     return JsonResponse({'status': 'ok', 'theme': us.theme})
@@ -439,7 +417,7 @@ def toggle_theme(request):
 @login_required
 @require_POST
 def update_page_size(request):
-    us, _ = UserSettings.objects.get_or_create(user=request.user)
+    us = user_context.user_settings(request)
     try:
         ps = max(1, min(100, int(request.POST.get('page_size', 12))))
     except ValueError:
@@ -450,7 +428,7 @@ def update_page_size(request):
 
 @login_required
 def save_catalog_filters(request):
-    us, _ = UserSettings.objects.get_or_create(user=request.user)
+    us = user_context.user_settings(request, 'saved_filters')
     data = request.GET.copy()
     data.pop('page', None)
     us.saved_filters['catalog'] = data
@@ -460,7 +438,7 @@ def save_catalog_filters(request):
 
 @login_required
 def apply_catalog_filters(request):
-    us, _ = UserSettings.objects.get_or_create(user=request.user)
+    us = user_context.user_settings(request, 'saved_filters')
     params = us.saved_filters.get('catalog', {})
     if not params:
         messages.info(request, "Сохранённых фильтров нет.")
@@ -497,28 +475,32 @@ def payment_mock_callback(request, payment_id):
         payment.order.status = s_paid
         payment.order.save(update_fields=['status'])
         CartItem.objects.filter(cart__user=payment.order.user).delete()
+        transaction.on_commit(lambda: metrics.CHECKOUT.inc(result="success"))
         return redirect('store:order_success', payment.order_id)
     else:
         payment.status = p_failed
         payment.save(update_fields=['status'])
         payment.order.status = s_failed
         payment.order.save(update_fields=['status'])
+        transaction.on_commit(lambda: metrics.CHECKOUT.inc(result="failure"))
         return render(request, 'store/payment_failed.html', {'order': payment.order, 'payment': payment})
     
 @login_required
 def user_settings_view(request):
     """Просмотр и изменение пользовательских настроек (тема, формат, размер страниц)."""
-    us, _ = UserSettings.objects.get_or_create(user=request.user)
+    us = user_context.user_settings(request)
     if request.method == 'POST':
         form = UserSettingsForm(request.POST, instance=us)
         if form.is_valid():
-            form.save()
+            form.save(commit=False)
+            us.save(update_fields=[*form.Meta.fields, 'updated_at'])
             messages.success(request, "Настройки сохранены.")
             return redirect('store:user_settings')
     else:
         form = UserSettingsForm(instance=us)
     return render(request, 'store/user_settings.html', {'form': form})
 
+@replica_reads
 @staff_member_required
 def export_catalog_csv(request):
     """Экспорт каталога (Product + Genre + PlayerRange) в CSV."""
@@ -546,144 +528,75 @@ def export_catalog_csv(request):
     return resp
 
 
+@replica_reads
 @staff_member_required
 def export_catalog_json(request):
-    """Экспорт каталога в JSON."""
-    from .models import Product
-    data = []
-    qs = Product.objects.select_related("genre").prefetch_related("player_ranges").order_by("id")
-    for p in qs:
-        data.append({
-            "id": p.id,
-            "name": p.name,
-            "description": p.description,
-            "price": float(p.price),
-            "stock": p.stock,
-            "genre": p.genre.name if p.genre_id else None,
-            "player_ranges": [f"{r.min_players}-{r.max_players}" for r in p.player_ranges.all()],
-        })
-    js = json.dumps(data, ensure_ascii=False, indent=2)
+    """
+    Экспорт каталога в JSON.
+    С параметром ?since=<watermark> — только изменения: {"watermark", "changed", "deleted"}.
+    Водяной знак для следующего запроса всегда передаётся в заголовке X-Catalog-Watermark.
+    """
+    from . import catalog_sync
+    since = request.GET.get("since")
+    if since:
+        try:
+            since = catalog_sync.parse_watermark(since)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        payload = catalog_sync.changes_since(since)
+        watermark = payload["watermark"]
+        filename = "catalog-changes.json"
+    else:
+        watermark = catalog_sync.format_watermark(catalog_sync.current_watermark())
+        payload = [catalog_sync.product_row(p) for p in catalog_sync.catalog_queryset()]
+        filename = "catalog.json"
+    js = json.dumps(payload, ensure_ascii=False, indent=2)
     resp = HttpResponse(js, content_type="application/json; charset=utf-8")
-    resp["Content-Disposition"] = 'attachment; filename="catalog.json"'
+    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp["X-Catalog-Watermark"] = watermark
     return resp
 
 
 @staff_member_required
 def import_catalog_view(request):
     """
-    Импорт каталога из CSV/JSON.
+    Импорт каталога из CSV/TSV/JSON/NDJSON.
     CSV-колонки: id(опц.), name, description, price, stock, genre, player_ranges (например: "2-4;3-6").
-    JSON — список объектов с теми же полями. 
+    JSON — список объектов с теми же полями, NDJSON — по объекту в строке.
     Поиск существующих: сперва по id, затем по name (без регистра).
     Жанры и диапазоны игроков создаются при необходимости.
+    С флажком dry_run ничего не сохраняется — показывается список изменений.
+    Файл ставится в очередь фонового импорта, ответ возвращается сразу с id задачи.
     """
+    from .import_jobs import spool_upload
 
     if request.method == "POST" and request.FILES.get("file"):
-        f = request.FILES["file"]
-        ext = (f.name.rsplit(".", 1)[-1] if "." in f.name else "").lower()
-        created = updated = 0
-        errors = []
-
-        def get_or_create_range(s: str):
-            s = (s or "").strip()
-            if not s:
-                return None
-            m = re.match(r"^(\d+)\s*[-–]\s*(\d+)$", s)
-            if not m:
-                return None
-            a, b = int(m.group(1)), int(m.group(2))
-            obj, _ = PlayerRange.objects.get_or_create(min_players=a, max_players=b)
-            return obj
-
-        try:
-            # читаем данные
-            if ext in ("csv", "tsv"):
-                decoded = f.read().decode("utf-8-sig")
-                rows = list(csv.DictReader(io.StringIO(decoded)))
-            else:
-                rows = json.load(f)
-
-            for idx, row in enumerate(rows, start=1):
-                try:
-                    # Унификация полей
-                    if isinstance(row, dict):
-                        name = (row.get("name") or "").strip()
-                        desc = row.get("description") or ""
-                        price = row.get("price") or 0
-                        stock = int(row.get("stock") or 0)
-                        genre_name = (row.get("genre") or "").strip()
-                        pr_raw = row.get("player_ranges") or ""
-                        if isinstance(pr_raw, str):
-                            pr_list = [s for s in pr_raw.split(";") if s.strip()]
-                        else:
-                            pr_list = list(pr_raw)
-                        pid = row.get("id")
-                    else:
-                        # CSV-строка
-                        name = (row.get("name") or "").strip()
-                        desc = row.get("description") or ""
-                        price = row.get("price") or "0"
-                        stock = int(row.get("stock") or 0)
-                        genre_name = (row.get("genre") or "").strip()
-                        pr_list = [s for s in (row.get("player_ranges") or "").split(";") if s.strip()]
-                        pid = row.get("id")
-
-                    if not name:
-                        errors.append(f"Строка {idx}: отсутствует name")
-                        continue
-
-                    genre = None
-                    if genre_name:
-                        genre, _ = Genre.objects.get_or_create(name=genre_name)
-
-                    # Поиск существующего товара
-                    obj = None
-                    if pid:
-                        try:
-                            obj = Product.objects.get(id=int(pid))
-                        except Product.DoesNotExist:
-                            obj = None
-                    if obj is None:
-                        obj = Product.objects.filter(name__iexact=name).first()
-
-                    # Создание/обновление
-                    if obj is None:
-                        obj = Product.objects.create(
-                            name=name,
-                            description=desc,
-                            price=price,
-                            stock=stock,
-                            genre=genre,
-                        )
-                        created += 1
-                    else:
-                        obj.name = name
-                        obj.description = desc
-                        obj.price = price
-                        obj.stock = stock
-                        obj.genre = genre
-                        obj.save()
-                        updated += 1
-
-                    # Диапазоны игроков
-                    ranges = [get_or_create_range(s) for s in pr_list]
-                    ranges = [r for r in ranges if r is not None]
-                    if ranges:
-                        obj.player_ranges.set(ranges)
-                    else:
-                        obj.player_ranges.clear()
-
-                except Exception as e:
-                    errors.append(f"Строка {idx}: {e}")
-
-            return render(request, "store/catalog_import_result.html", {
-                "created": created, "updated": updated, "errors": errors
-            })
-
-        except Exception as e:
-            return render(request, "store/catalog_import_result.html", {
-                "created": 0, "updated": 0, "errors": [str(e)]
-            })
+        job = spool_upload(request.FILES["file"], user=request.user, dry_run=bool(request.POST.get("dry_run")))
+        if "application/json" in request.headers.get("Accept", ""):
+            return JsonResponse({
+                "job_id": job.pk,
+                "status_url": reverse("store:catalog_import_job_status", args=[job.pk]),
+            }, status=202)
+        return render(request, "store/catalog_import_result.html", {"job": job})
 
     # GET — форма загрузки
-    return render(request, "store/catalog_import.html", {})
\ No newline at end of file
+    return render(request, "store/catalog_import.html", {})
+
+
+@staff_member_required
+def catalog_import_job_view(request, job_id):
+    """Страница задачи импорта (пока задача идёт, прогресс опрашивается через JSON)."""
+    from .models import CatalogImportJob
+    job = get_object_or_404(CatalogImportJob, pk=job_id)
+    return render(request, "store/catalog_import_result.html", {"job": job})
+
+
+@staff_member_required
+def catalog_import_job_status(request, job_id):
+    """JSON с прогрессом задачи импорта."""
+    from .models import CatalogImportJob
+    from .import_jobs import job_status
+    job = get_object_or_404(CatalogImportJob, pk=job_id)
+    resp = JsonResponse(job_status(job))
+    resp["Cache-Control"] = "no-store"
+    return resp
\ No newline at end of file